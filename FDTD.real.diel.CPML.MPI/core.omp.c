@@ -137,6 +137,37 @@ void get_diff_of_E_rankFM(											\
 );
 
 
+// Get derivatives of H field at x=0 from the plane received from the previous rank.
+void get_diff_of_H_halo(											\
+	int		myNx,		int		Ny,		int		Nz,					\
+	double	dt,			double  dx,		double  dy,		double dz,	\
+	double *recvHyfirst_re,	\
+	double *recvHzfirst_re,	\
+	double *Hx_re,		\
+	double *Hy_re,		\
+	double *Hz_re,		\
+	double *diffxHy_re, \
+	double *diffxHz_re, \
+	double *diffyHx_re, \
+	double *diffzHx_re  \
+);
+
+
+// Get derivatives of E field at x=myNx-1 from the plane received from the next rank.
+void get_diff_of_E_halo(											\
+	int		myNx,		int		Ny,		int		Nz,					\
+	double  dt,			double  dx,		double	dy,		double dz,	\
+	double *recvEylast_re,	\
+	double *recvEzlast_re,	\
+	double *Ex_re,		\
+	double *Ey_re,		\
+	double *Ez_re,		\
+	double *diffxEy_re, \
+	double *diffxEz_re, \
+	double *diffyEx_re, \
+	double *diffzEx_re  \
+);
+
 //Get derivatives of E field in the last rank.
 void get_diff_of_E_rank_L(											\
 	int		myNx,		int		Ny,		int		Nz,					\
@@ -809,6 +840,117 @@ void get_diff_of_E_rank_L(											\
 };
 
 
+// Get derivatives of H field at x=0 from the plane received from the previous rank.
+// With get_diff_of_H_rank_F, it gives the same derivatives as get_diff_of_H_rankML.
+void get_diff_of_H_halo(											\
+	int		myNx,		int		Ny,		int		Nz,					\
+	double	dt,			double  dx,		double  dy,		double dz,	\
+	double *recvHyfirst_re,	
+	double *recvHzfirst_re,	
+	double *Hx_re,		
+	double *Hy_re,		
+	double *Hz_re,		
+	double *diffxHy_re, 
+	double *diffxHz_re, 
+	double *diffyHx_re, 
+	double *diffzHx_re 
+){
+
+	// int for index
+	int j,k;
+	int myidx, myidx_j, myidx_k;
+
+	// Get derivatives of Hx and Hz to update Ey at x=0
+	#pragma omp parallel for \
+		shared(Ny, Nz, dx, dz, Hx_re, Hz_re, recvHzfirst_re, diffxHz_re, diffzHx_re)	\
+		private(j, k, myidx, myidx_k)
+	for(j=0; j < Ny; j++){
+		for(k=1; k < Nz; k++){
+
+			myidx   = (k  ) + (j  ) * Nz + (0  ) * Nz * Ny;
+			myidx_k = (k-1) + (j  ) * Nz + (0  ) * Nz * Ny;
+
+			diffxHz_re[myidx] = (Hz_re[myidx] - recvHzfirst_re[myidx]) / dx;
+			diffzHx_re[myidx] = (Hx_re[myidx] - Hx_re[myidx_k]) / dz;
+
+		}
+	}
+
+	// Get derivatives of Hx and Hy to update Ez at x=0
+	#pragma omp parallel for \
+		shared(Ny, Nz, dx, dy, Hx_re, Hy_re, recvHyfirst_re, diffxHy_re, diffyHx_re)	\
+		private(j, k, myidx, myidx_j)
+	for(j=1; j < Ny; j++){
+		for(k=0; k < Nz; k++){
+
+			myidx   = (k  ) + (j  ) * Nz + (0  ) * Nz * Ny;
+			myidx_j = (k  ) + (j-1) * Nz + (0  ) * Nz * Ny;
+
+			diffxHy_re[myidx] = (Hy_re[myidx] - recvHyfirst_re[myidx]) / dx;
+			diffyHx_re[myidx] = (Hx_re[myidx] - Hx_re[myidx_j]) / dy;
+		}
+	}
+
+	return;
+}
+
+
+// Get derivatives of E field at x=myNx-1 from the plane received from the next rank.
+// With get_diff_of_E_rank_L, it gives the same derivatives as get_diff_of_E_rankFM.
+void get_diff_of_E_halo(											\
+	int		myNx,		int		Ny,		int		Nz,					\
+	double  dt,			double  dx,		double	dy,		double dz,	\
+	double *recvEylast_re,
+	double *recvEzlast_re,
+	double *Ex_re,		
+	double *Ey_re,		
+	double *Ez_re,		
+	double *diffxEy_re, 
+	double *diffxEz_re, 
+	double *diffyEx_re, 
+	double *diffzEx_re
+){
+
+	// int for index
+	int j,k;
+	int myidx, j_myidx, k_myidx, yzidx;
+
+	/* Update Hy at x=myNx-1 */
+	#pragma omp parallel for \
+		shared(Ny, Nz, dx, dz, Ex_re, Ez_re, recvEzlast_re, diffxEz_re, diffzEx_re)	\
+		private(j,k, myidx, k_myidx, yzidx)
+	for(j=0; j < Ny; j++){
+		for(k=0; k < (Nz-1); k++){
+				
+			myidx   = (k  ) + (j  ) * Nz + (myNx-1) * Nz * Ny;
+			k_myidx = (k+1) + (j  ) * Nz + (myNx-1) * Nz * Ny;
+			yzidx   = (k  ) + (j  ) * Nz + (0     ) * Nz * Ny;
+
+			diffzEx_re[myidx] = (Ex_re[k_myidx] - Ex_re[myidx]) / dz;
+			diffxEz_re[myidx] = (recvEzlast_re[yzidx] - Ez_re[myidx]) / dx;
+		}
+	}
+
+	/* Update Hz at x=myNx-1 */
+	#pragma omp parallel for \
+		shared(Ny, Nz, dx, dy, Ex_re, Ey_re, recvEylast_re, diffxEy_re, diffyEx_re)	\
+		private(j,k, myidx, j_myidx, yzidx)
+	for(j=0; j < (Ny-1); j++){
+		for(k=0; k < Nz; k++){
+				
+			myidx   = (k  ) + (j  ) * Nz + (myNx-1) * Nz * Ny;
+			j_myidx = (k  ) + (j+1) * Nz + (myNx-1) * Nz * Ny;
+			yzidx   = (k  ) + (j  ) * Nz + (0     ) * Nz * Ny;
+
+			diffxEy_re[myidx] = (recvEylast_re[yzidx] - Ey_re[myidx]) / dx;
+			diffyEx_re[myidx] = (Ex_re[j_myidx] - Ex_re[myidx]) / dy;
+		}
+	}
+
+	return;
+};
+
+
 // Update H field.
 void updateH_rankFM(														\
 	int		myNx,		int		Ny,		int		Nz,					\
@@ -639,6 +639,8 @@ class Basic3D(object):
         self.clib_core.get_diff_of_H_rankML.restype = None
         self.clib_core.get_diff_of_E_rankFM.restype = None
         self.clib_core.get_diff_of_E_rank_L.restype = None
+        self.clib_core.get_diff_of_H_halo.restype = None
+        self.clib_core.get_diff_of_E_halo.restype = None
         self.clib_core.updateE_rank_F.restype = None
         self.clib_core.updateE_rankML.restype = None
         self.clib_core.updateH_rankFM.restype = None
@@ -704,6 +706,34 @@ class Basic3D(object):
                                                             ptr3d
                                                         ]
 
+        self.clib_core.get_diff_of_H_halo.argtypes   =  [\
+                                                            ctypes.c_int, ctypes.c_int, ctypes.c_int,   \
+                                                            ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double, \
+                                                            ptr2d, 
+                                                            ptr2d, 
+                                                            ptr3d, 
+                                                            ptr3d, 
+                                                            ptr3d, 
+                                                            ptr3d, 
+                                                            ptr3d, 
+                                                            ptr3d, 
+                                                            ptr3d 
+                                                        ]
+
+        self.clib_core.get_diff_of_E_halo.argtypes   =  [\
+                                                            ctypes.c_int, ctypes.c_int, ctypes.c_int,   \
+                                                            ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double, \
+                                                            ptr2d, 
+                                                            ptr2d,
+                                                            ptr3d, 
+                                                            ptr3d,
+                                                            ptr3d,
+                                                            ptr3d,
+                                                            ptr3d,
+                                                            ptr3d,
+                                                            ptr3d
+                                                        ]
+
         self.clib_core.updateE_rank_F.argtypes =    [\
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int,   \
                                                         ctypes.c_double, \
@@ -1185,69 +1215,85 @@ class Basic3D(object):
                                                     ptr3d, ptr3d\
                                                 ]
 
+        #-----------------------------------------------------------#
+        #------------- Persistent requests for MPI halo ------------#
+        #-----------------------------------------------------------#
+
+        # The boundary planes are copied into the preallocated buffers and
+        # exchanged with non-blocking persistent requests instead of pickled send/recv.
+        self.sendEyfirst_re = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.sendEzfirst_re = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.recvEylast_re  = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.recvEzlast_re  = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+
+        self.sendHylast_re  = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.sendHzlast_re  = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.recvHyfirst_re = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+        self.recvHzfirst_re = np.zeros((self.Ny, self.Nz), dtype=self.dtype)
+
+        self.halo_E = []
+        self.halo_H = []
+
+        if self.MPIrank > 0:
+            self.halo_E.append(self.MPIcomm.Send_init(self.sendEyfirst_re, dest=(self.MPIrank-1), tag=9 ))
+            self.halo_E.append(self.MPIcomm.Send_init(self.sendEzfirst_re, dest=(self.MPIrank-1), tag=11))
+            self.halo_H.append(self.MPIcomm.Recv_init(self.recvHyfirst_re, source=(self.MPIrank-1), tag=3))
+            self.halo_H.append(self.MPIcomm.Recv_init(self.recvHzfirst_re, source=(self.MPIrank-1), tag=5))
+
+        if self.MPIrank < (self.MPIsize-1):
+            self.halo_E.append(self.MPIcomm.Recv_init(self.recvEylast_re, source=(self.MPIrank+1), tag=9 ))
+            self.halo_E.append(self.MPIcomm.Recv_init(self.recvEzlast_re, source=(self.MPIrank+1), tag=11))
+            self.halo_H.append(self.MPIcomm.Send_init(self.sendHylast_re, dest=(self.MPIrank+1), tag=3))
+            self.halo_H.append(self.MPIcomm.Send_init(self.sendHzlast_re, dest=(self.MPIrank+1), tag=5))
+
     def updateH(self,tstep) :
         
         #--------------------------------------------------------------#
-        #------------ MPI send Ex and Ey to previous rank -------------#
+        #----- MPI exchange Ey and Ez with the neighboring ranks ------#
         #--------------------------------------------------------------#
 
-        if (self.MPIrank > 0) and (self.MPIrank < self.MPIsize):
+        if self.MPIrank > 0:
 
-            sendEyfirst_re = self.Ey_re[0,:,:].copy()
-            sendEzfirst_re = self.Ez_re[0,:,:].copy()
+            self.sendEyfirst_re[:,:] = self.Ey_re[0,:,:]
+            self.sendEzfirst_re[:,:] = self.Ez_re[0,:,:]
 
-            self.MPIcomm.send( sendEyfirst_re, dest=(self.MPIrank-1), tag=(tstep*100+9 ))
-            self.MPIcomm.send( sendEzfirst_re, dest=(self.MPIrank-1), tag=(tstep*100+11))
-
-        else: pass
-
-        #-----------------------------------------------------------#
-        #------------ MPI recv Ex and Ey from next rank ------------#
-        #-----------------------------------------------------------#
-
-        if (self.MPIrank > (-1)) and (self.MPIrank < (self.MPIsize-1)):
-
-            recvEylast_re = self.MPIcomm.recv( source=(self.MPIrank+1), tag=(tstep*100+9 ))
-            recvEzlast_re = self.MPIcomm.recv( source=(self.MPIrank+1), tag=(tstep*100+11))
-
-        else: pass
+        MPI.Prequest.Startall(self.halo_E)
 
         #-----------------------------------------------------------#
         #---------------------- Get derivatives --------------------#
         #-----------------------------------------------------------#
 
-        if self.MPIrank >= 0  and self.MPIrank < (self.MPIsize-1):
+        # The planes below x=myNx-1 do not need the neighbor, so they are taken while Ey and Ez are in flight.
+        self.clib_core.get_diff_of_E_rank_L(\
+                                            self.myNx, self.Ny, self.Nz,\
+                                            self.dt, self.dx, self.dy, self.dz, \
+                                            self.Ex_re, 
+                                            self.Ey_re, 
+                                            self.Ez_re, 
+                                            self.diffxEy_re, 
+                                            self.diffxEz_re, 
+                                            self.diffyEx_re, 
+                                            self.diffyEz_re, 
+                                            self.diffzEx_re, 
+                                            self.diffzEy_re
+                                            )
 
-            self.clib_core.get_diff_of_E_rankFM(\
-                                                self.myNx, self.Ny, self.Nz,\
-                                                self.dt, self.dx, self.dy, self.dz, \
-                                                recvEylast_re, 
-                                                recvEzlast_re, 
-                                                self.Ex_re, 
-                                                self.Ey_re, 
-                                                self.Ez_re, 
-                                                self.diffxEy_re, 
-                                                self.diffxEz_re, 
-                                                self.diffyEx_re, 
-                                                self.diffyEz_re, 
-                                                self.diffzEx_re, 
-                                                self.diffzEy_re
-                                                )
+        MPI.Prequest.Waitall (self.halo_E)
 
-        elif self.MPIrank == (self.MPIsize-1):
+        if self.MPIrank < (self.MPIsize-1):
 
-            self.clib_core.get_diff_of_E_rank_L(\
+            self.clib_core.get_diff_of_E_halo(\
                                                 self.myNx, self.Ny, self.Nz,\
                                                 self.dt, self.dx, self.dy, self.dz, \
+                                                self.recvEylast_re, 
+                                                self.recvEzlast_re, 
                                                 self.Ex_re, 
                                                 self.Ey_re, 
                                                 self.Ez_re, 
                                                 self.diffxEy_re, 
                                                 self.diffxEz_re, 
                                                 self.diffyEx_re, 
-                                                self.diffyEz_re, 
-                                                self.diffzEx_re, 
-                                                self.diffzEy_re
+                                                self.diffzEx_re
                                                 )
 
         #-----------------------------------------------------------#
@@ -1573,7 +1619,7 @@ class Basic3D(object):
                                             self.dt, self.dx, self.dy, self.dz, \
                                             self.mu_Hx, self.mu_Hz, \
                                             self.mcon_Hx, self.mcon_Hz, \
-                                            recvEylast_re, 
+                                            self.recvEylast_re, 
                                             self.Hx_re, 
                                             self.Hz_re, 
                                             self.Ex_re, 
@@ -1645,7 +1691,7 @@ class Basic3D(object):
                                             self.dt, self.dx, self.dy, self.dz, \
                                             self.mu_Hx, self.mu_Hy, \
                                             self.mcon_Hx, self.mcon_Hy, \
-                                            recvEzlast_re, 
+                                            self.recvEzlast_re, 
                                             self.Hx_re, 
                                             self.Hy_re, 
                                             self.Ex_re, 
@@ -1722,65 +1768,51 @@ class Basic3D(object):
         """
 
         #---------------------------------------------------------#
-        #------------ MPI send Hy and Hz to next rank ------------#
+        #--- MPI exchange Hy and Hz with the neighboring ranks ---#
         #---------------------------------------------------------#
 
-        if self.MPIrank > (-1) and self.MPIrank < (self.MPIsize-1):
-
-            sendHylast_re = self.Hy_re[-1,:,:].copy()
-            sendHzlast_re = self.Hz_re[-1,:,:].copy()
+        if self.MPIrank < (self.MPIsize-1):
 
-            self.MPIcomm.send(sendHylast_re, dest=(self.MPIrank+1), tag=(tstep*100+3))
-            self.MPIcomm.send(sendHzlast_re, dest=(self.MPIrank+1), tag=(tstep*100+5))
-        
-        else: pass
-
-        #---------------------------------------------------------#
-        #--------- MPI recv Hy and Hz from previous rank ---------#
-        #---------------------------------------------------------#
+            self.sendHylast_re[:,:] = self.Hy_re[-1,:,:]
+            self.sendHzlast_re[:,:] = self.Hz_re[-1,:,:]
 
-        if self.MPIrank > 0 and self.MPIrank < self.MPIsize:
-
-            recvHyfirst_re = self.MPIcomm.recv( source=(self.MPIrank-1), tag=(tstep*100+3))
-            recvHzfirst_re = self.MPIcomm.recv( source=(self.MPIrank-1), tag=(tstep*100+5))
-        
-        else: pass
+        MPI.Prequest.Startall(self.halo_H)
 
         #-----------------------------------------------------------#
         #---------------------- Get derivatives --------------------#
         #-----------------------------------------------------------#
 
-        if self.MPIrank == 0:
+        # The planes above x=0 do not need the neighbor, so they are taken while Hy and Hz are in flight.
+        self.clib_core.get_diff_of_H_rank_F(\
+                                            self.myNx, self.Ny, self.Nz,\
+                                            self.dt, self.dx, self.dy, self.dz, \
+                                            self.Hx_re, 
+                                            self.Hy_re, 
+                                            self.Hz_re, 
+                                            self.diffxHy_re, 
+                                            self.diffxHz_re, 
+                                            self.diffyHx_re, 
+                                            self.diffyHz_re, 
+                                            self.diffzHx_re, 
+                                            self.diffzHy_re
+                                            )
 
-            self.clib_core.get_diff_of_H_rank_F(\
-                                                self.myNx, self.Ny, self.Nz,\
-                                                self.dt, self.dx, self.dy, self.dz, \
-                                                self.Hx_re, 
-                                                self.Hy_re, 
-                                                self.Hz_re, 
-                                                self.diffxHy_re, 
-                                                self.diffxHz_re, 
-                                                self.diffyHx_re, 
-                                                self.diffyHz_re, 
-                                                self.diffzHx_re, 
-                                                self.diffzHy_re
-                                                )
-        else:
+        MPI.Prequest.Waitall (self.halo_H)
+
+        if self.MPIrank > 0:
 
-            self.clib_core.get_diff_of_H_rankML(\
+            self.clib_core.get_diff_of_H_halo(\
                                                 self.myNx, self.Ny, self.Nz,\
                                                 self.dt, self.dx, self.dy, self.dz, \
-                                                recvHyfirst_re, 
-                                                recvHzfirst_re, 
+                                                self.recvHyfirst_re, 
+                                                self.recvHzfirst_re, 
                                                 self.Hx_re, 
                                                 self.Hy_re, 
                                                 self.Hz_re, 
                                                 self.diffxHy_re, 
                                                 self.diffxHz_re, 
                                                 self.diffyHx_re, 
-                                                self.diffyHz_re, 
-                                                self.diffzHx_re, 
-                                                self.diffzHy_re
+                                                self.diffzHx_re
                                                 )
 
         #-----------------------------------------------------------#
@@ -2130,7 +2162,7 @@ class Basic3D(object):
                                             self.dt, self.dx, self.dy, self.dz,\
                                             self.eps_Ex, self.eps_Ez, \
                                             self.econ_Ex, self.econ_Ez, \
-                                            recvHyfirst_re,
+                                            self.recvHyfirst_re,
                                             self.Ex_re,
                                             self.Ez_re, 
                                             self.Hx_re, 
@@ -2203,7 +2235,7 @@ class Basic3D(object):
                                             self.dt, self.dx, self.dy, self.dz,\
                                             self.eps_Ex, self.eps_Ez, \
                                             self.econ_Ex, self.econ_Ez, \
-                                            recvHzfirst_re, 
+                                            self.recvHzfirst_re, 
                                             self.Ex_re, 
                                             self.Ey_re, 
                                             self.Hx_re, 
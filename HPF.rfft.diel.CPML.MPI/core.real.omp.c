@@ -4,6 +4,19 @@
 #include <omp.h>
 //#include <complex.h>
 
+/*
+	Precision of the fields.
+	Compile with -DSINGLE_PRECISION to get the float32 kernels, which use the fftwf_ interface.
+	space.py loads them as core.real.f32.so and core.real.omp.f32.so when Space.dtype is np.float32.
+*/
+#ifdef SINGLE_PRECISION
+typedef float real_t;
+#define FFTW(name) fftwf_ ## name
+#else
+typedef double real_t;
+#define FFTW(name) fftw_ ## name
+#endif
+
 /*	
 	Author: Donggun Lee	
 	Date  : 18.02.14
@@ -40,51 +53,143 @@
 /******************************** FUNCTION DECLARATION *****************************/
 /***********************************************************************************/
 
+// Plans and workspace of the real FFTs along y and z axis.
+// They are made once at init_update_equations and reused at every time step.
+typedef struct {
+
+	int myNx, Ny, Nz;
+
+	real_t		 *data_T1, *data_T2;
+	FFTW(complex) *FFTz1, *FFTz2;
+	FFTW(complex) *FFTy1, *FFTy2;
+
+	FFTW(plan) FFTz_FOR_plan, FFTz_BAK_plan;
+	FFTW(plan) FFTy_FOR_plan, FFTy_BAK_plan;
+
+	// Plans on a single yz plane and per-thread tiles for the fused update.
+	int nthreads;
+	FFTW(plan) FFTz_plane_FOR_plan, FFTz_plane_BAK_plan;
+	FFTW(plan) FFTy_plane_FOR_plan, FFTy_plane_BAK_plan;
+	real_t		 *tile_real;
+	FFTW(complex) *tile_cplx;
+
+} FFT_plans;
+
+// CPML of the fused kernels. The layers which are not in this rank have NULL psi arrays.
+typedef struct CPML {
+
+	int npml;
+
+	real_t *kappax, *bx, *ax;
+	real_t *kappay, *by, *ay;
+	real_t *kappaz, *bz, *az;
+
+	// psi of H field, named after the component, the axis of the derivative and the side.
+	real_t *hyx_p, *hzx_p, *hyx_m, *hzx_m;
+	real_t *hxy_p, *hzy_p, *hxy_m, *hzy_m;
+	real_t *hxz_p, *hyz_p, *hxz_m, *hyz_m;
+
+	// psi of E field.
+	real_t *eyx_p, *ezx_p, *eyx_m, *ezx_m;
+	real_t *exy_p, *ezy_p, *exy_m, *ezy_m;
+	real_t *exz_p, *eyz_p, *exz_m, *eyz_m;
+
+} CPML;
+
+// Update coefficient q of the cell idx. q = 0, 1 are C1, C2 at the HEE position and q = 2, 3 at the EHH position.
+// With materials='compact', coef is the table of (nmat, 4) coefficients and mat the material index of each cell.
+// With materials='dense', mat is NULL and coef holds four material arrays of ncell values each:
+// mu (eps) at HEE and EHH, then the magnetic (electric) conductivity at HEE and EHH.
+// The coefficient is then computed for the cell. sign is -1 for H and +1 for E field, where eps > 1e3 is PEC.
+static inline real_t cell_coef(unsigned short *mat, real_t *coef, long ncell, int idx, int q, double dt, double sign){
+
+	double m, s;
+
+	if (mat != NULL) return coef[4*mat[idx] + q];
+
+	m = coef[(q/2  )*ncell + idx];
+	s = coef[(q/2+2)*ncell + idx];
+
+	if (sign > 0 && m > 1e3) return 0.;
+
+	if (q % 2 == 0) return (2.*m - s*dt) / (2.*m + s*dt);
+	else			return (sign*2.*dt) / (2.*m + s*dt);
+}
+
+// Make FFT plans. rigor 0, 1, 2 means FFTW_ESTIMATE, FFTW_MEASURE, FFTW_PATIENT respectively.
+// The wisdom in wisdom_path is imported first if it is not NULL.
+FFT_plans* init_FFT_plans(
+	int myNx, int Ny, int Nz,
+	int rigor,
+	char* wisdom_path
+);
+
+// Write the wisdom of the plans made so far.
+void save_FFT_wisdom(char* wisdom_path);
+
+// Destroy the plans and free the workspace made by init_FFT_plans.
+void destroy_FFT_plans(FFT_plans* plans);
+
 // Get derivatives along last axis.
 void get_deriv_last_axis(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* data,
-	double* kz,
-	double* diffz_data
+	real_t* data,
+	real_t* kz,
+	real_t* diffz_data
 );
 
 //Get derivatives of E field.
 void get_deriv_z_E_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Ex_re,
-	double* Ey_re,
-	double* kz,
-	double* diffzEx_re,
-	double* diffzEy_re
+	real_t* Ex_re,
+	real_t* Ey_re,
+	real_t* kz,
+	real_t* diffzEx_re,
+	real_t* diffzEy_re
 );
 
 void get_deriv_y_E_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Ex_re,
-	double* Ez_re,
-	double* ky,
-	double* diffyEx_re,
-	double* diffyEz_re
+	real_t* Ex_re,
+	real_t* Ez_re,
+	real_t* ky,
+	real_t* diffyEx_re,
+	real_t* diffyEz_re
 );
 
 void get_deriv_x_E_FM0(
 	int	myNx, int Ny, int Nz,
 	double  dx,
-	double* Ey_re,
-	double* Ez_re,
-	double* diffxEy_re,
-	double* diffxEz_re,
-	double* recvEylast_re,
-	double* recvEzlast_re
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re,
+	real_t* recvEylast_re,
+	real_t* recvEzlast_re
 );
 
 void get_deriv_x_E_00L(
 	int	myNx, int Ny, int Nz,
 	double  dx,
-	double* Ey_re,
-	double* Ez_re,
-	double* diffxEy_re,
-	double* diffxEz_re
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re
+);
+
+// Get x derivatives of E field at the last plane, after receiving the first plane of the next rank.
+void get_deriv_x_E_halo(
+	int	myNx, int Ny, int Nz,
+	double  dx,
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re,
+	real_t* recvEylast_re,
+	real_t* recvEzlast_re
 );
 
 // Update H field.
@@ -92,56 +197,69 @@ void updateH(										\
 	int		MPIsize,	int MPIrank,
 	int		myNx,		int		Ny,		int		Nz,	\
 	double  dt,										\
-	double *Hx_re,		
-	double *Hy_re,	
-	double *Hz_re,	
-	double *mu_HEE,		double *mu_EHH,				\
-	double *mcon_HEE,	double *mcon_EHH,			\
-	double *diffxEy_re, 
-	double *diffxEz_re, 
-	double *diffyEx_re,
-	double *diffyEz_re,
-	double *diffzEx_re,
-	double *diffzEy_re
+	real_t *Hx_re,		
+	real_t *Hy_re,	
+	real_t *Hz_re,	
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *diffxEy_re, 
+	real_t *diffxEz_re, 
+	real_t *diffyEx_re,
+	real_t *diffyEz_re,
+	real_t *diffzEx_re,
+	real_t *diffzEy_re
 );
 
 // Get derivatives of H field.
 void get_deriv_z_H_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Hx_re,
-	double* Hy_re,
-	double* kz,
-	double* diffzHx_re,
-	double* diffzHy_re
+	real_t* Hx_re,
+	real_t* Hy_re,
+	real_t* kz,
+	real_t* diffzHx_re,
+	real_t* diffzHy_re
 );
 
 void get_deriv_y_H_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Hx_re,
-	double* Hz_re,
-	double* ky,
-	double* diffyHx_re,
-	double* diffyHz_re
+	real_t* Hx_re,
+	real_t* Hz_re,
+	real_t* ky,
+	real_t* diffyHx_re,
+	real_t* diffyHz_re
 );
 
 void get_deriv_x_H_F00(
 	int myNx, int Ny, int Nz,
 	double dx,
-	double* Hy_re,
-	double* Hz_re,
-	double* diffxHy_re,
-	double* diffxHz_re
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re
 );
 
 void get_deriv_x_H_0ML(
 	int myNx, int Ny, int Nz,
 	double dx,
-	double* Hy_re,
-	double* Hz_re,
-	double* diffxHy_re,
-	double* diffxHz_re,
-	double* recvHyfirst_re,
-	double* recvHzfirst_re
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re,
+	real_t* recvHyfirst_re,
+	real_t* recvHzfirst_re
+);
+
+// Get x derivatives of H field at the first plane, after receiving the last plane of the previous rank.
+void get_deriv_x_H_halo(
+	int myNx, int Ny, int Nz,
+	double dx,
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re,
+	real_t* recvHyfirst_re,
+	real_t* recvHzfirst_re
 );
 
 // Update E field
@@ -149,81 +267,205 @@ void updateE(
 	int		MPIsize,	int MPIrank,
 	int		myNx,		int		Ny,		int		Nz,	\
 	double dt,										\
-	double *Ex_re,		
-	double *Ey_re,		
-	double *Ez_re,		
-	double *eps_HEE,	double *eps_EHH,			\
-	double *econ_HEE,	double *econ_EHH,			\
-	double *diffxHy_re, 
-	double *diffxHz_re, 
-	double *diffyHx_re, 
-	double *diffyHz_re, 
-	double *diffzHx_re, 
-	double *diffzHy_re
+	real_t *Ex_re,		
+	real_t *Ey_re,		
+	real_t *Ez_re,		
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *diffxHy_re, 
+	real_t *diffxHz_re, 
+	real_t *diffyHx_re, 
+	real_t *diffyHz_re, 
+	real_t *diffzHx_re, 
+	real_t *diffzHy_re
+);
+
+// Fused update of H field. y, z derivatives of E field are computed plane by plane in per-thread tiles,
+// and x derivatives are taken in the same pass. Only planes in [isrt, iend) are updated.
+void updateH_fused(
+	FFT_plans* plans,
+	int		MPIsize,	int MPIrank,
+	int		myNx,		int		Ny,		int		Nz,
+	int		isrt,		int		iend,
+	int		pml_xm,		int		pml_xp,
+	int		pml_ym,		int		pml_yp,
+	int		pml_zm,		int		pml_zp,
+	double	dt,			double	dx,
+	real_t *ky,			real_t *kz,
+	real_t *Hx_re,
+	real_t *Hy_re,
+	real_t *Hz_re,
+	real_t *Ex_re,
+	real_t *Ey_re,
+	real_t *Ez_re,
+	unsigned short *mat,	real_t *coefH,
+	real_t *recvEylast_re,
+	real_t *recvEzlast_re,
+	CPML* pml
+);
+
+// Fused update of E field. Only planes in [isrt, iend) are updated.
+void updateE_fused(
+	FFT_plans* plans,
+	int		MPIsize,	int MPIrank,
+	int		myNx,		int		Ny,		int		Nz,
+	int		isrt,		int		iend,
+	int		pml_xm,		int		pml_xp,
+	int		pml_ym,		int		pml_yp,
+	int		pml_zm,		int		pml_zp,
+	double	dt,			double	dx,
+	real_t *ky,			real_t *kz,
+	real_t *Ex_re,
+	real_t *Ey_re,
+	real_t *Ez_re,
+	real_t *Hx_re,
+	real_t *Hy_re,
+	real_t *Hz_re,
+	unsigned short *mat,	real_t *coefE,
+	real_t *recvHyfirst_re,
+	real_t *recvHzfirst_re,
+	CPML* pml
 );
 
 /***********************************************************************************/
 /******************************** FUNCTION DESCRIPTION *****************************/
 /***********************************************************************************/
 
-void get_deriv_last_axis(
-	int Nx, int Ny, int Nz,
-	double* data,
-	double* kz,
-	double* diffz_data
+FFT_plans* init_FFT_plans(
+	int myNx, int Ny, int Nz,
+	int rigor,
+	char* wisdom_path
 ){
 
+	// Choose the planner rigor.
+	unsigned flags;
+
+	if		(rigor == 1) flags = FFTW_MEASURE;
+	else if (rigor == 2) flags = FFTW_PATIENT;
+	else				 flags = FFTW_ESTIMATE;
+
 	// initialize multi-threaded fftw3.
-	fftw_init_threads();
+	FFTW(init_threads)();
 	int nthreads = omp_get_max_threads();
-	fftw_plan_with_nthreads(nthreads);
+	FFTW(plan_with_nthreads)(nthreads);
 
-	int Nzh = Nz/2+1;
+	// Plans made by previous runs on the same grid are reused.
+	if (wisdom_path != NULL) FFTW(import_wisdom_from_filename)(wisdom_path);
+
+	FFT_plans* plans = (FFT_plans*) malloc(sizeof(FFT_plans));
 
-	int i,j,k,idx,idx_T;
-	double real, imag;
+	plans->myNx = myNx;
+	plans->Ny	= Ny;
+	plans->Nz	= Nz;
 
-	double* diffz = fftw_alloc_real(Nx*Ny*Nz);
-	fftw_complex *FFTz = fftw_alloc_complex(Nx*Ny*Nzh);
+	// Workspace shared by every call of get_deriv_*.
+	plans->data_T1 = FFTW(alloc_real)(myNx*Ny*Nz);
+	plans->data_T2 = FFTW(alloc_real)(myNx*Ny*Nz);
+	plans->FFTz1 = FFTW(alloc_complex)(myNx*Ny*(Nz/2+1));
+	plans->FFTz2 = FFTW(alloc_complex)(myNx*Ny*(Nz/2+1));
+	plans->FFTy1 = FFTW(alloc_complex)(myNx*(Ny/2+1)*Nz);
+	plans->FFTy2 = FFTW(alloc_complex)(myNx*(Ny/2+1)*Nz);
 
-	// Set forward FFTz parameters
-	int rankz = 1;
+	// Set Plans for real FFT along z axis.
+	// The z transforms read and write the field arrays directly at execution,
+	// so they are planned on the workspace without any alignment assumption.
 	int nz[1] = {Nz};
-	int howmanyz = (Nx*Ny);
-	const int *inembedz = NULL, *onembedz = NULL;
-	int istridez = 1, ostridez = 1;
-	int idistz = Nz, odistz= Nzh;
-
-	// Setup Forward plans.
-	fftw_plan FFTz_for_plan = fftw_plan_many_dft_r2c(rankz, nz, howmanyz, diffz, inembedz, istridez, idistz, \
-														FFTz, onembedz, ostridez, odistz, FFTW_ESTIMATE);
-
-	// Set backward FFTz parameters
-	int rankbz = 1;
-	int nbz[1] = {Nz};
-	int howmanybz = (Nx*Ny);
-	const int *inembedbz = NULL, *onembedbz = NULL;
-	int istridebz = 1, ostridebz = 1;
-	int idistbz = Nzh, odistbz = Nz;
-
-	// Setup Backward plans.
-	fftw_plan FFTz_bak_plan = fftw_plan_many_dft_c2r(rankbz, nbz, howmanybz, FFTz, inembedbz, istridebz, idistbz, \
-														diffz, onembedbz, ostridebz, odistbz, FFTW_ESTIMATE);
-
-	// Initialize diffz.
-	for(i=0; i < Nx; i++){
-		for(j=0; j < Ny; j++){
-			for(k=0; k < Nz; k++){
-				
-				idx   = k + j*Nz + i*Nz*Ny;
 
-				diffz[idx] = data[idx];
-			}
-		}
-	}
+	plans->FFTz_FOR_plan = FFTW(plan_many_dft_r2c)(1, nz, myNx*Ny, plans->data_T1, NULL, 1, Nz, \
+													plans->FFTz1, NULL, 1, Nz/2+1, flags | FFTW_UNALIGNED);
+
+	plans->FFTz_BAK_plan = FFTW(plan_many_dft_c2r)(1, nz, myNx*Ny, plans->FFTz1, NULL, 1, Nz/2+1, \
+													plans->data_T1, NULL, 1, Nz, flags | FFTW_UNALIGNED);
+
+	// Set Plans for real FFT along y axis.
+	// The y transforms only touch the transposed workspace.
+	int ny[1] = {Ny};
+
+	plans->FFTy_FOR_plan = FFTW(plan_many_dft_r2c)(1, ny, myNx*Nz, plans->data_T1, NULL, 1, Ny, \
+													plans->FFTy1, NULL, 1, Ny/2+1, flags);
+
+	plans->FFTy_BAK_plan = FFTW(plan_many_dft_c2r)(1, ny, myNx*Nz, plans->FFTy1, NULL, 1, Ny/2+1, \
+													plans->data_T1, NULL, 1, Ny, flags);
+
+	// Plans on a single yz plane for the fused update.
+	// Each thread executes them on its own tile, so they are made with a single thread.
+	int Nyz  = Ny*Nz;
+	int Ncpx = Ny*(Nz/2+1) > (Ny/2+1)*Nz ? Ny*(Nz/2+1) : (Ny/2+1)*Nz;
+
+	plans->nthreads  = nthreads;
+	plans->tile_real = FFTW(alloc_real)(nthreads*4*Nyz);
+	plans->tile_cplx = FFTW(alloc_complex)(nthreads*2*Ncpx);
+
+	FFTW(plan_with_nthreads)(1);
+
+	plans->FFTz_plane_FOR_plan = FFTW(plan_many_dft_r2c)(1, nz, Ny, plans->tile_real, NULL, 1, Nz, \
+													plans->tile_cplx, NULL, 1, Nz/2+1, flags | FFTW_UNALIGNED);
+
+	plans->FFTz_plane_BAK_plan = FFTW(plan_many_dft_c2r)(1, nz, Ny, plans->tile_cplx, NULL, 1, Nz/2+1, \
+													plans->tile_real, NULL, 1, Nz, flags | FFTW_UNALIGNED);
+
+	// y axis is strided by Nz in a plane. Transpose is not needed.
+	plans->FFTy_plane_FOR_plan = FFTW(plan_many_dft_r2c)(1, ny, Nz, plans->tile_real, NULL, Nz, 1, \
+													plans->tile_cplx, NULL, Nz, 1, flags | FFTW_UNALIGNED);
+
+	plans->FFTy_plane_BAK_plan = FFTW(plan_many_dft_c2r)(1, ny, Nz, plans->tile_cplx, NULL, Nz, 1, \
+													plans->tile_real, NULL, Nz, 1, flags | FFTW_UNALIGNED);
+
+	FFTW(plan_with_nthreads)(nthreads);
+
+	return plans;
+}
+
+void save_FFT_wisdom(char* wisdom_path){
+
+	FFTW(export_wisdom_to_filename)(wisdom_path);
+
+	return;
+}
+
+void destroy_FFT_plans(FFT_plans* plans){
+
+	FFTW(destroy_plan)(plans->FFTz_FOR_plan);
+	FFTW(destroy_plan)(plans->FFTz_BAK_plan);
+	FFTW(destroy_plan)(plans->FFTy_FOR_plan);
+	FFTW(destroy_plan)(plans->FFTy_BAK_plan);
+
+	FFTW(destroy_plan)(plans->FFTz_plane_FOR_plan);
+	FFTW(destroy_plan)(plans->FFTz_plane_BAK_plan);
+	FFTW(destroy_plan)(plans->FFTy_plane_FOR_plan);
+	FFTW(destroy_plan)(plans->FFTy_plane_BAK_plan);
+
+	FFTW(free)(plans->data_T1);
+	FFTW(free)(plans->data_T2);
+	FFTW(free)(plans->FFTz1);
+	FFTW(free)(plans->FFTz2);
+	FFTW(free)(plans->FFTy1);
+	FFTW(free)(plans->FFTy2);
+
+	FFTW(free)(plans->tile_real);
+	FFTW(free)(plans->tile_cplx);
+
+	free(plans);
+
+	return;
+}
+
+void get_deriv_last_axis(
+	FFT_plans* plans,
+	int Nx, int Ny, int Nz,
+	real_t* data,
+	real_t* kz,
+	real_t* diffz_data
+){
+
+	int Nzh = Nz/2+1;
+
+	int i,j,k,idx;
+	real_t real, imag;
+
+	FFTW(complex) *FFTz = plans->FFTz1;
 
 	// Perform 1D FFT along z axis.
-	fftw_execute(FFTz_for_plan);
+	FFTW(execute_dft_r2c)(plans->FFTz_FOR_plan, data, FFTz);
 
 	// Multiply ikz.
 	for(i=0; i < Nx; i++){
@@ -242,87 +484,45 @@ void get_deriv_last_axis(
 		}
 	}
 
-	// Perform 1D IFFT along y and z axis.
-	fftw_execute(FFTz_bak_plan);
+	// Perform 1D IFFT along z axis.
+	FFTW(execute_dft_c2r)(plans->FFTz_BAK_plan, FFTz, diffz_data);
 
 	// Normalize reconstructed signal.
-	// Transpose to restore original field array.
 	for(i=0; i < Nx; i++){
 		for(j=0; j < Ny; j++){
 			for(k=0; k < Nz; k++){
 				
 				idx   = k + j*Nz + i*Nz*Ny;
 
-				diffz_data[idx] = diffz[idx] / Nz;
+				diffz_data[idx] = diffz_data[idx] / Nz;
 
 			}
 		}
 	}
 
-	// Destroy the plan
-	fftw_destroy_plan(FFTz_for_plan);
-	fftw_destroy_plan(FFTz_bak_plan);
-
-	// Free the memory.
-	fftw_free(FFTz);
-	fftw_free(diffz);
-
 	return;
 }
 
 // Get derivatives of E field in the first and middle rank.
 void get_deriv_z_E_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Ex_re,
-	double* Ey_re,
-	double* kz,
-	double* diffzEx_re,
-	double* diffzEy_re
+	real_t* Ex_re,
+	real_t* Ey_re,
+	real_t* kz,
+	real_t* diffzEx_re,
+	real_t* diffzEy_re
 ){
-	// initialize multi-threaded fftw3.
-	fftw_init_threads();
-	int nthreads = omp_get_max_threads();
-	fftw_plan_with_nthreads(nthreads);
 
 	// int for index
 	int i, j, k, myidx;
-	double real, imag;
-
-	// Memory allocation for transpose of the field data.
-	fftw_complex *FFTzEx = fftw_alloc_complex(myNx*Ny*(Nz/2+1));
-	fftw_complex *FFTzEy = fftw_alloc_complex(myNx*Ny*(Nz/2+1));
-
-	// Set Plans for real FFT along z axis.
-	int rankz = 1;
-	int nz[1]  = {Nz};
-	int howmanyz = myNx*Ny;
-	int istridez = 1, ostridez = 1;
-	int idistz = Nz, odistz = Nz/2+1;
-	const int *inembedz = NULL, *onembedz = NULL;
-
-	fftw_plan FFTz_Ex_FOR_plan = fftw_plan_many_dft_r2c(rankz, nz, howmanyz, Ex_re, inembedz, istridez, idistz, \
-														FFTzEx, onembedz, ostridez, odistz, FFTW_ESTIMATE);
-
-	fftw_plan FFTz_Ey_FOR_plan = fftw_plan_many_dft_r2c(rankz, nz, howmanyz, Ey_re, inembedz, istridez, idistz, \
-														FFTzEy, onembedz, ostridez, odistz, FFTW_ESTIMATE);
-
-	// Set Plans for inverse real FFT along z axis.
-	int rankbz = 1;
-	int nbz[1]  = {Nz};
-	int howmanybz = myNx*Ny;
-	int istridebz = 1, ostridebz = 1;
-	int idistbz = Nz/2+1, odistbz = Nz;
-	const int *inembedbz = NULL, *onembedbz = NULL;
+	real_t real, imag;
 
-	// Setup BACKWARD plans.
-	fftw_plan FFTz_Ex_BAK_plan = fftw_plan_many_dft_c2r(rankbz, nbz, howmanybz, FFTzEx, inembedbz, istridebz, idistbz, \
-														diffzEx_re, onembedbz, ostridebz, odistbz, FFTW_ESTIMATE);
+	FFTW(complex) *FFTzEx = plans->FFTz1;
+	FFTW(complex) *FFTzEy = plans->FFTz2;
 
-	fftw_plan FFTz_Ey_BAK_plan = fftw_plan_many_dft_c2r(rankbz, nbz, howmanybz, FFTzEy, inembedbz, istridebz, idistbz, \
-														diffzEy_re, onembedbz, ostridebz, odistbz, FFTW_ESTIMATE);
-
-	fftw_execute(FFTz_Ex_FOR_plan);
-	fftw_execute(FFTz_Ey_FOR_plan);
+	FFTW(execute_dft_r2c)(plans->FFTz_FOR_plan, Ex_re, FFTzEx);
+	FFTW(execute_dft_r2c)(plans->FFTz_FOR_plan, Ey_re, FFTzEy);
 
 	// Multiply ikz.
 	#pragma omp parallel for \
@@ -357,8 +557,8 @@ void get_deriv_z_E_FML(
 	}
 
 	// Backward FFT.
-	fftw_execute(FFTz_Ex_BAK_plan);
-	fftw_execute(FFTz_Ey_BAK_plan);
+	FFTW(execute_dft_c2r)(plans->FFTz_BAK_plan, FFTzEx, diffzEx_re);
+	FFTW(execute_dft_c2r)(plans->FFTz_BAK_plan, FFTzEy, diffzEy_re);
 
 	// Normalize the results of pseudo-spectral method.
 	#pragma omp parallel for \
@@ -382,69 +582,29 @@ void get_deriv_z_E_FML(
 		}
 	}
 
-	// Destroy the plan and free the memory.
-	fftw_destroy_plan(FFTz_Ex_FOR_plan);
-	fftw_destroy_plan(FFTz_Ey_FOR_plan);
-	fftw_destroy_plan(FFTz_Ex_BAK_plan);
-	fftw_destroy_plan(FFTz_Ey_BAK_plan);
-	fftw_free(FFTzEx);
-	fftw_free(FFTzEy);
-
 	return;
 }
 
 void get_deriv_y_E_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Ex_re,
-	double* Ez_re,
-	double* ky,
-	double* diffyEx_re,
-	double* diffyEz_re
+	real_t* Ex_re,
+	real_t* Ez_re,
+	real_t* ky,
+	real_t* diffyEx_re,
+	real_t* diffyEz_re
 ){
 
-	// initialize multi-threaded fftw3.
-	fftw_init_threads();
-	int nthreads = omp_get_max_threads();
-	fftw_plan_with_nthreads(nthreads);
-
 	// int for index
 	int i,j,k;
-	int myidx, i_myidx, myidx_T, myidx_0;
-	double real, imag;
+	int myidx, myidx_T;
+	real_t real, imag;
 
-	// Memory allocation for transpose of the field data.
-	double* diffyEx_T = fftw_alloc_real(myNx*Ny*Nz);
-	double* diffyEz_T = fftw_alloc_real(myNx*Ny*Nz);
-	fftw_complex* FFTyEx_T = fftw_alloc_complex(myNx*(Ny/2+1)*Nz);
-	fftw_complex* FFTyEz_T = fftw_alloc_complex(myNx*(Ny/2+1)*Nz);
-
-	// Set Plans for real FFT along y axis.
-	int ranky = 1;
-	int ny[1]  = {Ny};
-	int howmanyy = myNx*Nz;
-	int istridey = 1, ostridey = 1;
-	int idisty = Ny, odisty = Ny/2+1;
-	const int *inembedy = NULL, *onembedy = NULL;
-
-	fftw_plan FFTy_Ex_FOR_plan = fftw_plan_many_dft_r2c(ranky, ny, howmanyy, diffyEx_T, inembedy, istridey, idisty, \
-														FFTyEx_T, onembedy, ostridey, odisty, FFTW_ESTIMATE);
-
-	fftw_plan FFTy_Ez_FOR_plan = fftw_plan_many_dft_r2c(ranky, ny, howmanyy, diffyEz_T, inembedy, istridey, idisty, \
-														FFTyEz_T, onembedy, ostridey, odisty, FFTW_ESTIMATE);
-	
-	// Set Plans for inverse real FFT along y axis.
-	int rankby = 1;
-	int nby[1]  = {Ny};
-	int howmanyby = myNx*Nz;
-	int istrideby = 1, ostrideby = 1;
-	int idistby = Ny/2+1, odistby = Ny;
-	const int *inembedby = NULL, *onembedby = NULL;
-
-	fftw_plan FFTy_Ex_BAK_plan = fftw_plan_many_dft_c2r(rankby, nby, howmanyby, FFTyEx_T, inembedby, istrideby, idistby, \
-														diffyEx_T, onembedby, ostrideby, odistby, FFTW_ESTIMATE);
-
-	fftw_plan FFTy_Ez_BAK_plan = fftw_plan_many_dft_c2r(rankby, nby, howmanyby, FFTyEz_T, inembedby, istrideby, idistby, \
-														diffyEz_T, onembedby, ostrideby, odistby, FFTW_ESTIMATE);
+	// Workspace for transpose of the field data.
+	real_t* diffyEx_T = plans->data_T1;
+	real_t* diffyEz_T = plans->data_T2;
+	FFTW(complex)* FFTyEx_T = plans->FFTy1;
+	FFTW(complex)* FFTyEz_T = plans->FFTy2;
 
 	// Transpose y and z axis of the Ex and Ez to get y-derivatives of them.
 	#pragma omp parallel for \
@@ -471,8 +631,8 @@ void get_deriv_y_E_FML(
 	}
 
 	// Perform 1D rFFT along y-axis.
-	fftw_execute(FFTy_Ex_FOR_plan);
-	fftw_execute(FFTy_Ez_FOR_plan);
+	FFTW(execute_dft_r2c)(plans->FFTy_FOR_plan, diffyEx_T, FFTyEx_T);
+	FFTW(execute_dft_r2c)(plans->FFTy_FOR_plan, diffyEz_T, FFTyEz_T);
 
 	// Multiply iky.
 	#pragma omp parallel for \
@@ -507,15 +667,15 @@ void get_deriv_y_E_FML(
 	}
 
 	// Perform Inverse FFT.
-	fftw_execute(FFTy_Ex_BAK_plan);
-	fftw_execute(FFTy_Ez_BAK_plan);
+	FFTW(execute_dft_c2r)(plans->FFTy_BAK_plan, FFTyEx_T, diffyEx_T);
+	FFTW(execute_dft_c2r)(plans->FFTy_BAK_plan, FFTyEz_T, diffyEz_T);
 
 	// Normalize the results of pseudo-spectral method. Get diffx, diffy and diffz of H fields.
 	#pragma omp parallel for \
 		shared(\
 			myNx, Ny, Nz, \
 			diffyEx_re, diffyEx_T, \
-			diffyEz_re, diffyEz_T, \
+			diffyEz_re, diffyEz_T \
 		) \
 		private( \
 			i, j, k, myidx, myidx_T \
@@ -534,16 +694,6 @@ void get_deriv_y_E_FML(
 		}
 	}
 
-	fftw_destroy_plan(FFTy_Ex_FOR_plan);
-	fftw_destroy_plan(FFTy_Ez_FOR_plan);
-	fftw_destroy_plan(FFTy_Ex_BAK_plan);
-	fftw_destroy_plan(FFTy_Ez_BAK_plan);
-
-	fftw_free(FFTyEx_T);
-	fftw_free(FFTyEz_T);
-	fftw_free(diffyEx_T);
-	fftw_free(diffyEz_T);
-
 	return;
 }
 
@@ -552,12 +702,12 @@ void get_deriv_x_EyEz(
 	int MPIsize, int MPIrank,
 	int	myNx, int Ny, int Nz,
 	double  dx,
-	double* Ey_re,
-	double* Ez_re,
-	double* diffxEy_re,
-	double* diffxEz_re,
-	double* recvEylast_re,
-	double* recvEzlast_re
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re,
+	real_t* recvEylast_re,
+	real_t* recvEzlast_re
 ){
 
 	// Integers for index.
@@ -603,12 +753,12 @@ void get_deriv_x_EyEz(
 void get_deriv_x_E_FM0(
 	int	myNx, int Ny, int Nz,
 	double  dx,
-	double* Ey_re,
-	double* Ez_re,
-	double* diffxEy_re,
-	double* diffxEz_re,
-	double* recvEylast_re,
-	double* recvEzlast_re
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re,
+	real_t* recvEylast_re,
+	real_t* recvEzlast_re
 ){
 
 	// Integers for index.
@@ -659,10 +809,10 @@ void get_deriv_x_E_FM0(
 void get_deriv_x_E_00L(
 	int	myNx, int Ny, int Nz,
 	double  dx,
-	double* Ey_re,
-	double* Ez_re,
-	double* diffxEy_re,
-	double* diffxEz_re
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re
 ){
 
 	// Integers for index.
@@ -699,37 +849,76 @@ void get_deriv_x_E_00L(
 	return;
 }
 
+void get_deriv_x_E_halo(
+	int	myNx, int Ny, int Nz,
+	double  dx,
+	real_t* Ey_re,
+	real_t* Ez_re,
+	real_t* diffxEy_re,
+	real_t* diffxEz_re,
+	real_t* recvEylast_re,
+	real_t* recvEzlast_re
+){
+
+	// Integers for index.
+	int j, k, myidx, myidx_0;
+
+	// Get x derivatives of E fields at the last plane with the plane received from the next rank.
+	#pragma omp parallel for \
+		shared(\
+			myNx, Ny, Nz,\
+			diffxEy_re, Ey_re, \
+			diffxEz_re, Ez_re, \
+			dx, \
+			recvEylast_re, recvEzlast_re \
+		) \
+		private( \
+			j, k, myidx, myidx_0 \
+		)
+	for(j=0; j < Ny; j++){
+		for(k=0; k < Nz; k++){
+
+			myidx   = (k  ) + (j  )*Nz + (myNx-1)*Nz*Ny;
+			myidx_0 = (k  ) + (j  )*Nz + (0     )*Nz*Ny;
+
+			diffxEy_re[myidx] = (recvEylast_re[myidx_0] - Ey_re[myidx]) / dx;
+			diffxEz_re[myidx] = (recvEzlast_re[myidx_0] - Ez_re[myidx]) / dx;
+
+		}
+	}
+
+	return;
+}
+
 // Update H field.
 void updateH(										\
 	int		MPIsize,	int MPIrank,
 	int		myNx,		int		Ny,		int		Nz,	\
 	double  dt,										\
-	double *Hx_re,		
-	double *Hy_re,	
-	double *Hz_re,	
-	double *mu_HEE,		double *mu_EHH,				\
-	double *mcon_HEE,	double *mcon_EHH,			\
-	double *diffxEy_re, 
-	double *diffxEz_re, 
-	double *diffyEx_re, 
-	double *diffyEz_re, 
-	double *diffzEx_re, 
-	double *diffzEy_re
+	real_t *Hx_re,		
+	real_t *Hy_re,	
+	real_t *Hz_re,	
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *diffxEy_re, 
+	real_t *diffxEz_re, 
+	real_t *diffyEx_re, 
+	real_t *diffyEz_re, 
+	real_t *diffzEx_re, 
+	real_t *diffzEy_re
 ){
 	/* MAIN UPDATE EQUATIONS */
 	int i,j,k;
 	int myidx;
 
-	double CHx1, CHx2;
-	double CHy1, CHy2;
-	double CHz1, CHz2;
+	real_t CHx1, CHx2;
+	real_t CHy1, CHy2;
+	real_t CHz1, CHz2;
 
 	// Update H field.
 	#pragma omp parallel for \
 		shared(\
 			myNx, Ny, Nz,\
-			mu_HEE, mu_EHH, \
-			mcon_HEE, mcon_EHH, \
+			mat, coefH, \
 			dt, \
 			Hx_re, Hy_re, Hz_re, \
 			diffyEz_re, diffzEy_re, \
@@ -747,13 +936,13 @@ void updateH(										\
 				
 				myidx   = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
 
-				CHx1 =	(2.*mu_HEE[myidx] - mcon_HEE[myidx]*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHy1 =	(2.*mu_EHH[myidx] - mcon_EHH[myidx]*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz1 =	(2.*mu_EHH[myidx] - mcon_EHH[myidx]*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 0, dt, -1.);
+				CHy1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
+				CHz1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
 
-				CHx2 =	(-2*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHy2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hx
 				Hx_re[myidx] = CHx1 * Hx_re[myidx] + CHx2 * (diffyEz_re[myidx] - diffzEy_re[myidx]);
@@ -774,8 +963,7 @@ void updateH(										\
 		#pragma omp parallel for \
 			shared(\
 				myNx, Ny, Nz,\
-				mu_HEE, mu_EHH, \
-				mcon_HEE, mcon_EHH, \
+				mat, coefH, \
 				dt, \
 				Hy_re, Hz_re, \
 				diffzEx_re, diffxEz_re, \
@@ -791,11 +979,11 @@ void updateH(										\
 				
 				myidx   = (k  ) + (j  ) * Nz + (myNx-1) * Nz * Ny;
 
-				CHy1 =	(2.*mu_EHH[myidx] - mcon_EHH[myidx]*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz1 =	(2.*mu_EHH[myidx] - mcon_EHH[myidx]*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHy1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
+				CHz1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
 
-				CHy2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hy
 				Hy_re[myidx] = CHy1 * Hy_re[myidx] + CHy2 * (diffzEx_re[myidx] - diffxEz_re[myidx]);
@@ -810,62 +998,28 @@ void updateH(										\
 }
 
 void get_deriv_z_H_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Hx_re,
-	double* Hy_re,
-	double* kz,
-	double* diffzHx_re,
-	double* diffzHy_re
+	real_t* Hx_re,
+	real_t* Hy_re,
+	real_t* kz,
+	real_t* diffzHx_re,
+	real_t* diffzHy_re
 ){
 
-	// initialize multi-threaded fftw3.
-	fftw_init_threads();
-	int nthreads = omp_get_max_threads();
-	fftw_plan_with_nthreads(nthreads);
-
 	// int for index
-	int i,j,k;
-	int myidx, myidx_i, myidx_T;
-	double real, imag;
-
-	fftw_complex *FFTzHx = fftw_alloc_complex(myNx*Ny*(Nz/2+1));
-	fftw_complex *FFTzHy = fftw_alloc_complex(myNx*Ny*(Nz/2+1));
-
-	// Set Plans for real FFT along z axis.
-	int rankz = 1;
-	int nz[1]  = {Nz};
-	int howmanyz = myNx*Ny;
-	int istridez = 1, ostridez = 1;
-	int idistz = Nz, odistz = Nz/2+1;
-	const int *inembedz = NULL, *onembedz = NULL;
-
-	fftw_plan FFTz_Hx_FOR_plan = fftw_plan_many_dft_r2c(rankz, nz, howmanyz, Hx_re, inembedz, istridez, idistz, \
-														FFTzHx, onembedz, ostridez, odistz, FFTW_ESTIMATE);
-
-	fftw_plan FFTz_Hy_FOR_plan = fftw_plan_many_dft_r2c(rankz, nz, howmanyz, Hy_re, inembedz, istridez, idistz, \
-														FFTzHy, onembedz, ostridez, odistz, FFTW_ESTIMATE);
-
-	// Set Plans for inverse real FFT along z axis.
-	int rankbz = 1;
-	int nbz[1]  = {Nz};
-	int howmanybz = myNx*Ny;
-	int istridebz = 1, ostridebz = 1;
-	int idistbz = Nz/2+1, odistbz = Nz;
-	const int *inembedbz = NULL, *onembedbz = NULL;
-
-	fftw_plan FFTz_Hx_BAK_plan = fftw_plan_many_dft_c2r(rankbz, nbz, howmanybz, FFTzHx, inembedbz, istridebz, idistbz, \
-														diffzHx_re, onembedbz, ostridebz, odistbz, FFTW_ESTIMATE);
+	int i, j, k, myidx;
+	real_t real, imag;
 
-	fftw_plan FFTz_Hy_BAK_plan = fftw_plan_many_dft_c2r(rankbz, nbz, howmanybz, FFTzHy, inembedbz, istridebz, idistbz, \
-														diffzHy_re, onembedbz, ostridebz, odistbz, FFTW_ESTIMATE);
+	FFTW(complex) *FFTzHx = plans->FFTz1;
+	FFTW(complex) *FFTzHy = plans->FFTz2;
 
-	// Perform 1D FFT along z-axis.
-	fftw_execute(FFTz_Hx_FOR_plan);
-	fftw_execute(FFTz_Hy_FOR_plan);
+	FFTW(execute_dft_r2c)(plans->FFTz_FOR_plan, Hx_re, FFTzHx);
+	FFTW(execute_dft_r2c)(plans->FFTz_FOR_plan, Hy_re, FFTzHy);
 
 	// Multiply ikz.
 	#pragma omp parallel for \
-		shared( \
+		shared(\
 			myNx, Ny, Nz, \
 			FFTzHx, FFTzHy, \
 			kz \
@@ -890,21 +1044,22 @@ void get_deriv_z_H_FML(
 
 				FFTzHy[myidx][0] = -kz[k] * imag;
 				FFTzHy[myidx][1] =  kz[k] * real;
-				
+
 			}
 		}
 	}
 
-	fftw_execute(FFTz_Hx_BAK_plan);
-	fftw_execute(FFTz_Hy_BAK_plan);
+	// Backward FFT.
+	FFTW(execute_dft_c2r)(plans->FFTz_BAK_plan, FFTzHx, diffzHx_re);
+	FFTW(execute_dft_c2r)(plans->FFTz_BAK_plan, FFTzHy, diffzHy_re);
 
-	// Normalize the results of pseudo-spectral method
+	// Normalize the results of pseudo-spectral method.
 	#pragma omp parallel for \
-		shared( \
+		shared(\
 			myNx, Ny, Nz, \
 			diffzHx_re, diffzHy_re \
 		) \
-		private ( \
+		private( \
 			i, j, k, myidx \
 		)
 	for(i=0; i < myNx; i++){
@@ -920,86 +1075,46 @@ void get_deriv_z_H_FML(
 		}
 	}
 
-	// Destroy the plan and free the memory.
-	fftw_destroy_plan(FFTz_Hx_FOR_plan);
-	fftw_destroy_plan(FFTz_Hy_FOR_plan);
-	fftw_destroy_plan(FFTz_Hx_BAK_plan);
-	fftw_destroy_plan(FFTz_Hy_BAK_plan);
-	fftw_free(FFTzHx);
-	fftw_free(FFTzHy);
-
 	return;
 }
 
 void get_deriv_y_H_FML(
+	FFT_plans* plans,
 	int myNx, int Ny, int Nz,
-	double* Hx_re,
-	double* Hz_re,
-	double* ky,
-	double* diffyHx_re,
-	double* diffyHz_re
+	real_t* Hx_re,
+	real_t* Hz_re,
+	real_t* ky,
+	real_t* diffyHx_re,
+	real_t* diffyHz_re
 ){
 
-	// initialize multi-threaded fftw3.
-	fftw_init_threads();
-	int nthreads = omp_get_max_threads();
-	fftw_plan_with_nthreads(nthreads);
-
 	// int for index
 	int i,j,k;
-	int myidx, myidx_i, myidx_T;
-	double real, imag;
-
-	// Memory allocation for transpose of the field data.
-	double* diffyHx_T = fftw_alloc_real(myNx*Ny*Nz);
-	double* diffyHz_T = fftw_alloc_real(myNx*Ny*Nz);
-	fftw_complex *FFTyHx_T = fftw_alloc_complex(myNx*(Ny/2+1)*Nz);
-	fftw_complex *FFTyHz_T = fftw_alloc_complex(myNx*(Ny/2+1)*Nz);
-
-	// Set Plans for real FFT along y axis.
-	int ranky = 1;
-	int ny[1]  = {Ny};
-	int howmanyy = myNx*Nz;
-	int istridey = 1, ostridey = 1;
-	int idisty = Ny, odisty = Ny/2+1;
-	const int *inembedy = NULL, *onembedy = NULL;
-
-	fftw_plan FFTy_Hx_FOR_plan = fftw_plan_many_dft_r2c(ranky, ny, howmanyy, diffyHx_T, inembedy, istridey, idisty, \
-														FFTyHx_T, onembedy, ostridey, odisty, FFTW_ESTIMATE);
-
-	fftw_plan FFTy_Hz_FOR_plan = fftw_plan_many_dft_r2c(ranky, ny, howmanyy, diffyHz_T, inembedy, istridey, idisty, \
-														FFTyHz_T, onembedy, ostridey, odisty, FFTW_ESTIMATE);
-
-	// Set Plans for inverse real FFT along y axis.
-	int rankby = 1;
-	int nby[1]  = {Ny};
-	int howmanyby = myNx*Nz;
-	int istrideby = 1, ostrideby = 1;
-	int idistby = Ny/2+1, odistby = Ny;
-	const int *inembedby = NULL, *onembedby = NULL;
+	int myidx, myidx_T;
+	real_t real, imag;
 
-	fftw_plan FFTy_Hx_BAK_plan = fftw_plan_many_dft_c2r(rankby, nby, howmanyby, FFTyHx_T, inembedby, istrideby, idistby, \
-																	diffyHx_T, onembedby, ostrideby, odistby, FFTW_ESTIMATE);
-
-	fftw_plan FFTy_Hz_BAK_plan = fftw_plan_many_dft_c2r(rankby, nby, howmanyby, FFTyHz_T, inembedby, istrideby, idistby, \
-																	diffyHz_T, onembedby, ostrideby, odistby, FFTW_ESTIMATE);
+	// Workspace for transpose of the field data.
+	real_t* diffyHx_T = plans->data_T1;
+	real_t* diffyHz_T = plans->data_T2;
+	FFTW(complex)* FFTyHx_T = plans->FFTy1;
+	FFTW(complex)* FFTyHz_T = plans->FFTy2;
 
 	// Transpose y and z axis of the Hx and Hz to get y-derivatives of them.
 	#pragma omp parallel for \
-		shared( \
+		shared(\
 			myNx, Ny, Nz, \
-			diffyHx_re, diffyHz_re, \
-			Hx_re, Hz_re, \
+			diffyHx_T, diffyHz_T, \
+			Hx_re, Hz_re \
 		) \
-		private ( \
+		private( \
 			i, j, k, myidx, myidx_T \
 		)
 	for(i=0; i < myNx; i++){
 		for(j=0; j < Ny; j++){
 			for(k=0; k < Nz; k++){
 
-				myidx   = k + j*Nz + i*Nz*Ny; // (x,y,z)
-				myidx_T = j + k*Ny + i*Nz*Ny; // (x,z,y)
+				myidx   = k + j*Nz + i*Nz*Ny;
+				myidx_T = j + k*Ny + i*Nz*Ny;
 
 				diffyHx_T[myidx_T] = Hx_re[myidx];
 				diffyHz_T[myidx_T] = Hz_re[myidx];
@@ -1008,25 +1123,25 @@ void get_deriv_y_H_FML(
 		}
 	}
 
-	// Perform 1D FFT along z-axis.
-	fftw_execute(FFTy_Hx_FOR_plan);
-	fftw_execute(FFTy_Hz_FOR_plan);
+	// Perform 1D rFFT along y-axis.
+	FFTW(execute_dft_r2c)(plans->FFTy_FOR_plan, diffyHx_T, FFTyHx_T);
+	FFTW(execute_dft_r2c)(plans->FFTy_FOR_plan, diffyHz_T, FFTyHz_T);
 
 	// Multiply iky.
 	#pragma omp parallel for \
-		shared( \
+		shared(\
 			myNx, Ny, Nz, \
 			FFTyHx_T, FFTyHz_T, \
 			ky \
 		) \
-		private ( \
+		private( \
 			i, j, k, myidx_T, real, imag \
 		)
 	for(i=0; i < myNx; i++){
 		for(k=0; k < Nz; k++){
 			for(j=0; j < (Ny/2+1); j++){
 
-				myidx_T = j + k*(Ny/2+1) + i*Nz*(Ny/2+1);
+				myidx_T = j + k*(Ny/2+1) + i*(Ny/2+1)*Nz;
 
 				real = FFTyHx_T[myidx_T][0];
 				imag = FFTyHx_T[myidx_T][1];
@@ -1045,18 +1160,18 @@ void get_deriv_y_H_FML(
 	}
 
 	// Perform Inverse FFT.
-	fftw_execute(FFTy_Hx_BAK_plan);
-	fftw_execute(FFTy_Hz_BAK_plan);
+	FFTW(execute_dft_c2r)(plans->FFTy_BAK_plan, FFTyHx_T, diffyHx_T);
+	FFTW(execute_dft_c2r)(plans->FFTy_BAK_plan, FFTyHz_T, diffyHz_T);
 
 	// Normalize the results of pseudo-spectral method. Get diffx, diffy, diffz of H field
 	#pragma omp parallel for \
-		shared( \
+		shared(\
 			myNx, Ny, Nz, \
-			FFTyHx_T, FFTyHz_T, \
-			ky \
+			diffyHx_re, diffyHx_T, \
+			diffyHz_re, diffyHz_T \
 		) \
-		private ( \
-			i, j, k, myidx_T, real, imag \
+		private( \
+			i, j, k, myidx, myidx_T \
 		)
 	for(i=0; i < myNx; i++){
 		for(j=0; j < Ny; j++){
@@ -1072,25 +1187,16 @@ void get_deriv_y_H_FML(
 		}
 	}
 
-	fftw_destroy_plan(FFTy_Hx_FOR_plan);
-	fftw_destroy_plan(FFTy_Hz_FOR_plan);
-	fftw_destroy_plan(FFTy_Hx_BAK_plan);
-	fftw_destroy_plan(FFTy_Hz_BAK_plan);
-	fftw_free(FFTyHx_T);
-	fftw_free(FFTyHz_T);
-	free(diffyHx_T);
-	free(diffyHz_T);
-
 	return;
 }
 
 void get_deriv_x_H_F00(
 	int myNx, int Ny, int Nz,
 	double dx,
-	double* Hy_re,
-	double* Hz_re,
-	double* diffxHy_re,
-	double* diffxHz_re
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re
 ){
 
 	int i, j, k, myidx, myidx_i;
@@ -1117,12 +1223,12 @@ void get_deriv_x_H_F00(
 void get_deriv_x_H_0ML(
 	int myNx, int Ny, int Nz,
 	double dx,
-	double* Hy_re,
-	double* Hz_re,
-	double* diffxHy_re,
-	double* diffxHz_re,
-	double* recvHyfirst_re,
-	double* recvHzfirst_re
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re,
+	real_t* recvHyfirst_re,
+	real_t* recvHzfirst_re
 ){
 
 	int i, j, k, myidx, myidx_i;
@@ -1160,17 +1266,57 @@ void get_deriv_x_H_0ML(
 	return;
 }
 
+void get_deriv_x_H_halo(
+	int myNx, int Ny, int Nz,
+	double dx,
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re,
+	real_t* recvHyfirst_re,
+	real_t* recvHzfirst_re
+){
+
+	// Integers for index.
+	int j, k, myidx;
+
+	// Get x derivatives of H fields at the first plane with the plane received from the previous rank.
+	#pragma omp parallel for \
+		shared( \
+			myNx, Ny, Nz, \
+			diffxHy_re, Hy_re, \
+			diffxHz_re, Hz_re, \
+			dx, \
+			recvHyfirst_re, recvHzfirst_re \
+		) \
+		private( \
+			j, k, myidx \
+		)
+	for(j=0; j < Ny; j++){
+		for(k=0; k < Nz; k++){
+
+			myidx = (k  ) + (j  )*Nz;
+
+			diffxHy_re[myidx] = (Hy_re[myidx] - recvHyfirst_re[myidx]) / dx;
+			diffxHz_re[myidx] = (Hz_re[myidx] - recvHzfirst_re[myidx]) / dx;
+
+		}
+	}
+
+	return;
+}
+
 /*
 void get_deriv_x_HyHz(
 	int MPIsize, int MPIrank,
 	int myNx, int Ny, int Nz,
 	double dx,
-	double* Hy_re,
-	double* Hz_re,
-	double* diffxHy_re,
-	double* diffxHz_re,
-	double* recvHyfirst_re,
-	double* recvHzfirst_re
+	real_t* Hy_re,
+	real_t* Hz_re,
+	real_t* diffxHy_re,
+	real_t* diffxHz_re,
+	real_t* recvHyfirst_re,
+	real_t* recvHzfirst_re
 ){
 
 	int i, j, k, myidx, myidx_i;
@@ -1209,31 +1355,29 @@ void updateE(
 	int		MPIsize,	int MPIrank,
 	int		myNx,		int		Ny,		int		Nz,	\
 	double dt,										\
-	double *Ex_re,	
-	double *Ey_re,	
-	double *Ez_re,	
-	double *eps_HEE,	double *eps_EHH,			\
-	double *econ_HEE,	double *econ_EHH,			\
-	double *diffxHy_re, 
-	double *diffxHz_re, 
-	double *diffyHx_re, 
-	double *diffyHz_re, 
-	double *diffzHx_re, 
-	double *diffzHy_re
+	real_t *Ex_re,	
+	real_t *Ey_re,	
+	real_t *Ez_re,	
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *diffxHy_re, 
+	real_t *diffxHz_re, 
+	real_t *diffyHx_re, 
+	real_t *diffyHz_re, 
+	real_t *diffzHx_re, 
+	real_t *diffzHy_re
 ){
 	/* MAIN UPDATE EQUATIONS */
 	int i,j,k;
 	int myidx;
 
-	double CEx1, CEx2;
-	double CEy1, CEy2;
-	double CEz1, CEz2;
+	real_t CEx1, CEx2;
+	real_t CEy1, CEy2;
+	real_t CEz1, CEz2;
 
 	#pragma omp parallel for \
 		shared( \
 			myNx, Ny, Nz, \
-			eps_EHH, eps_HEE, \
-			econ_EHH, econ_HEE, \
+			mat, coefE, \
 			dt, \
 			Ex_re, Ey_re, Ez_re, \
 			diffyHz_re, diffzHy_re, \
@@ -1251,26 +1395,13 @@ void updateE(
 
 				myidx   = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
 
-				CEx1 = (2.*eps_EHH[myidx] - econ_EHH[myidx]*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEy1 = (2.*eps_HEE[myidx] - econ_HEE[myidx]*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz1 = (2.*eps_HEE[myidx] - econ_HEE[myidx]*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-
-				CEx2 =	(2.*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEy2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEx1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 2, dt,  1.);
+				CEy1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
+				CEz1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
 
-				// PEC condition.
-				if(eps_EHH[myidx] > 1e3){
-					CEx1 = 0.;
-					CEx2 = 0.;
-				}
-
-				if(eps_HEE[myidx] > 1e3){
-					CEy1 = 0.;
-					CEy2 = 0.;
-					CEz1 = 0.;
-					CEz2 = 0.;
-				}
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ex.
 				Ex_re[myidx] = CEx1 * Ex_re[myidx] + CEx2 * (diffyHz_re[myidx] - diffzHy_re[myidx]);
@@ -1291,8 +1422,7 @@ void updateE(
 		#pragma omp parallel for \
 			shared( \
 				Ny, Nz, \
-				eps_EHH, eps_HEE, \
-				econ_EHH, econ_HEE, \
+				mat, coefE, \
 				dt, \
 				Ey_re, Ez_re, \
 				diffzHx_re, diffxHz_re, \
@@ -1308,19 +1438,11 @@ void updateE(
 
 				myidx   = (k  ) + (j  ) * Nz + (0  ) * Nz * Ny;
 
-				CEy1 = (2.*eps_HEE[myidx] - econ_HEE[myidx]*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz1 = (2.*eps_HEE[myidx] - econ_HEE[myidx]*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEy1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
+				CEz1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
 
-				CEy2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-
-				// PEC condition.
-				if(eps_HEE[myidx] > 1e3){
-					CEy1 = 0.;
-					CEy2 = 0.;
-					CEz1 = 0.;
-					CEz2 = 0.;
-				}
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ey.
 				Ey_re[myidx] = CEy1 * Ey_re[myidx] + CEy2 * (diffzHx_re[myidx] - diffxHz_re[myidx]);
@@ -1333,3 +1455,518 @@ void updateE(
 
 	return;
 }
+
+// Get z derivatives of F1, F2 and y derivatives of F1, F3 on a single yz plane.
+static void get_deriv_yz_plane(
+	FFT_plans* plans,
+	int Ny, int Nz,
+	real_t* ky, real_t* kz,
+	real_t* F1, real_t* F2, real_t* F3,
+	real_t* diffzF1, real_t* diffzF2,
+	real_t* diffyF1, real_t* diffyF3,
+	FFTW(complex)* FFT1, FFTW(complex)* FFT2
+){
+
+	int j, k, idx;
+	real_t real, imag;
+
+	// z derivatives.
+	FFTW(execute_dft_r2c)(plans->FFTz_plane_FOR_plan, F1, FFT1);
+	FFTW(execute_dft_r2c)(plans->FFTz_plane_FOR_plan, F2, FFT2);
+
+	for(j=0; j < Ny; j++){
+		for(k=0; k < (Nz/2+1); k++){
+
+			idx = k + j*(Nz/2+1);
+
+			real = FFT1[idx][0];
+			imag = FFT1[idx][1];
+
+			FFT1[idx][0] = -kz[k] * imag / Nz;
+			FFT1[idx][1] =  kz[k] * real / Nz;
+
+			real = FFT2[idx][0];
+			imag = FFT2[idx][1];
+
+			FFT2[idx][0] = -kz[k] * imag / Nz;
+			FFT2[idx][1] =  kz[k] * real / Nz;
+
+		}
+	}
+
+	FFTW(execute_dft_c2r)(plans->FFTz_plane_BAK_plan, FFT1, diffzF1);
+	FFTW(execute_dft_c2r)(plans->FFTz_plane_BAK_plan, FFT2, diffzF2);
+
+	// y derivatives.
+	FFTW(execute_dft_r2c)(plans->FFTy_plane_FOR_plan, F1, FFT1);
+	FFTW(execute_dft_r2c)(plans->FFTy_plane_FOR_plan, F3, FFT2);
+
+	for(j=0; j < (Ny/2+1); j++){
+		for(k=0; k < Nz; k++){
+
+			idx = k + j*Nz;
+
+			real = FFT1[idx][0];
+			imag = FFT1[idx][1];
+
+			FFT1[idx][0] = -ky[j] * imag / Ny;
+			FFT1[idx][1] =  ky[j] * real / Ny;
+
+			real = FFT2[idx][0];
+			imag = FFT2[idx][1];
+
+			FFT2[idx][0] = -ky[j] * imag / Ny;
+			FFT2[idx][1] =  ky[j] * real / Ny;
+
+		}
+	}
+
+	FFTW(execute_dft_c2r)(plans->FFTy_plane_BAK_plan, FFT1, diffyF1);
+	FFTW(execute_dft_c2r)(plans->FFTy_plane_BAK_plan, FFT2, diffyF3);
+
+	return;
+}
+
+void updateH_fused(
+	FFT_plans* plans,
+	int		MPIsize,	int MPIrank,
+	int		myNx,		int		Ny,		int		Nz,
+	int		isrt,		int		iend,
+	int		pml_xm,		int		pml_xp,
+	int		pml_ym,		int		pml_yp,
+	int		pml_zm,		int		pml_zp,
+	double	dt,			double	dx,
+	real_t *ky,			real_t *kz,
+	real_t *Hx_re,
+	real_t *Hy_re,
+	real_t *Hz_re,
+	real_t *Ex_re,
+	real_t *Ey_re,
+	real_t *Ez_re,
+	unsigned short *mat,	real_t *coefH,
+	real_t *recvEylast_re,
+	real_t *recvEzlast_re,
+	CPML* pml
+){
+	/* FUSED UPDATE EQUATIONS */
+	int i,j,k;
+	int idx, myidx, tid, inpml;
+	int cidx, psiidx;
+
+	int Nyz  = Ny*Nz;
+	int Ncpx = Ny*(Nz/2+1) > (Ny/2+1)*Nz ? Ny*(Nz/2+1) : (Ny/2+1)*Nz;
+
+	real_t CHx1, CHx2;
+	real_t CHy1, CHy2;
+	real_t CHz1, CHz2;
+
+	real_t dxEy, dxEz;
+	real_t *tzEx, *tzEy, *tyEx, *tyEz;
+	real_t *nextEy, *nextEz;
+	FFTW(complex) *FFT1, *FFT2;
+
+	#pragma omp parallel for \
+		shared(\
+			plans, MPIsize, MPIrank, \
+			myNx, Ny, Nz, Nyz, Ncpx, \
+			isrt, iend, \
+			pml_xm, pml_xp, pml_ym, pml_yp, pml_zm, pml_zp, \
+			dt, dx, ky, kz, \
+			mat, coefH, \
+			Hx_re, Hy_re, Hz_re, \
+			Ex_re, Ey_re, Ez_re, \
+			recvEylast_re, recvEzlast_re, \
+			pml \
+		) \
+		private( \
+			i, j, k, idx, myidx, tid, inpml, \
+			cidx, psiidx, \
+			CHx1, CHy1, CHz1, \
+			CHx2, CHy2, CHz2, \
+			dxEy, dxEz, \
+			tzEx, tzEy, tyEx, tyEz, \
+			nextEy, nextEz, \
+			FFT1, FFT2 \
+		)
+	for(i=isrt; i < iend; i++){
+
+		// Tiles of this thread.
+		tid  = omp_get_thread_num();
+		tzEx = plans->tile_real + (tid*4+0)*Nyz;
+		tzEy = plans->tile_real + (tid*4+1)*Nyz;
+		tyEx = plans->tile_real + (tid*4+2)*Nyz;
+		tyEz = plans->tile_real + (tid*4+3)*Nyz;
+		FFT1 = plans->tile_cplx + (tid*2+0)*Ncpx;
+		FFT2 = plans->tile_cplx + (tid*2+1)*Ncpx;
+
+		get_deriv_yz_plane(plans, Ny, Nz, ky, kz, \
+							Ex_re+i*Nyz, Ey_re+i*Nyz, Ez_re+i*Nyz, \
+							tzEx, tzEy, tyEx, tyEz, FFT1, FFT2);
+
+		// The next plane along x. The last plane of the last rank has no next plane.
+		if		(i < (myNx-1))			{ nextEy = Ey_re+(i+1)*Nyz; nextEz = Ez_re+(i+1)*Nyz; }
+		else if (MPIrank < (MPIsize-1))	{ nextEy = recvEylast_re;	nextEz = recvEzlast_re; }
+		else							{ nextEy = NULL;			nextEz = NULL; }
+
+		for(j=0; j < Ny; j++){
+			for(k=0; k < Nz; k++){
+
+				idx   = (k  ) + (j  ) * Nz;
+				myidx = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
+
+				CHx1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 0, dt, -1.);
+				CHy1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
+				CHz1 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 2, dt, -1.);
+
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+
+				// Update Hx
+				Hx_re[myidx] = CHx1 * Hx_re[myidx] + CHx2 * (tyEz[idx] - tzEy[idx]);
+
+				if (nextEy != NULL){
+
+					dxEy = (nextEy[idx] - Ey_re[myidx]) / dx;
+					dxEz = (nextEz[idx] - Ez_re[myidx]) / dx;
+
+					// Update Hy
+					Hy_re[myidx] = CHy1 * Hy_re[myidx] + CHy2 * (tzEx[idx] - dxEz);
+
+					// Update Hz
+					Hz_re[myidx] = CHz1 * Hz_re[myidx] + CHz2 * (dxEy - tyEx[idx]);
+				}
+
+				// The CPML is applied in the same sweep. The interior cells skip it.
+				inpml = (i < pml_xm) || (i >= myNx-pml_xp) || \
+						(j < pml_ym) || (j >= Ny-pml_yp) || \
+						(k < pml_zm) || (k >= Nz-pml_zp);
+
+				if (inpml){
+
+					// x+
+					if ((nextEy != NULL) && (i >= myNx-pml_xp)){
+
+						cidx   = 2*(i-(myNx-pml->npml)) + 1;
+						psiidx = k + j*Nz + (i-(myNx-pml->npml))*Nyz;
+
+						pml->hyx_p[psiidx] = (pml->bx[cidx] * pml->hyx_p[psiidx]) + (pml->ax[cidx] * dxEz);
+
+						Hy_re[myidx] += CHy2 * (-((1./pml->kappax[cidx] - 1.) * dxEz) - pml->hyx_p[psiidx]);
+
+						pml->hzx_p[psiidx] = (pml->bx[cidx] * pml->hzx_p[psiidx]) + (pml->ax[cidx] * dxEy);
+
+						Hz_re[myidx] += CHz2 * (+((1./pml->kappax[cidx] - 1.) * dxEy) + pml->hzx_p[psiidx]);
+					}
+
+					// x-
+					if ((nextEy != NULL) && (i < pml_xm)){
+
+						cidx   = 2*pml->npml - (2*i+2);
+						psiidx = k + j*Nz + i*Nyz;
+
+						pml->hyx_m[psiidx] = (pml->bx[cidx] * pml->hyx_m[psiidx]) + (pml->ax[cidx] * dxEz);
+
+						Hy_re[myidx] += CHy2 * (-((1./pml->kappax[cidx] - 1.) * dxEz) - pml->hyx_m[psiidx]);
+
+						pml->hzx_m[psiidx] = (pml->bx[cidx] * pml->hzx_m[psiidx]) + (pml->ax[cidx] * dxEy);
+
+						Hz_re[myidx] += CHz2 * (+((1./pml->kappax[cidx] - 1.) * dxEy) + pml->hzx_m[psiidx]);
+					}
+
+					// y+
+					if (j >= Ny-pml_yp){
+
+						cidx   = 2*(j-(Ny-pml->npml)) + 1;
+						psiidx = k + (j-(Ny-pml->npml))*Nz + i*Nz*pml->npml;
+
+						pml->hxy_p[psiidx] = (pml->by[cidx] * pml->hxy_p[psiidx]) + (pml->ay[cidx] * tyEz[idx]);
+
+						Hx_re[myidx] += CHx2 * (+((1./pml->kappay[cidx] - 1.) * tyEz[idx]) + pml->hxy_p[psiidx]);
+
+						if (nextEy != NULL){
+							pml->hzy_p[psiidx] = (pml->by[cidx] * pml->hzy_p[psiidx]) + (pml->ay[cidx] * tyEx[idx]);
+
+							Hz_re[myidx] += CHz2 * (-((1./pml->kappay[cidx] - 1.) * tyEx[idx]) - pml->hzy_p[psiidx]);
+						}
+					}
+
+					// y-
+					if (j < pml_ym){
+
+						cidx   = 2*pml->npml - (2*j+1);
+						psiidx = k + j*Nz + i*Nz*pml->npml;
+
+						pml->hxy_m[psiidx] = (pml->by[cidx] * pml->hxy_m[psiidx]) + (pml->ay[cidx] * tyEz[idx]);
+
+						Hx_re[myidx] += CHx2 * (+((1./pml->kappay[cidx] - 1.) * tyEz[idx]) + pml->hxy_m[psiidx]);
+
+						if (nextEy != NULL){
+							pml->hzy_m[psiidx] = (pml->by[cidx] * pml->hzy_m[psiidx]) + (pml->ay[cidx] * tyEx[idx]);
+
+							Hz_re[myidx] += CHz2 * (-((1./pml->kappay[cidx] - 1.) * tyEx[idx]) - pml->hzy_m[psiidx]);
+						}
+					}
+
+					// z+
+					if (k >= Nz-pml_zp){
+
+						cidx   = 2*(k-(Nz-pml->npml)) + 1;
+						psiidx = (k-(Nz-pml->npml)) + j*pml->npml + i*pml->npml*Ny;
+
+						pml->hxz_p[psiidx] = (pml->bz[cidx] * pml->hxz_p[psiidx]) + (pml->az[cidx] * tzEy[idx]);
+
+						Hx_re[myidx] += CHx2 * (-((1./pml->kappaz[cidx] - 1.) * tzEy[idx]) - pml->hxz_p[psiidx]);
+
+						if (nextEy != NULL){
+							pml->hyz_p[psiidx] = (pml->bz[cidx] * pml->hyz_p[psiidx]) + (pml->az[cidx] * tzEx[idx]);
+
+							Hy_re[myidx] += CHy2 * (+((1./pml->kappaz[cidx] - 1.) * tzEx[idx]) + pml->hyz_p[psiidx]);
+						}
+					}
+
+					// z-
+					if (k < pml_zm){
+
+						cidx   = 2*pml->npml - (2*k+1);
+						psiidx = k + j*pml->npml + i*pml->npml*Ny;
+
+						pml->hxz_m[psiidx] = (pml->bz[cidx] * pml->hxz_m[psiidx]) + (pml->az[cidx] * tzEy[idx]);
+
+						Hx_re[myidx] += CHx2 * (-((1./pml->kappaz[cidx] - 1.) * tzEy[idx]) - pml->hxz_m[psiidx]);
+
+						if (nextEy != NULL){
+							pml->hyz_m[psiidx] = (pml->bz[cidx] * pml->hyz_m[psiidx]) + (pml->az[cidx] * tzEx[idx]);
+
+							Hy_re[myidx] += CHy2 * (+((1./pml->kappaz[cidx] - 1.) * tzEx[idx]) + pml->hyz_m[psiidx]);
+						}
+					}
+				}
+			}
+		}
+	}
+
+	return;
+}
+
+void updateE_fused(
+	FFT_plans* plans,
+	int		MPIsize,	int MPIrank,
+	int		myNx,		int		Ny,		int		Nz,
+	int		isrt,		int		iend,
+	int		pml_xm,		int		pml_xp,
+	int		pml_ym,		int		pml_yp,
+	int		pml_zm,		int		pml_zp,
+	double	dt,			double	dx,
+	real_t *ky,			real_t *kz,
+	real_t *Ex_re,
+	real_t *Ey_re,
+	real_t *Ez_re,
+	real_t *Hx_re,
+	real_t *Hy_re,
+	real_t *Hz_re,
+	unsigned short *mat,	real_t *coefE,
+	real_t *recvHyfirst_re,
+	real_t *recvHzfirst_re,
+	CPML* pml
+){
+	/* FUSED UPDATE EQUATIONS */
+	int i,j,k;
+	int idx, myidx, tid, inpml;
+	int cidx, psiidx;
+
+	int Nyz  = Ny*Nz;
+	int Ncpx = Ny*(Nz/2+1) > (Ny/2+1)*Nz ? Ny*(Nz/2+1) : (Ny/2+1)*Nz;
+
+	real_t CEx1, CEx2;
+	real_t CEy1, CEy2;
+	real_t CEz1, CEz2;
+
+	real_t dxHy, dxHz;
+	real_t *tzHx, *tzHy, *tyHx, *tyHz;
+	real_t *prevHy, *prevHz;
+	FFTW(complex) *FFT1, *FFT2;
+
+	#pragma omp parallel for \
+		shared(\
+			plans, MPIsize, MPIrank, \
+			myNx, Ny, Nz, Nyz, Ncpx, \
+			isrt, iend, \
+			pml_xm, pml_xp, pml_ym, pml_yp, pml_zm, pml_zp, \
+			dt, dx, ky, kz, \
+			mat, coefE, \
+			Ex_re, Ey_re, Ez_re, \
+			Hx_re, Hy_re, Hz_re, \
+			recvHyfirst_re, recvHzfirst_re, \
+			pml \
+		) \
+		private( \
+			i, j, k, idx, myidx, tid, inpml, \
+			cidx, psiidx, \
+			CEx1, CEy1, CEz1, \
+			CEx2, CEy2, CEz2, \
+			dxHy, dxHz, \
+			tzHx, tzHy, tyHx, tyHz, \
+			prevHy, prevHz, \
+			FFT1, FFT2 \
+		)
+	for(i=isrt; i < iend; i++){
+
+		// Tiles of this thread.
+		tid  = omp_get_thread_num();
+		tzHx = plans->tile_real + (tid*4+0)*Nyz;
+		tzHy = plans->tile_real + (tid*4+1)*Nyz;
+		tyHx = plans->tile_real + (tid*4+2)*Nyz;
+		tyHz = plans->tile_real + (tid*4+3)*Nyz;
+		FFT1 = plans->tile_cplx + (tid*2+0)*Ncpx;
+		FFT2 = plans->tile_cplx + (tid*2+1)*Ncpx;
+
+		get_deriv_yz_plane(plans, Ny, Nz, ky, kz, \
+							Hx_re+i*Nyz, Hy_re+i*Nyz, Hz_re+i*Nyz, \
+							tzHx, tzHy, tyHx, tyHz, FFT1, FFT2);
+
+		// The previous plane along x. The first plane of the first rank has no previous plane.
+		if		(i > 0)			{ prevHy = Hy_re+(i-1)*Nyz; prevHz = Hz_re+(i-1)*Nyz; }
+		else if (MPIrank > 0)	{ prevHy = recvHyfirst_re;	prevHz = recvHzfirst_re; }
+		else					{ prevHy = NULL;			prevHz = NULL; }
+
+		for(j=0; j < Ny; j++){
+			for(k=0; k < Nz; k++){
+
+				idx   = (k  ) + (j  ) * Nz;
+				myidx = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
+
+				CEx1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 2, dt,  1.);
+				CEy1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
+				CEz1 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 0, dt,  1.);
+
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+
+				// Update Ex.
+				Ex_re[myidx] = CEx1 * Ex_re[myidx] + CEx2 * (tyHz[idx] - tzHy[idx]);
+
+				if (prevHy != NULL){
+
+					dxHy = (Hy_re[myidx] - prevHy[idx]) / dx;
+					dxHz = (Hz_re[myidx] - prevHz[idx]) / dx;
+
+					// Update Ey.
+					Ey_re[myidx] = CEy1 * Ey_re[myidx] + CEy2 * (tzHx[idx] - dxHz);
+
+					// Update Ez.
+					Ez_re[myidx] = CEz1 * Ez_re[myidx] + CEz2 * (dxHy - tyHx[idx]);
+				}
+
+				// The CPML is applied in the same sweep. The interior cells skip it.
+				inpml = (i < pml_xm) || (i >= myNx-pml_xp) || \
+						(j < pml_ym) || (j >= Ny-pml_yp) || \
+						(k < pml_zm) || (k >= Nz-pml_zp);
+
+				if (inpml){
+
+					// x+
+					if ((prevHy != NULL) && (i >= myNx-pml_xp)){
+
+						cidx   = 2*(i-(myNx-pml->npml));
+						psiidx = k + j*Nz + (i-(myNx-pml->npml))*Nyz;
+
+						pml->eyx_p[psiidx] = (pml->bx[cidx] * pml->eyx_p[psiidx]) + (pml->ax[cidx] * dxHz);
+
+						Ey_re[myidx] += CEy2 * (-(1./pml->kappax[cidx] - 1.) * dxHz - pml->eyx_p[psiidx]);
+
+						pml->ezx_p[psiidx] = (pml->bx[cidx] * pml->ezx_p[psiidx]) + (pml->ax[cidx] * dxHy);
+
+						Ez_re[myidx] += CEz2 * (+(1./pml->kappax[cidx] - 1.) * dxHy + pml->ezx_p[psiidx]);
+					}
+
+					// x-
+					if ((prevHy != NULL) && (i < pml_xm)){
+
+						cidx   = 2*pml->npml - (2*i+1);
+						psiidx = k + j*Nz + i*Nyz;
+
+						pml->eyx_m[psiidx] = (pml->bx[cidx] * pml->eyx_m[psiidx]) + (pml->ax[cidx] * dxHz);
+
+						Ey_re[myidx] += CEy2 * (-(1./pml->kappax[cidx] - 1.) * dxHz - pml->eyx_m[psiidx]);
+
+						pml->ezx_m[psiidx] = (pml->bx[cidx] * pml->ezx_m[psiidx]) + (pml->ax[cidx] * dxHy);
+
+						Ez_re[myidx] += CEz2 * (+(1./pml->kappax[cidx] - 1.) * dxHy + pml->ezx_m[psiidx]);
+					}
+
+					// y+
+					if (j >= Ny-pml_yp){
+
+						cidx   = 2*(j-(Ny-pml->npml)) + 1;
+						psiidx = k + (j-(Ny-pml->npml))*Nz + i*Nz*pml->npml;
+
+						pml->exy_p[psiidx] = (pml->by[cidx] * pml->exy_p[psiidx]) + (pml->ay[cidx] * tyHz[idx]);
+
+						Ex_re[myidx] += CEx2 * (+((1./pml->kappay[cidx] - 1.) * tyHz[idx]) + pml->exy_p[psiidx]);
+
+						if (prevHy != NULL){
+							pml->ezy_p[psiidx] = (pml->by[cidx] * pml->ezy_p[psiidx]) + (pml->ay[cidx] * tyHx[idx]);
+
+							Ez_re[myidx] += CEz2 * (-((1./pml->kappay[cidx] - 1.) * tyHx[idx]) - pml->ezy_p[psiidx]);
+						}
+					}
+
+					// y-
+					if (j < pml_ym){
+
+						cidx   = 2*pml->npml - (2*j+1);
+						psiidx = k + j*Nz + i*Nz*pml->npml;
+
+						pml->exy_m[psiidx] = (pml->by[cidx] * pml->exy_m[psiidx]) + (pml->ay[cidx] * tyHz[idx]);
+
+						Ex_re[myidx] += CEx2 * (+((1./pml->kappay[cidx] - 1.) * tyHz[idx]) + pml->exy_m[psiidx]);
+
+						if (prevHy != NULL){
+							pml->ezy_m[psiidx] = (pml->by[cidx] * pml->ezy_m[psiidx]) + (pml->ay[cidx] * tyHx[idx]);
+
+							Ez_re[myidx] += CEz2 * (-((1./pml->kappay[cidx] - 1.) * tyHx[idx]) - pml->ezy_m[psiidx]);
+						}
+					}
+
+					// z+
+					if (k >= Nz-pml_zp){
+
+						cidx   = 2*(k-(Nz-pml->npml)) + 1;
+						psiidx = (k-(Nz-pml->npml)) + j*pml->npml + i*pml->npml*Ny;
+
+						pml->exz_p[psiidx] = (pml->bz[cidx] * pml->exz_p[psiidx]) + (pml->az[cidx] * tzHy[idx]);
+
+						Ex_re[myidx] += CEx2 * (-((1./pml->kappaz[cidx] - 1.) * tzHy[idx]) - pml->exz_p[psiidx]);
+
+						if (prevHy != NULL){
+							pml->eyz_p[psiidx] = (pml->bz[cidx] * pml->eyz_p[psiidx]) + (pml->az[cidx] * tzHx[idx]);
+
+							Ey_re[myidx] += CEy2 * (+((1./pml->kappaz[cidx] - 1.) * tzHx[idx]) + pml->eyz_p[psiidx]);
+						}
+					}
+
+					// z-
+					if (k < pml_zm){
+
+						cidx   = 2*pml->npml - (2*k+1);
+						psiidx = k + j*pml->npml + i*pml->npml*Ny;
+
+						pml->exz_m[psiidx] = (pml->bz[cidx] * pml->exz_m[psiidx]) + (pml->az[cidx] * tzHy[idx]);
+
+						Ex_re[myidx] += CEx2 * (-((1./pml->kappaz[cidx] - 1.) * tzHy[idx]) - pml->exz_m[psiidx]);
+
+						if (prevHy != NULL){
+							pml->eyz_m[psiidx] = (pml->bz[cidx] * pml->eyz_m[psiidx]) + (pml->az[cidx] * tzHx[idx]);
+
+							Ey_re[myidx] += CEy2 * (+((1./pml->kappaz[cidx] - 1.) * tzHx[idx]) + pml->eyz_m[psiidx]);
+						}
+					}
+				}
+			}
+		}
+	}
+
+	return;
+}
@@ -85,50 +85,42 @@ Space.set_src_pos((Space.Nxc, Space.Nyc, Space.Nzc), (Space.Nxc+1, Space.Nyc+1,
 graphtool = plotfield.Graphtool(Space, 'TF', savedir)
 
 # Initialize the core
-Space.init_update_equations(omp_on=True)
+Space.init_update_equations(omp_on=True, fused=True)
 
 # Save what time the simulation begins.
 start_time = datetime.datetime.now()
 
-# time loop begins
-for tstep in range(Space.tsteps):
-
-	# At the start point
-	if tstep == 0:
-		Space.MPIcomm.Barrier()
-		if Space.MPIrank == 0:
-			print("Total time step: %d" %(Space.tsteps))
-			print(("Size of a total field array : %05.2f Mbytes" %(Space.TOTAL_NUM_GRID_SIZE)))
-			print("Simulation start: {}".format(datetime.datetime.now()))
-	
-	# Gaussian wave.	
-	#pulse_re = Src.pulse_re(tstep, pick_pos=pick_pos)
-	#pulse_im = Src.pulse_im(tstep, pick_pos=pick_pos)
+Space.MPIcomm.Barrier()
+if Space.MPIrank == 0:
+	print("Total time step: %d" %(Space.tsteps))
+	print(("Size of a total field array : %05.2f Mbytes" %(Space.TOTAL_NUM_GRID_SIZE)))
+	print("Simulation start: {}".format(datetime.datetime.now()))
 
-	# Sine wave.	
-	pulse_re = Src.signal(tstep)
-	#pulse_im = Src.pulse(tstep)
+# Gaussian wave.	
+#pulses = [Src.pulse_re(tstep, pick_pos=pick_pos) for tstep in range(Space.tsteps)]
 
-	#Space.put_src('Ex_re', 'Ex_im', pulse_re, 0, 'soft')
-	Space.put_src('Ey_re', pulse_re, 'soft')
-	#Space.put_src('Ez_re', 'Ez_im', pulse_re, 0, 'soft')
+# Sine wave.	
+pulses = [Src.signal(tstep) for tstep in range(Space.tsteps)]
 
-	Space.updateH(tstep)
-	Space.updateE(tstep)
+def report(tstep):
 
 	# Plot the field profile
-	if tstep % plot_per == 0:
-		#graphtool.plot2D3D('Ex', tstep, yidx=Space.Nyc, colordeep=.2, stride=2, zlim=.2)
-		graphtool.plot2D3D('Ey', tstep, yidx=Space.Nyc, colordeep=2, stride=2, zlim=2)
-		#graphtool.plot2D3D('Ez', tstep, zidx=Space.Nzc, colordeep=.2, stride=2, zlim=.2)
-		#graphtool.plot2D3D('Hx', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
-		#graphtool.plot2D3D('Hy', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
-		#graphtool.plot2D3D('Hz', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
-
-		if Space.MPIrank == 0:
-
-			interval_time = datetime.datetime.now()
-			print(("time: %s, step: %05d, %5.2f%%" %(interval_time-start_time, tstep, 100.*tstep/Space.tsteps)))
+	#graphtool.plot2D3D('Ex', tstep, yidx=Space.Nyc, colordeep=.2, stride=2, zlim=.2)
+	graphtool.plot2D3D('Ey', tstep, yidx=Space.Nyc, colordeep=2, stride=2, zlim=2)
+	#graphtool.plot2D3D('Ez', tstep, zidx=Space.Nzc, colordeep=.2, stride=2, zlim=.2)
+	#graphtool.plot2D3D('Hx', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
+	#graphtool.plot2D3D('Hy', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
+	#graphtool.plot2D3D('Hz', tstep, yidx=Space.Nyc, colordeep=1e-3, stride=2, zlim=1e-3)
+
+	if Space.MPIrank == 0:
+
+		interval_time = datetime.datetime.now()
+		print(("time: %s, step: %05d, %5.2f%%" %(interval_time-start_time, tstep, 100.*tstep/Space.tsteps)))
+
+# time loop. It comes back to python only to plot the field.
+#Space.run(Space.tsteps, src=('Ex_re', pulses, 'soft'), callbacks=[report], callbacks_every=plot_per)
+Space.run(Space.tsteps, src=('Ey_re', pulses, 'soft'), callbacks=[report], callbacks_every=plot_per)
+#Space.run(Space.tsteps, src=('Ez_re', pulses, 'soft'), callbacks=[report], callbacks_every=plot_per)
 
 if Space.MPIrank == 0:
 
@@ -97,26 +97,26 @@ leftx, rightx = int(Nx*1/4), int(Nx*3/4)
 lefty, righty = int(Ny*1/4), int(Ny*3/4)
 leftz, rightz = int(Nz*1/4), int(Nz*3/4)
 
-IF_Sx_R_calculator = rft.Sx("Sx_IF_R", "./graph/Sx", IF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True)
+IF_Sx_R_calculator = rft.Sx("Sx_IF_R", "./graph/Sx", IF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True, stride='auto')
 
-SF_Sx_L_calculator = rft.Sx("Sx_SF_L", "./graph/Sx", SF, (leftx , lefty, leftz), (leftx +1, righty, rightz), freqs, True)
-SF_Sx_R_calculator = rft.Sx("Sx_SF_R", "./graph/Sx", SF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True)
+SF_Sx_L_calculator = rft.Sx("Sx_SF_L", "./graph/Sx", SF, (leftx , lefty, leftz), (leftx +1, righty, rightz), freqs, True, stride='auto')
+SF_Sx_R_calculator = rft.Sx("Sx_SF_R", "./graph/Sx", SF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True, stride='auto')
 
-SF_Sy_L_calculator = rft.Sy("Sy_SF_L", "./graph/Sy", SF, (leftx, lefty , leftz), (rightx, lefty +1, rightz), freqs, True)
-SF_Sy_R_calculator = rft.Sy("Sy_SF_R", "./graph/Sy", SF, (leftx, righty, leftz), (rightx, righty+1, rightz), freqs, True)
+SF_Sy_L_calculator = rft.Sy("Sy_SF_L", "./graph/Sy", SF, (leftx, lefty , leftz), (rightx, lefty +1, rightz), freqs, True, stride='auto')
+SF_Sy_R_calculator = rft.Sy("Sy_SF_R", "./graph/Sy", SF, (leftx, righty, leftz), (rightx, righty+1, rightz), freqs, True, stride='auto')
 
-SF_Sz_L_calculator = rft.Sz("Sz_SF_L", "./graph/Sz", SF, (leftx, lefty, leftz ), (rightx, righty, leftz +1), freqs, True)
-SF_Sz_R_calculator = rft.Sz("Sz_SF_R", "./graph/Sz", SF, (leftx, lefty, rightz), (rightx, righty, rightz+1), freqs, True)
+SF_Sz_L_calculator = rft.Sz("Sz_SF_L", "./graph/Sz", SF, (leftx, lefty, leftz ), (rightx, righty, leftz +1), freqs, True, stride='auto')
+SF_Sz_R_calculator = rft.Sz("Sz_SF_R", "./graph/Sz", SF, (leftx, lefty, rightz), (rightx, righty, rightz+1), freqs, True, stride='auto')
 
 """
-TF_Sx_L_calculator = rft.Sx("Sx_TF_L", "./graph/Sx", TF, (leftx , lefty, leftz), (leftx +1, righty, rightz), freqs, True)
-TF_Sx_R_calculator = rft.Sx("Sx_TF_R", "./graph/Sx", TF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True)
+TF_Sx_L_calculator = rft.Sx("Sx_TF_L", "./graph/Sx", TF, (leftx , lefty, leftz), (leftx +1, righty, rightz), freqs, True, stride='auto')
+TF_Sx_R_calculator = rft.Sx("Sx_TF_R", "./graph/Sx", TF, (rightx, lefty, leftz), (rightx+1, righty, rightz), freqs, True, stride='auto')
 
-TF_Sy_L_calculator = rft.Sy("Sy_TF_L", "./graph/Sy", TF, (leftx, lefty , leftz), (rightx, lefty +1, rightz), freqs, True)
-TF_Sy_R_calculator = rft.Sy("Sy_TF_R", "./graph/Sy", TF, (leftx, righty, leftz), (rightx, righty+1, rightz), freqs, True)
+TF_Sy_L_calculator = rft.Sy("Sy_TF_L", "./graph/Sy", TF, (leftx, lefty , leftz), (rightx, lefty +1, rightz), freqs, True, stride='auto')
+TF_Sy_R_calculator = rft.Sy("Sy_TF_R", "./graph/Sy", TF, (leftx, righty, leftz), (rightx, righty+1, rightz), freqs, True, stride='auto')
 
-TF_Sz_L_calculator = rft.Sz("Sz_TF_L", "./graph/Sz", TF, (leftx, lefty, leftz ), (rightx, righty, leftz +1), freqs, True)
-TF_Sz_R_calculator = rft.Sz("Sz_TF_R", "./graph/Sz", TF, (leftx, lefty, rightz), (rightx, righty, rightz+1), freqs, True)
+TF_Sz_L_calculator = rft.Sz("Sz_TF_L", "./graph/Sz", TF, (leftx, lefty, leftz ), (rightx, righty, leftz +1), freqs, True, stride='auto')
+TF_Sz_R_calculator = rft.Sz("Sz_TF_R", "./graph/Sz", TF, (leftx, lefty, rightz), (rightx, righty, rightz+1), freqs, True, stride='auto')
 """
 # Set plotfield options
 TFgraphtool = plotfield.Graphtool(TF, 'TF', savedir)
@@ -189,7 +189,7 @@ for tstep in range(Tsteps):
     # Plot the field profile
     if tstep % plot_per == 0:
 
-        Ey = TFgraphtool.gather('Ey')
+        Ey = TFgraphtool.gather_plane('Ey', yidx=TF.Nyc)
         #TFgraphtool.plot2D3D('Ex', tstep, yidx=TF.Nyc, colordeep=2, stride=1, zlim=2)
         TFgraphtool.plot2D3D(Ey, tstep, yidx=TF.Nyc, colordeep=2, stride=1, zlim=2)
         #TFgraphtool.plot2D3D('Ez', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
@@ -197,7 +197,7 @@ for tstep in range(Tsteps):
         #TFgraphtool.plot2D3D('Hy', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
         #TFgraphtool.plot2D3D('Hz', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
 
-        Ey = IFgraphtool.gather('Ey')
+        Ey = IFgraphtool.gather_plane('Ey', yidx=IF.Nyc)
         #IFgraphtool.plot2D3D('Ex', tstep, yidx=TF.Nyc, colordeep=2, stride=1, zlim=2)
         IFgraphtool.plot2D3D(Ey, tstep, yidx=IF.Nyc, colordeep=2, stride=1, zlim=2)
         #IFgraphtool.plot2D3D('Ez', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
@@ -205,7 +205,7 @@ for tstep in range(Tsteps):
         #IFgraphtool.plot2D3D('Hy', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
         #IFgraphtool.plot2D3D('Hz', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
 
-        Ey = SFgraphtool.gather('Ey')
+        Ey = SFgraphtool.gather_plane('Ey', yidx=SF.Nyc)
         #SFgraphtool.plot2D3D('Ex', tstep, yidx=TF.Nyc, colordeep=2, stride=1, zlim=2)
         SFgraphtool.plot2D3D(Ey, tstep, yidx=SF.Nyc, colordeep=2, stride=1, zlim=2)
         #SFgraphtool.plot2D3D('Ez', tstep, xidx=TF.Nxc, colordeep=.1, stride=1, zlim=.1)
@@ -1,15 +1,25 @@
 import numpy as np
-import os, datetime, sys
+import os, datetime, sys, queue
+import multiprocessing as mp
 from scipy.constants import c
 
 class Graphtool(object):
 
-    def __init__(self, Space, name, path):
+    def __init__(self, Space, name, path, workers=0, maxqueue=4):
+        """
+        With workers > 0, rank 0 starts that many processes which draw the
+        planes given to plot2D3D. At most maxqueue planes wait for them and
+        the oldest one is dropped when a new one comes to a full queue.
+        """
 
         self.Space = Space
         self.name = name
         savedir = path + 'graph/'
         self.savedir = savedir 
+        self.planes = {}
+        self.workers = workers
+        self.dropped = 0
+        self.pool = []
 
         if self.Space.MPIrank == 0 : 
 
@@ -24,20 +34,34 @@ class Graphtool(object):
             if os.path.exists(savedir) == False: os.mkdir(savedir)
             else: pass
 
-    def gather(self, what):
+            if self.workers > 0:
+
+                # The workers are forked. They never call MPI.
+                ctx = mp.get_context('fork')
+                self.plot_queue = ctx.Queue(maxsize=maxqueue)
+                self.pool = [ctx.Process(target=_plot_worker, args=(self.plot_queue,), daemon=True) for i in range(self.workers)]
+
+                for worker in self.pool: worker.start()
+
+    def gather(self, what, member=0):
         """
         Gather the data resident in rank >0 to rank 0.
+        With batch > 1, member chooses the excitation.
         """
         ###################################################################################
         ###################### Gather field data from all slave nodes #####################
         ###################################################################################
         
-        if   what == 'Ex': gathered = self.Space.MPIcomm.gather(self.Space.Ex_re, root=0)
-        elif what == 'Ey': gathered = self.Space.MPIcomm.gather(self.Space.Ey_re, root=0)
-        elif what == 'Ez': gathered = self.Space.MPIcomm.gather(self.Space.Ez_re, root=0)
-        elif what == 'Hx': gathered = self.Space.MPIcomm.gather(self.Space.Hx_re, root=0)
-        elif what == 'Hy': gathered = self.Space.MPIcomm.gather(self.Space.Hy_re, root=0)
-        elif what == 'Hz': gathered = self.Space.MPIcomm.gather(self.Space.Hz_re, root=0)
+        if   what == 'Ex': field = self.Space.Ex_re
+        elif what == 'Ey': field = self.Space.Ey_re
+        elif what == 'Ez': field = self.Space.Ez_re
+        elif what == 'Hx': field = self.Space.Hx_re
+        elif what == 'Hy': field = self.Space.Hy_re
+        elif what == 'Hz': field = self.Space.Hz_re
+
+        if self.Space.batch > 1: field = field[member]
+
+        gathered = self.Space.MPIcomm.gather(field, root=0)
 
         self.what = what
 
@@ -46,7 +70,8 @@ class Graphtool(object):
             self.integrated = np.zeros((self.Space.grid), dtype=self.Space.dtype)
 
             for MPIrank in range(self.Space.MPIsize):
-                self.integrated[self.Space.myNx_slices[MPIrank],:,:] = gathered[MPIrank]
+                MPIxrank, MPIyrank = divmod(MPIrank, self.Space.MPIysize)
+                self.integrated[self.Space.myNx_slices[MPIxrank],self.Space.myNy_slices[MPIyrank],:] = gathered[MPIrank]
 
                 #if MPIrank == 1: print(MPIrank, gathered[MPIrank][xidx,yidx,zidx])
 
@@ -54,64 +79,127 @@ class Graphtool(object):
 
         else: return None
 
+    def gather_plane(self, what, xidx=None, yidx=None, zidx=None, member=0):
+        """
+        Gather one plane of the field to rank 0 with a buffer based Gatherv.
+        Only the ranks which own the plane send their part of it.
+        The plane is returned at rank 0 as a 2D array which plot2D3D takes
+        with the same xidx, yidx or zidx. Other ranks get None.
+        """
+
+        if   xidx != None: key = ('x', xidx)
+        elif yidx != None: key = ('y', yidx)
+        elif zidx != None: key = ('z', zidx)
+        else: raise ValueError("Plane is not defined. Please insert one of x,y or z index of the plane.")
+
+        if key not in self.planes: self.planes[key] = self._plane_layout(*key)
+
+        local, counts, displs, blocks, recvbuf, plane = self.planes[key]
+
+        field = getattr(self.Space, what+'_re')
+
+        if self.Space.batch > 1: field = field[member]
+
+        if local is None: sendbuf = np.zeros(0, dtype=self.Space.dtype)
+        else            : sendbuf = np.ascontiguousarray(field[local])
+
+        if self.Space.MPIrank == 0: self.Space.MPIcomm.Gatherv(sendbuf, [recvbuf, (counts, displs)], root=0)
+        else                      : self.Space.MPIcomm.Gatherv(sendbuf, None, root=0)
+
+        self.what = what
+
+        if self.Space.MPIrank == 0:
+
+            for displ, (where, shape) in zip(displs, blocks):
+                if where is not None: plane[where] = recvbuf[displ:displ+np.prod(shape)].reshape(shape)
+
+            return plane
+
+        else: return None
+
+    def _plane_layout(self, axis, idx):
+        """
+        The local slice of this rank, the counts and displacements of Gatherv
+        and the place of every rank's block in the plane.
+        """
+
+        Space = self.Space
+
+        counts = []
+        blocks = []
+
+        for MPIrank in range(Space.MPIsize):
+
+            MPIxrank, MPIyrank = divmod(MPIrank, Space.MPIysize)
+
+            xsrt, xend = Space.myNx_indice[MPIxrank]
+            ysrt, yend = Space.myNy_indice[MPIyrank]
+
+            if   axis == 'x' and xsrt <= idx < xend:
+                where = (slice(ysrt, yend), slice(None))
+                shape = (yend-ysrt, Space.Nz)
+
+            elif axis == 'y' and ysrt <= idx < yend:
+                where = (slice(xsrt, xend), slice(None))
+                shape = (xend-xsrt, Space.Nz)
+
+            elif axis == 'z':
+                where = (slice(xsrt, xend), slice(ysrt, yend))
+                shape = (xend-xsrt, yend-ysrt)
+
+            else: where, shape = None, (0,)
+
+            if MPIrank == Space.MPIrank:
+
+                if   where is None: local = None
+                elif axis == 'x'  : local = (idx-xsrt, slice(None), slice(None))
+                elif axis == 'y'  : local = (slice(None), idx-ysrt, slice(None))
+                elif axis == 'z'  : local = (slice(None), slice(None), idx)
+
+            counts.append(int(np.prod(shape)))
+            blocks.append((where, shape))
+
+        displs = [sum(counts[:MPIrank]) for MPIrank in range(Space.MPIsize)]
+
+        if   axis == 'x': plane_shape = (Space.Ny, Space.Nz)
+        elif axis == 'y': plane_shape = (Space.Nx, Space.Nz)
+        elif axis == 'z': plane_shape = (Space.Nx, Space.Ny)
+
+        if Space.MPIrank == 0:
+            recvbuf = np.zeros(sum(counts), dtype=Space.dtype)
+            plane   = np.zeros(plane_shape, dtype=Space.dtype)
+        else: recvbuf, plane = None, None
+
+        return local, counts, displs, blocks, recvbuf, plane
+
     def plot2D3D(self, integrated, tstep, xidx=None, yidx=None, zidx=None, **kwargs):
+        """
+        Plot a plane of the field at rank 0.
+        With workers > 0 the plane is handed to the plotting processes and
+        the time loop goes on while they draw. Otherwise it is drawn here.
+        """
 
         if self.Space.MPIrank == 0: 
 
-            try:
-                import matplotlib.pyplot as plt
-                from mpl_toolkits.mplot3d import axes3d
-                from mpl_toolkits.axes_grid1 import make_axes_locatable
-
-            except ImportError as err:
-                print("Please install matplotlib at rank 0")
-                sys.exit()
-
-            colordeep = .1
-            stride    = 1
-            zlim      = 1
-            figsize   = (18, 8)
-            cmap      = plt.cm.bwr
-            lc = 'b'
-            aspect = 'auto'
-
-            for key, value in kwargs.items():
-
-                if   key == 'colordeep': colordeep = value
-                elif key == 'figsize': figsize = value
-                elif key == 'aspect': aspect = value
-                elif key == 'stride': stride = value
-                elif key == 'what': self.what = value
-                elif key == 'zlim': zlim = value
-                elif key == 'cmap': cmap = value
-                elif key == 'lc': lc = value
+            if 'what' in kwargs: self.what = kwargs.pop('what')
 
             if xidx != None : 
                 assert type(xidx) == int
                 yidx  = slice(None,None) # indices from beginning to end
                 zidx  = slice(None,None)
                 plane = 'yz'
-                col = np.arange(self.Space.Ny)
-                row = np.arange(self.Space.Nz)
-                plane_to_plot = np.zeros((len(col),len(row)), dtype=self.Space.dtype)
 
             elif yidx != None :
                 assert type(yidx) == int
                 xidx  = slice(None,None)
                 zidx  = slice(None,None)
                 plane = 'xz'
-                col = np.arange(self.Space.Nx)
-                row = np.arange(self.Space.Nz)
-                plane_to_plot = np.zeros((len(col), len(row)), dtype=self.Space.dtype)
 
             elif zidx != None :
                 assert type(zidx) == int
                 xidx  = slice(None,None)
                 yidx  = slice(None,None)
                 plane = 'xy'
-                col = np.arange(self.Space.Nx)
-                row = np.arange(self.Space.Ny)
-                plane_to_plot = np.zeros((len(col),len(row)), dtype=self.Space.dtype)
         
             elif (xidx,yidx,zidx) == (None,None,None):
                 raise ValueError("Plane is not defined. Please insert one of x,y or z index of the plane.")
@@ -120,79 +208,158 @@ class Graphtool(object):
             ######### Build up total field with the parts of the grid from slave nodes ##########
             #####################################################################################
 
-            self.plane_to_plot_re = integrated[xidx, yidx, zidx].copy()
+            if integrated.ndim == 2: self.plane_to_plot_re = integrated.copy()
+            else                  : self.plane_to_plot_re = integrated[xidx, yidx, zidx].copy()
+
+            job = (self.plane_to_plot_re, plane, self.what, tstep, self.savedir, self.name, kwargs)
+
+            if self.workers == 0: _render2D3D(*job)
+            else:
+
+                # Drop the oldest waiting plane when the queue is full.
+                while True:
+                    try:
+                        self.plot_queue.put_nowait(job)
+                        break
+                    except queue.Full:
+                        try:
+                            self.plot_queue.get_nowait()
+                            self.dropped += 1
+                        except queue.Empty: pass
+
+    def close(self):
+        """
+        Wait for the plotting processes to draw the planes in the queue.
+        """
+
+        if self.Space.MPIrank == 0 and self.workers > 0:
+
+            for worker in self.pool: self.plot_queue.put(None)
+            for worker in self.pool: worker.join()
+
+            if self.dropped > 0: print("{} planes were dropped by the plotting queue." .format(self.dropped))
+
+            self.pool = []
+            self.workers = 0
+
+
+def _plot_worker(plot_queue):
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    while True:
+
+        job = plot_queue.get()
+
+        if job is None: break
+
+        _render2D3D(*job)
+
+
+def _render2D3D(plane_to_plot_re, plane, what, tstep, savedir, name, kwargs):
+
+    try:
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import axes3d
+        from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+    except ImportError as err:
+        print("Please install matplotlib at rank 0")
+        sys.exit()
+
+    colordeep = .1
+    stride    = 1
+    zlim      = 1
+    figsize   = (18, 8)
+    cmap      = plt.cm.bwr
+    lc = 'b'
+    aspect = 'auto'
+
+    for key, value in kwargs.items():
+
+        if   key == 'colordeep': colordeep = value
+        elif key == 'figsize': figsize = value
+        elif key == 'aspect': aspect = value
+        elif key == 'stride': stride = value
+        elif key == 'zlim': zlim = value
+        elif key == 'cmap': cmap = value
+        elif key == 'lc': lc = value
+
+    col = np.arange(plane_to_plot_re.shape[0])
+    row = np.arange(plane_to_plot_re.shape[1])
 
-            Row, Col = np.meshgrid(row, col, indexing='xy', sparse=True)
-            today    = datetime.date.today()
+    Row, Col = np.meshgrid(row, col, indexing='xy', sparse=True)
+    today    = datetime.date.today()
 
-            fig  = plt.figure(figsize=figsize)
-            ax11 = fig.add_subplot(1,2,1)
-            ax12 = fig.add_subplot(1,2,2, projection='3d')
+    fig  = plt.figure(figsize=figsize)
+    ax11 = fig.add_subplot(1,2,1)
+    ax12 = fig.add_subplot(1,2,2, projection='3d')
 
-            if plane == 'yz':
+    if plane == 'yz':
 
-                image11 = ax11.imshow(self.plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
-                ax12.plot_wireframe(Col, Row, self.plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
+        image11 = ax11.imshow(plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
+        ax12.plot_wireframe(Col, Row, plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
 
-                divider11 = make_axes_locatable(ax11)
+        divider11 = make_axes_locatable(ax11)
 
-                cax11  = divider11.append_axes('right', size='5%', pad=0.1)
-                cbar11 = fig.colorbar(image11, cax=cax11)
+        cax11  = divider11.append_axes('right', size='5%', pad=0.1)
+        cbar11 = fig.colorbar(image11, cax=cax11)
 
-                ax11.invert_yaxis()
-                #ax12.invert_yaxis()
+        ax11.invert_yaxis()
+        #ax12.invert_yaxis()
 
-                ax11.set_xlabel('y')
-                ax11.set_ylabel('z')
-                ax12.set_xlabel('y')
-                ax12.set_ylabel('z')
+        ax11.set_xlabel('y')
+        ax11.set_ylabel('z')
+        ax12.set_xlabel('y')
+        ax12.set_ylabel('z')
 
-            elif plane == 'xy':
+    elif plane == 'xy':
 
-                image11 = ax11.imshow(self.plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
-                ax12.plot_wireframe(Col, Row, self.plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
+        image11 = ax11.imshow(plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
+        ax12.plot_wireframe(Col, Row, plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
 
-                divider11 = make_axes_locatable(ax11)
+        divider11 = make_axes_locatable(ax11)
 
-                cax11  = divider11.append_axes('right', size='5%', pad=0.1)
-                cbar11 = fig.colorbar(image11, cax=cax11)
+        cax11  = divider11.append_axes('right', size='5%', pad=0.1)
+        cbar11 = fig.colorbar(image11, cax=cax11)
 
-                ax11.invert_yaxis()
-                #ax12.invert_yaxis()
+        ax11.invert_yaxis()
+        #ax12.invert_yaxis()
 
-                ax11.set_xlabel('x')
-                ax11.set_ylabel('y')
-                ax12.set_xlabel('x')
-                ax12.set_ylabel('y')
+        ax11.set_xlabel('x')
+        ax11.set_ylabel('y')
+        ax12.set_xlabel('x')
+        ax12.set_ylabel('y')
 
-            elif plane == 'xz':
+    elif plane == 'xz':
 
-                image11 = ax11.imshow(self.plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
-                ax12.plot_wireframe(Col, Row, self.plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
+        image11 = ax11.imshow(plane_to_plot_re.T, vmax=colordeep, vmin=-colordeep, cmap=cmap, aspect=aspect)
+        ax12.plot_wireframe(Col, Row, plane_to_plot_re[Col, Row], color=lc, rstride=stride, cstride=stride)
 
-                divider11 = make_axes_locatable(ax11)
+        divider11 = make_axes_locatable(ax11)
 
-                cax11  = divider11.append_axes('right', size='5%', pad=0.1)
-                cbar11 = fig.colorbar(image11, cax=cax11)
+        cax11  = divider11.append_axes('right', size='5%', pad=0.1)
+        cbar11 = fig.colorbar(image11, cax=cax11)
 
-                #ax11.invert_yaxis()
-                ax12.invert_yaxis()
+        #ax11.invert_yaxis()
+        ax12.invert_yaxis()
 
-                ax11.set_xlabel('x')
-                ax11.set_ylabel('z')
-                ax12.set_xlabel('x')
-                ax12.set_ylabel('z')
+        ax11.set_xlabel('x')
+        ax11.set_ylabel('z')
+        ax12.set_xlabel('x')
+        ax12.set_ylabel('z')
 
-            ax11.set_title(r'$%s.real, 2D$' %self.what)
-            ax12.set_title(r'$%s.real, 3D$' %self.what)
+    ax11.set_title(r'$%s.real, 2D$' %what)
+    ax12.set_title(r'$%s.real, 3D$' %what)
 
-            ax12.set_zlim(-zlim,zlim)
-            ax12.set_zlabel('field')
+    ax12.set_zlim(-zlim,zlim)
+    ax12.set_zlabel('field')
 
-            foldername = 'plot2D3D/'
-            save_dir   = self.savedir + foldername
+    foldername = 'plot2D3D/'
+    save_dir   = savedir + foldername
 
-            if os.path.exists(save_dir) == False: os.mkdir(save_dir)
-            plt.tight_layout()
-            fig.savefig('%s%s_%s_%s_%s_%s.png' %(save_dir, str(today), self.name,self.what, plane, tstep), format='png', bbox_inches='tight')
-            plt.close('all')
+    os.makedirs(save_dir, exist_ok=True)
+    plt.tight_layout()
+    fig.savefig('%s%s_%s_%s_%s_%s.png' %(save_dir, str(today), name,what, plane, tstep), format='png', bbox_inches='tight')
+    plt.close('all')
@@ -3,6 +3,17 @@
 #include <omp.h>
 #include <math.h>
 
+/*
+	Precision of the fields.
+	Compile with -DSINGLE_PRECISION to get the float32 kernels.
+	space.py loads them as pml.f32.so and pml.omp.f32.so when Space.dtype is np.float32.
+*/
+#ifdef SINGLE_PRECISION
+typedef float real_t;
+#else
+typedef double real_t;
+#endif
+
 /*
 	Auther: Donggun Lee
 	Date  : 18.07.24
@@ -31,6 +42,26 @@
 	void PML_updateE_mz();
 */
 
+// Update coefficient q of the cell idx. q = 0, 1 are C1, C2 at the HEE position and q = 2, 3 at the EHH position.
+// With materials='compact', coef is the table of (nmat, 4) coefficients and mat the material index of each cell.
+// With materials='dense', mat is NULL and coef holds four material arrays of ncell values each:
+// mu (eps) at HEE and EHH, then the magnetic (electric) conductivity at HEE and EHH.
+// The coefficient is then computed for the cell. sign is -1 for H and +1 for E field, where eps > 1e3 is PEC.
+static inline real_t cell_coef(unsigned short *mat, real_t *coef, long ncell, int idx, int q, double dt, double sign){
+
+	double m, s;
+
+	if (mat != NULL) return coef[4*mat[idx] + q];
+
+	m = coef[(q/2  )*ncell + idx];
+	s = coef[(q/2+2)*ncell + idx];
+
+	if (sign > 0 && m > 1e3) return 0.;
+
+	if (q % 2 == 0) return (2.*m - s*dt) / (2.*m + s*dt);
+	else			return (sign*2.*dt) / (2.*m + s*dt);
+}
+
 /***********************************************************************************/
 /******************************** FUNCTION DECLARATION *****************************/
 /***********************************************************************************/
@@ -39,58 +70,54 @@
 void PML_updateH_px(												\
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hy_re,			
-	double *Hz_re,			
-	double *diffxEy_re,		
-	double *diffxEz_re,		
-	double *psi_hyx_p_re,	
-	double *psi_hzx_p_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hy_re,			
+	real_t *Hz_re,			
+	real_t *diffxEy_re,		
+	real_t *diffxEz_re,		
+	real_t *psi_hyx_p_re,	
+	real_t *psi_hzx_p_re
 );
 
 void PML_updateE_px(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ey_re,			
-	double *Ez_re,			
-	double *diffxHy_re,		
-	double *diffxHz_re,		
-	double *psi_eyx_p_re,
-	double *psi_ezx_p_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ey_re,			
+	real_t *Ez_re,			
+	real_t *diffxHy_re,		
+	real_t *diffxHz_re,		
+	real_t *psi_eyx_p_re,
+	real_t *psi_ezx_p_re
 );
 
 // PML at x-.
 void PML_updateH_mx(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hy_re,			
-	double *Hz_re,			
-	double *diffxEy_re,		
-	double *diffxEz_re,		
-	double *psi_hyx_m_re,	
-	double *psi_hzx_m_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hy_re,			
+	real_t *Hz_re,			
+	real_t *diffxEy_re,		
+	real_t *diffxEz_re,		
+	real_t *psi_hyx_m_re,	
+	real_t *psi_hzx_m_re
 );
 
 void PML_updateE_mx(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ey_re,			
-	double *Ez_re,			
-	double *diffxHy_re,	
-	double *diffxHz_re,
-	double *psi_eyx_m_re,
-	double *psi_ezx_m_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ey_re,			
+	real_t *Ez_re,			
+	real_t *diffxHy_re,	
+	real_t *diffxHz_re,
+	real_t *psi_eyx_m_re,
+	real_t *psi_ezx_m_re
 );
 
 // PML at y+.
@@ -98,30 +125,28 @@ void PML_updateH_py(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,	
-	double *Hz_re,	
-	double *diffyEx_re,
-	double *diffyEz_re,
-	double *psi_hxy_p_re,	
-	double *psi_hzy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,	
+	real_t *Hz_re,	
+	real_t *diffyEx_re,
+	real_t *diffyEz_re,
+	real_t *psi_hxy_p_re,	
+	real_t *psi_hzy_p_re
 );
 
 void PML_updateE_py(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,		
-	double *Ez_re,		
-	double *diffyHx_re,	
-	double *diffyHz_re,	
-	double *psi_exy_p_re,
-	double *psi_ezy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,		
+	real_t *Ez_re,		
+	real_t *diffyHx_re,	
+	real_t *diffyHz_re,	
+	real_t *psi_exy_p_re,
+	real_t *psi_ezy_p_re
 );
 
 // PML at y-.
@@ -129,29 +154,27 @@ void PML_updateH_my(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,	
-	double *Hz_re,	
-	double *diffyEx_re,
-	double *diffyEz_re,
-	double *psi_hxy_p_re,	
-	double *psi_hzy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,	
+	real_t *Hz_re,	
+	real_t *diffyEx_re,
+	real_t *diffyEz_re,
+	real_t *psi_hxy_p_re,	
+	real_t *psi_hzy_p_re
 );
 void PML_updateE_my(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,		
-	double *Ez_re,		
-	double *diffyHx_re,	
-	double *diffyHz_re,	
-	double *psi_exy_p_re,
-	double *psi_ezy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,		
+	real_t *Ez_re,		
+	real_t *diffyHx_re,	
+	real_t *diffyHz_re,	
+	real_t *psi_exy_p_re,
+	real_t *psi_ezy_p_re
 );
 
 // PML at z+.
@@ -159,30 +182,28 @@ void PML_updateH_pz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,		
-	double *Hy_re,		
-	double *diffzEx_re,	
-	double *diffzEy_re,	
-	double *psi_hxz_p_re,	
-	double *psi_hyz_p_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,		
+	real_t *Hy_re,		
+	real_t *diffzEx_re,	
+	real_t *diffzEy_re,	
+	real_t *psi_hxz_p_re,	
+	real_t *psi_hyz_p_re
 );
 
 void PML_updateE_pz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,			
-	double *Ey_re,			
-	double *diffzHx_re,		
-	double *diffzHy_re,		
-	double *psi_exz_p_re,	
-	double *psi_eyz_p_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,			
+	real_t *Ey_re,			
+	real_t *diffzHx_re,		
+	real_t *diffzHy_re,		
+	real_t *psi_exz_p_re,	
+	real_t *psi_eyz_p_re
 );
 
 // PML at z-.
@@ -190,29 +211,27 @@ void PML_updateH_mz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,			
-	double *Hy_re,			
-	double *diffzEx_re,	
-	double *diffzEy_re,	
-	double *psi_hxz_m_re,
-	double *psi_hyz_m_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,			
+	real_t *Hy_re,			
+	real_t *diffzEx_re,	
+	real_t *diffzEy_re,	
+	real_t *psi_hxz_m_re,
+	real_t *psi_hyz_m_re
 );
 void PML_updateE_mz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,		
-	double *Ey_re,		
-	double *diffzHx_re,	
-	double *diffzHy_re,	
-	double *psi_exz_m_re,
-	double *psi_eyz_m_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,		
+	real_t *Ey_re,		
+	real_t *diffzHx_re,	
+	real_t *diffzHy_re,	
+	real_t *psi_exz_m_re,
+	real_t *psi_eyz_m_re
 );
 
 /***********************************************************************************/
@@ -223,15 +242,14 @@ void PML_updateE_mz(
 void PML_updateH_px(											\
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hy_re,			
-	double *Hz_re,			
-	double *diffxEy_re,		
-	double *diffxEz_re,		
-	double *psi_hyx_p_re,	
-	double *psi_hzx_p_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hy_re,			
+	real_t *Hz_re,			
+	real_t *diffxEy_re,		
+	real_t *diffxEz_re,		
+	real_t *psi_hyx_p_re,	
+	real_t *psi_hzx_p_re
 ){
 
 	int i,j,k;
@@ -239,13 +257,12 @@ void PML_updateH_px(											\
 	int psiidx, myidx;
 	
 	//printf("Here?\n");
-	double CHy2, CHz2;
+	real_t CHy2, CHz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappax, PMLbx, PMLax,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hy_re, \
 				Hz_re, \
 				diffxEy_re, \
@@ -261,8 +278,8 @@ void PML_updateH_px(											\
 				psiidx = (k  ) + (j  ) * Nz + (i          ) * Nz * Ny;
 				myidx  = (k  ) + (j  ) * Nz + (i+myNx-npml) * Nz * Ny;
 
-				CHy2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hy
 				psi_hyx_p_re[psiidx] = (PMLbx[odd] * psi_hyx_p_re[psiidx]) + (PMLax[odd] * diffxEz_re[myidx]);
@@ -283,29 +300,27 @@ void PML_updateH_px(											\
 void PML_updateE_px(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ey_re,			
-	double *Ez_re,			
-	double *diffxHy_re,		
-	double *diffxHz_re,		
-	double *psi_eyx_p_re,	
-	double *psi_ezx_p_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ey_re,			
+	real_t *Ez_re,			
+	real_t *diffxHy_re,		
+	real_t *diffxHz_re,		
+	real_t *psi_eyx_p_re,	
+	real_t *psi_ezx_p_re
 ){
 
 	int i,j,k;
 	int even;
 	int psiidx, myidx;
 	
-	double CEy2, CEz2;
+	real_t CEy2, CEz2;
 
 	#pragma omp parallel for				\
 		shared(	npml, myNx, Ny, Nz,			\
 				dt,							\
 				PMLkappax,	PMLbx,	PMLax,	\
-				eps_EHH,	eps_HEE,		\
-				econ_EHH,	econ_HEE,		\
+				mat, coefE,		\
 				Ey_re,		\
 				Ez_re,		\
 				diffxHy_re, \
@@ -321,8 +336,8 @@ void PML_updateE_px(
 				psiidx = (k  ) + (j  ) * Nz + (i          ) * Nz * Ny;
 				myidx  = (k  ) + (j  ) * Nz + (i+myNx-npml) * Nz * Ny;
 
-				CEy2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ey.
 				psi_eyx_p_re[psiidx] = (PMLbx[even] * psi_eyx_p_re[psiidx]) + (PMLax[even] * diffxHz_re[myidx]);
@@ -345,28 +360,26 @@ void PML_updateE_px(
 void PML_updateH_mx(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hy_re,			
-	double *Hz_re,			
-	double *diffxEy_re,		
-	double *diffxEz_re,		
-	double *psi_hyx_m_re,	
-	double *psi_hzx_m_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hy_re,			
+	real_t *Hz_re,			
+	real_t *diffxEy_re,		
+	real_t *diffxEz_re,		
+	real_t *psi_hyx_m_re,	
+	real_t *psi_hzx_m_re
 ){
 
 	int i,j,k;
 	int even;
 	int psiidx, myidx;
 	
-	double CHy2, CHz2;
+	real_t CHy2, CHz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappax, PMLbx, PMLax,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hy_re, \
 				Hz_re, \
 				diffxEy_re, \
@@ -382,8 +395,8 @@ void PML_updateH_mx(
 				psiidx = (k  ) + (j  ) * Nz + (i          ) * Nz * Ny;
 				myidx  = (k  ) + (j  ) * Nz + (i		  ) * Nz * Ny;
 
-				CHy2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hy
 				psi_hyx_m_re[psiidx] = (PMLbx[even] * psi_hyx_m_re[psiidx]) + (PMLax[even] * diffxEz_re[myidx]);
@@ -403,28 +416,26 @@ void PML_updateH_mx(
 void PML_updateE_mx(
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappax,		double *PMLbx,	double *PMLax,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ey_re,			
-	double *Ez_re,			
-	double *diffxHy_re,		
-	double *diffxHz_re,		
-	double *psi_eyx_m_re,
-	double *psi_ezx_m_re
+	real_t *PMLkappax,		real_t *PMLbx,	real_t *PMLax,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ey_re,			
+	real_t *Ez_re,			
+	real_t *diffxHy_re,		
+	real_t *diffxHz_re,		
+	real_t *psi_eyx_m_re,
+	real_t *psi_ezx_m_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CEy2, CEz2;
+	real_t CEy2, CEz2;
 
 	#pragma omp parallel for				\
 		shared(	npml, myNx, Ny, Nz,			\
 				dt,							\
 				PMLkappax,	PMLbx,	PMLax,	\
-				eps_EHH,	eps_HEE,		\
-				econ_EHH,	econ_HEE,		\
+				mat, coefE,		\
 				Ey_re,		\
 				Ez_re,		\
 				diffxHy_re, \
@@ -440,8 +451,8 @@ void PML_updateE_mx(
 				psiidx = (k  ) + (j  ) * Nz + (i          ) * Nz * Ny;
 				myidx  = (k  ) + (j  ) * Nz + (i		  ) * Nz * Ny;
 
-				CEy2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
-				CEz2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ey.
 				psi_eyx_m_re[psiidx] = (PMLbx[odd] * psi_eyx_m_re[psiidx]) + (PMLax[odd] * diffxHz_re[myidx]);
@@ -464,27 +475,25 @@ void PML_updateH_py(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,			
-	double *Hz_re,			
-	double *diffyEx_re,		
-	double *diffyEz_re,		
-	double *psi_hxy_p_re,	
-	double *psi_hzy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,			
+	real_t *Hz_re,			
+	real_t *diffyEx_re,		
+	real_t *diffyEz_re,		
+	real_t *psi_hxy_p_re,	
+	real_t *psi_hzy_p_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CHx2, CHz2;
+	real_t CHx2, CHz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappay, PMLby, PMLay,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hx_re, \
 				Hz_re, \
 				diffyEx_re, \
@@ -501,8 +510,8 @@ void PML_updateH_py(
 				myidx  = (k  ) + (j+Ny-npml) * Nz + (i  ) * Nz * Ny;
 				//if(i==0){printf("%d has %d\n", omp_get_thread_num(), psiidx);};
 
-				CHx2 =	(-2*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hx
 				psi_hxy_p_re[psiidx] = (PMLby[odd] * psi_hxy_p_re[psiidx]) + (PMLay[odd] * diffyEz_re[myidx]);
@@ -531,27 +540,25 @@ void PML_updateE_py(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,			
-	double *Ez_re,			
-	double *diffyHx_re,		
-	double *diffyHz_re,	
-	double *psi_exy_p_re,
-	double *psi_ezy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,			
+	real_t *Ez_re,			
+	real_t *diffyHx_re,		
+	real_t *diffyHz_re,	
+	real_t *psi_exy_p_re,
+	real_t *psi_ezy_p_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CEx2, CEz2;
+	real_t CEx2, CEz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappay, PMLby, PMLay,\
-				eps_HEE,	eps_EHH,	\
-				econ_HEE,	econ_EHH,	\
+				mat, coefE,	\
 				Ex_re, \
 				Ez_re, \
 				diffyHx_re, \
@@ -567,8 +574,8 @@ void PML_updateE_py(
 				psiidx = (k  ) + (j		   ) * Nz + (i  ) * Nz * npml;
 				myidx  = (k  ) + (j+Ny-npml) * Nz + (i  ) * Nz * Ny;
 
-				CEx2 =	(2*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEz2 =	(2*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ex
 				psi_exy_p_re[psiidx] = (PMLby[odd] * psi_exy_p_re[psiidx]) + (PMLay[odd] * diffyHz_re[myidx]);
@@ -597,27 +604,25 @@ void PML_updateH_my(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,			
-	double *Hz_re,			
-	double *diffyEx_re,		
-	double *diffyEz_re,		
-	double *psi_hxy_p_re,	
-	double *psi_hzy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,			
+	real_t *Hz_re,			
+	real_t *diffyEx_re,		
+	real_t *diffyEz_re,		
+	real_t *psi_hxy_p_re,	
+	real_t *psi_hzy_p_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CHx2, CHz2;
+	real_t CHx2, CHz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappay, PMLby, PMLay,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hx_re, \
 				Hz_re, \
 				diffyEx_re, \
@@ -634,8 +639,8 @@ void PML_updateH_my(
 				myidx  = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
 				//if(i==0){printf("%d has %d\n", omp_get_thread_num(), psiidx);};
 
-				CHx2 =	(-2*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHz2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHz2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hx
 				psi_hxy_p_re[psiidx] = (PMLby[odd] * psi_hxy_p_re[psiidx]) + (PMLay[odd] * diffyEz_re[myidx]);
@@ -663,27 +668,25 @@ void PML_updateE_my(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappay,		double *PMLby,	double *PMLay,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,			
-	double *Ez_re,			
-	double *diffyHx_re,		
-	double *diffyHz_re,		
-	double *psi_exy_p_re,	
-	double *psi_ezy_p_re
+	real_t *PMLkappay,		real_t *PMLby,	real_t *PMLay,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,			
+	real_t *Ez_re,			
+	real_t *diffyHx_re,		
+	real_t *diffyHz_re,		
+	real_t *psi_exy_p_re,	
+	real_t *psi_ezy_p_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CEx2, CEz2;
+	real_t CEx2, CEz2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappay, PMLby, PMLay,\
-				eps_HEE,	eps_EHH,	\
-				econ_HEE,	econ_EHH,	\
+				mat, coefE,	\
 				Ex_re, \
 				Ez_re, \
 				diffyHx_re, \
@@ -699,8 +702,8 @@ void PML_updateE_my(
 				psiidx = (k  ) + (j  ) * Nz + (i  ) * Nz * npml;
 				myidx  = (k  ) + (j  ) * Nz + (i  ) * Nz * Ny;
 
-				CEx2 =	(2*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEz2 =	(2*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEz2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ex
 				psi_exy_p_re[psiidx] = (PMLby[odd] * psi_exy_p_re[psiidx]) + (PMLay[odd] * diffyHz_re[myidx]);
@@ -729,28 +732,26 @@ void PML_updateH_pz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,			
-	double *Hy_re,			
-	double *diffzEx_re,		
-	double *diffzEy_re,		
-	double *psi_hxz_p_re,	
-	double *psi_hyz_p_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,			
+	real_t *Hy_re,			
+	real_t *diffzEx_re,		
+	real_t *diffzEy_re,		
+	real_t *psi_hxz_p_re,	
+	real_t *psi_hyz_p_re
 ){
 
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CHx2, CHy2;
+	real_t CHx2, CHy2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappaz, PMLbz, PMLaz,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hx_re, \
 				Hy_re, \
 				diffzEx_re, \
@@ -767,8 +768,8 @@ void PML_updateH_pz(
 				myidx  = (k+Nz-npml) + (j  ) * Nz   + (i  ) * Nz   * Ny;
 				//if(i==0){printf("%d has %d\n", omp_get_thread_num(), myidx);};
 
-				CHx2 =	(-2*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHy2 =	(-2*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hx
 				psi_hxz_p_re[psiidx] = (PMLbz[odd] * psi_hxz_p_re[psiidx]) + (PMLaz[odd] * diffzEy_re[myidx]);
@@ -797,27 +798,25 @@ void PML_updateE_pz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,			
-	double *Ey_re,		
-	double *diffzHx_re,	
-	double *diffzHy_re,	
-	double *psi_exz_p_re,
-	double *psi_eyz_p_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,			
+	real_t *Ey_re,		
+	real_t *diffzHx_re,	
+	real_t *diffzHy_re,	
+	real_t *psi_exz_p_re,
+	real_t *psi_eyz_p_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CEx2, CEy2;
+	real_t CEx2, CEy2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappaz, PMLbz, PMLaz,\
-				eps_HEE,	eps_EHH,	\
-				econ_HEE,	econ_EHH,	\
+				mat, coefE,	\
 				Ex_re, \
 				Ey_re, \
 				diffzHx_re, \
@@ -833,8 +832,8 @@ void PML_updateE_pz(
 				psiidx = (k        ) + (j  ) * npml + (i  ) * npml * Ny;
 				myidx  = (k+Nz-npml) + (j  ) * Nz   + (i  ) * Nz   * Ny;
 
-				CEx2 =	(2*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEy2 =	(2*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ex
 				psi_exz_p_re[psiidx] = (PMLbz[odd] * psi_exz_p_re[psiidx]) + (PMLaz[odd] * diffzHy_re[myidx]);
@@ -864,28 +863,26 @@ void PML_updateH_mz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *mu_HEE,			double *mu_EHH,							\
-	double *mcon_HEE,		double *mcon_EHH,						\
-	double *Hx_re,			
-	double *Hy_re,			
-	double *diffzEx_re,		
-	double *diffzEy_re,		
-	double *psi_hxz_m_re,	
-	double *psi_hyz_m_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefH,				\
+	real_t *Hx_re,			
+	real_t *Hy_re,			
+	real_t *diffzEx_re,		
+	real_t *diffzEy_re,		
+	real_t *psi_hxz_m_re,	
+	real_t *psi_hyz_m_re
 ){
 
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CHx2, CHy2;
+	real_t CHx2, CHy2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappaz, PMLbz, PMLaz,\
-				mu_HEE,		mu_EHH,		\
-				mcon_HEE,	mcon_EHH,	\
+				mat, coefH,		\
 				Hx_re, \
 				Hy_re, \
 				diffzEx_re, \
@@ -901,8 +898,8 @@ void PML_updateH_mz(
 				psiidx = (k        ) + (j  ) * npml + (i  ) * npml * Ny;
 				myidx  = (k		   ) + (j  ) * Nz   + (i  ) * Nz   * Ny;
 
-				CHx2 =	(-2.*dt) / (2.*mu_HEE[myidx] + mcon_HEE[myidx]*dt);
-				CHy2 =	(-2.*dt) / (2.*mu_EHH[myidx] + mcon_EHH[myidx]*dt);
+				CHx2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 1, dt, -1.);
+				CHy2 = cell_coef(mat, coefH, (long) myNx*Ny*Nz, myidx, 3, dt, -1.);
 
 				// Update Hx
 				psi_hxz_m_re[psiidx] = (PMLbz[odd] * psi_hxz_m_re[psiidx]) + (PMLaz[odd] * diffzEy_re[myidx]);
@@ -931,27 +928,25 @@ void PML_updateE_mz(
 	int MPIsize,	int MPIrank,
 	int myNx,				int Ny,			int Nz,		int npml,	\
 	double  dt,														\
-	double *PMLkappaz,		double *PMLbz,	double *PMLaz,			\
-	double *eps_HEE,		double *eps_EHH,						\
-	double *econ_HEE,		double *econ_EHH,						\
-	double *Ex_re,			
-	double *Ey_re,			
-	double *diffzHx_re,		
-	double *diffzHy_re,	
-	double *psi_exz_m_re,
-	double *psi_eyz_m_re
+	real_t *PMLkappaz,		real_t *PMLbz,	real_t *PMLaz,			\
+	unsigned short *mat,	real_t *coefE,				\
+	real_t *Ex_re,			
+	real_t *Ey_re,			
+	real_t *diffzHx_re,		
+	real_t *diffzHy_re,	
+	real_t *psi_exz_m_re,
+	real_t *psi_eyz_m_re
 ){
 	int i,j,k;
 	int odd;
 	int psiidx, myidx;
 	
-	double CEx2, CEy2;
+	real_t CEx2, CEy2;
 	#pragma omp parallel for			\
 		shared(	npml, myNx, Ny, Nz,		\
 				dt,			 			\
 				PMLkappaz, PMLbz, PMLaz,\
-				eps_HEE,	eps_EHH,	\
-				econ_HEE,	econ_EHH,	\
+				mat, coefE,	\
 				Ex_re, \
 				Ey_re, \
 				diffzHx_re, \
@@ -968,8 +963,8 @@ void PML_updateE_mz(
 				myidx  = (k		   ) + (j  ) * Nz   + (i  ) * Nz   * Ny;
 				//if(i==0){printf("%d has %d\n", omp_get_thread_num(), psiidx);};
 
-				CEx2 =	(2.*dt) / (2.*eps_EHH[myidx] + econ_EHH[myidx]*dt);
-				CEy2 =	(2.*dt) / (2.*eps_HEE[myidx] + econ_HEE[myidx]*dt);
+				CEx2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 3, dt,  1.);
+				CEy2 = cell_coef(mat, coefE, (long) myNx*Ny*Nz, myidx, 1, dt,  1.);
 
 				// Update Ex
 				psi_exz_m_re[psiidx] = (PMLbz[odd] * psi_exz_m_re[psiidx]) + (PMLaz[odd] * diffzHy_re[myidx]);
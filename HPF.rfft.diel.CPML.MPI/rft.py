@@ -3,9 +3,166 @@ from functools import reduce
 import numpy as np
 import matplotlib.pyplot as plt
 
+def _planar_views(DFT, thin):
+    """Planar views of a frequency-blocked DFT accumulator.
+
+    Args:
+        DFT: ndarray of shape (nx, ny, nz, 4, Nf, 2).
+
+        thin: int. The axis along which the collector is one cell thick.
+
+    Returns:
+        list of four (re, im) pairs of (Nf, n1, n2) views, one per field.
+    """
+
+    idx = [slice(None)] * 3
+    idx[thin] = 0
+    plane = DFT[tuple(idx)]
+
+    return [(plane[:,:,q,:,0].transpose(2,0,1), plane[:,:,q,:,1].transpose(2,0,1)) for q in range(4)]
+
+def _dft_stride(Space, freqs, stride, margin):
+    """Decimation of the running DFT.
+
+    Args:
+        Space: Space object.
+
+        freqs: ndarray
+
+        stride: int or 'auto'.
+
+        margin: float. With 'auto', the Nyquist frequency of the decimated
+            sampling is kept at least margin * max(freqs).
+
+    Returns:
+        stride: int
+
+        alias_bound: float. Field content above this frequency aliases into the monitored band.
+    """
+
+    fmax = np.max(freqs)
+
+    if stride == 'auto': stride = max(1, int(1. / (2. * margin * fmax * Space.dt)))
+    stride = int(stride)
+
+    fs = 1. / (stride * Space.dt)
+    if fs/2 <= fmax:
+        raise ValueError("DFT stride {} aliases: Nyquist {:.3e} Hz <= max(freqs) {:.3e} Hz" .format(stride, fs/2, fmax))
+
+    return stride, fs - fmax
+
+def _load_rftkernel(Space, omp_on, acc_dtype):
+    """Load the DFT kernel built for the precision of the fields and the accumulators.
+
+    Args:
+        Space: Space object.
+
+        omp_on: boolean
+
+        acc_dtype: numpy dtype or None. None follows Space.dtype.
+
+    Returns:
+        clib: ctypes.CDLL
+
+        acc_dtype: numpy dtype
+    """
+
+    if acc_dtype is None: acc_dtype = Space.dtype
+
+    suffixes = {
+                    ('float64', 'float64'): '',
+                    ('float32', 'float32'): '.f32',
+                    ('float32', 'float64'): '.f32.acc64',
+               }
+
+    key = (np.dtype(Space.dtype).name, np.dtype(acc_dtype).name)
+    if key not in suffixes: raise ValueError("No DFT kernel for {} fields and {} accumulators." .format(*key))
+
+    if   omp_on == False: clib = ctypes.cdll.LoadLibrary("./rftkernel{}.so"    .format(suffixes[key]))
+    elif omp_on == True : clib = ctypes.cdll.LoadLibrary("./rftkernel.omp{}.so".format(suffixes[key]))
+    else: raise ValueError("Choose True or False")
+
+    return clib, np.dtype(acc_dtype).type
+
+def _field_block(collector, names):
+    """Field arrays of a collector and its extent in them.
+
+    A Space with lazy fields, like space.Empty3D, computes the fields only on
+    the local box of the collector into buffers which are reused at every step.
+
+    Args:
+        collector: Sx, Sy or Sz object.
+
+        names: tuple of the four field names the kernel reads.
+
+    Returns:
+        extent: tuple. (Ny, Nz, xsrt, xend, ysrt, yend, zsrt, zend) to pass to the kernel.
+
+        fields: list of four 3D arrays.
+    """
+
+    Space = collector.Space
+    (xsrt, ysrt, zsrt), (xend, yend, zend) = collector.lloc
+
+    if getattr(Space, 'lazy', False) == False:
+        return (Space.Ny, Space.Nz, xsrt, xend, ysrt, yend, zsrt, zend), [getattr(Space, name) for name in names]
+
+    if collector.blocks is None:
+        collector.blocks = [np.empty((xend-xsrt, yend-ysrt, zend-zsrt), dtype=Space.dtype) for name in names]
+
+    for name, block in zip(names, collector.blocks): Space.get_SF_block(name, collector.lloc, block)
+
+    return (yend-ysrt, zend-zsrt, 0, xend-xsrt, 0, yend-ysrt, 0, zend-zsrt), collector.blocks
+
+def _state_arrays(collector):
+    """DFT accumulators of a collector which own their memory.
+
+    Args:
+        collector: Sx, Sy or Sz object.
+
+    Returns:
+        list of (name, ndarray) pairs, sorted by name. The planar views of
+        the 'blocked' layout are left out since DFT holds their data.
+    """
+
+    return [(key, value) for key, value in sorted(vars(collector).items()) \
+                if key.startswith('DFT') and isinstance(value, np.ndarray) and value.base is None]
+
+def _loop_task(collector, kernel, names):
+    """The DFT of a collector as the native time loop of Basic3D.run does it.
+
+    The loop writes the twiddles into collector.coswdt and collector.sinwdt
+    and calls the kernel every collector.stride steps, as do_RFT does.
+
+    Args:
+        collector: Sx, Sy or Sz object.
+
+        kernel: string. Name of the planar kernel of the collector.
+
+        names: tuple of the four field names the kernel reads.
+
+    Returns:
+        None if the collector has no plane in this rank. Otherwise (kernel, extent, accumulators, fields),
+        with the arguments of the kernel as in do_RFT. accumulators holds the eight planar arrays
+        in the order of the planar kernel, or DFT alone for the 'blocked' layout.
+    """
+
+    if collector.gloc == None: return None
+
+    extent, fields = _field_block(collector, names)
+
+    if collector.layout == 'planar':
+
+        pairs = ((names[0][:2], names[1][:2]), (names[2][:2], names[3][:2]))
+        accumulators = [getattr(collector, 'DFT_%s_%s' %(F, part)) for pair in pairs for part in ('re', 'im') for F in pair]
+
+        return getattr(collector.clib_rftkernel, kernel), extent, accumulators, fields
+
+    return collector.clib_rftkernel.do_RFT_blocked, extent, [collector.DFT], fields
+
 class Sx(object):
 
-    def __init__(self, name, path, Space, srt, end, freqs, omp_on):
+    def __init__(self, name, path, Space, srt, end, freqs, omp_on, layout='planar', stride=1, margin=2., acc_dtype=None):
         """Sx collector object.
 
         Args:
@@ -21,6 +178,21 @@ class Sx(object):
 
             omp_on: boolean
 
+            layout: string. 'planar' or 'blocked'.
+                'planar' keeps eight (Nf, n1, n2) arrays and loops over frequencies outermost.
+                'blocked' keeps one interleaved complex array with the frequencies innermost,
+                so each field sample is read once per step. The DFT_* attributes are then
+                views into it.
+
+            stride: int or 'auto'. Accumulate the DFT only every stride-th time step.
+                'auto' picks the largest stride whose Nyquist frequency stays above margin * max(freqs).
+
+            margin: float. Safety factor of the automatic stride.
+
+            acc_dtype: numpy dtype. Precision of the DFT accumulators.
+                None follows Space.dtype. With np.float32 fields, np.float64 keeps
+                the running sums in double precision.
+
         Returns:
             None
         """
@@ -48,9 +220,25 @@ class Sx(object):
             if os.path.exists(self.path) == True: pass
             else: os.mkdir(self.path)
 
+        if self.Space.MPIysize > 1: raise ValueError("Collectors need full yz planes. They are not available with pencil > 1.")
+        if self.Space.batch    > 1: raise ValueError("Collectors read a single excitation. They are not available with batch > 1.")
+
         # Turn on/off OpenMP parallelization.
         self.omp_on = omp_on
 
+        # Load kernel.
+        self.clib_rftkernel, self.acc_dtype = _load_rftkernel(self.Space, self.omp_on, acc_dtype)
+
+        if layout not in ('planar', 'blocked'): raise ValueError("Choose 'planar' or 'blocked'")
+        self.layout = layout
+        self.blocks = None
+
+        self.stride, self.alias_bound = _dft_stride(self.Space, self.freqs, stride, margin)
+
+        if self.Space.MPIrank == 0 and self.stride > 1:
+            print("{}: DFT every {} steps. Field content above {:.3e} Hz aliases into the monitored band." \
+                  .format(self.name, self.stride, self.alias_bound))
+
         # Start index of the structure.
         self.xsrt = srt[0]
         self.ysrt = srt[1]
@@ -100,64 +288,123 @@ class Sx(object):
             #print("rank {:>2}: loc of Sx collector >>> global \"{},{}\" and local \"{},{}\"" \
             #      .format(self.Space.MPIrank, self.gloc[0], self.gloc[1], self.lloc[0], self.lloc[1]))
 
-            self.DFT_Ey_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Ey_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
+            if self.layout == 'planar':
 
-            self.DFT_Ez_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Ez_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
+                self.DFT_Ey_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Ey_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
 
-            self.DFT_Hy_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Hy_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
+                self.DFT_Ez_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Ez_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
 
-            self.DFT_Hz_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Hz_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
+                self.DFT_Hy_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Hy_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
 
-        # Load kernel.
-        if   self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-        elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-        else: raise ValueError("Choose True or False")
+                self.DFT_Hz_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Hz_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.acc_dtype)
 
-        ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-        ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-        ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
+            elif self.layout == 'blocked':
+
+                self.DFT = np.zeros((1, yend-ysrt, zend-zsrt, 4, self.Nf, 2), dtype=self.acc_dtype)
+
+                (self.DFT_Ey_re, self.DFT_Ey_im), (self.DFT_Ez_re, self.DFT_Ez_im), \
+                (self.DFT_Hy_re, self.DFT_Hy_im), (self.DFT_Hz_re, self.DFT_Hz_im) = _planar_views(self.DFT, 0)
+
+        # Twiddles of the current time step, dt included.
+        self.coswdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+        self.sinwdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+
+        ptr1d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=1, flags='C_CONTIGUOUS')
+        ptr2d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=2, flags='C_CONTIGUOUS')
+        ptr3d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=3, flags='C_CONTIGUOUS')
+        ptrF  = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
 
         self.clib_rftkernel.do_RFT_to_get_Sx.restype    = None
         self.clib_rftkernel.do_RFT_to_get_Sx.argtypes = [
+                                                            ctypes.c_int,
                                                             ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_double, ctypes.c_double, ctypes.c_double,
-                                                            ptr1d,
-                                                            ptr3d, ptr3d,
+                                                            ptr1d, ptr1d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
-                                                            ptr3d, ptr3d
+                                                            ptrF,  ptrF,
+                                                            ptrF,  ptrF
                                                          ]
+
+        ptrblk = np.ctypeslib.ndpointer(dtype=self.acc_dtype, ndim=6, flags='C_CONTIGUOUS')
+
+        self.clib_rftkernel.do_RFT_blocked.restype  = None
+        self.clib_rftkernel.do_RFT_blocked.argtypes = [
+                                                        ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ptr1d, ptr1d,
+                                                        ptrblk,
+                                                        ptrF,  ptrF,
+                                                        ptrF,  ptrF
+                                                      ]
     def do_RFT(self, tstep):
 
         if self.gloc != None:
 
-            self.clib_rftkernel.do_RFT_to_get_Sx(
-                                                    self.Space.MPIrank,
-                                                    self.Nf, tstep,
-                                                    self.Space.Ny, self.Space.Nz,
-                                                    self.lloc[0][0], self.lloc[1][0],
-                                                    self.ysrt, self.yend,
-                                                    self.zsrt, self.zend,
-                                                    self.Space.dt, self.Space.dy, self.Space.dz,
-                                                    self.freqs,
-                                                    self.DFT_Ey_re, self.DFT_Ez_re,
-                                                    self.DFT_Ey_im, self.DFT_Ez_im,
-                                                    self.DFT_Hy_re, self.DFT_Hz_re,
-                                                    self.DFT_Hy_im, self.DFT_Hz_im,
-                                                    self.Space.Ey_re, self.Space.Ez_re,
-                                                    self.Space.Hy_re, self.Space.Hz_re
-                                                )
+            if tstep % self.stride != 0: return
+
+            # Evaluate the phase once per frequency, not once per cell.
+            # Each sample stands for stride time steps.
+            phase = 2. * np.pi * self.freqs * tstep * self.Space.dt
+            self.coswdt[:] = np.cos(phase) * self.Space.dt * self.stride
+            self.sinwdt[:] = np.sin(phase) * self.Space.dt * self.stride
+
+            # Fields and the extent of the collector in them.
+            (Ny, Nz, xsrt, xend, ysrt, yend, zsrt, zend), (F0, F1, F2, F3) = _field_block(self, ('Ey_re', 'Ez_re', 'Hy_re', 'Hz_re'))
+
+            if self.layout == 'planar':
+
+                self.clib_rftkernel.do_RFT_to_get_Sx(
+                                                        self.Space.MPIrank,
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT_Ey_re, self.DFT_Ez_re,
+                                                        self.DFT_Ey_im, self.DFT_Ez_im,
+                                                        self.DFT_Hy_re, self.DFT_Hz_re,
+                                                        self.DFT_Hy_im, self.DFT_Hz_im,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+            elif self.layout == 'blocked':
+
+                self.clib_rftkernel.do_RFT_blocked(
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+    def state_arrays(self):
+        """Arrays which carry the state of the collector. Used by Basic3D.save_checkpoint."""
+
+        return _state_arrays(self)
+
+    def loop_task(self):
+        """Kernel and arguments of do_RFT. Used by the native time loop of Basic3D.run."""
+
+        return _loop_task(self, 'do_RFT_to_get_Sx', ('Ey_re', 'Ez_re', 'Hy_re', 'Hz_re'))
 
     def get_Sx(self):
 
@@ -181,186 +428,11 @@ class Sx(object):
             self.Sx_area = self.Sx.sum(axis=(1,2)) * self.Space.dy * self.Space.dz
             np.save("./graph/%s_area" %self.name, self.Sx_area)
 
-	def __init__(self, name, path, Space, srt, end, freqs, omp_on):
-		"""Sx collector object.
-
-		Args:
-			name: string.
-
-			Space: Space object.
-
-			srt: tuple
-
-			end: tuple
-
-			freqs: ndarray
-
-			omp_on: boolean
-
-		Returns:
-			None
-		"""
-
-		assert type(srt) == tuple
-		assert type(end) == tuple
-		
-		assert len(srt) == 3
-		assert len(end) == 3
-
-		assert (end[0]-srt[0]) == 1, "Sx Collector must have 2D shape with x-thick = 1."
-
-		self.name = name
-		self.freqs = freqs
-
-		if type(self.freqs) == np.ndarray: self.Nf = len(self.freqs)
-		else: self.Nf = 1
-
-		self.Space = Space
-		self.path = path
-
-		# Make save directory.
-		if self.Space.MPIrank == 0:
-
-			if os.path.exists(self.path) == True: pass
-			else: os.mkdir(self.path)
-
-		# Turn on/off OpenMP parallelization.
-		self.omp_on = omp_on
-
-		# Start index of the structure.
-		self.xsrt = srt[0]
-		self.ysrt = srt[1]
-		self.zsrt = srt[2]
-
-		# End index of the structure.
-		self.xend = end[0]
-		self.yend = end[1]
-		self.zend = end[2]
-
-		# Local variables for readable code.
-		xsrt = self.xsrt
-		ysrt = self.ysrt
-		zsrt = self.zsrt
-		xend = self.xend
-		yend = self.yend
-		zend = self.zend
-
-		# Global x index of each node.
-		node_xsrt = self.Space.myNx_indice[self.Space.MPIrank][0]
-		node_xend = self.Space.myNx_indice[self.Space.MPIrank][1]
-
-		self.gloc = None
-		self.lloc = None
-
-		if xend <  node_xsrt:
-			self.gloc = None
-			self.lloc = None
-		if xsrt <  node_xsrt and xend > node_xsrt and xend <= node_xend:
-			self.gloc = ((node_xsrt		     , ysrt, zsrt), (		xend          , yend, zend))
-			self.lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (		xend-node_xsrt, yend, zend))
-		if xsrt <  node_xsrt and xend > node_xend:
-			self.gloc = ((node_xsrt		     , ysrt, zsrt), (node_xend		    , yend, zend))
-			self.lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-		if xsrt >= node_xsrt and xsrt < node_xend and xend <= node_xend:
-			self.gloc = ((xsrt		    , ysrt, zsrt), (		xend		  , yend, zend))
-			self.lloc = ((xsrt-node_xsrt, ysrt, zsrt), (		xend-node_xsrt, yend, zend))
-		if xsrt >= node_xsrt and xsrt < node_xend and xend >  node_xend:
-			self.gloc = ((xsrt		    , ysrt, zsrt), (node_xend          , yend, zend))
-			self.lloc = ((xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-		if xsrt >  node_xend:
-			self.gloc = None
-			self.lloc = None
-
-		if self.gloc != None:
-
-			#print("rank {:>2}: loc of Sx collector >>> global \"{},{}\" and local \"{},{}\"" \
-			#	   .format(self.Space.MPIrank, self.gloc[0], self.gloc[1], self.lloc[0], self.lloc[1]))
-
-			self.DFT_Ey_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Ey_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Ez_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Ez_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Hy_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Hy_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Hz_re = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Hz_im = np.zeros((self.Nf, yend-ysrt, zend-zsrt), dtype=self.Space.dtype)
-
-		# Load kernel.
-		if	 self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-		elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-		else: raise ValueError("Choose True or False")
-
-		ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-		ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-		ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
-
-		self.clib_rftkernel.do_RFT_to_get_Sx.restype	= None
-		self.clib_rftkernel.do_RFT_to_get_Sx.argtypes =	[
-															ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_double, ctypes.c_double, ctypes.c_double,
-															ptr1d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d
-														 ]
-	def do_RFT(self, tstep):
-
-		if self.gloc != None:
-
-			self.clib_rftkernel.do_RFT_to_get_Sx(
-													self.Space.MPIrank,
-													self.Nf, tstep,
-													self.Space.Ny, self.Space.Nz,
-													self.lloc[0][0], self.lloc[1][0],
-													self.ysrt, self.yend,
-													self.zsrt, self.zend,
-													self.Space.dt, self.Space.dy, self.Space.dz,
-													self.freqs,
-													self.DFT_Ey_re, self.DFT_Ez_re,
-													self.DFT_Ey_im, self.DFT_Ez_im,
-													self.DFT_Hy_re, self.DFT_Hz_re,
-													self.DFT_Hy_im, self.DFT_Hz_im,
-													self.Space.Ey_re, self.Space.Ez_re,
-													self.Space.Hy_re, self.Space.Hz_re
-												)
-
-	def get_Sx(self):
-
-		self.Space.MPIcomm.barrier()
-
-		if self.gloc != None:
-
-			np.save("{}/{}_DFT_Ey_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ey_re)
-			np.save("{}/{}_DFT_Ez_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ez_re)
-			np.save("{}/{}_DFT_Hy_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hy_re)
-			np.save("{}/{}_DFT_Hz_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hz_re)
-
-			np.save("{}/{}_DFT_Ey_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ey_im)
-			np.save("{}/{}_DFT_Ez_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ez_im)
-			np.save("{}/{}_DFT_Hy_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hy_im)
-			np.save("{}/{}_DFT_Hz_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hz_im)
-
-			self.Sx = 0.5 * (  (self.DFT_Ey_re*self.DFT_Hz_re) + (self.DFT_Ey_im*self.DFT_Hz_im)
-							  -(self.DFT_Ez_re*self.DFT_Hy_re) - (self.DFT_Ez_im*self.DFT_Hy_im)  )
-
-			self.Sx_area = self.Sx.sum(axis=(1,2)) * self.Space.dy * self.Space.dz
-			np.save("./graph/%s_area" %self.name, self.Sx_area)
 
 
 class Sy(object):
 
-    def __init__(self, name, path, Space, srt, end, freqs, omp_on):
+    def __init__(self, name, path, Space, srt, end, freqs, omp_on, layout='planar', stride=1, margin=2., acc_dtype=None):
         """Sy collector object.
 
         Args:
@@ -376,6 +448,21 @@ class Sy(object):
 
             omp_on: boolean
 
+            layout: string. 'planar' or 'blocked'.
+                'planar' keeps eight (Nf, n1, n2) arrays and loops over frequencies outermost.
+                'blocked' keeps one interleaved complex array with the frequencies innermost,
+                so each field sample is read once per step. The DFT_* attributes are then
+                views into it.
+
+            stride: int or 'auto'. Accumulate the DFT only every stride-th time step.
+                'auto' picks the largest stride whose Nyquist frequency stays above margin * max(freqs).
+
+            margin: float. Safety factor of the automatic stride.
+
+            acc_dtype: numpy dtype. Precision of the DFT accumulators.
+                None follows Space.dtype. With np.float32 fields, np.float64 keeps
+                the running sums in double precision.
+
         Returns:
             None
         """
@@ -403,9 +490,25 @@ class Sy(object):
             if os.path.exists(self.path) == True: pass
             else: os.mkdir(self.path)
 
+        if self.Space.MPIysize > 1: raise ValueError("Collectors need full yz planes. They are not available with pencil > 1.")
+        if self.Space.batch    > 1: raise ValueError("Collectors read a single excitation. They are not available with batch > 1.")
+
         # Turn on/off OpenMP parallelization.
         self.omp_on = omp_on
 
+        # Load kernel.
+        self.clib_rftkernel, self.acc_dtype = _load_rftkernel(self.Space, self.omp_on, acc_dtype)
+
+        if layout not in ('planar', 'blocked'): raise ValueError("Choose 'planar' or 'blocked'")
+        self.layout = layout
+        self.blocks = None
+
+        self.stride, self.alias_bound = _dft_stride(self.Space, self.freqs, stride, margin)
+
+        if self.Space.MPIrank == 0 and self.stride > 1:
+            print("{}: DFT every {} steps. Field content above {:.3e} Hz aliases into the monitored band." \
+                  .format(self.name, self.stride, self.alias_bound))
+
         # Start index of the structure.
         self.xsrt = srt[0]
         self.ysrt = srt[1]
@@ -490,45 +593,68 @@ class Sy(object):
             xsrt = self.lloc[0][0]
             xend = self.lloc[1][0]
 
-            self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
+            if self.layout == 'planar':
 
-            self.DFT_Ez_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Ez_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
+                self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
 
-            self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
+                self.DFT_Ez_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Ez_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
 
-            self.DFT_Hz_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-            self.DFT_Hz_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-        
-        # Load kernel.
-        if   self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-        elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-        else: raise ValueError("Choose True or False")
+                self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+
+                self.DFT_Hz_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+                self.DFT_Hz_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.acc_dtype)
+
+            elif self.layout == 'blocked':
+
+                self.DFT = np.zeros((xend-xsrt, 1, zend-zsrt, 4, self.Nf, 2), dtype=self.acc_dtype)
+
+                (self.DFT_Ex_re, self.DFT_Ex_im), (self.DFT_Ez_re, self.DFT_Ez_im), \
+                (self.DFT_Hx_re, self.DFT_Hx_im), (self.DFT_Hz_re, self.DFT_Hz_im) = _planar_views(self.DFT, 1)
 
-        ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-        ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-        ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
+        # Twiddles of the current time step, dt included.
+        self.coswdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+        self.sinwdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+
+        ptr1d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=1, flags='C_CONTIGUOUS')
+        ptr2d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=2, flags='C_CONTIGUOUS')
+        ptr3d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=3, flags='C_CONTIGUOUS')
+        ptrF  = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
 
         self.clib_rftkernel.do_RFT_to_get_Sy.restype  = None
         self.clib_rftkernel.do_RFT_to_get_Sy.argtypes = [
+                                                            ctypes.c_int,
                                                             ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_double, ctypes.c_double, ctypes.c_double,
-                                                            ptr1d,
+                                                            ptr1d, ptr1d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
-                                                            ptr3d, ptr3d,
-                                                            ptr3d, ptr3d
+                                                            ptrF,  ptrF,
+                                                            ptrF,  ptrF
                                                          ]
 
+        ptrblk = np.ctypeslib.ndpointer(dtype=self.acc_dtype, ndim=6, flags='C_CONTIGUOUS')
+
+        self.clib_rftkernel.do_RFT_blocked.restype  = None
+        self.clib_rftkernel.do_RFT_blocked.argtypes = [
+                                                        ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ptr1d, ptr1d,
+                                                        ptrblk,
+                                                        ptrF,  ptrF,
+                                                        ptrF,  ptrF
+                                                      ]
+
         #print(self.who_get_Sy_gloc)
         #print(self.who_get_Sy_lloc)
 
@@ -536,22 +662,58 @@ class Sy(object):
 
         if self.Space.MPIrank in self.who_get_Sy_lloc:
 
-            self.clib_rftkernel.do_RFT_to_get_Sy(
-                                                    self.Space.MPIrank,
-                                                    self.Nf, tstep,
-                                                    self.Space.Ny, self.Space.Nz,
-                                                    self.lloc[0][0], self.lloc[1][0],
-                                                    self.lloc[0][1], self.lloc[1][1],
-                                                    self.lloc[0][2], self.lloc[1][2],
-                                                    self.Space.dt, self.Space.dy, self.Space.dz,
-                                                    self.freqs,
-                                                    self.DFT_Ex_re, self.DFT_Ez_re,
-                                                    self.DFT_Ex_im, self.DFT_Ez_im,
-                                                    self.DFT_Hx_re, self.DFT_Hz_re,
-                                                    self.DFT_Hx_im, self.DFT_Hz_im,
-                                                    self.Space.Ex_re, self.Space.Ez_re,
-                                                    self.Space.Hx_re, self.Space.Hz_re
-                                                )
+            if tstep % self.stride != 0: return
+
+            # Evaluate the phase once per frequency, not once per cell.
+            # Each sample stands for stride time steps.
+            phase = 2. * np.pi * self.freqs * tstep * self.Space.dt
+            self.coswdt[:] = np.cos(phase) * self.Space.dt * self.stride
+            self.sinwdt[:] = np.sin(phase) * self.Space.dt * self.stride
+
+            # Fields and the extent of the collector in them.
+            (Ny, Nz, xsrt, xend, ysrt, yend, zsrt, zend), (F0, F1, F2, F3) = _field_block(self, ('Ex_re', 'Ez_re', 'Hx_re', 'Hz_re'))
+
+            if self.layout == 'planar':
+
+                self.clib_rftkernel.do_RFT_to_get_Sy(
+                                                        self.Space.MPIrank,
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT_Ex_re, self.DFT_Ez_re,
+                                                        self.DFT_Ex_im, self.DFT_Ez_im,
+                                                        self.DFT_Hx_re, self.DFT_Hz_re,
+                                                        self.DFT_Hx_im, self.DFT_Hz_im,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+            elif self.layout == 'blocked':
+
+                self.clib_rftkernel.do_RFT_blocked(
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+    def state_arrays(self):
+        """Arrays which carry the state of the collector. Used by Basic3D.save_checkpoint."""
+
+        return _state_arrays(self)
+
+    def loop_task(self):
+        """Kernel and arguments of do_RFT. Used by the native time loop of Basic3D.run."""
+
+        return _loop_task(self, 'do_RFT_to_get_Sy', ('Ex_re', 'Ez_re', 'Hx_re', 'Hz_re'))
 
     def get_Sy(self):
 
@@ -617,267 +779,11 @@ class Sy(object):
             self.Sy_area = self.Sy.sum(axis=(1,2)) * self.Space.dx * self.Space.dz
             np.save("./graph/%s_area" %self.name, self.Sy_area)
 
-	def __init__(self, name, path, Space, srt, end, freqs, omp_on):
-		"""Sy collector object.
-
-		Args:
-			name: string.
-
-			Space: Space object.
-
-			srt: tuple
-
-			end: tuple
-
-			freqs: ndarray
-
-			omp_on: boolean
-
-		Returns:
-			None
-		"""
-
-		assert type(srt) == tuple
-		assert type(end) == tuple
-		
-		assert len(srt) == 3
-		assert len(end) == 3
-
-		assert (end[1]-srt[1]) == 1, "Sy Collector must have 2D shape with y-thick = 1."
-
-		self.name = name
-		self.freqs = freqs
-
-		if type(self.freqs) == np.ndarray: self.Nf = len(self.freqs)
-		else: self.Nf = 1
-
-		self.Space = Space
-		self.path = path
-
-		# Make save directory.
-		if self.Space.MPIrank == 0:
-
-			if os.path.exists(self.path) == True: pass
-			else: os.mkdir(self.path)
-
-		# Turn on/off OpenMP parallelization.
-		self.omp_on = omp_on
-
-		# Start index of the structure.
-		self.xsrt = srt[0]
-		self.ysrt = srt[1]
-		self.zsrt = srt[2]
-
-		# End index of the structure.
-		self.xend = end[0]
-		self.yend = end[1]
-		self.zend = end[2]
-
-		# Local variables for readable code.
-		xsrt = self.xsrt
-		ysrt = self.ysrt
-		zsrt = self.zsrt
-		xend = self.xend
-		yend = self.yend
-		zend = self.zend
-
-		self.who_get_Sy_gloc = {} # global locations
-		self.who_get_Sy_lloc = {} # local locations
-
-		self.gloc = None
-		self.lloc = None
-
-		# Every node has to know who collects Sy.
-		for MPIrank in range(self.Space.MPIsize):
-
-			# Global x index of each node.
-			node_xsrt = self.Space.myNx_indice[MPIrank][0]
-			node_xend = self.Space.myNx_indice[MPIrank][1]
-
-			if xsrt >  node_xend: pass
-			if xend <  node_xsrt: pass
-			if xsrt <  node_xsrt and xend > node_xsrt and xend <= node_xend:
-
-				gloc = ((node_xsrt		    , ysrt, zsrt), (xend          , yend, zend))
-				lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (xend-node_xsrt, yend, zend))
-
-				self.who_get_Sy_gloc[MPIrank] = gloc
-				self.who_get_Sy_lloc[MPIrank] = lloc
-
-			if xsrt <  node_xsrt and xend > node_xend:
-				gloc = ((node_xsrt	        , ysrt, zsrt), (node_xend          , yend, zend))
-				lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-
-				self.who_get_Sy_gloc[MPIrank] = gloc
-				self.who_get_Sy_lloc[MPIrank] = lloc
-
-			if xsrt >= node_xsrt and xsrt < node_xend and xend <= node_xend:
-				gloc = ((xsrt		   , ysrt, zsrt), (xend		     , yend, zend))
-				lloc = ((xsrt-node_xsrt, ysrt, zsrt), (xend-node_xsrt, yend, zend))
-
-				self.who_get_Sy_gloc[MPIrank] = gloc
-				self.who_get_Sy_lloc[MPIrank] = lloc
-
-			if xsrt >= node_xsrt and xsrt < node_xend and xend >  node_xend:
-				gloc = ((xsrt		   , ysrt, zsrt), (node_xend          , yend, zend))
-				lloc = ((xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-
-				self.who_get_Sy_gloc[MPIrank] = gloc
-				self.who_get_Sy_lloc[MPIrank] = lloc
-
-		#if self.Space.MPIrank == 0: print("{} collectors: rank{}" .format(self.name, list(self.who_get_Sy_gloc)))
-
-		self.Space.MPIcomm.barrier()
-		if self.Space.MPIrank in self.who_get_Sy_lloc:
-
-			self.gloc = self.who_get_Sy_gloc[self.Space.MPIrank]
-			self.lloc = self.who_get_Sy_lloc[self.Space.MPIrank]
-
-			"""
-			print("rank {:>2}: x loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-				   .format(self.Space.MPIrank, self.name, self.gloc[0][0], self.gloc[1][0], self.lloc[0][0], self.lloc[1][0]))
-
-			print("rank {:>2}: y loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-				   .format(self.Space.MPIrank, self.name, self.gloc[0][1], self.gloc[1][1], self.lloc[0][1], self.lloc[1][1]))
-
-			print("rank {:>2}: z loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-				   .format(self.Space.MPIrank, self.name, self.gloc[0][2], self.gloc[1][2], self.lloc[0][2], self.lloc[1][2]))
-			"""
-
-			xsrt = self.lloc[0][0]
-			xend = self.lloc[1][0]
-
-			self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Ez_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Ez_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-
-			self.DFT_Hz_re = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-			self.DFT_Hz_im = np.zeros((self.Nf, xend-xsrt, zend-zsrt), dtype=self.Space.dtype)
-		
-		# Load kernel.
-		if	 self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-		elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-		else: raise ValueError("Choose True or False")
-
-		ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-		ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-		ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
-
-		self.clib_rftkernel.do_RFT_to_get_Sy.restype  = None
-		self.clib_rftkernel.do_RFT_to_get_Sy.argtypes =	[
-															ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_double, ctypes.c_double, ctypes.c_double,
-															ptr1d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d
-														 ]
-
-		#print(self.who_get_Sy_gloc)
-		#print(self.who_get_Sy_lloc)
-
-	def do_RFT(self, tstep):
-
-		if self.Space.MPIrank in self.who_get_Sy_lloc:
-
-			self.clib_rftkernel.do_RFT_to_get_Sy(
-													self.Space.MPIrank,
-													self.Nf, tstep,
-													self.Space.Ny, self.Space.Nz,
-													self.lloc[0][0], self.lloc[1][0],
-													self.lloc[0][1], self.lloc[1][1],
-													self.lloc[0][2], self.lloc[1][2],
-													self.Space.dt, self.Space.dy, self.Space.dz,
-													self.freqs,
-													self.DFT_Ex_re, self.DFT_Ez_re,
-													self.DFT_Ex_im, self.DFT_Ez_im,
-													self.DFT_Hx_re, self.DFT_Hz_re,
-													self.DFT_Hx_im, self.DFT_Hz_im,
-													self.Space.Ex_re, self.Space.Ez_re,
-													self.Space.Hx_re, self.Space.Hz_re
-												)
-
-	def get_Sy(self):
-
-		self.Space.MPIcomm.barrier()
-
-		if self.Space.MPIrank in self.who_get_Sy_lloc:
-
-			np.save("{}/{}_DFT_Ex_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ex_re)
-			np.save("{}/{}_DFT_Ez_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ez_re)
-			np.save("{}/{}_DFT_Hx_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hx_re)
-			np.save("{}/{}_DFT_Hz_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hz_re)
-
-			np.save("{}/{}_DFT_Ex_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ex_im)
-			np.save("{}/{}_DFT_Ez_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ez_im)
-			np.save("{}/{}_DFT_Hx_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hx_im)
-			np.save("{}/{}_DFT_Hz_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hz_im)
-
-		self.Space.MPIcomm.barrier()
-
-		if self.Space.MPIrank == 0:
-
-			DFT_Sy_Ex_res = []
-			DFT_Sy_Ex_ims = []
-
-			DFT_Sy_Ez_res = []
-			DFT_Sy_Ez_ims = []
-
-			DFT_Sy_Hx_res = []
-			DFT_Sy_Hx_ims = []
-
-			DFT_Sy_Hz_res = []
-			DFT_Sy_Hz_ims = []
-
-			for rank in self.who_get_Sy_lloc:
-
-				DFT_Sy_Ex_res.append(np.load("{}/{}_DFT_Ex_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sy_Ex_ims.append(np.load("{}/{}_DFT_Ex_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sy_Ez_res.append(np.load("{}/{}_DFT_Ez_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sy_Ez_ims.append(np.load("{}/{}_DFT_Ez_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sy_Hx_res.append(np.load("{}/{}_DFT_Hx_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sy_Hx_ims.append(np.load("{}/{}_DFT_Hx_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sy_Hz_res.append(np.load("{}/{}_DFT_Hz_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sy_Hz_ims.append(np.load("{}/{}_DFT_Hz_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-			DFT_Ex_re = np.concatenate(DFT_Sy_Ex_res, axis=1)
-			DFT_Ex_im = np.concatenate(DFT_Sy_Ex_ims, axis=1)
-
-			DFT_Ez_re = np.concatenate(DFT_Sy_Ez_res, axis=1)
-			DFT_Ez_im = np.concatenate(DFT_Sy_Ez_ims, axis=1)
-
-			DFT_Hx_re = np.concatenate(DFT_Sy_Hx_res, axis=1)
-			DFT_Hx_im = np.concatenate(DFT_Sy_Hx_ims, axis=1)
-
-			DFT_Hz_re = np.concatenate(DFT_Sy_Hz_res, axis=1)
-			DFT_Hz_im = np.concatenate(DFT_Sy_Hz_ims, axis=1)
-
-			self.Sy = 0.5 * ( -(DFT_Ex_re*DFT_Hz_re) - (DFT_Ex_im*DFT_Hz_im)
-							  +(DFT_Ez_re*DFT_Hx_re) + (DFT_Ez_im*DFT_Hx_im)  )
-
-			self.Sy_area = self.Sy.sum(axis=(1,2)) * self.Space.dx * self.Space.dz
-			np.save("./graph/%s_area" %self.name, self.Sy_area)
 
 
 class Sz(object):
 
-    def __init__(self, name, path, Space, srt, end, freqs, omp_on):
+    def __init__(self, name, path, Space, srt, end, freqs, omp_on, layout='planar', stride=1, margin=2., acc_dtype=None):
         """Sy collector object.
 
         Args:
@@ -895,6 +801,21 @@ class Sz(object):
 
             omp_on: boolean
 
+            layout: string. 'planar' or 'blocked'.
+                'planar' keeps eight (Nf, n1, n2) arrays and loops over frequencies outermost.
+                'blocked' keeps one interleaved complex array with the frequencies innermost,
+                so each field sample is read once per step. The DFT_* attributes are then
+                views into it.
+
+            stride: int or 'auto'. Accumulate the DFT only every stride-th time step.
+                'auto' picks the largest stride whose Nyquist frequency stays above margin * max(freqs).
+
+            margin: float. Safety factor of the automatic stride.
+
+            acc_dtype: numpy dtype. Precision of the DFT accumulators.
+                None follows Space.dtype. With np.float32 fields, np.float64 keeps
+                the running sums in double precision.
+
         Returns:
             None
         """
@@ -921,9 +842,25 @@ class Sz(object):
             if os.path.exists(self.path) == True: pass
             else: os.mkdir(self.path)
 
+        if self.Space.MPIysize > 1: raise ValueError("Collectors need full yz planes. They are not available with pencil > 1.")
+        if self.Space.batch    > 1: raise ValueError("Collectors read a single excitation. They are not available with batch > 1.")
+
         # Turn on/off OpenMP parallelization.
         self.omp_on = omp_on
 
+        # Load kernel.
+        self.clib_rftkernel, self.acc_dtype = _load_rftkernel(self.Space, self.omp_on, acc_dtype)
+
+        if layout not in ('planar', 'blocked'): raise ValueError("Choose 'planar' or 'blocked'")
+        self.layout = layout
+        self.blocks = None
+
+        self.stride, self.alias_bound = _dft_stride(self.Space, self.freqs, stride, margin)
+
+        if self.Space.MPIrank == 0 and self.stride > 1:
+            print("{}: DFT every {} steps. Field content above {:.3e} Hz aliases into the monitored band." \
+                  .format(self.name, self.stride, self.alias_bound))
+
         # Start index of the structure.
         self.xsrt = srt[0]
         self.ysrt = srt[1]
@@ -1006,65 +943,124 @@ class Sz(object):
             xsrt = self.lloc[0][0]
             xend = self.lloc[1][0]
 
-            self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-            self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
+            if self.layout == 'planar':
 
-            self.DFT_Ey_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-            self.DFT_Ey_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
+                self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+                self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
 
-            self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-            self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
+                self.DFT_Ey_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+                self.DFT_Ey_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
 
-            self.DFT_Hy_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-            self.DFT_Hy_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-        
-        # Load kernel.
-        if   self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-        elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-        else: raise ValueError("Choose True or False")
+                self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+                self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+
+                self.DFT_Hy_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+                self.DFT_Hy_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.acc_dtype)
+
+            elif self.layout == 'blocked':
+
+                self.DFT = np.zeros((xend-xsrt, yend-ysrt, 1, 4, self.Nf, 2), dtype=self.acc_dtype)
+
+                (self.DFT_Ex_re, self.DFT_Ex_im), (self.DFT_Ey_re, self.DFT_Ey_im), \
+                (self.DFT_Hx_re, self.DFT_Hx_im), (self.DFT_Hy_re, self.DFT_Hy_im) = _planar_views(self.DFT, 2)
 
-        ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-        ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-        ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
+        # Twiddles of the current time step, dt included.
+        self.coswdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+        self.sinwdt = np.zeros(self.Nf, dtype=self.acc_dtype)
+
+        ptr1d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=1, flags='C_CONTIGUOUS')
+        ptr2d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=2, flags='C_CONTIGUOUS')
+        ptr3d = np.ctypeslib.ndpointer(dtype=self.acc_dtype,   ndim=3, flags='C_CONTIGUOUS')
+        ptrF  = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
 
         self.clib_rftkernel.do_RFT_to_get_Sz.restype  = None
         self.clib_rftkernel.do_RFT_to_get_Sz.argtypes = [
+                                                            ctypes.c_int,
                                                             ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
                                                             ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_int, ctypes.c_int,
-                                                            ctypes.c_double, ctypes.c_double, ctypes.c_double,
-                                                            ptr1d,
-                                                            ptr3d, ptr3d,
+                                                            ptr1d, ptr1d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
                                                             ptr3d, ptr3d,
-                                                            ptr3d, ptr3d
+                                                            ptrF,  ptrF,
+                                                            ptrF,  ptrF
                                                          ]
 
+        ptrblk = np.ctypeslib.ndpointer(dtype=self.acc_dtype, ndim=6, flags='C_CONTIGUOUS')
+
+        self.clib_rftkernel.do_RFT_blocked.restype  = None
+        self.clib_rftkernel.do_RFT_blocked.argtypes = [
+                                                        ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ctypes.c_int, ctypes.c_int,
+                                                        ptr1d, ptr1d,
+                                                        ptrblk,
+                                                        ptrF,  ptrF,
+                                                        ptrF,  ptrF
+                                                      ]
+
     def do_RFT(self, tstep):
 
         if self.Space.MPIrank in self.who_get_Sz_lloc:
 
-            self.clib_rftkernel.do_RFT_to_get_Sz(
-                                                    self.Space.MPIrank,
-                                                    len(self.freqs), tstep,
-                                                    self.Space.Ny, self.Space.Nz,
-                                                    self.lloc[0][0], self.lloc[1][0],
-                                                    self.lloc[0][1], self.lloc[1][1],
-                                                    self.lloc[0][2], self.lloc[1][2],
-                                                    self.Space.dt, self.Space.dx, self.Space.dy,
-                                                    self.freqs,
-                                                    self.DFT_Ex_re, self.DFT_Ey_re,
-                                                    self.DFT_Ex_im, self.DFT_Ey_im,
-                                                    self.DFT_Hx_re, self.DFT_Hy_re,
-                                                    self.DFT_Hx_im, self.DFT_Hy_im,
-                                                    self.Space.Ex_re, self.Space.Ey_re,
-                                                    self.Space.Hx_re, self.Space.Hy_re
-                                                )
+            if tstep % self.stride != 0: return
+
+            # Evaluate the phase once per frequency, not once per cell.
+            # Each sample stands for stride time steps.
+            phase = 2. * np.pi * self.freqs * tstep * self.Space.dt
+            self.coswdt[:] = np.cos(phase) * self.Space.dt * self.stride
+            self.sinwdt[:] = np.sin(phase) * self.Space.dt * self.stride
+
+            # Fields and the extent of the collector in them.
+            (Ny, Nz, xsrt, xend, ysrt, yend, zsrt, zend), (F0, F1, F2, F3) = _field_block(self, ('Ex_re', 'Ey_re', 'Hx_re', 'Hy_re'))
+
+            if self.layout == 'planar':
+
+                self.clib_rftkernel.do_RFT_to_get_Sz(
+                                                        self.Space.MPIrank,
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT_Ex_re, self.DFT_Ey_re,
+                                                        self.DFT_Ex_im, self.DFT_Ey_im,
+                                                        self.DFT_Hx_re, self.DFT_Hy_re,
+                                                        self.DFT_Hx_im, self.DFT_Hy_im,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+            elif self.layout == 'blocked':
+
+                self.clib_rftkernel.do_RFT_blocked(
+                                                        self.Nf,
+                                                        Ny, Nz,
+                                                        xsrt, xend,
+                                                        ysrt, yend,
+                                                        zsrt, zend,
+                                                        self.coswdt, self.sinwdt,
+                                                        self.DFT,
+                                                        F0, F1,
+                                                        F2, F3
+                                                    )
+
+    def state_arrays(self):
+        """Arrays which carry the state of the collector. Used by Basic3D.save_checkpoint."""
+
+        return _state_arrays(self)
+
+    def loop_task(self):
+        """Kernel and arguments of do_RFT. Used by the native time loop of Basic3D.run."""
+
+        return _loop_task(self, 'do_RFT_to_get_Sz', ('Ex_re', 'Ey_re', 'Hx_re', 'Hy_re'))
 
     def get_Sz(self):
 
@@ -1129,257 +1125,3 @@ class Sz(object):
 
             self.Sz_area = self.Sz.sum(axis=(1,2)) * self.Space.dx * self.Space.dy
             np.save("./graph/%s_area" %self.name, self.Sz_area)
-
-	def __init__(self, name, path, Space, srt, end, freqs, omp_on):
-		"""Sy collector object.
-
-		Args:
-			name: string.
-
-			path: string.
-
-			Space: Space object.
-
-			srt: tuple
-
-			end: tuple
-
-			freqs: ndarray
-
-			omp_on: boolean
-
-		Returns:
-			None
-		"""
-
-		assert type(srt) == tuple
-		assert type(end) == tuple
-		
-		assert len(srt) == 3
-		assert len(end) == 3
-
-		assert (end[2]-srt[2]) == 1, "Sz Collector must have 2D shape with z-thick = 1."
-
-		self.name = name
-		self.freqs = freqs
-		if type(self.freqs) == np.ndarray: self.Nf = len(self.freqs)
-		else: self.Nf = 1
-
-		self.Space = Space
-		self.path = path
-
-		# Make save directory.
-		if self.Space.MPIrank == 0:
-
-			if os.path.exists(self.path) == True: pass
-			else: os.mkdir(self.path)
-
-		# Turn on/off OpenMP parallelization.
-		self.omp_on = omp_on
-
-		# Start index of the structure.
-		self.xsrt = srt[0]
-		self.ysrt = srt[1]
-		self.zsrt = srt[2]
-
-		# End index of the structure.
-		self.xend = end[0]
-		self.yend = end[1]
-		self.zend = end[2]
-
-		# Local variables for readable code.
-		xsrt = self.xsrt
-		ysrt = self.ysrt
-		zsrt = self.zsrt
-		xend = self.xend
-		yend = self.yend
-		zend = self.zend
-
-		self.who_get_Sz_gloc = {} # global locations
-		self.who_get_Sz_lloc = {} # local locations
-
-		self.gloc = None
-		self.lloc = None
-
-		# Every node has to know who collects Sy.
-		for MPIrank in range(self.Space.MPIsize):
-
-			# Global x index of each node.
-			node_xsrt = self.Space.myNx_indice[MPIrank][0]
-			node_xend = self.Space.myNx_indice[MPIrank][1]
-
-			if xsrt >  node_xend: pass
-			if xend <  node_xsrt: pass
-			if xsrt <  node_xsrt and xend > node_xsrt and xend <= node_xend:
-
-				gloc = ((node_xsrt		    , ysrt, zsrt), (xend          , yend, zend))
-				lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (xend-node_xsrt, yend, zend))
-
-				self.who_get_Sz_gloc[MPIrank] = gloc
-				self.who_get_Sz_lloc[MPIrank] = lloc
-
-			if xsrt <  node_xsrt and xend > node_xend:
-				gloc = ((node_xsrt	        , ysrt, zsrt), (node_xend          , yend, zend))
-				lloc = ((node_xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-
-				self.who_get_Sz_gloc[MPIrank] = gloc
-				self.who_get_Sz_lloc[MPIrank] = lloc
-
-			if xsrt >= node_xsrt and xsrt < node_xend and xend <= node_xend:
-				gloc = ((xsrt		   , ysrt, zsrt), (xend		     , yend, zend))
-				lloc = ((xsrt-node_xsrt, ysrt, zsrt), (xend-node_xsrt, yend, zend))
-
-				self.who_get_Sz_gloc[MPIrank] = gloc
-				self.who_get_Sz_lloc[MPIrank] = lloc
-
-			if xsrt >= node_xsrt and xsrt < node_xend and xend >  node_xend:
-				gloc = ((xsrt		   , ysrt, zsrt), (node_xend          , yend, zend))
-				lloc = ((xsrt-node_xsrt, ysrt, zsrt), (node_xend-node_xsrt, yend, zend))
-
-				self.who_get_Sz_gloc[MPIrank] = gloc
-				self.who_get_Sz_lloc[MPIrank] = lloc
-
-		#if self.Space.MPIrank == 0: print("{} collectors: rank{}" .format(self.name, list(self.who_get_Sz_gloc)))
-
-		self.Space.MPIcomm.barrier()
-		if self.Space.MPIrank in self.who_get_Sz_lloc:
-
-			self.gloc = self.who_get_Sz_gloc[self.Space.MPIrank]
-			self.lloc = self.who_get_Sz_lloc[self.Space.MPIrank]
-
-			#print("rank {:>2}: x loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-			#	   .format(self.Space.MPIrank, self.name, self.gloc[0][0], self.gloc[1][0], self.lloc[0][0], self.lloc[1][0]))
-
-			#print("rank {:>2}: y loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-			#	   .format(self.Space.MPIrank, self.name, self.gloc[0][1], self.gloc[1][1], self.lloc[0][1], self.lloc[1][1]))
-
-			#print("rank {:>2}: z loc of {} collector >>> global range({:4d},{:4d}) // local range({:4d},{:4d})\"" \
-			#	   .format(self.Space.MPIrank, self.name, self.gloc[0][2], self.gloc[1][2], self.lloc[0][2], self.lloc[1][2]))
-
-			xsrt = self.lloc[0][0]
-			xend = self.lloc[1][0]
-
-			self.DFT_Ex_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-			self.DFT_Ex_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-
-			self.DFT_Ey_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-			self.DFT_Ey_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-
-			self.DFT_Hx_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-			self.DFT_Hx_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-
-			self.DFT_Hy_re = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-			self.DFT_Hy_im = np.zeros((self.Nf, xend-xsrt, yend-ysrt), dtype=self.Space.dtype)
-		
-		# Load kernel.
-		if	 self.omp_on == False: self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.so")
-		elif self.omp_on == True : self.clib_rftkernel = ctypes.cdll.LoadLibrary("./rftkernel.omp.so")
-		else: raise ValueError("Choose True or False")
-
-		ptr1d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=1, flags='C_CONTIGUOUS')
-		ptr2d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=2, flags='C_CONTIGUOUS')
-		ptr3d = np.ctypeslib.ndpointer(dtype=self.Space.dtype, ndim=3, flags='C_CONTIGUOUS')
-
-		self.clib_rftkernel.do_RFT_to_get_Sz.restype  = None
-		self.clib_rftkernel.do_RFT_to_get_Sz.argtypes =	[
-															ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_int, ctypes.c_int,
-															ctypes.c_double, ctypes.c_double, ctypes.c_double,
-															ptr1d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d,
-															ptr3d, ptr3d
-														 ]
-
-	def do_RFT(self, tstep):
-
-		if self.Space.MPIrank in self.who_get_Sz_lloc:
-
-			self.clib_rftkernel.do_RFT_to_get_Sz(
-													self.Space.MPIrank,
-													len(self.freqs), tstep,
-													self.Space.Ny, self.Space.Nz,
-													self.lloc[0][0], self.lloc[1][0],
-													self.lloc[0][1], self.lloc[1][1],
-													self.lloc[0][2], self.lloc[1][2],
-													self.Space.dt, self.Space.dx, self.Space.dy,
-													self.freqs,
-													self.DFT_Ex_re, self.DFT_Ey_re,
-													self.DFT_Ex_im, self.DFT_Ey_im,
-													self.DFT_Hx_re, self.DFT_Hy_re,
-													self.DFT_Hx_im, self.DFT_Hy_im,
-													self.Space.Ex_re, self.Space.Ey_re,
-													self.Space.Hx_re, self.Space.Hy_re
-												)
-
-	def get_Sz(self):
-
-		self.Space.MPIcomm.barrier()
-
-		if self.Space.MPIrank in self.who_get_Sz_lloc:
-
-			np.save("{}/{}_DFT_Ex_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ex_re)
-			np.save("{}/{}_DFT_Ey_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ey_re)
-			np.save("{}/{}_DFT_Hx_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hx_re)
-			np.save("{}/{}_DFT_Hy_re_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hy_re)
-
-			np.save("{}/{}_DFT_Ex_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ex_im)
-			np.save("{}/{}_DFT_Ey_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Ey_im)
-			np.save("{}/{}_DFT_Hx_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hx_im)
-			np.save("{}/{}_DFT_Hy_im_rank{:02d}" .format(self.path, self.name, self.Space.MPIrank), self.DFT_Hy_im)
-
-		self.Space.MPIcomm.barrier()
-
-		if self.Space.MPIrank == 0:
-
-			DFT_Sz_Ex_res = []
-			DFT_Sz_Ex_ims = []
-
-			DFT_Sz_Ey_res = []
-			DFT_Sz_Ey_ims = []
-
-			DFT_Sz_Hx_res = []
-			DFT_Sz_Hx_ims = []
-
-			DFT_Sz_Hy_res = []
-			DFT_Sz_Hy_ims = []
-
-			for rank in self.who_get_Sz_lloc:
-
-				DFT_Sz_Ex_res.append(np.load("{}/{}_DFT_Ex_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sz_Ex_ims.append(np.load("{}/{}_DFT_Ex_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sz_Ey_res.append(np.load("{}/{}_DFT_Ey_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sz_Ey_ims.append(np.load("{}/{}_DFT_Ey_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sz_Hx_res.append(np.load("{}/{}_DFT_Hx_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sz_Hx_ims.append(np.load("{}/{}_DFT_Hx_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-				DFT_Sz_Hy_res.append(np.load("{}/{}_DFT_Hy_re_rank{:02d}.npy" .format(self.path, self.name, rank)))
-				DFT_Sz_Hy_ims.append(np.load("{}/{}_DFT_Hy_im_rank{:02d}.npy" .format(self.path, self.name, rank)))
-
-			DFT_Ex_re = np.concatenate(DFT_Sz_Ex_res, axis=1)
-			DFT_Ex_im = np.concatenate(DFT_Sz_Ex_ims, axis=1)
-
-			DFT_Ey_re = np.concatenate(DFT_Sz_Ey_res, axis=1)
-			DFT_Ey_im = np.concatenate(DFT_Sz_Ey_ims, axis=1)
-
-			DFT_Hx_re = np.concatenate(DFT_Sz_Hx_res, axis=1)
-			DFT_Hx_im = np.concatenate(DFT_Sz_Hx_ims, axis=1)
-
-			DFT_Hy_re = np.concatenate(DFT_Sz_Hy_res, axis=1)
-			DFT_Hy_im = np.concatenate(DFT_Sz_Hy_ims, axis=1)
-
-			self.Sz = 0.5 * ( -(DFT_Ey_re*DFT_Hx_re) - (DFT_Ey_im*DFT_Hx_im)
-							  +(DFT_Ex_re*DFT_Hy_re) + (DFT_Ex_im*DFT_Hy_im)  )
-
-			self.Sz_area = self.Sz.sum(axis=(1,2)) * self.Space.dx * self.Space.dy
-			np.save("./graph/%s_area" %self.name, self.Sz_area)
->>>>>>> .
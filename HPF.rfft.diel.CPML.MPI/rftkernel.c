@@ -3,7 +3,23 @@
 #include <math.h>
 #include <omp.h>
 
-#define PI 3.1415926535897
+/*
+	Precision of the fields and of the DFT accumulators.
+	Compile with -DSINGLE_PRECISION for float32 fields and accumulators (rftkernel.f32.so),
+	and add -DDOUBLE_ACCUMULATOR to keep the accumulators in float64 (rftkernel.f32.acc64.so).
+	The OpenMP builds are named rftkernel.omp.f32.so and rftkernel.omp.f32.acc64.so.
+*/
+#ifdef SINGLE_PRECISION
+typedef float real_t;
+#else
+typedef double real_t;
+#endif
+
+#if defined(SINGLE_PRECISION) && !defined(DOUBLE_ACCUMULATOR)
+typedef float acc_t;
+#else
+typedef double acc_t;
+#endif
 
 /**********************************************************/
 /******************** Function Prototype ******************/
@@ -11,53 +27,62 @@
 
 void do_RFT_to_get_Sx(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dy, double dz,
-	double* freqs,
-	double* DFT_Ey_re, double* DFT_Ez_re,
-	double* DFT_Ey_im, double* DFT_Ez_im,
-	double* DFT_Hy_re, double* DFT_Hz_re,
-	double* DFT_Hy_im, double* DFT_Hz_im,
-	double* Ey_re, double* Ez_re,
-	double* Hy_re, double* Hz_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ey_re, acc_t* DFT_Ez_re,
+	acc_t* DFT_Ey_im, acc_t* DFT_Ez_im,
+	acc_t* DFT_Hy_re, acc_t* DFT_Hz_re,
+	acc_t* DFT_Hy_im, acc_t* DFT_Hz_im,
+	real_t* Ey_re, real_t* Ez_re,
+	real_t* Hy_re, real_t* Hz_re
 );
 
 void do_RFT_to_get_Sy(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dx, double dz,
-	double* freqs,
-	double* DFT_Ex_re, double* DFT_Ez_re,
-	double* DFT_Ex_im, double* DFT_Ez_im,
-	double* DFT_Hx_re, double* DFT_Hz_re,
-	double* DFT_Hx_im, double* DFT_Hz_im,
-	double* Ex_re, double* Ez_re,
-	double* Hx_re, double* Hz_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ex_re, acc_t* DFT_Ez_re,
+	acc_t* DFT_Ex_im, acc_t* DFT_Ez_im,
+	acc_t* DFT_Hx_re, acc_t* DFT_Hz_re,
+	acc_t* DFT_Hx_im, acc_t* DFT_Hz_im,
+	real_t* Ex_re, real_t* Ez_re,
+	real_t* Hx_re, real_t* Hz_re
 );
 
 void do_RFT_to_get_Sz(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dx, double dy,
-	double* freqs,
-	double* DFT_Ex_re, double* DFT_Ey_re,
-	double* DFT_Ex_im, double* DFT_Ey_im,
-	double* DFT_Hx_re, double* DFT_Hy_re,
-	double* DFT_Hx_im, double* DFT_Hy_im,
-	double* Ex_re, double* Ey_re,
-	double* Hx_re, double* Hy_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ex_re, acc_t* DFT_Ey_re,
+	acc_t* DFT_Ex_im, acc_t* DFT_Ey_im,
+	acc_t* DFT_Hx_re, acc_t* DFT_Hy_re,
+	acc_t* DFT_Hx_im, acc_t* DFT_Hy_im,
+	real_t* Ex_re, real_t* Ey_re,
+	real_t* Hx_re, real_t* Hy_re
+);
+
+void do_RFT_blocked(
+	int Nf,
+	int Ny,	  int Nz,
+	int xsrt, int xend,
+	int ysrt, int yend,
+	int zsrt, int zend,
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT,
+	real_t* F0, real_t* F1,
+	real_t* F2, real_t* F3
 );
 
 /**********************************************************/
@@ -66,67 +91,64 @@ void do_RFT_to_get_Sz(
 
 void do_RFT_to_get_Sx(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dy, double dz,
-	double* freqs,
-	double* DFT_Ey_re, double* DFT_Ez_re,
-	double* DFT_Ey_im, double* DFT_Ez_im,
-	double* DFT_Hy_re, double* DFT_Hz_re,
-	double* DFT_Hy_im, double* DFT_Hz_im,
-	double* Ey_re, double* Ez_re,
-	double* Hy_re, double* Hz_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ey_re, acc_t* DFT_Ez_re,
+	acc_t* DFT_Ey_im, acc_t* DFT_Ez_im,
+	acc_t* DFT_Hy_re, acc_t* DFT_Hz_re,
+	acc_t* DFT_Hy_im, acc_t* DFT_Hz_im,
+	real_t* Ey_re, real_t* Ez_re,
+	real_t* Hy_re, real_t* Hz_re
 ){
 
 	int i, j, k, f;
 	int Fidx, Sidx; // Field yz-plane index, Sx yz-plane index
-	int nx, ny, nz;
-
-	int omp_max = omp_get_max_threads();
-	omp_set_num_threads(omp_max);
-	int omp_in_use = omp_get_num_threads();
-	int omp_me = omp_get_thread_num();
+	int ny, nz;
+	acc_t c, s;
 
 	i  = xsrt;
-	nx = xend - xsrt;
 	ny = yend - ysrt;
 	nz = zend - zsrt;
 
-	/*
+	// The twiddles of this time step already carry dt. The k loop is
+	// contiguous in both the field and the DFT plane.
 	#pragma omp parallel for \
-		shared( ny, nz, dt,\
-				freqs, \
+		shared(	Nf, Ny, Nz, ny, nz, i, ysrt, zsrt, \
+				coswdt, sinwdt, \
 				DFT_Ey_re, DFT_Ey_im, \
 				DFT_Ez_re, DFT_Ez_im, \
 				DFT_Hy_re, DFT_Hy_im, \
 				DFT_Hz_re, DFT_Hz_im, \
-			) \
-		private(f, j, k, Nf, ysrt, yend, zsrt, zend, idx, tstep)
-	*/
-	#pragma omp parallel for schedule(dynamic)
+				Ey_re, Ez_re, Hy_re, Hz_re) \
+		private(f, j, k, Sidx, Fidx, c, s)
 	for(f=0; f<Nf; f++){
+
+		c = coswdt[f];
+		s = sinwdt[f];
+
 		for(j=0; j<ny; j++){
 			for(k=0; k<nz; k++){
-				
+
 				Sidx   = (k     ) + (j     )*nz + (f  )*ny*nz;
 				Fidx   = (k+zsrt) + (j+ysrt)*Nz + (i  )*Ny*Nz;
 
 				// First term.
-				DFT_Ey_re[Sidx] +=  Ey_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ey_im[Sidx] += -Ey_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Ey_re[Sidx] += Ey_re[Fidx] * c;
+				DFT_Ey_im[Sidx] -= Ey_re[Fidx] * s;
 
-				DFT_Hz_re[Sidx] +=  Hz_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hz_im[Sidx] += -Hz_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hz_re[Sidx] += Hz_re[Fidx] * c;
+				DFT_Hz_im[Sidx] -= Hz_re[Fidx] * s;
 
 				// Second term.
-				DFT_Ez_re[Sidx] +=  Ez_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ez_im[Sidx] += -Ez_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Ez_re[Sidx] += Ez_re[Fidx] * c;
+				DFT_Ez_im[Sidx] -= Ez_re[Fidx] * s;
 
-				DFT_Hy_re[Sidx] +=  Hy_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hy_im[Sidx] += -Hy_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hy_re[Sidx] += Hy_re[Fidx] * c;
+				DFT_Hy_im[Sidx] -= Hy_re[Fidx] * s;
 			}
 		}
 	}
@@ -137,80 +159,60 @@ void do_RFT_to_get_Sx(
 
 void do_RFT_to_get_Sy(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dx, double dz,
-	double* freqs,
-	double* DFT_Ex_re, double* DFT_Ez_re,
-	double* DFT_Ex_im, double* DFT_Ez_im,
-	double* DFT_Hx_re, double* DFT_Hz_re,
-	double* DFT_Hx_im, double* DFT_Hz_im,
-	double* Ex_re, double* Ez_re,
-	double* Hx_re, double* Hz_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ex_re, acc_t* DFT_Ez_re,
+	acc_t* DFT_Ex_im, acc_t* DFT_Ez_im,
+	acc_t* DFT_Hx_re, acc_t* DFT_Hz_re,
+	acc_t* DFT_Hx_im, acc_t* DFT_Hz_im,
+	real_t* Ex_re, real_t* Ez_re,
+	real_t* Hx_re, real_t* Hz_re
 ){
 
 	int i, j, k, f;
 	int Fidx, Sidx; // Field xz-plane index, Sy xz-plane index
-	int nx, ny, nz;
-
-	int omp_max = omp_get_max_threads();
-	omp_set_num_threads(omp_max);
-
-	int omp_in_use = omp_get_num_threads();
-	int omp_me = omp_get_thread_num();
+	int nx, nz;
+	acc_t c, s;
 
 	j  = ysrt;
 	nx = xend - xsrt;
-	ny = yend - ysrt;
 	nz = zend - zsrt;
 
-	/*
-	printf("%d, %d, %d\n", nx, ny, nz);
-
-	if(MPIrank == 0){
-		printf("%d, %d\n", xsrt, xend);
-		printf("%d, %d\n", ysrt, yend);
-		printf("%d, %d\n", zsrt, zend);
-	}
-	*/
-	
-	/*
 	#pragma omp parallel for \
-		shared(Ex_re, Ez_re, Hx_re, Hz_re, freqs, tstep, dt, \
-			DFT_Ex_re, DFT_Ex_im, \
-			DFT_Ez_re, DFT_Ez_im, \
-			DFT_Hx_re, DFT_Hx_im, \
-			DFT_Hz_re, DFT_Hz_im, \
-			) \
-		private(Nf, nx, nz, i, k, f, Sidx, Fidx)
-	*/
-	#pragma omp parallel for schedule(dynamic)
+		shared(	Nf, Ny, Nz, nx, nz, j, xsrt, zsrt, \
+				coswdt, sinwdt, \
+				DFT_Ex_re, DFT_Ex_im, \
+				DFT_Ez_re, DFT_Ez_im, \
+				DFT_Hx_re, DFT_Hx_im, \
+				DFT_Hz_re, DFT_Hz_im, \
+				Ex_re, Ez_re, Hx_re, Hz_re) \
+		private(f, i, k, Sidx, Fidx, c, s)
 	for(f=0; f<Nf; f++){
+
+		c = coswdt[f];
+		s = sinwdt[f];
+
 		for(i=0; i<nx; i++){
 			for(k=0; k<nz; k++){
-				
+
 				Sidx   = (k     ) + (i)*nz + (f     )*nx*nz;
 				Fidx   = (k+zsrt) + (j)*Nz + (i+xsrt)*Ny*Nz;
 
-				//if(MPIrank == 0) printf("%d, %d\n", Sidx, Fidx);
-				//if(MPIrank == 0) printf("%d, %d\n", Sidx-f*nx*nz, Fidx);
-				//if(MPIrank == 2) printf("%d, %d\n", i+xsrt, k+zsrt);
-				//if(MPIrank == 4) printf("%d, %d\n", Sidx-f*nx*nz, Fidx);
+				DFT_Ex_re[Sidx] += Ex_re[Fidx] * c;
+				DFT_Ex_im[Sidx] -= Ex_re[Fidx] * s;
 
-				DFT_Ex_re[Sidx] +=  Ex_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ex_im[Sidx] += -Ex_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hz_re[Sidx] += Hz_re[Fidx] * c;
+				DFT_Hz_im[Sidx] -= Hz_re[Fidx] * s;
 
-				DFT_Hz_re[Sidx] +=  Hz_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hz_im[Sidx] += -Hz_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Ez_re[Sidx] += Ez_re[Fidx] * c;
+				DFT_Ez_im[Sidx] -= Ez_re[Fidx] * s;
 
-				DFT_Ez_re[Sidx] +=  Ez_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ez_im[Sidx] += -Ez_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
-
-				DFT_Hx_re[Sidx] +=  Hx_re[Fidx] * cos(2.*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hx_im[Sidx] += -Hx_re[Fidx] * sin(2.*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hx_re[Sidx] += Hx_re[Fidx] * c;
+				DFT_Hx_im[Sidx] -= Hx_re[Fidx] * s;
 			}
 		}
 	}
@@ -221,56 +223,61 @@ void do_RFT_to_get_Sy(
 
 void do_RFT_to_get_Sz(
 	int MPIrank,
-	int Nf,	  int tstep,
+	int Nf,
 	int Ny,	  int Nz,
 	int xsrt, int xend,
 	int ysrt, int yend,
 	int zsrt, int zend,
-	double dt, double dx, double dy,
-	double* freqs,
-	double* DFT_Ex_re, double* DFT_Ey_re,
-	double* DFT_Ex_im, double* DFT_Ey_im,
-	double* DFT_Hx_re, double* DFT_Hy_re,
-	double* DFT_Hx_im, double* DFT_Hy_im,
-	double* Ex_re, double* Ey_re,
-	double* Hx_re, double* Hy_re
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT_Ex_re, acc_t* DFT_Ey_re,
+	acc_t* DFT_Ex_im, acc_t* DFT_Ey_im,
+	acc_t* DFT_Hx_re, acc_t* DFT_Hy_re,
+	acc_t* DFT_Hx_im, acc_t* DFT_Hy_im,
+	real_t* Ex_re, real_t* Ey_re,
+	real_t* Hx_re, real_t* Hy_re
 ){
 
 	int i, j, k, f;
 	int Fidx, Sidx; // Field xy-plane index, Sz xy-plane index
-	int nx, ny, nz;
-
-	int omp_max = omp_get_max_threads();
-	omp_set_num_threads(omp_max);
-
-	int omp_in_use = omp_get_num_threads();
-	int omp_me = omp_get_thread_num();
+	int nx, ny;
+	acc_t c, s;
 
 	k  = zsrt;
 	nx = xend - xsrt;
 	ny = yend - ysrt;
-	nz = zend - zsrt;
 
-	#pragma omp parallel for schedule(dynamic)
+	#pragma omp parallel for \
+		shared(	Nf, Ny, Nz, nx, ny, k, xsrt, ysrt, \
+				coswdt, sinwdt, \
+				DFT_Ex_re, DFT_Ex_im, \
+				DFT_Ey_re, DFT_Ey_im, \
+				DFT_Hx_re, DFT_Hx_im, \
+				DFT_Hy_re, DFT_Hy_im, \
+				Ex_re, Ey_re, Hx_re, Hy_re) \
+		private(f, i, j, Sidx, Fidx, c, s)
 	for(f=0; f<Nf; f++){
+
+		c = coswdt[f];
+		s = sinwdt[f];
+
 		for(i=0; i<nx; i++){
 			for(j=0; j<ny; j++){
-				
+
 				// idx for Sz
 				Sidx   = (j   ) + (i     )*ny + (f     )*nx*ny;
-				Fidx   = (zsrt) + (j+ysrt)*Nz + (i+xsrt)*Ny*Nz;
+				Fidx   = (k   ) + (j+ysrt)*Nz + (i+xsrt)*Ny*Nz;
 
-				DFT_Ex_re[Sidx] +=  Ex_re[Fidx] * cos(2*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ex_im[Sidx] += -Ex_re[Fidx] * sin(2*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Ex_re[Sidx] += Ex_re[Fidx] * c;
+				DFT_Ex_im[Sidx] -= Ex_re[Fidx] * s;
 
-				DFT_Ey_re[Sidx] +=  Ey_re[Fidx] * cos(2*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Ey_im[Sidx] += -Ey_re[Fidx] * sin(2*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Ey_re[Sidx] += Ey_re[Fidx] * c;
+				DFT_Ey_im[Sidx] -= Ey_re[Fidx] * s;
 
-				DFT_Hx_re[Sidx] +=  Hx_re[Fidx] * cos(2*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hx_im[Sidx] += -Hx_re[Fidx] * sin(2*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hx_re[Sidx] += Hx_re[Fidx] * c;
+				DFT_Hx_im[Sidx] -= Hx_re[Fidx] * s;
 
-				DFT_Hy_re[Sidx] +=  Hy_re[Fidx] * cos(2*PI*freqs[f]*tstep*dt) * dt;
-				DFT_Hy_im[Sidx] += -Hy_re[Fidx] * sin(2*PI*freqs[f]*tstep*dt) * dt;
+				DFT_Hy_re[Sidx] += Hy_re[Fidx] * c;
+				DFT_Hy_im[Sidx] -= Hy_re[Fidx] * s;
 			}
 		}
 	}
@@ -278,3 +285,77 @@ void do_RFT_to_get_Sz(
 	return;
 
 }
+
+/*
+	Frequency-blocked accumulation. DFT has the shape (nx, ny, nz, 4, Nf, 2):
+	for every plane point and every field, the Nf frequencies are stored
+	next to each other as interleaved (re, im) pairs. Each field sample is
+	read once and updates all of its frequencies in one contiguous sweep.
+*/
+void do_RFT_blocked(
+	int Nf,
+	int Ny,	  int Nz,
+	int xsrt, int xend,
+	int ysrt, int yend,
+	int zsrt, int zend,
+	acc_t* coswdt, acc_t* sinwdt,
+	acc_t* DFT,
+	real_t* F0, real_t* F1,
+	real_t* F2, real_t* F3
+){
+
+	int i, j, k, f, p;
+	int Fidx;
+	int nx, ny, nz, npts;
+	acc_t v0, v1, v2, v3;
+	acc_t * restrict acc0;
+	acc_t * restrict acc1;
+	acc_t * restrict acc2;
+	acc_t * restrict acc3;
+
+	nx = xend - xsrt;
+	ny = yend - ysrt;
+	nz = zend - zsrt;
+	npts = nx * ny * nz;
+
+	#pragma omp parallel for \
+		shared(	Nf, Ny, Nz, ny, nz, npts, xsrt, ysrt, zsrt, \
+				coswdt, sinwdt, DFT, F0, F1, F2, F3) \
+		private(p, i, j, k, f, Fidx, v0, v1, v2, v3, acc0, acc1, acc2, acc3)
+	for(p=0; p<npts; p++){
+
+		i = p / (ny*nz);
+		j = (p / nz) % ny;
+		k = p % nz;
+
+		Fidx = (k+zsrt) + (j+ysrt)*Nz + (i+xsrt)*Ny*Nz;
+
+		v0 = F0[Fidx];
+		v1 = F1[Fidx];
+		v2 = F2[Fidx];
+		v3 = F3[Fidx];
+
+		acc0 = DFT + (p*4    )*Nf*2;
+		acc1 = DFT + (p*4 + 1)*Nf*2;
+		acc2 = DFT + (p*4 + 2)*Nf*2;
+		acc3 = DFT + (p*4 + 3)*Nf*2;
+
+		for(f=0; f<Nf; f++){
+
+			acc0[2*f  ] += v0 * coswdt[f];
+			acc0[2*f+1] -= v0 * sinwdt[f];
+
+			acc1[2*f  ] += v1 * coswdt[f];
+			acc1[2*f+1] -= v1 * sinwdt[f];
+
+			acc2[2*f  ] += v2 * coswdt[f];
+			acc2[2*f+1] -= v2 * sinwdt[f];
+
+			acc3[2*f  ] += v3 * coswdt[f];
+			acc3[2*f+1] -= v3 * sinwdt[f];
+		}
+	}
+
+	return;
+
+}
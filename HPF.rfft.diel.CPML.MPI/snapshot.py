@@ -0,0 +1,249 @@
+import numpy as np
+import os, json, threading, queue
+
+class Snapshot(object):
+    """Write planes and subvolumes of the fields from every rank without gathering them.
+
+    Each rank appends its own part of the requested regions to its own file,
+    graph/snapshot/<name>.<rank>.bin, one record per call of write().
+    The copy of the fields is done in the time loop, the file I/O in a writer thread.
+    close() writes graph/snapshot/<name>.index.json, which tells load_snapshot
+    where the parts of every region are.
+    """
+
+    def __init__(self, Space, name, path, maxqueue=4):
+        """
+        PARAMETERS
+        ----------
+        Space : Basic3D or Empty3D object.
+
+        name : string
+            Prefix of the files.
+
+        path : string
+            The files are written in path + 'graph/snapshot/'.
+
+        maxqueue : int
+            Number of records which may wait for the writer thread.
+            write() blocks when the queue is full.
+
+        RETURNS
+        -------
+        None
+        """
+
+        self.Space   = Space
+        self.name    = name
+        self.savedir = path + 'graph/snapshot/'
+        self.regions = []
+        self.tsteps  = []
+        self.queue   = queue.Queue(maxsize=maxqueue)
+        self.thread  = None
+
+        if self.Space.MPIrank == 0: os.makedirs(self.savedir, exist_ok=True)
+
+        self.Space.MPIcomm.Barrier()
+
+        xsrt, xend = self.Space.myNx_indice[self.Space.MPIxrank]
+        ysrt, yend = self.Space.myNy_indice[self.Space.MPIyrank]
+
+        self.mybox = ((xsrt, xend), (ysrt, yend), (0, self.Space.Nz))
+
+    def add_plane(self, what, xidx=None, yidx=None, zidx=None, member=0):
+        """Request the plane of the field 'what' at one of xidx, yidx or zidx.
+
+        PARAMETERS
+        ----------
+        what : string
+            'Ex', 'Ey', 'Ez', 'Hx', 'Hy' or 'Hz'.
+
+        xidx, yidx, zidx : int
+            Only one of them is given.
+
+        member : int
+            The excitation to write when Space.batch > 1.
+
+        RETURNS
+        -------
+        label : string
+            The name of the region in the index.
+        """
+
+        srt = [0, 0, 0]
+        end = list(self.Space.grid)
+
+        if   xidx != None: srt[0], end[0], label = xidx, xidx+1, '%s_x%d' %(what, xidx)
+        elif yidx != None: srt[1], end[1], label = yidx, yidx+1, '%s_y%d' %(what, yidx)
+        elif zidx != None: srt[2], end[2], label = zidx, zidx+1, '%s_z%d' %(what, zidx)
+        else: raise ValueError("Plane is not defined. Please insert one of x,y or z index of the plane.")
+
+        return self.add_volume(what, tuple(srt), tuple(end), member=member, label=label)
+
+    def add_volume(self, what, srt, end, member=0, label=None):
+        """Request the field 'what' in the box [srt, end).
+
+        PARAMETERS
+        ----------
+        what : string
+            'Ex', 'Ey', 'Ez', 'Hx', 'Hy' or 'Hz'.
+
+        srt, end : tuple
+            Global indices of the box.
+
+        member : int
+            The excitation to write when Space.batch > 1.
+
+        label : string
+            The name of the region in the index.
+
+        RETURNS
+        -------
+        label : string
+        """
+
+        assert self.thread is None, "Regions must be added before the first write."
+        assert what in ('Ex', 'Ey', 'Ez', 'Hx', 'Hy', 'Hz')
+        assert len(srt) == 3 and len(end) == 3
+
+        for s, e, N in zip(srt, end, self.Space.grid): assert 0 <= s < e <= N
+
+        if label == None: label = '%s_%d_%d_%d_%d_%d_%d' %((what,) + tuple(srt) + tuple(end))
+
+        # The part of the box on this rank, in global indices.
+        box = [(max(s, mys), min(e, mye)) for s, e, (mys, mye) in zip(srt, end, self.mybox)]
+
+        if any(s >= e for s, e in box): box = None
+
+        self.regions.append({'label': label, 'what': what, 'member': member, 'srt': list(srt), 'end': list(end), 'box': box})
+
+        return label
+
+    def write(self, tstep):
+        """Copy the requested regions of this rank and hand them to the writer thread.
+
+        PARAMETERS
+        ----------
+        tstep : int
+
+        RETURNS
+        -------
+        None
+        """
+
+        if self.thread is None:
+
+            self.fh = open(self.savedir + '%s.%05d.bin' %(self.name, self.Space.MPIrank), 'wb')
+            self.thread = threading.Thread(target=self._writer, daemon=True)
+            self.thread.start()
+
+        blocks = []
+
+        for region in self.regions:
+
+            if region['box'] is None: continue
+
+            field = getattr(self.Space, region['what']+'_re')
+
+            if self.Space.batch > 1: field = field[region['member']]
+
+            local = tuple(slice(s-mys, e-mys) for (s, e), (mys, mye) in zip(region['box'], self.mybox))
+
+            blocks.append(np.ascontiguousarray(field[local]))
+
+        self.tsteps.append(tstep)
+        self.queue.put(blocks)
+
+    def _writer(self):
+
+        while True:
+
+            blocks = self.queue.get()
+
+            if blocks is None: break
+
+            for block in blocks: self.fh.write(memoryview(block).cast('B'))
+
+    def close(self):
+        """Wait for the writer thread and write the index at rank 0.
+
+        RETURNS
+        -------
+        None
+        """
+
+        if self.thread is not None:
+
+            self.queue.put(None)
+            self.thread.join()
+            self.fh.close()
+            self.thread = None
+
+        boxes = self.Space.MPIcomm.gather([region['box'] for region in self.regions], root=0)
+
+        if self.Space.MPIrank == 0:
+
+            index = {
+                        'grid'   : list(self.Space.grid),
+                        'dtype'  : np.dtype(self.Space.dtype).str,
+                        'MPIsize': self.Space.MPIsize,
+                        'tsteps' : self.tsteps,
+                        'regions': [{key: region[key] for key in ('label', 'what', 'member', 'srt', 'end')} for region in self.regions],
+                        'boxes'  : boxes,
+                    }
+
+            with open(self.savedir + '%s.index.json' %self.name, 'w') as f: json.dump(index, f)
+
+        self.Space.MPIcomm.Barrier()
+
+
+def load_snapshot(savedir, name, label):
+    """Assemble a region written by Snapshot from the files of all ranks.
+
+    PARAMETERS
+    ----------
+    savedir : string
+        The directory of the files, path + 'graph/snapshot/'.
+
+    name : string
+        The name given to Snapshot.
+
+    label : string
+        The label of the region.
+
+    RETURNS
+    -------
+    tsteps : list
+        The time steps of the records.
+
+    data : ndarray
+        The region at every time step, with shape (len(tsteps),) + (end - srt).
+    """
+
+    with open(savedir + '%s.index.json' %name) as f: index = json.load(f)
+
+    dtype   = np.dtype(index['dtype'])
+    tsteps  = index['tsteps']
+    labels  = [region['label'] for region in index['regions']]
+    which   = labels.index(label)
+    region  = index['regions'][which]
+    srt     = region['srt']
+    shape   = tuple(e-s for s, e in zip(srt, region['end']))
+    data    = np.zeros((len(tsteps),) + shape, dtype=dtype)
+
+    for rank, boxes in enumerate(index['boxes']):
+
+        # One record of a rank holds its parts of all the regions, in order.
+        sizes  = [0 if box is None else int(np.prod([e-s for s, e in box])) for box in boxes]
+        offset = sum(sizes[:which])
+
+        if sizes[which] == 0: continue
+
+        record = np.memmap(savedir + '%s.%05d.bin' %(name, rank), dtype=dtype, mode='r', shape=(len(tsteps), sum(sizes)))
+        box    = boxes[which]
+        glob   = tuple(slice(s-gs, e-gs) for (s, e), gs in zip(box, srt))
+
+        data[(slice(None),) + glob] = record[:, offset:offset+sizes[which]].reshape((len(tsteps),) + tuple(e-s for s, e in box))
+
+        del record
+
+    return tsteps, data
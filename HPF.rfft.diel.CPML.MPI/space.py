@@ -1,11 +1,247 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import time, os, datetime, sys, ctypes
+import time, os, datetime, sys, ctypes, json, numbers
 from mpi4py import MPI
 from mpl_toolkits.mplot3d import axes3d
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from scipy.constants import c, mu_0, epsilon_0
 
+def xplane_cost(Nx, npml=0, pml='', collectors=(), sources=(), weights=None):
+    """Estimate the update cost of every x plane.
+
+    Every plane costs 1 for the core update. The planes in the x-PML, the planes
+    of the DFT collectors and the source planes add the cost given in weights.
+    Use the result as the xcost argument of Basic3D.
+
+    PARAMETERS
+    ----------
+    Nx : int
+        Number of grid points along x.
+
+    npml : int
+        Number of PML cells along x.
+
+    pml : string
+        '+', '-' or '+-'. The x PML region, same as PMLregion['x'] of set_pml().
+
+    collectors : list of tuple
+        (xsrt, xend, nfreq) of every DFT collector.
+
+    sources : list of tuple
+        (xsrt, xend) of every source.
+
+    weights : dict
+        Extra cost of one plane relative to the core update.
+        'pml' for a CPML plane, 'collector' for one frequency of a collector plane,
+        'source' for a source plane. Default is {'pml':.3, 'collector':.02, 'source':.05}.
+
+    RETURNS
+    -------
+    cost : ndarray
+        Estimated cost of each x plane.
+    """
+
+    w = {'pml':.3, 'collector':.02, 'source':.05}
+    if weights is not None: w.update(weights)
+
+    cost = np.ones(Nx)
+
+    if '+' in pml: cost[Nx-npml:] += w['pml']
+    if '-' in pml: cost[:npml]    += w['pml']
+
+    for xsrt, xend, nfreq in collectors: cost[xsrt:max(xend, xsrt+1)] += w['collector'] * nfreq
+    for xsrt, xend        in sources   : cost[xsrt:max(xend, xsrt+1)] += w['source']
+
+    return cost
+
+
+def partition_x(cost, nparts, min_edge=1):
+    """Split the x planes into contiguous slabs with the least maximum cost.
+
+    PARAMETERS
+    ----------
+    cost : array_like
+        Cost of each x plane, estimated by xplane_cost() or measured by Basic3D.measure_xcost().
+
+    nparts : int
+        Number of slabs.
+
+    min_edge : int
+        Minimum number of planes of the first and the last slab. Give the npml of set_pml,
+        since the x-PML must fit in the edge slabs while its cost makes them thinner.
+
+    RETURNS
+    -------
+    indice : list of tuple
+        (xstart, xend) of each slab.
+    """
+
+    cost = np.asarray(cost, dtype=np.float64)
+    Nx   = len(cost)
+
+    min_edge = max(int(min_edge), 1)
+
+    assert Nx >= nparts, "Nx must be at least the number of nodes along x."
+    assert (cost > 0).all(), "The cost of every plane must be positive."
+
+    if nparts == 1:
+        assert Nx >= min_edge, "Nx must be at least min_edge."
+        return [(0, Nx)]
+
+    assert Nx >= 2*min_edge + nparts-2, "Nx is too small for {} slabs with {} planes at each edge.".format(nparts, min_edge)
+
+    def split(cap):
+
+        bounds = [0]
+        load   = 0.
+        peak   = 0.
+
+        for i, w in enumerate(cost):
+
+            # Planes of the current slab, the planes it needs and the slabs still to start after it.
+            width = i - bounds[-1]
+            need  = min_edge if len(bounds) == 1 else 1
+            rest  = nparts - len(bounds)
+
+            # A slab may start at i if the slabs after it still fit, the last one with min_edge planes.
+            # It must start there when every remaining plane is needed by them.
+            room   = rest == 0 or Nx - i >= rest-1 + min_edge
+            forced = rest  > 0 and Nx - i == rest-1 + min_edge
+
+            if width >= need and ((load + w > cap and room) or forced):
+                bounds.append(i)
+                load = 0.
+
+            load += w
+            peak  = max(peak, load)
+
+        return bounds, peak
+
+    def fits(cap):
+
+        # The edge slabs may have to take more than cap.
+        bounds, peak = split(cap)
+
+        return len(bounds) <= nparts and peak <= cap
+
+    # split() adds the costs one by one, so the upper bound is summed in the same order.
+    # cost.sum() may round below it and cut off the last plane.
+    lo = cost.max()
+    hi = np.cumsum(cost)[-1]
+
+    for i in range(100):
+
+        if hi - lo <= 1e-12 * hi: break
+
+        mid = (lo + hi) / 2
+        if fits(mid): hi = mid
+        else        : lo = mid
+
+    bounds = split(hi)[0]
+
+    assert len(bounds) == nparts, "x planes could not be split into {} slabs.".format(nparts)
+
+    bounds += [Nx]
+
+    return [(bounds[p], bounds[p+1]) for p in range(nparts)]
+
+
+def x_slabs(Nx, nparts, xcost=None, min_edge=1):
+    """Global x range of every x-slab, as Basic3D and Empty3D split the space.
+
+    PARAMETERS
+    ----------
+    Nx : int
+        Number of grid points along x.
+
+    nparts : int
+        Number of x-slabs.
+
+    xcost : array_like
+        Cost of each x plane. If None, every x-slab gets the same number of planes up to one.
+        Otherwise the x-slabs are sized by partition_x().
+
+    min_edge : int
+        Minimum number of planes of the first and the last x-slab with xcost.
+
+    RETURNS
+    -------
+    indice : list of tuple
+        (xstart, xend) of each slab.
+    """
+
+    if xcost is None:
+
+        # The first Nx % nparts slabs get one more plane.
+        widths = [Nx // nparts + (rank < Nx % nparts) for rank in range(nparts)]
+        bounds = np.concatenate(([0], np.cumsum(widths)))
+
+        return [(int(bounds[rank]), int(bounds[rank+1])) for rank in range(nparts)]
+
+    assert len(xcost) == Nx, "xcost must have Nx elements."
+
+    return partition_x(xcost, nparts, min_edge)
+
+
+class _Member(object):
+    """Views of the arrays of one excitation in a batch, under the attribute names of Basic3D."""
+
+    def __init__(self, Space, b):
+
+        for name in Space.batch_arrays: setattr(self, name, getattr(Space, name)[b])
+
+
+class _CPML(ctypes.Structure):
+    """Mirror of the CPML struct of the fused kernels. The psi of the layers not in this rank are NULL."""
+
+    _fields_ = [('npml', ctypes.c_int)]
+    _fields_+= [(name, ctypes.c_void_p) for name in ('kappax', 'bx', 'ax', 'kappay', 'by', 'ay', 'kappaz', 'bz', 'az')]
+    _fields_+= [('%s%s%s_%s' %(f, a, axis, side), ctypes.c_void_p)                      \
+                    for f in ('h', 'e')                                                 \
+                    for axis, pair in (('x', ('y', 'z')), ('y', ('x', 'z')), ('z', ('x', 'y'))) \
+                    for side in ('p', 'm')                                              \
+                    for a in pair]
+
+
+class _Source(ctypes.Structure):
+    """Mirror of the Source struct of steploop.c."""
+
+    _fields_ = [('field', ctypes.c_void_p), ('Ny', ctypes.c_int), ('Nz', ctypes.c_int)]
+    _fields_+= [(name, ctypes.c_int) for name in ('xsrt', 'xend', 'ysrt', 'yend', 'zsrt', 'zend', 'soft')]
+    _fields_+= [('pulses', ctypes.c_void_p)]
+
+
+class _Collector(ctypes.Structure):
+    """Mirror of the Collector struct of steploop.c."""
+
+    _fields_ = [('kernel', ctypes.c_void_p)]
+    _fields_+= [(name, ctypes.c_int) for name in ('blocked', 'Nf', 'Ny', 'Nz', 'xsrt', 'xend', 'ysrt', 'yend', 'zsrt', 'zend', 'stride', 'single')]
+    _fields_+= [(name, ctypes.c_void_p) for name in ('freqs', 'coswdt', 'sinwdt')]
+    _fields_+= [('DFT', ctypes.c_void_p * 8), ('F', ctypes.c_void_p * 4)]
+
+
+class _HalfStep(ctypes.Structure):
+    """Mirror of the HalfStep struct of steploop.c."""
+
+    _fields_ = [('kernel', ctypes.c_void_p)]
+    _fields_+= [('ncopy', ctypes.c_int), ('copy_src', ctypes.c_void_p * 2), ('copy_dst', ctypes.c_void_p * 2)]
+    _fields_+= [('nreqs', ctypes.c_int), ('reqs', ctypes.POINTER(ctypes.c_void_p))]
+    _fields_+= [('isrt', ctypes.c_int * 2), ('iend', ctypes.c_int * 2)]
+    _fields_+= [('F', ctypes.c_void_p * 3), ('G', ctypes.c_void_p * 3), ('coef', ctypes.c_void_p), ('recv', ctypes.c_void_p * 2)]
+
+
+class _StepLoop(ctypes.Structure):
+    """Mirror of the StepLoop struct of steploop.c."""
+
+    _fields_ = [(name, ctypes.c_void_p) for name in ('plans', 'pml', 'win')]
+    _fields_+= [(name, ctypes.c_int) for name in ('MPIsize', 'MPIrank', 'myNx', 'Ny', 'Nz')]
+    _fields_+= [('pml_widths', ctypes.c_int * 6), ('dt', ctypes.c_double), ('dx', ctypes.c_double)]
+    _fields_+= [(name, ctypes.c_void_p) for name in ('ky', 'kz', 'mat')]
+    _fields_+= [('half', _HalfStep * 2)]
+    _fields_+= [('nsrc', ctypes.c_int), ('src', ctypes.POINTER(_Source))]
+    _fields_+= [('ncol', ctypes.c_int), ('col', ctypes.POINTER(_Collector))]
+
+
 class Basic3D(object):
 
     def __init__(self, grid, gridgap, courant, dt, tsteps, dtype, **kwargs):
@@ -23,6 +259,7 @@ class Basic3D(object):
 
         dtype : class numpy dtype
             choose np.float32 or np.float64
+            With np.float32, the single precision kernels (core.real.f32.so, pml.f32.so, ...) are used.
 
         kwargs : string
             
@@ -33,6 +270,42 @@ class Basic3D(object):
                 Set the courant number. For FDTD, default is 0.5
                 For PSTD, default is 0.25
 
+            materials : string
+                'dense' or 'compact'. Default is 'dense'.
+                'dense' keeps eps, mu and the conductivities in eight full-size arrays,
+                from which the kernels compute the update coefficients of each cell.
+                'compact' keeps only a uint16 material index per cell and a table of
+                the distinct materials. Use put_material() and get_material() to access them.
+
+            pencil : int
+                Number of ranks along y. Default is 1, which splits the space into x-slabs only.
+                With pencil > 1, the ranks form a (MPIsize/pencil) x pencil grid and each rank holds
+                a (myNx, myNy, Nz) pencil. The y derivatives are taken after an all-to-all transpose
+                among the ranks of the same x-slab. Ny and Nz must be multiples of pencil.
+
+            xcost : array_like
+                Cost of each x plane. Default is None, which gives every x-slab the same number of planes
+                up to one. Otherwise the x-slabs are sized to balance the cost, see partition_x().
+                Estimate it with xplane_cost() or measure it with measure_xcost() on a previous run.
+
+            min_edge : int
+                Minimum number of planes of the first and the last x-slab with xcost. Default is 1.
+                Give the npml of set_pml, since the cost of the x-PML makes the edge slabs thinner
+                and the x-PML must fit in them.
+
+            batch : int
+                Number of independent excitations of the same geometry. Default is 1.
+                With batch > 1, the fields have the shape (batch, myNx, myNy, Nz) and share one set of
+                materials and PML parameters. The y and z derivatives of all excitations are taken by
+                one batched FFT and the boundary planes of all excitations go in one halo message.
+                Use the member argument of put_src to excite each of them.
+
+            shared_halo : bool
+                Default is True. Ey, Ez, Hy and Hz are allocated in an MPI-3 shared memory window of the
+                ranks along x on the same node. A neighbor on the same node reads their boundary planes in place
+                and only an empty message tells it that they are ready. Neighbors on other nodes get the planes
+                in messages as before.
+
         RETURNS
         -------
         None
@@ -50,6 +323,11 @@ class Basic3D(object):
         assert len(grid)    == 3, "Simulation grid should be a tuple with length 3."
         assert len(gridgap) == 3, "Argument 'gridgap' should be a tuple with length 3."
 
+        # Suffix of the shared objects built for the precision of the fields.
+        if   np.dtype(self.dtype) == np.float64: self.clib_suffix = ''
+        elif np.dtype(self.dtype) == np.float32: self.clib_suffix = '.f32'
+        else: raise ValueError("dtype should be np.float32 or np.float64.")
+
         self.tsteps = tsteps        
 
         self.grid = grid
@@ -84,8 +362,41 @@ class Basic3D(object):
         self.courant = courant
         self.dt = dt
 
+        self.materials = 'dense'
+        self.MPIysize  = 1
+        self.xcost     = None
+        self.min_edge  = 1
+        self.tfsf      = False
+        self.batch     = 1
+        self.shared_halo = True
+
         for key, value in kwargs.items():
-            if key == 'courant': self.courant = value
+            if key == 'courant'  : self.courant   = value
+            if key == 'materials': self.materials = value
+            if key == 'pencil'   : self.MPIysize  = int(value)
+            if key == 'xcost'    : self.xcost     = value
+            if key == 'min_edge' : self.min_edge  = int(value)
+            if key == 'batch'    : self.batch     = int(value)
+            if key == 'shared_halo': self.shared_halo = value
+
+        if self.materials not in ('dense', 'compact'): raise ValueError("materials should be 'dense' or 'compact'.")
+
+        #############################################################################
+        ####################### Arrange the ranks in an x-y grid ####################
+        #############################################################################
+
+        # world rank = MPIxrank * MPIysize + MPIyrank.
+        # MPIcomm_x connects the ranks along x, MPIcomm_y the ranks along y.
+        assert self.MPIsize % self.MPIysize == 0, "The number of nodes must be a multiple of pencil."
+        assert self.Ny      % self.MPIysize == 0, "Ny must be a multiple of pencil."
+        assert self.Nz      % self.MPIysize == 0, "Nz must be a multiple of pencil."
+
+        self.MPIxsize = self.MPIsize // self.MPIysize
+        self.MPIxrank = self.MPIrank // self.MPIysize
+        self.MPIyrank = self.MPIrank %  self.MPIysize
+
+        self.MPIcomm_x = self.MPIcomm.Split(color=self.MPIyrank, key=self.MPIxrank)
+        self.MPIcomm_y = self.MPIcomm.Split(color=self.MPIxrank, key=self.MPIyrank)
 
         self.maxdt = 2. / c / np.sqrt( (2./self.dx)**2 + (np.pi/self.dy)**2 + (np.pi/self.dz)**2 )
 
@@ -96,71 +407,194 @@ class Basic3D(object):
         """
 
         assert self.dt < self.maxdt, "Time interval is too big so that causality is broken. Lower the courant number."
-        assert float(self.Nx) % self.MPIsize == 0., "Nx must be a multiple of the number of nodes."
+        assert self.Nx >= self.MPIxsize, "Nx must be at least the number of nodes along x."
         
+        ###############################################################################
+        ######################## Slice object that each node got ######################
+        ###############################################################################
+
+        xindice = x_slabs(self.Nx, self.MPIxsize, self.xcost, self.min_edge)
+
+        self.myNx_slices = []
+        self.myNx_indice = []
+
+        for xstart, xend in xindice:
+
+            self.myNx_slices.append(slice(xstart, xend))
+            self.myNx_indice.append(     (xstart, xend))
+
         #############################################################################
         ################# Set the loc_grid each node should possess #################
         #############################################################################
 
-        self.myNx     = int(self.Nx / self.MPIsize)
-        self.loc_grid = [self.myNx, self.Ny, self.Nz]
+        self.myNx     = self.myNx_indice[self.MPIxrank][1] - self.myNx_indice[self.MPIxrank][0]
+        self.myNy     = int(self.Ny / self.MPIysize)
+        self.loc_grid = [self.myNx, self.myNy, self.Nz]
+
+        # Fields, derivatives and the PML auxiliary arrays have a leading batch axis when batch > 1.
+        if self.batch > 1: self.batch_shape = (self.batch,)
+        else             : self.batch_shape = ()
+
+        self.field_shape = self.batch_shape + tuple(self.loc_grid)
 
-        self.Ex_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.Ey_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.Ez_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        self.Ex_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.Hx_re = np.zeros(self.field_shape, dtype=self.dtype)
 
-        self.Hx_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.Hy_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.Hz_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        self._alloc_shared_fields()
 
         ###############################################################################
 
-        self.diffxEy_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffxEz_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffyEx_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffyEz_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffzEx_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffzEy_re = np.zeros(self.loc_grid, dtype=self.dtype)
-
-        self.diffxHy_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffxHz_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffyHx_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffyHz_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffzHx_re = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.diffzHy_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        self.diffxEy_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffxEz_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffyEx_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffyEz_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffzEx_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffzEy_re = np.zeros(self.field_shape, dtype=self.dtype)
+
+        self.diffxHy_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffxHz_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffyHx_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffyHz_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffzHx_re = np.zeros(self.field_shape, dtype=self.dtype)
+        self.diffzHy_re = np.zeros(self.field_shape, dtype=self.dtype)
         ###############################################################################
 
-        self.eps_HEE  = np.ones(self.loc_grid, dtype=self.dtype) * epsilon_0
-        self.eps_EHH  = np.ones(self.loc_grid, dtype=self.dtype) * epsilon_0
+        # Columns of the material table.
+        self.mat_columns = ('eps_HEE', 'eps_EHH', 'mu_HEE', 'mu_EHH', 'econ_HEE', 'econ_EHH', 'mcon_HEE', 'mcon_EHH')
 
-        self.mu_HEE   = np.ones(self.loc_grid, dtype=self.dtype) * mu_0
-        self.mu_EHH   = np.ones(self.loc_grid, dtype=self.dtype) * mu_0
+        if self.materials == 'dense':
 
-        self.econ_HEE = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.econ_EHH = np.zeros(self.loc_grid, dtype=self.dtype)
+            # The arrays read by the update of E and H field are views of one block each,
+            # which the kernels take in place of the coefficient table.
+            self.dense_E  = np.zeros((4,) + tuple(self.loc_grid), dtype=self.dtype)
+            self.dense_H  = np.zeros((4,) + tuple(self.loc_grid), dtype=self.dtype)
 
-        self.mcon_HEE = np.zeros(self.loc_grid, dtype=self.dtype)
-        self.mcon_EHH = np.zeros(self.loc_grid, dtype=self.dtype)
+            self.eps_HEE, self.eps_EHH, self.econ_HEE, self.econ_EHH = self.dense_E
+            self. mu_HEE, self. mu_EHH, self.mcon_HEE, self.mcon_EHH = self.dense_H
 
-        ###############################################################################
-        ######################## Slice object that each node got ######################
-        ###############################################################################
-        
-        self.myNx_slices = []
-        self.myNx_indice = []
+            self.eps_HEE[...] = epsilon_0
+            self.eps_EHH[...] = epsilon_0
 
-        for rank in range(self.MPIsize):
+            self. mu_HEE[...] = mu_0
+            self. mu_EHH[...] = mu_0
 
-            xstart = (rank    ) * self.myNx
-            xend   = (rank + 1) * self.myNx
+        else:
 
-            self.myNx_slices.append(slice(xstart, xend))
-            self.myNx_indice.append(     (xstart, xend))
+            # Row 0 is the vacuum.
+            self.mat_index  = np.zeros(self.loc_grid, dtype=np.uint16)
+            self.mat_table  = np.array([[epsilon_0, epsilon_0, mu_0, mu_0, 0., 0., 0., 0.]])
+            self.mat_lookup = {tuple(self.mat_table[0]) : 0}
+
+        self.myNy_slices = []
+        self.myNy_indice = []
+
+        for rank in range(self.MPIysize):
+
+            ystart = (rank    ) * self.myNy
+            yend   = (rank + 1) * self.myNy
+
+            self.myNy_slices.append(slice(ystart, yend))
+            self.myNy_indice.append(     (ystart, yend))
 
         self.MPIcomm.Barrier()
 
         #print("rank{:>2}:\tlocal xindex: {},\tlocal xslice: {}" \
-        #       .format(self.MPIrank, self.myNx_indice[self.MPIrank], self.myNx_slices[self.MPIrank]))
+        #       .format(self.MPIxrank, self.myNx_indice[self.MPIxrank], self.myNx_slices[self.MPIxrank]))
+
+    def measure_xcost(self, elapsed):
+        """Measure the cost of every x plane from the elapsed time of each rank.
+
+        The time of an x-slab is the longest time among its ranks along y, spread evenly over its planes.
+        Pass the result as the xcost argument of the next Basic3D to rebalance the x-slabs.
+
+        PARAMETERS
+        ----------
+        elapsed : float
+            Time this rank spent in the time loop.
+
+        RETURNS
+        -------
+        cost : ndarray
+            Measured cost of each x plane. Every rank gets the same array.
+        """
+
+        slab_time = self.MPIcomm_y.allreduce(elapsed, op=MPI.MAX)
+        slab_time = self.MPIcomm_x.allgather(slab_time)
+
+        cost = np.empty(self.Nx)
+
+        for rank in range(self.MPIxsize):
+            xsrt, xend = self.myNx_indice[rank]
+            cost[xsrt:xend] = slab_time[rank] / (xend - xsrt)
+
+        return cost
+
+    def _alloc_shared_fields(self):
+        """Allocate Ey, Ez, Hy and Hz, in a shared memory window if an x-neighbor is on the same node.
+
+        Sets shm_prev and shm_next, which tell if the previous and the next rank along x
+        are on the same node, and shm_fields_prev and shm_fields_next, the (Ey, Ez, Hy, Hz)
+        arrays of those neighbors.
+        """
+
+        self.shm_win  = None
+        self.shm_prev = False
+        self.shm_next = False
+
+        if self.shared_halo == True and self.MPIxsize > 1:
+
+            self.MPIcomm_node = self.MPIcomm_x.Split_type(MPI.COMM_TYPE_SHARED, key=self.MPIxrank)
+
+            xgroup = self.MPIcomm_x.Get_group()
+            ngroup = self.MPIcomm_node.Get_group()
+
+            neighbors = [self.MPIxrank-1, self.MPIxrank+1]
+            neighbors = [rank if 0 <= rank < self.MPIxsize else MPI.PROC_NULL for rank in neighbors]
+            node_prev, node_next = MPI.Group.Translate_ranks(xgroup, neighbors, ngroup)
+
+            xgroup.Free()
+            ngroup.Free()
+
+            self.shm_prev = node_prev not in (MPI.UNDEFINED, MPI.PROC_NULL)
+            self.shm_next = node_next not in (MPI.UNDEFINED, MPI.PROC_NULL)
+
+            shm_used = self.MPIcomm_node.allreduce(self.shm_prev or self.shm_next, op=MPI.LOR)
+
+        else: shm_used = False
+
+        if shm_used == False:
+
+            self.Ey_re = np.zeros(self.field_shape, dtype=self.dtype)
+            self.Ez_re = np.zeros(self.field_shape, dtype=self.dtype)
+            self.Hy_re = np.zeros(self.field_shape, dtype=self.dtype)
+            self.Hz_re = np.zeros(self.field_shape, dtype=self.dtype)
+
+            return
+
+        itemsize = np.dtype(self.dtype).itemsize
+        nbytes   = 4 * int(np.prod(self.field_shape)) * itemsize
+
+        self.shm_win = MPI.Win.Allocate_shared(nbytes, itemsize, comm=self.MPIcomm_node)
+
+        # Passive target epoch for Win.Sync, which orders the loads and stores around the halo messages.
+        self.shm_win.Lock_all(MPI.MODE_NOCHECK)
+
+        def fields_of(node_rank, xrank):
+            buf, itemsize = self.shm_win.Shared_query(node_rank)
+            xsrt, xend = self.myNx_indice[xrank]
+            shape = (4,) + self.batch_shape + (xend-xsrt, self.myNy, self.Nz)
+            return np.frombuffer(buf, dtype=self.dtype, count=int(np.prod(shape))).reshape(shape)
+
+        mine = fields_of(self.MPIcomm_node.Get_rank(), self.MPIxrank)
+        mine[...] = 0.
+
+        self.Ey_re, self.Ez_re, self.Hy_re, self.Hz_re = mine
+
+        if self.shm_prev: self.shm_fields_prev = fields_of(node_prev, self.MPIxrank-1)
+        if self.shm_next: self.shm_fields_next = fields_of(node_next, self.MPIxrank+1)
+
+        self.shm_win.Sync()
+        self.MPIcomm_node.Barrier()
 
     def set_pml(self, region, npml):
 
@@ -168,6 +602,18 @@ class Basic3D(object):
         self.npml       = npml
         self.PMLgrading = 2 * self.npml
 
+        if region.get('y', '') != '':
+            assert self.myNy >= npml, "The y-PML must fit in the first and the last pencil along y."
+
+        # Every rank checks the edge slabs, so that none of them is left waiting in a collective.
+        first = self.myNx_indice[ 0][1] - self.myNx_indice[ 0][0]
+        last  = self.myNx_indice[-1][1] - self.myNx_indice[-1][0]
+
+        if '+' in region.get('x', ''):
+            assert last  >= npml, "The x-PML must fit in the last x-slab. Use min_edge={} with xcost.".format(npml)
+        if '-' in region.get('x', ''):
+            assert first >= npml, "The x-PML must fit in the first x-slab. Use min_edge={} with xcost.".format(npml)
+
         self.rc0   = 1.e-16                             # reflection coefficient
         self.imp   = np.sqrt(mu_0/epsilon_0)            # impedence
         self.gO    = 3.                                 # gradingOrder
@@ -216,15 +662,18 @@ class Basic3D(object):
 
             if   key == 'x' and value != '':
 
-                self.psi_eyx_p_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_ezx_p_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_hyx_p_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_hzx_p_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
+                # Only the first and the last x-slab hold the x-PML.
+                if '+' in value and self.MPIxrank == self.MPIxsize-1:
+                    self.psi_eyx_p_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_ezx_p_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_hyx_p_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_hzx_p_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
 
-                self.psi_eyx_m_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_ezx_m_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_hyx_m_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
-                self.psi_hzx_m_re = np.zeros((npml, self.Ny, self.Nz), dtype=self.dtype)
+                if '-' in value and self.MPIxrank == 0:
+                    self.psi_eyx_m_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_ezx_m_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_hyx_m_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
+                    self.psi_hzx_m_re = np.zeros(self.batch_shape + (npml, self.myNy, self.Nz), dtype=self.dtype)
 
                 for i in range(self.PMLgrading):
 
@@ -236,15 +685,18 @@ class Basic3D(object):
 
             elif key == 'y' and value != '':
 
-                self.psi_exy_p_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_ezy_p_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_hxy_p_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_hzy_p_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
+                # Only the first and the last pencil along y hold the y-PML.
+                if '+' in value and self.MPIyrank == self.MPIysize-1:
+                    self.psi_exy_p_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_ezy_p_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_hxy_p_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_hzy_p_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
 
-                self.psi_exy_m_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_ezy_m_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_hxy_m_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
-                self.psi_hzy_m_re = np.zeros((self.myNx, npml, self.Nz), dtype=self.dtype)
+                if '-' in value and self.MPIyrank == 0:
+                    self.psi_exy_m_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_ezy_m_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_hxy_m_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
+                    self.psi_hzy_m_re = np.zeros(self.batch_shape + (self.myNx, npml, self.Nz), dtype=self.dtype)
 
                 for i in range(self.PMLgrading):
 
@@ -256,15 +708,17 @@ class Basic3D(object):
 
             elif key == 'z' and value != '':
 
-                self.psi_exz_p_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_eyz_p_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_hxz_p_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_hyz_p_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
+                if '+' in value:
+                    self.psi_exz_p_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_eyz_p_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_hxz_p_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_hyz_p_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
 
-                self.psi_exz_m_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_eyz_m_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_hxz_m_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
-                self.psi_hyz_m_re = np.zeros((self.myNx, self.Ny, npml), dtype=self.dtype)
+                if '-' in value:
+                    self.psi_exz_m_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_eyz_m_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_hxz_m_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
+                    self.psi_hyz_m_re = np.zeros(self.batch_shape + (self.myNx, self.myNy, npml), dtype=self.dtype)
 
                 for i in range(self.PMLgrading):
 
@@ -290,6 +744,10 @@ class Basic3D(object):
             self.PMLbz = np.exp(-(self.PMLsigmaz/self.PMLkappaz + self.PMLalphaz) * self.dt / epsilon_0)
             self.PMLaz = self.PMLsigmaz / (self.PMLsigmaz*self.PMLkappaz + self.PMLalphaz*self.PMLkappaz**2) * (self.PMLbz - 1.)
 
+        # The PML kernels take these in the precision of the fields.
+        for name in ('PMLkappax', 'PMLbx', 'PMLax', 'PMLkappay', 'PMLby', 'PMLay', 'PMLkappaz', 'PMLbz', 'PMLaz'):
+            setattr(self, name, getattr(self, name).astype(self.dtype))
+
     def save_pml_parameters(self, path):
         """Save PML parameters to check"""
 
@@ -325,6 +783,154 @@ class Basic3D(object):
             
         self.MPIcomm.Barrier()
 
+    def put_material(self, region, frac, eps_r, mu_r):
+        """Put a dielectric material into the local slab.
+
+        PARAMETERS
+        ----------
+        region : tuple of slices or boolean ndarray
+            Region to put the material. A tuple of slices is given by the local x index
+            and the global y and z index. A boolean ndarray covers the local grid.
+
+        frac : float or ndarray
+            Fill fraction of each cell in the region, boolean or float in [0, 1].
+            The material is averaged with whatever is already there.
+
+        eps_r : float
+            Relative permittivity.
+
+        mu_r : float
+            Relative permeability.
+
+        RETURNS
+        -------
+        None
+        """
+
+        eps = eps_r * epsilon_0
+        mu  =  mu_r * mu_0
+
+        if type(region) == tuple and self.MPIysize > 1:
+
+            # Keep the part of the region in this pencil.
+            ysl = region[1]
+            loc = self._local_y(ysl.start, ysl.stop)
+            if loc.start == loc.stop: return
+
+            frac = np.asarray(frac)
+            if frac.ndim == 3 and frac.shape[1] != 1:
+                off  = loc.start + self.myNy_indice[self.MPIyrank][0] - ysl.start
+                frac = frac[:, off:off+(loc.stop-loc.start)]
+
+            region = (region[0], loc, region[2])
+
+        if self.materials == 'dense':
+
+            frac = np.asarray(frac, dtype=self.dtype)
+            rest = 1. - frac
+
+            self.eps_HEE[region] = frac * eps + rest * self.eps_HEE[region]
+            self.eps_EHH[region] = frac * eps + rest * self.eps_EHH[region]
+
+            self. mu_HEE[region] = frac * mu  + rest * self. mu_HEE[region]
+            self. mu_EHH[region] = frac * mu  + rest * self. mu_EHH[region]
+
+            return
+
+        index = self.mat_index[region]
+        frac  = np.broadcast_to(np.asarray(frac, dtype=self.dtype), index.shape)
+        hit   = frac > 0
+
+        if hit.any() == False: return
+
+        # Each distinct pair of (old material, fraction) becomes one row of the table.
+        pairs, inverse = np.unique(np.stack([index[hit], frac[hit]], axis=1), axis=0, return_inverse=True)
+
+        rows = self.mat_table[pairs[:,0].astype(np.intp)].copy()
+        f    = pairs[:,1:2]
+
+        rows[:,0:2] = f * eps + (1. - f) * rows[:,0:2]
+        rows[:,2:4] = f * mu  + (1. - f) * rows[:,2:4]
+
+        index[hit] = self._material_rows(rows)[inverse.reshape(-1)]
+        self.mat_index[region] = index
+
+    def _local_y(self, ysrt, yend):
+        """Clip the global y range [ysrt, yend) to this rank and return it as a local slice."""
+
+        node_ysrt, node_yend = self.myNy_indice[self.MPIyrank]
+
+        srt = min(max(ysrt, node_ysrt), node_yend) - node_ysrt
+        end = min(max(yend, node_ysrt), node_yend) - node_ysrt
+
+        return slice(srt, max(srt, end))
+
+    def get_material(self, name):
+        """Return one of the material arrays in full size.
+
+        PARAMETERS
+        ----------
+        name : string
+            One of 'eps_HEE', 'eps_EHH', 'mu_HEE', 'mu_EHH', 'econ_HEE', 'econ_EHH', 'mcon_HEE', 'mcon_EHH'.
+
+        RETURNS
+        -------
+        ndarray
+        """
+
+        if name not in self.mat_columns: raise ValueError("Unknown material array: {}" .format(name))
+
+        if self.materials == 'dense': return getattr(self, name)
+        else: return self.mat_table[self.mat_index, self.mat_columns.index(name)].astype(self.dtype)
+
+    def _material_rows(self, rows):
+        """Return the table index of each row, appending the rows not in the table yet."""
+
+        found = np.empty(len(rows), dtype=np.uint16)
+        new   = []
+
+        for i, row in enumerate(rows):
+
+            key = tuple(row)
+
+            if key not in self.mat_lookup:
+                if len(self.mat_lookup) == 65536: raise ValueError("Too many distinct materials. At most 65536 are allowed.")
+                self.mat_lookup[key] = len(self.mat_lookup)
+                new.append(row)
+
+            found[i] = self.mat_lookup[key]
+
+        if len(new) > 0: self.mat_table = np.vstack([self.mat_table] + new)
+
+        return found
+
+    def _init_coef_table(self):
+        """Compute the update coefficients of each material in the table of the 'compact' materials.
+
+        The kernels read them through the material index.
+        The coefficients are computed in double precision and rounded once.
+        """
+
+        eps_HEE, eps_EHH, mu_HEE, mu_EHH, econ_HEE, econ_EHH, mcon_HEE, mcon_EHH = self.mat_table.T.astype(np.float64)
+
+        dt = self.dt
+
+        self.coefH = np.zeros((len(self.mat_table), 4), dtype=self.dtype)
+        self.coefH[:,0] = (2.*mu_HEE - mcon_HEE*dt) / (2.*mu_HEE + mcon_HEE*dt)
+        self.coefH[:,1] = (-2.*dt) / (2.*mu_HEE + mcon_HEE*dt)
+        self.coefH[:,2] = (2.*mu_EHH - mcon_EHH*dt) / (2.*mu_EHH + mcon_EHH*dt)
+        self.coefH[:,3] = (-2.*dt) / (2.*mu_EHH + mcon_EHH*dt)
+
+        self.coefE = np.zeros((len(self.mat_table), 4), dtype=self.dtype)
+        self.coefE[:,0] = (2.*eps_HEE - econ_HEE*dt) / (2.*eps_HEE + econ_HEE*dt)
+        self.coefE[:,1] = (2.*dt) / (2.*eps_HEE + econ_HEE*dt)
+        self.coefE[:,2] = (2.*eps_EHH - econ_EHH*dt) / (2.*eps_EHH + econ_EHH*dt)
+        self.coefE[:,3] = (2.*dt) / (2.*eps_EHH + econ_EHH*dt)
+
+        # Perfect electric conductor.
+        self.coefE[eps_HEE > 1e3, 0:2] = 0.
+        self.coefE[eps_EHH > 1e3, 2:4] = 0.
+
     def save_eps_mu(self, path):
         """Save eps_r and mu_r to check
 
@@ -341,10 +947,10 @@ class Basic3D(object):
 
         f = h5py.File(save_dir+'eps_r_mu_r_rank{:>02d}.h5' .format(self.MPIrank), 'w')
 
-        f.create_dataset('eps_HEE', data=self.eps_HEE)
-        f.create_dataset('eps_EHH', data=self.eps_EHH)
-        f.create_dataset( 'mu_HEE', data=self. mu_HEE)
-        f.create_dataset( 'mu_EHH', data=self. mu_EHH)
+        f.create_dataset('eps_HEE', data=self.get_material('eps_HEE'))
+        f.create_dataset('eps_EHH', data=self.get_material('eps_EHH'))
+        f.create_dataset( 'mu_HEE', data=self.get_material( 'mu_HEE'))
+        f.create_dataset( 'mu_EHH', data=self.get_material( 'mu_EHH'))
             
         self.MPIcomm.Barrier()
 
@@ -374,7 +980,7 @@ class Basic3D(object):
         #-------- All rank should know who gets trs ---------#
         #----------------------------------------------------#
 
-        for rank in range(self.MPIsize) : 
+        for rank in range(self.MPIxsize) : 
 
             srt = self.myNx_indice[rank][0]
             end = self.myNx_indice[rank][1]
@@ -387,7 +993,7 @@ class Basic3D(object):
         #------- All rank should know who gets the ref ------#
         #----------------------------------------------------#
 
-        for rank in range(self.MPIsize):
+        for rank in range(self.MPIxsize):
             srt = self.myNx_indice[rank][0]
             end = self.myNx_indice[rank][1]
 
@@ -401,15 +1007,15 @@ class Basic3D(object):
 
         self.MPIcomm.Barrier()
 
-        if   self.MPIrank == self.who_get_trs:
+        if   self.MPIxrank == self.who_get_trs:
             #print("rank %d: I collect trs from %d which is essentially %d in my own grid."\
-            #        %(self.MPIrank, self.trs_pos, self.local_trs_xpos))
-            self.trs_re = np.zeros(self.tsteps, dtype=self.dtype) 
+            #        %(self.MPIxrank, self.trs_pos, self.local_trs_xpos))
+            self.trs_re = np.zeros((self.tsteps,) + self.batch_shape, dtype=self.dtype) 
 
-        if self.MPIrank == self.who_get_ref: 
+        if self.MPIxrank == self.who_get_ref: 
             #print("rank %d: I collect ref from %d which is essentially %d in my own grid."\
-            #        %(self.MPIrank, self.ref_pos, self.local_ref_xpos))
-            self.ref_re = np.zeros(self.tsteps, dtype=self.dtype)
+            #        %(self.MPIxrank, self.ref_pos, self.local_ref_xpos))
+            self.ref_re = np.zeros((self.tsteps,) + self.batch_shape, dtype=self.dtype)
 
     def set_src_pos(self, src_srt, src_end):
         """Set the position, type of the source and field.
@@ -455,7 +1061,7 @@ class Basic3D(object):
         #----------------------------------------------------------------------#
 
         self.MPIcomm.Barrier()
-        for rank in range(self.MPIsize):
+        for rank in range(self.MPIxsize):
 
             my_xsrt = self.myNx_indice[rank][0]
             my_xend = self.myNx_indice[rank][1]
@@ -466,22 +1072,22 @@ class Basic3D(object):
                 if self.src_xsrt >= my_xsrt and self.src_xend <= my_xend:
                     self.who_put_src = rank
 
-                    if self.MPIrank == self.who_put_src:
+                    if self.MPIxrank == self.who_put_src:
                         self.my_src_xsrt = self.src_xsrt - my_xsrt
                         self.my_src_xend = self.src_xend - my_xsrt
 
                         self.src_re = np.zeros(self.tsteps, dtype=self.dtype)
 
                         #print("rank{:>2}: src_xsrt: {}, my_src_xsrt: {}, my_src_xend: {}"\
-                        #       .format(self.MPIrank, self.src_xsrt, self.my_src_xsrt, self.my_src_xend))
+                        #       .format(self.MPIxrank, self.src_xsrt, self.my_src_xsrt, self.my_src_xend))
                     #else:
-                    #   print("rank {:>2}: I don't put source".format(self.MPIrank))
+                    #   print("rank {:>2}: I don't put source".format(self.MPIxrank))
 
                 else: continue
 
             # case 2. x position of source has range.
             elif self.src_xsrt < (self.src_xend-1):
-                assert self.MPIsize == 1
+                assert self.MPIxsize == 1
                 self.who_put_src = 0
 
                 self.my_src_xsrt = self.src_xsrt
@@ -496,7 +1102,7 @@ class Basic3D(object):
             else:
                 raise IndexError("x position of src is not defined!")
 
-    def put_src(self, where_re, pulse_re, put_type):
+    def put_src(self, where_re, pulse_re, put_type, member=None):
         """Put source at the designated postion set by set_src_pos method.
         
         PARAMETERS
@@ -513,6 +1119,9 @@ class Basic3D(object):
         put_type : string
             'soft' or 'hard'
 
+        member : int
+            Excitation of the batch to put the source in. Default is None, which puts it in all of them.
+
         """
         #------------------------------------------------------------#
         #--------- Put the source into the designated field ---------#
@@ -524,108 +1133,417 @@ class Basic3D(object):
         
         self.pulse_re = self.dtype(pulse_re)
 
-        if self.MPIrank == self.who_put_src:
+        if self.MPIxrank == self.who_put_src:
 
             x = slice(self.my_src_xsrt, self.my_src_xend)
-            y = slice(self.   src_ysrt, self.   src_yend)
+            y = self._local_y(self.src_ysrt, self.src_yend)
             z = slice(self.   src_zsrt, self.   src_zend)
 
+            if   self.batch == 1  : idx = (x, y, z)
+            elif member is None   : idx = (slice(None), x, y, z)
+            else                  : idx = (member, x, y, z)
+
             if   self.put_type == 'soft':
 
-                if (self.where_re == 'Ex_re') or (self.where_re == 'ex_re'): self.Ex_re[x,y,z] += self.pulse_re
-                if (self.where_re == 'Ey_re') or (self.where_re == 'ey_re'): self.Ey_re[x,y,z] += self.pulse_re
-                if (self.where_re == 'Ez_re') or (self.where_re == 'ez_re'): self.Ez_re[x,y,z] += self.pulse_re
-                if (self.where_re == 'Hx_re') or (self.where_re == 'hx_re'): self.Hx_re[x,y,z] += self.pulse_re
-                if (self.where_re == 'Hy_re') or (self.where_re == 'hy_re'): self.Hy_re[x,y,z] += self.pulse_re
-                if (self.where_re == 'Hz_re') or (self.where_re == 'hz_re'): self.Hz_re[x,y,z] += self.pulse_re
+                if (self.where_re == 'Ex_re') or (self.where_re == 'ex_re'): self.Ex_re[idx] += self.pulse_re
+                if (self.where_re == 'Ey_re') or (self.where_re == 'ey_re'): self.Ey_re[idx] += self.pulse_re
+                if (self.where_re == 'Ez_re') or (self.where_re == 'ez_re'): self.Ez_re[idx] += self.pulse_re
+                if (self.where_re == 'Hx_re') or (self.where_re == 'hx_re'): self.Hx_re[idx] += self.pulse_re
+                if (self.where_re == 'Hy_re') or (self.where_re == 'hy_re'): self.Hy_re[idx] += self.pulse_re
+                if (self.where_re == 'Hz_re') or (self.where_re == 'hz_re'): self.Hz_re[idx] += self.pulse_re
 
             elif self.put_type == 'hard':
     
-                if (self.where_re == 'Ex_re') or (self.where_re == 'ex_re'): self.Ex_re[x,y,z] = self.pulse_re
-                if (self.where_re == 'Ey_re') or (self.where_re == 'ey_re'): self.Ey_re[x,y,z] = self.pulse_re
-                if (self.where_re == 'Ez_re') or (self.where_re == 'ez_re'): self.Ez_re[x,y,z] = self.pulse_re
-                if (self.where_re == 'Hx_re') or (self.where_re == 'hx_re'): self.Hx_re[x,y,z] = self.pulse_re
-                if (self.where_re == 'Hy_re') or (self.where_re == 'hy_re'): self.Hy_re[x,y,z] = self.pulse_re
-                if (self.where_re == 'Hz_re') or (self.where_re == 'hz_re'): self.Hz_re[x,y,z] = self.pulse_re
+                if (self.where_re == 'Ex_re') or (self.where_re == 'ex_re'): self.Ex_re[idx] = self.pulse_re
+                if (self.where_re == 'Ey_re') or (self.where_re == 'ey_re'): self.Ey_re[idx] = self.pulse_re
+                if (self.where_re == 'Ez_re') or (self.where_re == 'ez_re'): self.Ez_re[idx] = self.pulse_re
+                if (self.where_re == 'Hx_re') or (self.where_re == 'hx_re'): self.Hx_re[idx] = self.pulse_re
+                if (self.where_re == 'Hy_re') or (self.where_re == 'hy_re'): self.Hy_re[idx] = self.pulse_re
+                if (self.where_re == 'Hz_re') or (self.where_re == 'hz_re'): self.Hz_re[idx] = self.pulse_re
 
             else:
                 raise ValueError("Please insert 'soft' or 'hard'")
 
-    def init_update_equations(self, omp_on):
-        """Setter for PML, structures
+    def set_tfsf(self, tfsf_srt, tfsf_end, where_re='Ey_re', inc_xpos=None, npad=50):
+        """Set a total-field/scattered-field box fed by a plane wave along x.
 
-            After applying structures, setting PML finished, call this method.
-            It will prepare DLL(shared object) for update equations.
-        """
+        The incident plane wave is computed on a 1D auxiliary grid along x which has the same
+        dx and dt as the space, so it has the same numerical dispersion. Inside the box the space
+        holds the total field and outside the scattered field. Call it before init_update_equations
+        and feed the auxiliary grid with put_tfsf_src at every time step.
+
+        Since the incident wave is uniform in y and z, its y and z derivatives vanish and
+        the correction at the y and z faces of the box is the spectral derivative of the box profile,
+        which is computed once. The correction at the x faces touches two planes only.
 
-        self.ky = np.fft.rfftfreq(self.Ny, self.dy) * 2 * np.pi
-        self.kz = np.fft.rfftfreq(self.Nz, self.dz) * 2 * np.pi
+        PARAMETERS
+        ----------
+        tfsf_srt : tuple
+        tfsf_end : tuple
+            Global indices of the box, [tfsf_srt, tfsf_end) along each axis.
 
-        self.FFTz_storage = np.zeros((self.myNx, self.Ny, int(self.Nz/2)+1), dtype=np.complex128)
-        self.FFTy_storage = np.zeros((self.myNx, int(self.Ny/2)+1, self.Nz), dtype=np.complex128)
+        where_re : string
+            'Ey_re' or 'Ez_re'. Polarization of the incident wave.
 
-        """
-        self.ky = np.fft.fftfreq(self.Ny, self.dy) * 2 * np.pi
-        self.kz = np.fft.fftfreq(self.Nz, self.dz) * 2 * np.pi
+        inc_xpos : int
+            x index of the source on the auxiliary grid. It must be outside the box.
+            Default is tfsf_srt[0]-1 so that the wave goes to +x.
 
-        self.FFTz_storage = np.zeros((self.myNx, self.Ny, self.Nz), dtype=np.complex128)
-        self.FFTy_storage = np.zeros((self.myNx, self.Ny, self.Nz), dtype=np.complex128)
+        npad : int
+            Number of absorbing cells appended to each end of the auxiliary grid.
 
+        RETURNS
+        -------
+        None
         """
 
-        ptr1d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=1, flags='C_CONTIGUOUS')
-        ptr2d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=2, flags='C_CONTIGUOUS')
-        ptr3d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=3, flags='C_CONTIGUOUS')
-        self.omp_on = omp_on
+        assert len(tfsf_srt) == 3, "tfsf_srt argument is a list or tuple with length 3."
+        assert len(tfsf_end) == 3, "tfsf_end argument is a list or tuple with length 3."
 
-        # Call C librarys for the core update equations.
-        if   self.omp_on == False: self.clib_core = ctypes.cdll.LoadLibrary("./core.real.so")
-        elif self.omp_on == True : self.clib_core = ctypes.cdll.LoadLibrary("./core.real.omp.so")
-        else: raise ValueError("Select True or False")
+        if   where_re in ('Ey_re', 'ey_re'): self.tfsf_where = ('Ey_re', 'Hz_re',  1., 'z', 'y')
+        elif where_re in ('Ez_re', 'ez_re'): self.tfsf_where = ('Ez_re', 'Hy_re', -1., 'y', 'z')
+        else: raise ValueError("where_re of the TF/SF box should be 'Ey_re' or 'Ez_re'.")
 
-        # Call C librarys for the PML update equations.
-        if   self.omp_on == False: self.clib_PML = ctypes.cdll.LoadLibrary("./pml.so")
-        elif self.omp_on == True : self.clib_PML = ctypes.cdll.LoadLibrary("./pml.omp.so")
-        else: raise ValueError("Select True or False")
+        for srt, end, N in zip(tfsf_srt, tfsf_end, self.grid):
+            assert 0 < srt < end < N, "The TF/SF box must be inside the space."
 
-        """Initialize functions to get derivatives of E and H fields.
+        if inc_xpos is None: inc_xpos = tfsf_srt[0] - 1
+        assert not (tfsf_srt[0] <= inc_xpos < tfsf_end[0]), "The source of the incident wave must be outside the TF/SF box."
 
-        In the first rank.
-        -----------------------------------------------------------
-        -----------------------------------------------------------
+        self.tfsf_srt = tfsf_srt
+        self.tfsf_end = tfsf_end
+        self.tfsf_npad = npad
+        self.tfsf_src  = inc_xpos + npad
 
-        In the middle and the last rank.
-        -----------------------------------------------------------
-        -----------------------------------------------------------
-        """
+        #------------------------------------------------------------#
+        #------- 1D auxiliary grid with absorbers at both ends -------#
+        #------------------------------------------------------------#
 
-        # Get z derivatives.
-        self.clib_core.get_deriv_last_axis.restype = None
-        self.clib_core.get_deriv_last_axis.argtypes =   [
-                                                            ctypes.c_int, ctypes.c_int, ctypes.c_int,
-                                                            ptr3d, ptr1d, ptr3d
-                                                        ]
+        # Index n of the auxiliary grid is the global x index n-npad.
+        # Einc[n] sits on the E points and Hinc[n] half a cell after them.
+        L = self.Nx + 2*npad
 
-        # C Functions for update H field.
-        self.clib_core.get_deriv_z_E_FML.restype = None
-        self.clib_core.get_deriv_y_E_FML.restype = None
-        self.clib_core.get_deriv_x_E_FM0.restype = None
-        self.clib_core.get_deriv_x_E_00L.restype = None
-        self.clib_core.updateH.restype           = None
+        self.tfsf_Einc = np.zeros(L)
+        self.tfsf_Hinc = np.zeros(L)
+
+        order = 3
+        sigmax = -(order+1) * np.log(1e-12) / (2 * np.sqrt(mu_0/epsilon_0) * npad * self.dx)
+
+        depthE = np.maximum(np.maximum(npad - np.arange(L), np.arange(L) - (L-1-npad)), 0) / npad
+        depthH = np.maximum(np.maximum(npad - np.arange(L) - .5, np.arange(L) + .5 - (L-1-npad)), 0) / npad
+
+        sigE = sigmax * depthE**order
+        sigH = sigmax * depthH**order * mu_0 / epsilon_0
+
+        self.tfsf_CE1 = (2.*epsilon_0 - sigE*self.dt) / (2.*epsilon_0 + sigE*self.dt)
+        self.tfsf_CE2 = (2.*self.dt) / (2.*epsilon_0 + sigE*self.dt)
+        self.tfsf_CH1 = (2.*mu_0 - sigH*self.dt) / (2.*mu_0 + sigH*self.dt)
+        self.tfsf_CH2 = (-2.*self.dt) / (2.*mu_0 + sigH*self.dt)
+
+        self.tfsf = True
+
+    def put_tfsf_src(self, pulse_re, put_type='soft'):
+        """Put the source of the incident wave into the auxiliary grid of the TF/SF box.
+
+        PARAMETERS
+        ----------
+        pulse_re : float
+            float returned by source.pulse_re.
+
+        put_type : string
+            'soft' or 'hard'
+
+        RETURNS
+        -------
+        None
+        """
+
+        if   put_type == 'soft': self.tfsf_Einc[self.tfsf_src] += pulse_re
+        elif put_type == 'hard': self.tfsf_Einc[self.tfsf_src]  = pulse_re
+        else: raise ValueError("Please insert 'soft' or 'hard'")
+
+    def _init_tfsf(self):
+        """Prepare the box profiles and their y and z derivatives for the TF/SF corrections."""
+
+        (x0, y0, z0), (x1, y1, z1) = self.tfsf_srt, self.tfsf_end
+
+        if hasattr(self, 'npml'):
+            for axis, srt, end, N in zip('xyz', self.tfsf_srt, self.tfsf_end, self.grid):
+                if '-' in self.PMLregion.get(axis, ''): assert srt >  self.npml,   "The TF/SF box must not overlap the PML."
+                if '+' in self.PMLregion.get(axis, ''): assert end <  N-self.npml, "The TF/SF box must not overlap the PML."
+
+        # Box profiles of the E points and of the H points along x.
+        # Ey and Ez are in the box for x0 <= i < x1, Hy and Hz for x0 <= i < x1-1.
+        self.tfsf_chiE = np.zeros(self.Nx+1)
+        self.tfsf_chiH = np.zeros(self.Nx+1)
+        self.tfsf_chiE[x0:x1  ] = 1.
+        self.tfsf_chiH[x0:x1-1] = 1.
+
+        chiy = np.zeros(self.Ny)
+        chiz = np.zeros(self.Nz)
+        chiy[y0:y1] = 1.
+        chiz[z0:z1] = 1.
+
+        # Spectral derivatives of the profiles, taken the same way as the fields.
+        diffychi = np.fft.irfft(1j*self.ky*np.fft.rfft(chiy), n=self.Ny)
+        diffzchi = np.fft.irfft(1j*self.kz*np.fft.rfft(chiz), n=self.Nz)
+
+        node_ysrt, node_yend = self.myNy_indice[self.MPIyrank]
+
+        self.tfsf_chiy     = chiy    [node_ysrt:node_yend]
+        self.tfsf_chiz     = chiz
+        self.tfsf_diffychi = diffychi[node_ysrt:node_yend]
+        self.tfsf_diffzchi = diffzchi
+
+        # Local x planes which the x faces touch.
+        node_xsrt, node_xend = self.myNx_indice[self.MPIxrank]
+
+        self.tfsf_xrows_H = [i for i in (x0-1, x1-1) if node_xsrt <= i < node_xend]
+        self.tfsf_xrows_E = [i for i in (x0  , x1-1) if node_xsrt <= i < node_xend]
+
+        # Local x range of the box.
+        self.tfsf_xbox = slice(min(max(x0, node_xsrt), node_xend) - node_xsrt, min(max(x1, node_xsrt), node_xend) - node_xsrt)
+        self.tfsf_gxbox = slice(self.tfsf_xbox.start + node_xsrt, self.tfsf_xbox.stop + node_xsrt)
+
+    def _tfsf_correct_H(self):
+        """Correct the derivatives of E at the faces of the TF/SF box and advance the incident H."""
+
+        Ename, Hname, sign, Edir, Hdir = self.tfsf_where
+        (x0, y0, z0), (x1, y1, z1) = self.tfsf_srt, self.tfsf_end
+
+        npad  = self.tfsf_npad
+        Einc  = self.tfsf_Einc[npad:npad+self.Nx+1]
+        chiE  = self.tfsf_chiE
+        chiH  = self.tfsf_chiH
+        node_xsrt = self.myNx_indice[self.MPIxrank][0]
+
+        diffx = getattr(self, 'diffx' + Ename)
+        difft = getattr(self, 'diff' + Edir + Ename)
+
+        # x faces: chi_H d/dx(Einc) - d/dx(chi_E Einc).
+        for i in self.tfsf_xrows_H:
+            corr = (chiH[i] * (Einc[i+1] - Einc[i]) - (chiE[i+1]*Einc[i+1] - chiE[i]*Einc[i])) / self.dx
+            diffx[i-node_xsrt, self._local_y(y0, y1), z0:z1] += corr
+
+        # y or z faces: -chi_E Einc d/dy(chi_y) chi_z or -chi_E Einc chi_y d/dz(chi_z).
+        inc = (chiE * Einc)[self.tfsf_gxbox]
+
+        if Edir == 'z': difft[self.tfsf_xbox, self._local_y(y0, y1), :] -= inc[:,None,None] * self.tfsf_diffzchi[None,None,:]
+        else          : difft[self.tfsf_xbox, :, z0:z1]                -= inc[:,None,None] * self.tfsf_diffychi[None,:,None]
+
+        # Advance the incident H by half a time step.
+        E = self.tfsf_Einc
+        H = self.tfsf_Hinc
+        H[:-1] = self.tfsf_CH1[:-1] * H[:-1] + self.tfsf_CH2[:-1] * (E[1:] - E[:-1]) / self.dx
+
+    def _tfsf_correct_E(self):
+        """Correct the derivatives of H at the faces of the TF/SF box and advance the incident E."""
+
+        Ename, Hname, sign, Edir, Hdir = self.tfsf_where
+        (x0, y0, z0), (x1, y1, z1) = self.tfsf_srt, self.tfsf_end
+
+        # The incident H of the space is sign times the H of the auxiliary grid.
+        npad  = self.tfsf_npad
+        Hinc  = sign * self.tfsf_Hinc[npad-1:npad+self.Nx]
+        chiE  = self.tfsf_chiE
+        chiH  = np.concatenate(([0.], self.tfsf_chiH))
+        node_xsrt = self.myNx_indice[self.MPIxrank][0]
+
+        diffx = getattr(self, 'diffx' + Hname)
+        difft = getattr(self, 'diff' + Hdir + Hname)
+
+        # x faces: chi_E d/dx(Hinc) - d/dx(chi_H Hinc). Hinc[i+1] is the H point right after the E point i.
+        for i in self.tfsf_xrows_E:
+            corr = (chiE[i] * (Hinc[i+1] - Hinc[i]) - (chiH[i+1]*Hinc[i+1] - chiH[i]*Hinc[i])) / self.dx
+            diffx[i-node_xsrt, self._local_y(y0, y1), z0:z1] += corr
+
+        # y or z faces.
+        inc = (self.tfsf_chiH[:self.Nx] * Hinc[1:])[self.tfsf_gxbox]
+
+        if Hdir == 'y': difft[self.tfsf_xbox, :, z0:z1]                -= inc[:,None,None] * self.tfsf_diffychi[None,:,None]
+        else          : difft[self.tfsf_xbox, self._local_y(y0, y1), :] -= inc[:,None,None] * self.tfsf_diffzchi[None,None,:]
+
+        # Advance the incident E by half a time step.
+        E = self.tfsf_Einc
+        H = self.tfsf_Hinc
+        E[1:] = self.tfsf_CE1[1:] * E[1:] - self.tfsf_CE2[1:] * (H[1:] - H[:-1]) / self.dx
+
+    def init_update_equations(self, omp_on, fftw_rigor='ESTIMATE', wisdom=None, deriv='fftw', workers=None, validate_deriv=False, fused=False):
+        """Setter for PML, structures
+
+            After applying structures, setting PML finished, call this method.
+            It will prepare DLL(shared object) for update equations.
+
+        PARAMETERS
+        ----------
+        omp_on : bool
+            If True, load the OpenMP version of the shared objects.
+
+        fftw_rigor : str
+            Planner rigor of the FFTW plans. 'ESTIMATE', 'MEASURE' or 'PATIENT'.
+            The plans are made once here and reused at every time step,
+            so the time spent by 'MEASURE' or 'PATIENT' is paid only once.
+
+        wisdom : str
+            Path of the FFTW wisdom file. If the file exists, the plans stored in it are imported.
+            After planning, rank 0 exports the accumulated wisdom to the same path.
+
+        deriv : str
+            Backend of the y and z derivatives. 'fftw', 'numpy' or 'scipy'.
+            'fftw' uses the C kernels in core.real.so or core.real.omp.so.
+
+        workers : int
+            Number of threads used by scipy.fft. Only used when deriv is 'scipy'.
+
+        validate_deriv : bool
+            If True, the derivatives are computed again with the other backends
+            at every time step and compared with the result of the selected backend.
+            It is for testing only.
+
+        fused : bool
+            If True, H and E field are updated by the fused kernels. They compute the y and z derivatives
+            plane by plane in per-thread tiles and take the x derivatives in the same pass.
+            In the PML region the CPML psi and the field correction are applied in the same sweep,
+            so the full-size derivative arrays are not written.
+            Only available with deriv='fftw', pencil=1 and without a TF/SF box.
+
+        With pencil > 1, the z derivatives are taken by the selected backend and the y derivatives
+        on the transposed pencils with numpy.fft ('fftw', 'numpy') or scipy.fft ('scipy').
+
+        RETURNS
+        -------
+        None
+        """
+
+        self.ky = (np.fft.rfftfreq(self.Ny, self.dy) * 2 * np.pi).astype(self.dtype)
+        self.kz = (np.fft.rfftfreq(self.Nz, self.dz) * 2 * np.pi).astype(self.dtype)
+
+        # Choose the backend of the y and z derivatives.
+        if deriv not in ('fftw', 'numpy', 'scipy'): raise ValueError("deriv should be 'fftw', 'numpy' or 'scipy'.")
+        if fused == True and deriv != 'fftw': raise ValueError("fused update is only available with deriv='fftw'.")
+        if fused == True and self.MPIysize > 1: raise ValueError("fused update needs full yz planes. It is not available with pencil > 1.")
+        if fused == True and self.tfsf == True: raise ValueError("fused update is not available with the TF/SF box.")
+        if self.batch > 1 and fused == True       : raise ValueError("fused update is not available with batch > 1.")
+        if self.batch > 1 and self.MPIysize > 1   : raise ValueError("batch > 1 is not available with pencil > 1.")
+        if self.batch > 1 and self.tfsf == True   : raise ValueError("batch > 1 is not available with the TF/SF box.")
+
+        if self.tfsf == True: self._init_tfsf()
+
+        self.deriv = deriv
+        self.fused = fused
+        self.workers = workers
+        self.validate_deriv = validate_deriv
+        self.deriv_backends = ['fftw', 'numpy']
+
+        try:
+            import scipy.fft
+            self.deriv_backends.append('scipy')
+        except ImportError as e:
+            if self.deriv == 'scipy': raise ImportError("scipy.fft is required for deriv='scipy'.")
+
+        ptr1d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=1, flags='C_CONTIGUOUS')
+        ptr2d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=2, flags='C_CONTIGUOUS')
+        ptr3d = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=3, flags='C_CONTIGUOUS')
+        ptrmat  = np.ctypeslib.ndpointer(dtype=np.uint16,  ndim=3, flags='C_CONTIGUOUS')
+        ptrcoef = np.ctypeslib.ndpointer(dtype=self.dtype, ndim=2, flags='C_CONTIGUOUS')
+        self.omp_on = omp_on
+
+        # With 'dense' materials, the kernels compute the update coefficients of each cell
+        # from the material arrays. mat_index is None, which they get as NULL.
+        if self.materials == 'dense':
+
+            self.mat_index = None
+            self.coefH = self.dense_H.reshape(4, -1)
+            self.coefE = self.dense_E.reshape(4, -1)
+
+        else: self._init_coef_table()
+
+        # Call C librarys for the core update equations.
+        if   self.omp_on == False: self.clib_core = ctypes.cdll.LoadLibrary("./core.real{}.so"    .format(self.clib_suffix))
+        elif self.omp_on == True : self.clib_core = ctypes.cdll.LoadLibrary("./core.real.omp{}.so".format(self.clib_suffix))
+        else: raise ValueError("Select True or False")
+
+        # Call C librarys for the PML update equations.
+        if   self.omp_on == False: self.clib_PML = ctypes.cdll.LoadLibrary("./pml{}.so"    .format(self.clib_suffix))
+        elif self.omp_on == True : self.clib_PML = ctypes.cdll.LoadLibrary("./pml.omp{}.so".format(self.clib_suffix))
+        else: raise ValueError("Select True or False")
+
+        # Make FFT plans and workspace once. They are reused at every time step.
+        rigors = {'ESTIMATE':0, 'MEASURE':1, 'PATIENT':2}
+        if fftw_rigor not in rigors: raise ValueError("fftw_rigor should be 'ESTIMATE', 'MEASURE' or 'PATIENT'.")
+
+        if wisdom is not None: wisdom_path = wisdom.encode()
+        else                 : wisdom_path = None
+
+        self.clib_core.init_FFT_plans.restype  = ctypes.c_void_p
+        self.clib_core.init_FFT_plans.argtypes = [
+                                                    ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_char_p
+                                                ]
+
+        self.clib_core.save_FFT_wisdom.restype   = None
+        self.clib_core.save_FFT_wisdom.argtypes  = [ctypes.c_char_p]
+        self.clib_core.destroy_FFT_plans.restype = None
+        self.clib_core.destroy_FFT_plans.argtypes= [ctypes.c_void_p]
+
+        self.FFT_plans = ctypes.c_void_p(self.clib_core.init_FFT_plans(
+                                                                        self.myNx*self.batch, self.myNy, self.Nz,
+                                                                        rigors[fftw_rigor], wisdom_path
+                                                                    ))
+
+        # Every rank has read the wisdom before rank 0 writes it.
+        # It is written to a temporary file and moved into place, so the file is never read half written.
+        if wisdom is not None:
+
+            self.MPIcomm.Barrier()
+
+            if self.MPIrank == 0:
+                self.clib_core.save_FFT_wisdom((wisdom + '.tmp').encode())
+                os.replace(wisdom + '.tmp', wisdom)
+
+        """Initialize functions to get derivatives of E and H fields.
+
+        In the first rank.
+        -----------------------------------------------------------
+        -----------------------------------------------------------
+
+        In the middle and the last rank.
+        -----------------------------------------------------------
+        -----------------------------------------------------------
+        """
+
+        # Get z derivatives.
+        self.clib_core.get_deriv_last_axis.restype = None
+        self.clib_core.get_deriv_last_axis.argtypes =   [
+                                                            ctypes.c_void_p,
+                                                            ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                            ptr3d, ptr1d, ptr3d
+                                                        ]
+
+        # C Functions for update H field.
+        self.clib_core.get_deriv_z_E_FML.restype = None
+        self.clib_core.get_deriv_y_E_FML.restype = None
+        self.clib_core.get_deriv_x_E_FM0.restype = None
+        self.clib_core.get_deriv_x_E_00L.restype = None
+        self.clib_core.get_deriv_x_E_halo.restype= None
+        self.clib_core.updateH.restype           = None
 
         # C Functions for update E field.
         self.clib_core.get_deriv_z_H_FML.restype = None
         self.clib_core.get_deriv_y_H_FML.restype = None
         self.clib_core.get_deriv_x_H_F00.restype = None
         self.clib_core.get_deriv_x_H_0ML.restype = None
+        self.clib_core.get_deriv_x_H_halo.restype= None
         self.clib_core.updateE.restype           = None
 
         self.clib_core.get_deriv_z_E_FML.argtypes = [ \
+                                                        ctypes.c_void_p, \
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                         ptr3d, ptr3d, ptr1d, ptr3d, ptr3d \
                                                     ]
 
         self.clib_core.get_deriv_y_E_FML.argtypes = [ \
+                                                        ctypes.c_void_p, \
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                         ptr3d, ptr3d, ptr1d, ptr3d, ptr3d \
                                                     ]
@@ -642,6 +1560,12 @@ class Basic3D(object):
                                                         ptr3d, ptr3d, ptr3d, ptr3d \
                                                     ]
 
+        self.clib_core.get_deriv_x_E_halo.argtypes= [ \
+                                                        ctypes.c_int, ctypes.c_int, ctypes.c_int, \
+                                                        ctypes.c_double, \
+                                                        ptr3d, ptr3d, ptr3d, ptr3d, ptr2d, ptr2d \
+                                                    ]
+
         self.clib_core.updateH.argtypes =           [
                                                         ctypes.c_int, ctypes.c_int,
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int,
@@ -649,8 +1573,7 @@ class Basic3D(object):
                                                         ptr3d, 
                                                         ptr3d, 
                                                         ptr3d, 
-                                                        ptr3d, ptr3d,
-                                                        ptr3d, ptr3d,
+                                                        ptrmat, ptrcoef,
                                                         ptr3d, 
                                                         ptr3d, 
                                                         ptr3d, 
@@ -660,11 +1583,13 @@ class Basic3D(object):
                                                     ]
 
         self.clib_core.get_deriv_z_H_FML.argtypes = [ \
+                                                        ctypes.c_void_p, \
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                         ptr3d, ptr3d, ptr1d, ptr3d, ptr3d \
                                                     ]
 
         self.clib_core.get_deriv_y_H_FML.argtypes = [ \
+                                                        ctypes.c_void_p, \
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                         ptr3d, ptr3d, ptr1d, ptr3d, ptr3d \
                                                     ]
@@ -681,6 +1606,12 @@ class Basic3D(object):
                                                         ptr3d, ptr3d, ptr3d, ptr3d, ptr2d, ptr2d \
                                                     ]
 
+        self.clib_core.get_deriv_x_H_halo.argtypes= [ \
+                                                        ctypes.c_int, ctypes.c_int, ctypes.c_int, \
+                                                        ctypes.c_double, \
+                                                        ptr3d, ptr3d, ptr3d, ptr3d, ptr2d, ptr2d \
+                                                    ]
+
         self.clib_core.updateE.argtypes =           [                                               \
                                                         ctypes.c_int, ctypes.c_int,                 \
                                                         ctypes.c_int, ctypes.c_int, ctypes.c_int,   \
@@ -688,8 +1619,7 @@ class Basic3D(object):
                                                         ptr3d, 
                                                         ptr3d, 
                                                         ptr3d, 
-                                                        ptr3d, ptr3d,                               \
-                                                        ptr3d, ptr3d,                               \
+                                                        ptrmat, ptrcoef,                               \
                                                         ptr3d, 
                                                         ptr3d, 
                                                         ptr3d, 
@@ -698,6 +1628,108 @@ class Basic3D(object):
                                                         ptr3d
                                                     ]
 
+        self.clib_core.updateH_fused.restype  = None
+        self.clib_core.updateE_fused.restype  = None
+
+        self.clib_core.updateH_fused.argtypes = [
+                                                    ctypes.c_void_p,
+                                                    ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_int, ctypes.c_int,
+                                                    ctypes.c_double, ctypes.c_double,
+                                                    ptr1d, ptr1d,
+                                                    ptr3d, ptr3d, ptr3d,
+                                                    ptr3d, ptr3d, ptr3d,
+                                                    ptrmat, ptrcoef,
+                                                    ptr2d, ptr2d,
+                                                    ctypes.POINTER(_CPML)
+                                                ]
+
+        self.clib_core.updateE_fused.argtypes = self.clib_core.updateH_fused.argtypes
+
+        # Width of the PML region in this rank, where the fused kernels apply the CPML.
+        self.pml_widths = [0, 0, 0, 0, 0, 0]
+
+        if self.MPIxrank == 0              and '-' in self.PMLregion.get('x', ''): self.pml_widths[0] = self.npml
+        if self.MPIxrank == self.MPIxsize-1 and '+' in self.PMLregion.get('x', ''): self.pml_widths[1] = self.npml
+        if '-' in self.PMLregion.get('y', ''): self.pml_widths[2] = self.npml
+        if '+' in self.PMLregion.get('y', ''): self.pml_widths[3] = self.npml
+        if '-' in self.PMLregion.get('z', ''): self.pml_widths[4] = self.npml
+        if '+' in self.PMLregion.get('z', ''): self.pml_widths[5] = self.npml
+
+        #-----------------------------------------------------------#
+        #------------- Persistent requests for MPI halo ------------#
+        #-----------------------------------------------------------#
+
+        # The boundary planes are copied into the preallocated buffers and
+        # exchanged with non-blocking persistent requests. The requests are started
+        # before the y and z derivatives and waited only before the boundary plane is used.
+        self.sendEyfirst_re = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.sendEzfirst_re = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.recvEylast_re  = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.recvEzlast_re  = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+
+        self.sendHylast_re  = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.sendHzlast_re  = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.recvHyfirst_re = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+        self.recvHzfirst_re = np.zeros(self.batch_shape + (self.myNy, self.Nz), dtype=self.dtype)
+
+        # A neighbor on the same node is read in place. The messages to and from it are empty
+        # and only tell that its boundary planes are ready.
+        if self.shm_next:
+            self.recvEylast_re  = self.shm_fields_next[0][...,0,:,:]
+            self.recvEzlast_re  = self.shm_fields_next[1][...,0,:,:]
+
+        if self.shm_prev:
+            self.recvHyfirst_re = self.shm_fields_prev[2][...,-1,:,:]
+            self.recvHzfirst_re = self.shm_fields_prev[3][...,-1,:,:]
+
+        ready = [np.zeros(0, dtype=self.dtype) for i in range(4)]
+
+        self.halo_E = []
+        self.halo_H = []
+
+        # Buffers of the all-to-all transpose for the y derivatives of the pencils.
+        if self.MPIysize > 1:
+            self.pencil_send = np.zeros((self.MPIysize, 2, self.myNx, self.myNy, self.Nz//self.MPIysize), dtype=self.dtype)
+            self.pencil_recv = np.zeros((self.MPIysize, 2, self.myNx, self.myNy, self.Nz//self.MPIysize), dtype=self.dtype)
+
+        if self.MPIxrank > 0 and self.shm_prev:
+            self.halo_E.append(self.MPIcomm_x.Send_init(ready[0], dest=(self.MPIxrank-1), tag=9 ))
+            self.halo_H.append(self.MPIcomm_x.Recv_init(ready[1], source=(self.MPIxrank-1), tag=3))
+
+        elif self.MPIxrank > 0:
+            self.halo_E.append(self.MPIcomm_x.Send_init(self.sendEyfirst_re, dest=(self.MPIxrank-1), tag=9 ))
+            self.halo_E.append(self.MPIcomm_x.Send_init(self.sendEzfirst_re, dest=(self.MPIxrank-1), tag=11))
+            self.halo_H.append(self.MPIcomm_x.Recv_init(self.recvHyfirst_re, source=(self.MPIxrank-1), tag=3))
+            self.halo_H.append(self.MPIcomm_x.Recv_init(self.recvHzfirst_re, source=(self.MPIxrank-1), tag=5))
+
+        if self.MPIxrank < (self.MPIxsize-1) and self.shm_next:
+            self.halo_E.append(self.MPIcomm_x.Recv_init(ready[2], source=(self.MPIxrank+1), tag=9 ))
+            self.halo_H.append(self.MPIcomm_x.Send_init(ready[3], dest=(self.MPIxrank+1), tag=3))
+
+        elif self.MPIxrank < (self.MPIxsize-1):
+            self.halo_E.append(self.MPIcomm_x.Recv_init(self.recvEylast_re, source=(self.MPIxrank+1), tag=9 ))
+            self.halo_E.append(self.MPIcomm_x.Recv_init(self.recvEzlast_re, source=(self.MPIxrank+1), tag=11))
+            self.halo_H.append(self.MPIcomm_x.Send_init(self.sendHylast_re, dest=(self.MPIxrank+1), tag=3))
+            self.halo_H.append(self.MPIcomm_x.Send_init(self.sendHzlast_re, dest=(self.MPIxrank+1), tag=5))
+
+        #-----------------------------------------------------------#
+        #------------- Views of each excitation in a batch ---------#
+        #-----------------------------------------------------------#
+
+        # The kernels along x and in the PML run on one excitation at a time.
+        self.batch_arrays  = ['Ex_re', 'Ey_re', 'Ez_re', 'Hx_re', 'Hy_re', 'Hz_re']
+        self.batch_arrays += [name for name in vars(self) if name.startswith('diff') and name.endswith('_re')]
+        self.batch_arrays += [name for name in vars(self) if name.startswith('psi_')]
+        self.batch_arrays += ['recvEylast_re', 'recvEzlast_re', 'recvHyfirst_re', 'recvHzfirst_re']
+
+        if self.batch > 1: self.members = [_Member(self, b) for b in range(self.batch)]
+        else             : self.members = [self]
+
         """INITIALIZE PML UPDATE EQUATIONS.
 
         UPDATE PML region at x-.
@@ -716,8 +1748,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -730,8 +1761,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -744,8 +1774,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -758,8 +1787,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -778,8 +1806,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -792,8 +1819,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -807,8 +1833,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -822,8 +1847,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -843,8 +1867,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -858,8 +1881,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d,
                                                     ptr3d, 
                                                     ptr3d, 
@@ -873,8 +1895,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -888,8 +1909,7 @@ class Basic3D(object):
                                                     ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, \
                                                     ctypes.c_double,                                        \
                                                     ptr1d, ptr1d, ptr1d,                                    \
-                                                    ptr3d, ptr3d,                                           \
-                                                    ptr3d, ptr3d,                                           \
+                                                    ptrmat, ptrcoef,                                           \
                                                     ptr3d, 
                                                     ptr3d, 
                                                     ptr3d, 
@@ -898,857 +1918,710 @@ class Basic3D(object):
                                                     ptr3d
                                                 ]
 
-    def updateH(self,tstep) :
-        
-        #self.MPIcomm.Barrier()
+        self._build_pml_plan()
+        self._build_step_plan()
 
-        #--------------------------------------------------------------#
-        #------------ MPI send Ex and Ey to previous rank -------------#
-        #--------------------------------------------------------------#
+    def _build_pml_plan(self):
+        """Build the list of PML kernels this rank calls at each half step, with their arguments.
 
-        if self.MPIrank > 0:
+        Only the PML layers which touch the x-slab and the y-pencil of this rank are in the plan,
+        so updateH and updateE do not look at PMLregion while stepping.
+        """
 
-            sendEyfirst_re = self.Ey_re[0,:,:].copy()
-            sendEzfirst_re = self.Ez_re[0,:,:].copy()
+        region = self.PMLregion
 
-            self.MPIcomm.send( sendEyfirst_re, dest=(self.MPIrank-1), tag=(tstep*100+9 ))
-            self.MPIcomm.send( sendEzfirst_re, dest=(self.MPIrank-1), tag=(tstep*100+11))
+        # name of the kernel, axis, side and whether the kernel takes the rank along x.
+        layers = []
 
-        #-----------------------------------------------------------#
-        #------------ MPI recv Ex and Ey from next rank ------------#
-        #-----------------------------------------------------------#
+        if '+' in region.get('x', '') and self.MPIxrank == self.MPIxsize-1: layers.append(('px', 'x', 'p', False))
+        if '-' in region.get('x', '') and self.MPIxrank == 0              : layers.append(('mx', 'x', 'm', False))
+        if '+' in region.get('y', '') and self.MPIyrank == self.MPIysize-1: layers.append(('py', 'y', 'p', True))
+        if '-' in region.get('y', '') and self.MPIyrank == 0              : layers.append(('my', 'y', 'm', True))
+        if '+' in region.get('z', '')                                     : layers.append(('pz', 'z', 'p', True))
+        if '-' in region.get('z', '')                                     : layers.append(('mz', 'z', 'm', True))
 
-        if (self.MPIrank < (self.MPIsize-1)):
+        # The two field components tangential to each axis.
+        pairs = {'x': ('y', 'z'), 'y': ('x', 'z'), 'z': ('x', 'y')}
 
-            recvEylast_re = self.MPIcomm.recv( source=(self.MPIrank+1), tag=(tstep*100+9 ))
-            recvEzlast_re = self.MPIcomm.recv( source=(self.MPIrank+1), tag=(tstep*100+11))
-        
-        #self.MPIcomm.Barrier()
-
-        # Get x derivatives of Ey and Ez.
-        if self.MPIrank < (self.MPIsize-1):
-            self.clib_core.get_deriv_x_E_FM0( \
-                                                self.myNx, self.Ny, self.Nz, \
-                                                self.dx, \
-                                                self.Ey_re, \
-                                                self.Ez_re, \
-                                                self.diffxEy_re, \
-                                                self.diffxEz_re, \
-                                                recvEylast_re, \
-                                                recvEzlast_re \
-                                            )
-                                                
-        else:
-            self.clib_core.get_deriv_x_E_00L( 
-                                                self.myNx, self.Ny, self.Nz,
-                                                self.dx,
-                                                self.Ey_re,
-                                                self.Ez_re,
-                                                self.diffxEy_re,
-                                                self.diffxEz_re
-                                            )
-
-        # Get z derivatives of Ex and Ey.
-        self.clib_core.get_deriv_z_E_FML( \
-                                            self.myNx, self.Ny, self.Nz, \
-                                            self.Ex_re, \
-                                            self.Ey_re, \
-                                            self.kz, \
-                                            self.diffzEx_re, \
-                                            self.diffzEy_re \
-                                        )
-
-        # Get y derivatives of Ex and Ez.
-        self.clib_core.get_deriv_y_E_FML( \
-                                            self.myNx, self.Ny, self.Nz, \
-                                            self.Ex_re, \
-                                            self.Ez_re, \
-                                            self.ky, \
-                                            self.diffyEx_re, \
-                                            self.diffyEz_re \
-                                        )
+        self.pml_plan_H = []
+        self.pml_plan_E = []
+
+        # The fused kernels apply the CPML in the same sweep as the core update, so their plans stay empty.
+        if self.fused == True:
+
+            self.cpml = _CPML(npml=self.npml)
+
+            for axis in 'xyz':
+                for coef in ('PMLkappa', 'PMLb', 'PMLa'):
+                    setattr(self.cpml, coef[3:]+axis, getattr(self, coef+axis).ctypes.data)
+
+            for name, axis, side, takes_rank in layers:
+                for f in ('h', 'e'):
+                    for a in pairs[axis]:
+                        setattr(self.cpml, '%s%s%s_%s' %(f, a, axis, side), getattr(self, 'psi_%s%s%s_%s_re' %(f, a, axis, side)).ctypes.data)
 
+            return
+
+        for F in self.members:
+            for name, axis, side, takes_rank in layers:
+
+                a, b = pairs[axis]
+
+                head  = (self.MPIxsize, self.MPIxrank) if takes_rank else ()
+                head += (self.myNx, self.myNy, self.Nz, self.npml, self.dt)
+                head += (getattr(self, 'PMLkappa'+axis), getattr(self, 'PMLb'+axis), getattr(self, 'PMLa'+axis), self.mat_index)
+
+                for plan, f, g, coef in ((self.pml_plan_H, 'H', 'E', self.coefH), (self.pml_plan_E, 'E', 'H', self.coefE)):
+
+                    args = head + (coef,                                                    \
+                                    getattr(F, '%s%s_re' %(f, a)),                          \
+                                    getattr(F, '%s%s_re' %(f, b)),                          \
+                                    getattr(F, 'diff%s%s%s_re' %(axis, g, a)),              \
+                                    getattr(F, 'diff%s%s%s_re' %(axis, g, b)),              \
+                                    getattr(F, 'psi_%s%s%s_%s_re' %(f.lower(), a, axis, side)), \
+                                    getattr(F, 'psi_%s%s%s_%s_re' %(f.lower(), b, axis, side)))
+
+                    plan.append(self._bind(getattr(self.clib_PML, 'PML_update%s_%s' %(f, name)), *args))
+
+    def _bind(self, kernel, *args):
+        """Check and convert the arguments of a C kernel once, so that it can be called without argtypes.
+
+        PARAMETERS
+        ----------
+        kernel : ctypes function
+            A kernel of clib_core or clib_PML with its argtypes.
+
+        args : the arguments of the kernel.
+
+        RETURNS
+        -------
+        (function, params) : tuple
+            The same C function without argtypes and the converted arguments.
+            The arrays are passed by their address, so they must not be reallocated afterwards.
         """
-        self.clib_core.get_deriv_last_axis  ( 
-                                                self.myNx, self.Ny, self.Nz, \
-                                                self.Ex_re, \
-                                                self.kz, \
-                                                self.diffzEx_re, \
-                                            )
-
-        self.clib_core.get_deriv_last_axis  ( 
-                                                self.myNx, self.Ny, self.Nz, \
-                                                self.Ey_re, \
-                                                self.kz, \
-                                                self.diffzEy_re \
-                                            )
-        nax = np.newaxis
-        self.FFTz_storage = np.fft.rfftn(self.Ex_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.diffzEx_re = np.fft.irfftn(self.FFTz_storage, axes=(2,))
 
-        self.FFTz_storage = np.fft.rfftn(self.Ey_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.diffzEy_re = np.fft.irfftn(self.FFTz_storage, axes=(2,))
+        assert len(args) == len(kernel.argtypes), "{} takes {} arguments.".format(kernel.__name__, len(kernel.argtypes))
+
+        params = []
+
+        for argtype, arg in zip(kernel.argtypes, args):
+
+            if isinstance(arg, np.ndarray):
+                argtype.from_param(arg)
+                params.append(ctypes.c_void_p(arg.ctypes.data))
+
+            elif isinstance(arg, numbers.Number): params.append(argtype(arg))
+            else                                : params.append(arg)
+
+        function = type(kernel)(ctypes.cast(kernel, ctypes.c_void_p).value)
+        function.restype = kernel.restype
+
+        return function, tuple(params)
+
+    def _build_step_plan(self):
+        """Build the calls of updateH and updateE as tuples of (function, args).
+
+        The rank checks, the choice of the kernels and the conversion of the ctypes arguments
+        are done here once. updateH and updateE only run through the plans.
+        The MPI calls and the steps written in Python are in the plans as bound methods.
+        """
+
+        plans = {}
+
+        for F, G, Gy, Gz, halo, plane, recv, update, coef in (
+                ('H', 'E', 'Ey', 'Ez', self.halo_E, 0 , 'last' , self.clib_core.updateH, self.coefH),
+                ('E', 'H', 'Hy', 'Hz', self.halo_H, -1, 'first', self.clib_core.updateE, self.coefE),
+            ):
+
+            plan = []
+
+            # The boundary planes of G sent to the neighbor along x.
+            if F == 'H': send_to = self.MPIxrank > 0                 and not self.shm_prev
+            else       : send_to = self.MPIxrank < (self.MPIxsize-1) and not self.shm_next
+
+            if send_to:
+                for Gc in (Gy, Gz):
+                    send = getattr(self, 'send%s%s_re' %(Gc, 'first' if F == 'H' else 'last'))
+                    plan.append((np.copyto, (send, getattr(self, Gc+'_re')[...,plane,:,:])))
 
-        self.FFTy_storage = np.fft.rfftn(self.Ex_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.diffyEx_re = np.fft.irfftn(self.FFTy_storage, axes=(1,))
+            if self.shm_win is not None: plan.append((self.shm_win.Sync, ()))
 
-        self.FFTy_storage = np.fft.rfftn(self.Ez_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.diffyEz_re = np.fft.irfftn(self.FFTy_storage, axes=(1,))
+            plan.append((MPI.Prequest.Startall, (halo,)))
 
-        self.diffzEx_re = np.ascontiguousarray(self.diffzEx_re, dtype=self.dtype)
-        self.diffzEy_re = np.ascontiguousarray(self.diffzEy_re, dtype=self.dtype)
+            waitall = [(MPI.Prequest.Waitall, (halo,))]
 
-        self.diffyEx_re = np.ascontiguousarray(self.diffyEx_re, dtype=self.dtype)
-        self.diffyEz_re = np.ascontiguousarray(self.diffyEz_re, dtype=self.dtype)
+            if self.shm_win is not None: waitall.append((self.shm_win.Sync, ()))
 
+            if self.fused == True:
+
+                fused = getattr(self.clib_core, 'update%s_fused' %F)
+
+                # The plane next to the neighbor is updated after its boundary plane is received.
+                if F == 'H': inner, outer = (0, self.myNx-1), (self.myNx-1, self.myNx)
+                else       : inner, outer = (1, self.myNx), (0, 1)
+
+                for isrt, iend in (inner, outer):
+
+                    args  = (self.FFT_plans, self.MPIxsize, self.MPIxrank, self.myNx, self.myNy, self.Nz, isrt, iend)
+                    args += tuple(self.pml_widths) + (self.dt, self.dx, self.ky, self.kz)
+                    args += tuple(getattr(self, '%s%s_re' %(F, c)) for c in 'xyz')
+                    args += tuple(getattr(self, '%s%s_re' %(G, c)) for c in 'xyz')
+                    args += (self.mat_index, coef)
+                    args += (getattr(self, 'recv%s%s_re' %(Gy, recv)), getattr(self, 'recv%s%s_re' %(Gz, recv)))
+                    args += (ctypes.byref(self.cpml),)
+
+                    plan.append(self._bind(fused, *args))
+
+                    if (isrt, iend) == inner: plan += waitall
+
+            else:
+
+                # x derivatives of Gy and Gz except the plane next to the previous or the next rank.
+                if F == 'H': deriv_x, deriv_x_halo, has_halo = self.clib_core.get_deriv_x_E_00L, self.clib_core.get_deriv_x_E_halo, self.MPIxrank < (self.MPIxsize-1)
+                else       : deriv_x, deriv_x_halo, has_halo = self.clib_core.get_deriv_x_H_F00, self.clib_core.get_deriv_x_H_halo, self.MPIxrank > 0
+
+                for M in self.members:
+                    plan.append(self._bind(deriv_x, self.myNx, self.myNy, self.Nz, self.dx,                                        \
+                                            getattr(M, Gy+'_re'), getattr(M, Gz+'_re'),                                         \
+                                            getattr(M, 'diffx%s_re' %Gy), getattr(M, 'diffx%s_re' %Gz)))
+
+                # y and z derivatives of G while the boundary planes are in flight.
+                plan += self._deriv_yz_plan(G)
+
+                plan += waitall
+
+                if has_halo:
+                    for M in self.members:
+                        plan.append(self._bind(deriv_x_halo, self.myNx, self.myNy, self.Nz, self.dx,                               \
+                                                getattr(M, Gy+'_re'), getattr(M, Gz+'_re'),                                     \
+                                                getattr(M, 'diffx%s_re' %Gy), getattr(M, 'diffx%s_re' %Gz),                     \
+                                                getattr(M, 'recv%s%s_re' %(Gy, recv)), getattr(M, 'recv%s%s_re' %(Gz, recv))))
+
+                # Correct the derivatives at the faces of the TF/SF box.
+                if self.tfsf == True: plan.append((getattr(self, '_tfsf_correct_'+F), ()))
+
+                # All excitations read the same material table.
+                for M in self.members:
+
+                    args  = (self.MPIxsize, self.MPIxrank, self.myNx, self.myNy, self.Nz, self.dt)
+                    args += tuple(getattr(M, '%s%s_re' %(F, c)) for c in 'xyz')
+                    args += (self.mat_index, coef)
+                    args += tuple(getattr(M, 'diff%s%s%s_re' %(d, G, c)) for d, c in (('x','y'), ('x','z'), ('y','x'), ('y','z'), ('z','x'), ('z','y')))
+
+                    plan.append(self._bind(update, *args))
+
+            plan += getattr(self, 'pml_plan_'+F)
+
+            plans[F] = tuple(plan)
+
+        self.step_plan_H = plans['H']
+        self.step_plan_E = plans['E']
+
+    def _deriv_yz_plan(self, where):
+        """The steps of the y and z derivatives of the field 'where' in the step plan.
+
+        The FFTW kernels are bound directly when there is no pencil decomposition and no validation.
+        Otherwise get_deriv_yz_E or get_deriv_yz_H is called.
+        """
+
+        if self.deriv != 'fftw' or self.MPIysize > 1 or self.validate_deriv == True:
+            return [(getattr(self, 'get_deriv_yz_'+where), ())]
+
+        Fx, Fy, Fz = self._xstack(*(getattr(self, '%s%s_re' %(where, c)) for c in 'xyz'))
+        diffzFx, diffzFy, diffyFx, diffyFz = self._xstack(*(getattr(self, 'diff%s%s_re' %(d, where+c)) for d, c in (('z','x'), ('z','y'), ('y','x'), ('y','z'))))
+
+        get_deriv_z = getattr(self.clib_core, 'get_deriv_z_%s_FML' %where)
+        get_deriv_y = getattr(self.clib_core, 'get_deriv_y_%s_FML' %where)
+
+        return [
+                    self._bind(get_deriv_z, self.FFT_plans, len(Fx), self.myNy, self.Nz, Fx, Fy, self.kz, diffzFx, diffzFy),
+                    self._bind(get_deriv_y, self.FFT_plans, len(Fx), self.myNy, self.Nz, Fx, Fz, self.ky, diffyFx, diffyFz),
+                ]
+
+    def get_deriv_yz_E(self):
+        """Get y and z derivatives of E field with the selected backend.
+
+            dEx/dz, dEy/dz are stored in diffzEx_re, diffzEy_re.
+            dEx/dy, dEz/dy are stored in diffyEx_re, diffyEz_re.
+        """
+
+        fields = self._xstack(self.Ex_re, self.Ey_re, self.Ez_re)
+        diffs  = self._xstack(self.diffzEx_re, self.diffzEy_re, self.diffyEx_re, self.diffyEz_re)
+
+        self._get_deriv_yz(self.deriv, 'E', fields, diffs)
+
+        if self.validate_deriv == True: self._validate_deriv_yz('E', fields, diffs)
+
+    def get_deriv_yz_H(self):
+        """Get y and z derivatives of H field with the selected backend.
+
+            dHx/dz, dHy/dz are stored in diffzHx_re, diffzHy_re.
+            dHx/dy, dHz/dy are stored in diffyHx_re, diffyHz_re.
+        """
+
+        fields = self._xstack(self.Hx_re, self.Hy_re, self.Hz_re)
+        diffs  = self._xstack(self.diffzHx_re, self.diffzHy_re, self.diffyHx_re, self.diffyHz_re)
+
+        self._get_deriv_yz(self.deriv, 'H', fields, diffs)
+
+        if self.validate_deriv == True: self._validate_deriv_yz('H', fields, diffs)
+
+    def _xstack(self, *arrays):
+        """Views of the arrays with the batch axis merged into the x axis."""
+
+        return tuple(array.reshape((-1, self.myNy, self.Nz)) for array in arrays)
+
+    def _get_deriv_yz(self, backend, where, fields, diffs):
+        """Compute y and z derivatives with the given backend.
+
+        PARAMETERS
+        ----------
+        backend : str
+            'fftw', 'numpy' or 'scipy'.
+
+        where : str
+            'E' or 'H'.
+
+        fields : tuple
+            x, y and z component of the field.
+
+        diffs : tuple
+            z derivatives of x, y component and y derivatives of x, z component.
+            The results are written in these arrays.
+
+        RETURNS
+        -------
+        None
+        """
+
+        Fx, Fy, Fz = fields
+        diffzFx, diffzFy, diffyFx, diffyFz = diffs
+
+        if backend == 'fftw':
+
+            if where == 'E':
+                get_deriv_z = self.clib_core.get_deriv_z_E_FML
+                get_deriv_y = self.clib_core.get_deriv_y_E_FML
+
+            elif where == 'H':
+                get_deriv_z = self.clib_core.get_deriv_z_H_FML
+                get_deriv_y = self.clib_core.get_deriv_y_H_FML
+
+            get_deriv_z(self.FFT_plans, len(Fx), self.myNy, self.Nz, Fx, Fy, self.kz, diffzFx, diffzFy)
+
+            if self.MPIysize == 1: get_deriv_y(self.FFT_plans, len(Fx), self.myNy, self.Nz, Fx, Fz, self.ky, diffyFx, diffyFz)
+            else                 : self._get_deriv_y_pencil(np.fft, {}, Fx, Fz, diffyFx, diffyFz)
+
+            return
+
+        if backend == 'numpy':
+            import numpy.fft as fft
+            kwargs = {}
+
+        elif backend == 'scipy':
+            import scipy.fft as fft
+            kwargs = {'workers': self.workers}
 
         nax = np.newaxis
-        self.FFTz_storage = np.fft.fftn(self.Ex_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.FFTz_storage = np.fft.ifftn(self.FFTz_storage, axes=(2,))
-        self.diffzEx_re = self.FFTz_storage.real
-        self.diffzEx_im = self.FFTz_storage.imag
-
-        self.FFTz_storage = np.fft.fftn(self.Ey_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.FFTz_storage = np.fft.ifftn(self.FFTz_storage, axes=(2,))
-        self.diffzEy_re = self.FFTz_storage.real
-        self.diffzEy_im = self.FFTz_storage.imag
-
-        self.FFTy_storage = np.fft.fftn(self.Ex_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.FFTy_storage = np.fft.ifftn(self.FFTy_storage, axes=(1,))
-        self.diffyEx_re = self.FFTy_storage.real
-        self.diffyEx_im = self.FFTy_storage.imag
-
-        self.FFTy_storage = np.fft.fftn(self.Ez_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.FFTy_storage = np.fft.ifftn(self.FFTy_storage, axes=(1,))
-        self.diffyEz_re = self.FFTy_storage.real
-        self.diffyEz_im = self.FFTy_storage.imag
-
-        self.diffzEx_re = np.ascontiguousarray(self.diffzEx_re, dtype=self.dtype)
-        self.diffzEy_re = np.ascontiguousarray(self.diffzEy_re, dtype=self.dtype)
-
-        self.diffyEx_re = np.ascontiguousarray(self.diffyEx_re, dtype=self.dtype)
-        self.diffyEz_re = np.ascontiguousarray(self.diffyEz_re, dtype=self.dtype)
-
-        self.diffzEx_im = np.ascontiguousarray(self.diffzEx_im, dtype=self.dtype)
-        self.diffzEy_im = np.ascontiguousarray(self.diffzEy_im, dtype=self.dtype)
-
-        self.diffyEx_im = np.ascontiguousarray(self.diffyEx_im, dtype=self.dtype)
-        self.diffyEz_im = np.ascontiguousarray(self.diffyEz_im, dtype=self.dtype)
+        ikz = 1j * self.kz[nax,nax,:]
+        iky = 1j * self.ky[nax,:,nax]
+
+        diffzFx[:] = fft.irfft(fft.rfft(Fx, axis=2, **kwargs) * ikz, n=self.Nz, axis=2, **kwargs)
+        diffzFy[:] = fft.irfft(fft.rfft(Fy, axis=2, **kwargs) * ikz, n=self.Nz, axis=2, **kwargs)
+
+        if self.MPIysize > 1:
+            self._get_deriv_y_pencil(fft, kwargs, Fx, Fz, diffyFx, diffyFz)
+            return
+
+        diffyFx[:] = fft.irfft(fft.rfft(Fx, axis=1, **kwargs) * iky, n=self.Ny, axis=1, **kwargs)
+        diffyFz[:] = fft.irfft(fft.rfft(Fz, axis=1, **kwargs) * iky, n=self.Ny, axis=1, **kwargs)
+
+    def _get_deriv_y_pencil(self, fft, kwargs, Fx, Fz, diffyFx, diffyFz):
+        """y derivatives of the x and z component in the pencil decomposition.
+
+        The (myNx, myNy, Nz) pencils of the ranks in the same x-slab are transposed
+        into (myNx, Ny, Nz/MPIysize) pencils with one all-to-all, differentiated along
+        the full y axis, and transposed back.
+
+        PARAMETERS
+        ----------
+        fft : module
+            numpy.fft or scipy.fft.
+
+        kwargs : dict
+            Keyword arguments of the fft functions.
+
+        Fx, Fz : ndarray
+            x and z component of the field.
+
+        diffyFx, diffyFz : ndarray
+            The results are written in these arrays.
 
+        RETURNS
+        -------
+        None
         """
-        self.clib_core.updateH  (                                       \
-                                    self.MPIsize, self.MPIrank,         \
-                                    self.myNx, self.Ny, self.Nz,        \
-                                    self.dt,                            \
-                                    self.Hx_re, 
-                                    self.Hy_re, 
-                                    self.Hz_re, 
-                                    self.mu_HEE, self.mu_EHH,           \
-                                    self.mcon_HEE, self.mcon_EHH,       \
-                                    self.diffxEy_re, 
-                                    self.diffxEz_re, 
-                                    self.diffyEx_re, 
-                                    self.diffyEz_re, 
-                                    self.diffzEx_re, 
-                                    self.diffzEy_re
-                                )
-
-        #-------------------------------------------------------------------------------------------#
-        #----------------------------------- Update H in PML region --------------------------------#
-        #-------------------------------------------------------------------------------------------#
 
-        if self.MPIrank == 0:
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x') and self.MPIsize == 1:
-                    self.clib_PML.PML_updateH_px(
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappax,     self.PMLbx, self.PMLax,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hy_re,         
-                                                    self.Hz_re,         
-                                                    self.diffxEy_re,    
-                                                    self.diffxEz_re,    
-                                                    self.psi_hyx_p_re,  
-                                                    self.psi_hzx_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('x'):
-                    self.clib_PML.PML_updateH_mx(
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappax,     self.PMLbx, self.PMLax,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hy_re,         
-                                                    self.Hz_re,         
-                                                    self.diffxEy_re,    
-                                                    self.diffxEz_re,    
-                                                    self.psi_hyx_m_re,  
-                                                    self.psi_hzx_m_re
-                                                )
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_p_re,  
-                                                    self.psi_hzy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_m_re,  
-                                                    self.psi_hzy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_pz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hy_re,         
-                                                    self.diffzEx_re,
-                                                    self.diffzEy_re,    
-                                                    self.psi_hxz_p_re,  
-                                                    self.psi_hyz_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_mz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hy_re,         
-                                                    self.diffzEx_re,    
-                                                    self.diffzEy_re,
-                                                    self.psi_hxz_m_re,  
-                                                    self.psi_hyz_m_re
-                                                )
-
-        elif self.MPIrank > 0 and self.MPIrank < (self.MPIsize-1):
-
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x'): pass
-                if '-' in self.PMLregion.get('x'): pass
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_p_re,  
-                                                    self.psi_hzy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_m_re,  
-                                                    self.psi_hzy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_pz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hy_re,         
-                                                    self.diffzEx_re,    
-                                                    self.diffzEy_re,    
-                                                    self.psi_hxz_p_re,  
-                                                    self.psi_hyz_p_re
-                                                )
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_mz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hy_re,         
-                                                    self.diffzEx_re,    
-                                                    self.diffzEy_re,    
-                                                    self.psi_hxz_m_re,  
-                                                    self.psi_hyz_m_re
-                                                )
-
-        elif self.MPIrank == (self.MPIsize-1) and self.MPIsize != 1:
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x'):
-
-                    self.clib_PML.PML_updateH_px(                                                               \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappax,     self.PMLbx, self.PMLax,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hy_re,     
-                                                    self.Hz_re,     
-                                                    self.diffxEy_re,
-                                                    self.diffxEz_re,    
-                                                    self.psi_hyx_p_re,  
-                                                    self.psi_hzx_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('x'): pass
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_p_re,  
-                                                    self.psi_hzy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateH_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappay,     self.PMLby, self.PMLay,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hz_re,         
-                                                    self.diffyEx_re,    
-                                                    self.diffyEz_re,    
-                                                    self.psi_hxy_m_re,  
-                                                    self.psi_hzy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_pz(                                                               \
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,         
-                                                    self.Hy_re,     
-                                                    self.diffzEx_re,
-                                                    self.diffzEy_re,
-                                                    self.psi_hxz_p_re,
-                                                    self.psi_hyz_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateH_mz(                                                               \
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,          self.Ny,    self.Nz,        self.npml,  \
-                                                    self.dt,                                                    \
-                                                    self.PMLkappaz,     self.PMLbz, self.PMLaz,                 \
-                                                    self.mu_HEE,        self.mu_EHH,                            \
-                                                    self.mcon_HEE,      self.mcon_EHH,                          \
-                                                    self.Hx_re,     
-                                                    self.Hy_re,     
-                                                    self.diffzEx_re,
-                                                    self.diffzEy_re,
-                                                    self.psi_hxz_m_re,  
-                                                    self.psi_hyz_m_re
-                                                )
-
-        return None
+        Py  = self.MPIysize
+        Nzt = self.Nz // Py
+
+        send = self.pencil_send
+        recv = self.pencil_recv
+
+        # Block q holds the q-th z chunk and goes to the q-th rank along y.
+        send[:,0] = Fx.reshape(self.myNx, self.myNy, Py, Nzt).transpose(2,0,1,3)
+        send[:,1] = Fz.reshape(self.myNx, self.myNy, Py, Nzt).transpose(2,0,1,3)
+
+        self.MPIcomm_y.Alltoall(send, recv)
+
+        # Block p holds the y range of the p-th rank, so the full y axis is (p, myNy).
+        lines = recv.transpose(1,2,0,3,4).reshape(2, self.myNx, self.Ny, Nzt)
+        iky   = 1j * self.ky[np.newaxis,np.newaxis,:,np.newaxis]
+        lines = fft.irfft(fft.rfft(lines, axis=2, **kwargs) * iky, n=self.Ny, axis=2, **kwargs)
+
+        recv[:] = lines.reshape(2, self.myNx, Py, self.myNy, Nzt).transpose(2,0,1,3,4)
+
+        self.MPIcomm_y.Alltoall(recv, send)
+
+        diffyFx[:] = send[:,0].transpose(1,2,0,3).reshape(self.myNx, self.myNy, self.Nz)
+        diffyFz[:] = send[:,1].transpose(1,2,0,3).reshape(self.myNx, self.myNy, self.Nz)
+
+    def _validate_deriv_yz(self, where, fields, diffs):
+        """Compare the derivatives of the selected backend with the other backends."""
+
+        tol = np.sqrt(np.finfo(self.dtype).eps)
+
+        for backend in self.deriv_backends:
+
+            if backend == self.deriv: continue
+
+            others = tuple(np.empty_like(diff) for diff in diffs)
+            self._get_deriv_yz(backend, where, fields, others)
+
+            for diff, other in zip(diffs, others):
+
+                scale = max(abs(diff).max(), abs(other).max(), np.finfo(self.dtype).tiny)
+                error = abs(diff - other).max() / scale
+
+                assert error < tol, "rank {:>2}: derivatives of {} field from '{}' and '{}' backend differ by {:.3e}." \
+                                        .format(self.MPIrank, where, self.deriv, backend, error)
+
+    def updateH(self, tstep):
+        """Update H field by one time step with the step plan built in init_update_equations."""
+
+        for function, args in self.step_plan_H: function(*args)
 
     def updateE(self, tstep):
+        """Update E field by one time step with the step plan built in init_update_equations."""
+
+        for function, args in self.step_plan_E: function(*args)
+
+    def run(self, nsteps, src=None, tfsf_src=None, collectors=(), callbacks=(), callbacks_every=None, tstart=0, native=True):
+        """Advance the fields by nsteps time steps.
+
+        A step puts the sources, runs updateH and updateE and accumulates the DFT of the collectors.
+        The loop returns to python only for the callbacks, every callbacks_every steps.
+
+        With the fused kernels, the steps between the callbacks run in run_steps of steploop.so.
+        It puts the sources from their pulse tables, starts and waits the persistent requests of the halo,
+        calls updateH_fused and updateE_fused and accumulates the DFT of the collectors with the twiddles
+        of each step, without going back to python. Without the fused kernels, with the TF/SF box or with
+        collectors of another Space, like the scattered field of Empty3D, the same steps run from python.
+
+            ex) Space.run(Space.tsteps, src=('Ey_re', pulses, 'soft'), callbacks=[plot], callbacks_every=100)
+
+        PARAMETERS
+        ----------
+        nsteps : int
+            Number of time steps.
+
+        src : tuple or list of tuples
+            (where_re, pulses, put_type) as in put_src. pulses holds the pulse at every time step,
+            pulses[tstep] is put at tstep. The position is the one set by set_src_pos.
+            Default None puts no source.
+
+        tfsf_src : tuple
+            (pulses, put_type) of the incident wave of the TF/SF box, as in put_tfsf_src.
+            pulses[tstep] is put before updateH at tstep. Default None puts no incident wave.
+
+        collectors : list
+            Objects with do_RFT(tstep), ex) rft.Sx, rft.Sy, rft.Sz. They are called after updateE.
+
+        callbacks : list
+            Functions f(tstep) called after the steps where tstep % callbacks_every == 0,
+            ex) plots, checkpoints and progress reports.
+
+        callbacks_every : int
+            If None, the callbacks are called once after the last step.
+
+        tstart : int
+            Time step of the first step.
+
+        native : bool
+            If False, the steps always run from python. Default is True.
+
+        RETURNS
+        -------
+        tstep : int
+            The time step after the last one, to continue with another run.
+        """
+
+        # A single source may be given without the list.
+        if   src is None: src = []
+        elif isinstance(src, tuple) and len(src) == 3 and isinstance(src[0], str): src = [src]
+
+        if tfsf_src is not None:
+
+            assert self.tfsf == True, "tfsf_src needs the TF/SF box. Call set_tfsf first."
+
+            tfsf_pulses, tfsf_type = tfsf_src
+
+            if tfsf_type not in ('soft', 'hard'): raise ValueError("Please insert 'soft' or 'hard'")
 
-        #self.MPIcomm.Barrier()
+            tfsf_pulses = np.asarray(tfsf_pulses, dtype=np.float64)
 
-        #---------------------------------------------------------#
-        #------------ MPI send Hy and Hz to next rank ------------#
-        #---------------------------------------------------------#
+            assert len(tfsf_pulses) >= tstart+nsteps, "pulses should have the pulse of every time step up to {}.".format(tstart+nsteps)
 
-        if self.MPIrank < (self.MPIsize-1):
+        # The fields at the source position and the pulses in the precision of the fields.
+        injections = []
 
-            sendHylast_re = self.Hy_re[-1,:,:].copy()
-            sendHzlast_re = self.Hz_re[-1,:,:].copy()
+        for where_re, pulses, put_type in src:
 
-            self.MPIcomm.send(sendHylast_re, dest=(self.MPIrank+1), tag=(tstep*100+3))
-            self.MPIcomm.send(sendHzlast_re, dest=(self.MPIrank+1), tag=(tstep*100+5))
+            if put_type not in ('soft', 'hard'): raise ValueError("Please insert 'soft' or 'hard'")
 
-        #---------------------------------------------------------#
-        #--------- MPI recv Hy and Hz from previous rank ---------#
-        #---------------------------------------------------------#
+            pulses = np.ascontiguousarray(pulses, dtype=self.dtype)
 
-        if self.MPIrank > 0:
+            assert len(pulses) >= tstart+nsteps, "pulses should have the pulse of every time step up to {}.".format(tstart+nsteps)
 
-            recvHyfirst_re = self.MPIcomm.recv( source=(self.MPIrank-1), tag=(tstep*100+3))
-            recvHzfirst_re = self.MPIcomm.recv( source=(self.MPIrank-1), tag=(tstep*100+5))
+            if self.MPIxrank != self.who_put_src: continue
 
-        #self.MPIcomm.Barrier()
+            x = slice(self.my_src_xsrt, self.my_src_xend)
+            y = self._local_y(self.src_ysrt, self.src_yend)
+            z = slice(self.   src_zsrt, self.   src_zend)
+
+            if self.batch == 1: idx = (x, y, z)
+            else              : idx = (slice(None), x, y, z)
+
+            field = getattr(self, where_re[0].upper() + where_re[1:])
+
+            injections.append((field, idx, pulses, put_type == 'soft'))
+
+        # The step plans are gone after close().
+        plan = self.step_plan_H + self.step_plan_E
+
+        native = native == True and self.fused == True \
+                    and all(getattr(collector, 'Space', None) is self and hasattr(collector, 'loop_task') for collector in collectors)
+
+        if native == True:
 
-        # Get x derivatives of Hy and Hz.
-        if self.MPIrank > 0:
-            self.clib_core.get_deriv_x_H_0ML( \
-                                                self.myNx, self.Ny, self.Nz,        \
-                                                self.dx, \
-                                                self.Hy_re, \
-                                                self.Hz_re, \
-                                                self.diffxHy_re, \
-                                                self.diffxHz_re, \
-                                                recvHyfirst_re, \
-                                                recvHzfirst_re \
-                                            )
+            loop, keep = self._step_loop(injections, collectors)
+
+            def advance(tsrt, tend): self.clib_loop.run_steps(ctypes.byref(loop), tsrt, tend-tsrt)
 
         else:
-            self.clib_core.get_deriv_x_H_F00( \
-                                                self.myNx, self.Ny, self.Nz,        \
-                                                self.dx, \
-                                                self.Hy_re, \
-                                                self.Hz_re, \
-                                                self.diffxHy_re, \
-                                                self.diffxHz_re, \
-                                            )
-
-        # Get z derivatives of Hx and Hy.
-        self.clib_core.get_deriv_z_H_FML( \
-                                            self.myNx, self.Ny, self.Nz, \
-                                            self.Hx_re, \
-                                            self.Hy_re, \
-                                            self.kz, \
-                                            self.diffzHx_re, \
-                                            self.diffzHy_re \
-                                        )
-
-        # Get y derivatives of Hx and Hz.
-        self.clib_core.get_deriv_y_H_FML( \
-                                            self.myNx, self.Ny, self.Nz, \
-                                            self.Hx_re, \
-                                            self.Hz_re, \
-                                            self.ky, \
-                                            self.diffyHx_re, \
-                                            self.diffyHz_re \
-                                        )
 
+            views   = [(field[idx], pulses, soft) for field, idx, pulses, soft in injections]
+            do_RFTs = tuple(collector.do_RFT for collector in collectors)
+
+            def advance(tsrt, tend):
+
+                for tstep in range(tsrt, tend):
+
+                    for view, pulses, soft in views:
+                        if soft: view += pulses[tstep]
+                        else   : view[...] = pulses[tstep]
+
+                    if tfsf_src is not None: self.put_tfsf_src(tfsf_pulses[tstep], tfsf_type)
+
+                    for function, args in plan: function(*args)
+
+                    for do_RFT in do_RFTs: do_RFT(tstep)
+
+        tstep = tstart
+        tend  = tstart + nsteps
+
+        while tstep < tend:
+
+            # Run up to the next step with the callbacks.
+            if callbacks_every == None: stop = tend
+            else                      : stop = min(tend, tstep + (-tstep) % callbacks_every + 1)
+
+            advance(tstep, stop)
+
+            tstep = stop
+
+            if callbacks_every != None and (tstep-1) % callbacks_every == 0:
+                for callback in callbacks: callback(tstep-1)
+
+        if callbacks_every == None and nsteps > 0:
+            for callback in callbacks: callback(tend-1)
+
+        return tend
+
+    def _step_loop(self, injections, collectors):
+        """Fill the StepLoop struct of steploop.c for the fused kernels.
+
+        PARAMETERS
+        ----------
+        injections : list
+            (field, idx, pulses, soft) of the sources in this rank.
+
+        collectors : list
+            Collectors with loop_task().
+
+        RETURNS
+        -------
+        (loop, keep) : tuple
+            The struct and the arrays made here, which it points to and which must live while it is used.
         """
-        self.clib_core.get_deriv_last_axis  ( 
-                                                self.myNx, self.Ny, self.Nz, \
-                                                self.Hx_re, \
-                                                self.kz, \
-                                                self.diffzHx_re, \
-                                            )
-
-        self.clib_core.get_deriv_last_axis  ( 
-                                                self.myNx, self.Ny, self.Nz, \
-                                                self.Hy_re, \
-                                                self.kz, \
-                                                self.diffzHy_re \
-                                            )
 
-        nax = np.newaxis
-        self.FFTz_storage = np.fft.rfftn(self.Hx_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.diffzHx_re = np.fft.irfftn(self.FFTz_storage, axes=(2,))
+        if getattr(self, 'clib_loop', None) is None:
 
-        self.FFTz_storage = np.fft.rfftn(self.Hy_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.diffzHy_re = np.fft.irfftn(self.FFTz_storage, axes=(2,))
+            self.clib_loop = ctypes.cdll.LoadLibrary("./steploop{}.so".format(self.clib_suffix))
+            self.clib_loop.run_steps.restype  = None
+            self.clib_loop.run_steps.argtypes = [ctypes.POINTER(_StepLoop), ctypes.c_int, ctypes.c_int]
 
-        self.FFTy_storage = np.fft.rfftn(self.Hx_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.diffyHx_re = np.fft.irfftn(self.FFTy_storage, axes=(1,))
+        address = lambda array: array.ctypes.data
 
-        self.FFTy_storage = np.fft.rfftn(self.Hz_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.diffyHz_re = np.fft.irfftn(self.FFTy_storage, axes=(1,))
+        loop = _StepLoop()
+        keep = []
 
-        self.diffzHx_re = np.ascontiguousarray(self.diffzHx_re, dtype=self.dtype)
-        self.diffzHy_re = np.ascontiguousarray(self.diffzHy_re, dtype=self.dtype)
+        loop.plans = self.FFT_plans.value
+        loop.pml   = ctypes.addressof(self.cpml)
+        loop.win   = MPI._addressof(self.shm_win) if self.shm_win is not None else None
 
-        self.diffyHx_re = np.ascontiguousarray(self.diffyHx_re, dtype=self.dtype)
-        self.diffyHz_re = np.ascontiguousarray(self.diffyHz_re, dtype=self.dtype)
+        loop.MPIsize, loop.MPIrank = self.MPIxsize, self.MPIxrank
+        loop.myNx, loop.Ny, loop.Nz = self.myNx, self.myNy, self.Nz
 
-        nax = np.newaxis
-        self.FFTz_storage = np.fft.fftn(self.Hx_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.FFTz_storage = np.fft.ifftn(self.FFTz_storage, axes=(2,))
-        self.diffzHx_re = self.FFTz_storage.real
-        self.diffzHx_im = self.FFTz_storage.imag
-
-        self.FFTz_storage = np.fft.fftn(self.Hy_re, axes=(2,))
-        self.FFTz_storage = self.FFTz_storage * self.kz[nax,nax,:] * 1j
-        self.FFTz_storage = np.fft.ifftn(self.FFTz_storage, axes=(2,))
-        self.diffzHy_re = self.FFTz_storage.real
-        self.diffzHy_im = self.FFTz_storage.imag
-
-        self.FFTy_storage = np.fft.fftn(self.Hx_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.FFTy_storage = np.fft.ifftn(self.FFTy_storage, axes=(1,))
-        self.diffyHx_re = self.FFTy_storage.real
-        self.diffyHx_im = self.FFTy_storage.imag
-
-        self.FFTy_storage = np.fft.fftn(self.Hz_re, axes=(1,))
-        self.FFTy_storage = self.FFTy_storage * self.ky[nax,:,nax] * 1j
-        self.FFTy_storage = np.fft.ifftn(self.FFTy_storage, axes=(1,))
-        self.diffyHz_re = self.FFTy_storage.real
-        self.diffyHz_im = self.FFTy_storage.imag
-
-        self.diffzHx_re = np.ascontiguousarray(self.diffzHx_re, dtype=self.dtype)
-        self.diffzHy_re = np.ascontiguousarray(self.diffzHy_re, dtype=self.dtype)
-
-        self.diffyHx_re = np.ascontiguousarray(self.diffyHx_re, dtype=self.dtype)
-        self.diffyHz_re = np.ascontiguousarray(self.diffyHz_re, dtype=self.dtype)
-
-        self.diffzHx_im = np.ascontiguousarray(self.diffzHx_im, dtype=self.dtype)
-        self.diffzHy_im = np.ascontiguousarray(self.diffzHy_im, dtype=self.dtype)
-
-        self.diffyHx_im = np.ascontiguousarray(self.diffyHx_im, dtype=self.dtype)
-        self.diffyHz_im = np.ascontiguousarray(self.diffyHz_im, dtype=self.dtype)
+        loop.pml_widths[:] = self.pml_widths
+        loop.dt, loop.dx   = self.dt, self.dx
+        loop.ky, loop.kz   = address(self.ky), address(self.kz)
+        loop.mat           = address(self.mat_index) if self.mat_index is not None else None
+
+        # The same half steps as the fused branch of _build_step_plan.
+        for half, F, G, halo, recv, coef in (
+                (loop.half[0], 'H', 'E', self.halo_E, 'last' , self.coefH),
+                (loop.half[1], 'E', 'H', self.halo_H, 'first', self.coefE),
+            ):
+
+            half.kernel = ctypes.cast(getattr(self.clib_core, 'update%s_fused' %F), ctypes.c_void_p).value
+
+            if F == 'H': send_to, plane, side = self.MPIxrank > 0                 and not self.shm_prev, 0 , 'first'
+            else       : send_to, plane, side = self.MPIxrank < (self.MPIxsize-1) and not self.shm_next, -1, 'last'
+
+            if send_to:
+                half.ncopy = 2
+                for n, Gc in enumerate((G+'y', G+'z')):
+                    half.copy_src[n] = address(getattr(self, Gc+'_re')[plane])
+                    half.copy_dst[n] = address(getattr(self, 'send%s%s_re' %(Gc, side)))
+
+            assert len(halo) <= 8, "run_steps takes at most 8 requests per half step."
+
+            reqs = (ctypes.c_void_p * max(len(halo), 1))(*[MPI._addressof(req) for req in halo])
+            half.nreqs, half.reqs = len(halo), reqs
+
+            # The plane next to the neighbor is updated after its boundary plane is received.
+            if F == 'H': inner, outer = (0, self.myNx-1), (self.myNx-1, self.myNx)
+            else       : inner, outer = (1, self.myNx), (0, 1)
+
+            (half.isrt[0], half.iend[0]), (half.isrt[1], half.iend[1]) = inner, outer
+
+            half.F[:]    = [address(getattr(self, '%s%s_re' %(F, c))) for c in 'xyz']
+            half.G[:]    = [address(getattr(self, '%s%s_re' %(G, c))) for c in 'xyz']
+            half.coef    = address(coef)
+            half.recv[:] = [address(getattr(self, 'recv%s%s_re' %(G+c, recv))) for c in 'yz']
+
+        # The sources.
+        sources = (_Source * max(len(injections), 1))()
+
+        for source, (field, (x, y, z), pulses, soft) in zip(sources, injections):
+
+            source.field  = address(field)
+            source.Ny     = self.myNy
+            source.Nz     = self.Nz
+            source.xsrt, source.xend = x.start, x.stop
+            source.ysrt, source.yend = y.start, y.stop
+            source.zsrt, source.zend = z.start, z.stop
+            source.soft   = soft
+            source.pulses = address(pulses)
 
+        loop.nsrc, loop.src = len(injections), sources
+
+        # The collectors with a plane in this rank.
+        tasks = [(collector, collector.loop_task()) for collector in collectors]
+        tasks = [(collector, task) for collector, task in tasks if task is not None]
+
+        cols = (_Collector * max(len(tasks), 1))()
+
+        for col, (collector, (kernel, extent, accumulators, fields)) in zip(cols, tasks):
+
+            freqs = np.ascontiguousarray(np.atleast_1d(collector.freqs), dtype=np.float64)
+            keep.append(freqs)
+
+            col.kernel  = ctypes.cast(kernel, ctypes.c_void_p).value
+            col.blocked = len(accumulators) == 1
+            col.Nf      = collector.Nf
+            col.Ny, col.Nz, col.xsrt, col.xend, col.ysrt, col.yend, col.zsrt, col.zend = extent
+            col.stride  = collector.stride
+            col.single  = int(np.dtype(collector.acc_dtype) == np.float32)
+            col.freqs   = address(freqs)
+            col.coswdt  = address(collector.coswdt)
+            col.sinwdt  = address(collector.sinwdt)
+
+            col.DFT[:len(accumulators)] = [address(acc) for acc in accumulators]
+            col.F[:] = [address(field) for field in fields]
+
+        loop.ncol, loop.col = len(tasks), cols
+
+        return loop, keep
+
+    def close(self):
+        """Destroy the FFT plans, free their workspace and the shared memory window of the fields.
+
+        The update equations can not be used after close(). Ey, Ez, Hy and Hz are copied
+        out of the shared memory window, so that the fields can still be read.
+        It is called again by __del__, where it does nothing.
+
+        RETURNS
+        -------
+        None
         """
-        # Update E field.
-        self.clib_core.updateE  (                                                   \
-                                    self.MPIsize, self.MPIrank,
-                                    self.myNx, self.Ny, self.Nz,                    \
-                                    self.dt,                                        \
-                                    self.Ex_re, 
-                                    self.Ey_re, 
-                                    self.Ez_re, 
-                                    self.eps_HEE, self.eps_EHH,                     \
-                                    self.econ_HEE, self.econ_EHH,                   \
-                                    self.diffxHy_re, 
-                                    self.diffxHz_re, 
-                                    self.diffyHx_re, 
-                                    self.diffyHz_re, 
-                                    self.diffzHx_re, 
-                                    self.diffzHy_re
-                                )
-
-        #-------------------------------------------------------------------------------------------#
-        #----------------------------------- Update E in PML region --------------------------------#
-        #-------------------------------------------------------------------------------------------#
 
-        if self.MPIrank == 0:
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x') and self.MPIsize == 1:
-                    self.clib_PML.PML_updateE_px(
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappax,     self.PMLbx,     self.PMLax, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ey_re,         
-                                                    self.Ez_re,         
-                                                    self.diffxHy_re,    
-                                                    self.diffxHz_re,    
-                                                    self.psi_eyx_p_re,  
-                                                    self.psi_ezx_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('x'):
-                    self.clib_PML.PML_updateE_mx(
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappax,     self.PMLbx,     self.PMLax, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ey_re,     
-                                                    self.Ez_re,     
-                                                    self.diffxHy_re,
-                                                    self.diffxHz_re,
-                                                    self.psi_eyx_m_re,
-                                                    self.psi_ezx_m_re
-                                                )
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,     
-                                                    self.Ez_re,     
-                                                    self.diffyHx_re,
-                                                    self.diffyHz_re,
-                                                    self.psi_exy_p_re,
-                                                    self.psi_ezy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,     
-                                                    self.Ez_re,     
-                                                    self.diffyHx_re,
-                                                    self.diffyHz_re,    
-                                                    self.psi_exy_m_re,  
-                                                    self.psi_ezy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_pz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ey_re,         
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_p_re,  
-                                                    self.psi_eyz_p_re
-                                                )
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_mz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ey_re,         
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_m_re,  
-                                                    self.psi_eyz_m_re
-                                                )
-
-        elif self.MPIrank > 0 and self.MPIrank < (self.MPIsize-1):
-
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x'): pass
-                if '-' in self.PMLregion.get('x'): pass
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ez_re,         
-                                                    self.diffyHx_re,    
-                                                    self.diffyHz_re,    
-                                                    self.psi_exy_p_re,  
-                                                    self.psi_ezy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,     
-                                                    self.Ez_re,     
-                                                    self.diffyHx_re,
-                                                    self.diffyHz_re,
-                                                    self.psi_exy_m_re,
-                                                    self.psi_ezy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_pz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ey_re,         
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_p_re,
-                                                    self.psi_eyz_p_re
-                                                )
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_mz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ey_re,         
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_m_re,  
-                                                    self.psi_eyz_m_re
-                                                )
-
-        elif self.MPIrank == (self.MPIsize-1) and self.MPIsize != 1:
-            if 'x' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('x'):
-
-                    self.clib_PML.PML_updateE_px(
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappax,     self.PMLbx,     self.PMLax, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ey_re,         
-                                                    self.Ez_re,         
-                                                    self.diffxHy_re,    
-                                                    self.diffxHz_re,    
-                                                    self.psi_eyx_p_re,
-                                                    self.psi_ezx_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('x'): pass
-
-            if 'y' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_py(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ez_re,         
-                                                    self.diffyHx_re,    
-                                                    self.diffyHz_re,
-                                                    self.psi_exy_p_re,  
-                                                    self.psi_ezy_p_re
-                                                )
-
-                if '-' in self.PMLregion.get('y'):
-                    self.clib_PML.PML_updateE_my(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappay,     self.PMLby,     self.PMLay, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ez_re,         
-                                                    self.diffyHx_re,
-                                                    self.diffyHz_re,
-                                                    self.psi_exy_m_re,  
-                                                    self.psi_ezy_m_re
-                                                )
-
-            if 'z' in self.PMLregion.keys():
-                if '+' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_pz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,     
-                                                    self.Ey_re,     
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_p_re,  
-                                                    self.psi_eyz_p_re
-                                                )
-    
-                if '-' in self.PMLregion.get('z'):
-                    self.clib_PML.PML_updateE_mz(
-                                                    self.MPIsize, self.MPIrank,         \
-                                                    self.myNx,  self.Ny,    self.Nz,    self.npml,  \
-                                                    self.dt,                                        \
-                                                    self.PMLkappaz,     self.PMLbz,     self.PMLaz, \
-                                                    self.eps_HEE,       self.eps_EHH,               \
-                                                    self.econ_HEE,      self.econ_EHH,              \
-                                                    self.Ex_re,         
-                                                    self.Ey_re,         
-                                                    self.diffzHx_re,    
-                                                    self.diffzHy_re,    
-                                                    self.psi_exz_m_re,  
-                                                    self.psi_eyz_m_re
-                                                )
-
-        return None
+        if getattr(self, 'FFT_plans', None) is not None:
+
+            self.clib_core.destroy_FFT_plans(self.FFT_plans)
+            self.FFT_plans = None
+
+        # The step plans hold the address of the freed workspace.
+        # They are not there if init_update_equations stopped before making them.
+        self.__dict__.pop('step_plan_H', None)
+        self.__dict__.pop('step_plan_E', None)
+
+        if getattr(self, 'shm_win', None) is None or MPI.Is_finalized(): return
+
+        self.Ey_re, self.Ez_re, self.Hy_re, self.Hz_re = [np.array(field) for field in (self.Ey_re, self.Ez_re, self.Hy_re, self.Hz_re)]
+
+        # The views of the neighbors in the window.
+        views = ['shm_fields_prev', 'shm_fields_next']
+        if self.shm_next: views += ['recvEylast_re' , 'recvEzlast_re' ]
+        if self.shm_prev: views += ['recvHyfirst_re', 'recvHzfirst_re']
+
+        for name in views: self.__dict__.pop(name, None)
+
+        if self.batch > 1 and hasattr(self, 'members'): self.members = [_Member(self, b) for b in range(self.batch)]
+
+        # Win.Free is collective over the ranks of the node.
+        self.shm_win.Unlock_all()
+        self.shm_win.Free()
+        self.shm_win = None
+
+    def __del__(self):
+
+        self.close()
 
     def get_src(self, what, tstep):
 
-        if self.MPIrank == self.who_put_src:
+        if self.MPIxrank == self.who_put_src:
             
             if   what == 'Ex': 
                 from_the_re = self.Ex_re
@@ -1771,7 +2644,7 @@ class Basic3D(object):
         ########################## All rank already knows who put src ########################
         ######################################################################################
 
-        if self.MPIrank == self.who_get_ref:
+        if self.MPIxrank == self.who_get_ref:
 
             if   what == 'Ex': 
                 from_the_re = self.Ex_re
@@ -1788,7 +2661,7 @@ class Basic3D(object):
             
             #self.ref_re[tstep] = from_the_re[self.local_ref_xpos,:,:].mean() - amp * self.pulse_re
 
-            self.ref_re[tstep] = from_the_re[self.local_ref_xpos,:,:].mean()
+            self.ref_re[tstep] = from_the_re[...,self.local_ref_xpos,:,:].mean(axis=(-2,-1))
 
             #print(from_the_re[self.local_ref_xpos,:,:].mean(), self.pulse_re)
 
@@ -1796,7 +2669,7 @@ class Basic3D(object):
         
     def get_trs(self, what, tstep) : 
 
-        if self.MPIrank == self.who_get_trs:
+        if self.MPIxrank == self.who_get_trs:
             
             if   what == 'Ex': 
                 from_the_re = self.Ex_re
@@ -1811,7 +2684,7 @@ class Basic3D(object):
             elif what == 'Hz':
                 from_the_re = self.Hz_re
 
-            self.trs_re[tstep] = from_the_re[self.local_trs_xpos,:,:].mean()
+            self.trs_re[tstep] = from_the_re[...,self.local_trs_xpos,:,:].mean(axis=(-2,-1))
 
         else : pass
 
@@ -1819,11 +2692,174 @@ class Basic3D(object):
 
         self.MPIcomm.Barrier()
 
-        if self.MPIrank == self.who_get_trs:
-            np.save('./graph/trs_re.npy', self.trs_re)
+        if self.MPIxrank == self.who_get_trs:
+            trs_re = self._mean_over_y(self.trs_re)
+            if self.MPIyrank == 0: np.save('./graph/trs_re.npy', trs_re)
+
+        if self.MPIxrank == self.who_get_ref:
+            ref_re = self._mean_over_y(self.ref_re)
+            if self.MPIyrank == 0: np.save('./graph/ref_re.npy', ref_re)
+
+    def save_checkpoint(self, path, tstep, collectors=()):
+        """Write the state of the solver after time step tstep into one file with collective MPI-IO.
+
+        The file starts with a JSON header which lists the arrays of every rank.
+        Each rank writes its own arrays into its own contiguous region after the header,
+        straight from memory. The file is written to path+'.tmp' and renamed when complete,
+        so an interrupted write leaves the previous checkpoint intact.
+
+        PARAMETERS
+        ----------
+        path : string
+            Path of the checkpoint file.
+
+        tstep : int
+            The last time step which is completed.
+
+        collectors : list
+            rft.Sx, rft.Sy and rft.Sz objects whose DFT accumulators are saved too.
+
+        RETURNS
+        -------
+        None
+        """
+
+        arrays = self._checkpoint_arrays(collectors)
+        header, offset = self._checkpoint_header(tstep+1, arrays)
+
+        fh = MPI.File.Open(self.MPIcomm, path+'.tmp', MPI.MODE_WRONLY | MPI.MODE_CREATE)
+        fh.Set_size(0)
+
+        if self.MPIrank == 0: fh.Write_at(0, np.array([len(header)], dtype='<u8').tobytes() + header)
+
+        buf, datatype = self._checkpoint_buffer(arrays)
+        fh.Write_at_all(offset, buf)
+        datatype.Free()
+
+        fh.Close()
+
+        if self.MPIrank == 0: os.replace(path+'.tmp', path)
+
+        self.MPIcomm.Barrier()
+
+    def load_checkpoint(self, path, collectors=()):
+        """Read the state written by save_checkpoint.
+
+        Call it after init_update_equations and after the collectors are made.
+        The run must use the same grid, dtype, number of ranks, pencil, batch and x-slabs.
+
+        PARAMETERS
+        ----------
+        path : string
+            Path of the checkpoint file.
+
+        collectors : list
+            The collectors given to save_checkpoint, in the same order.
+
+        RETURNS
+        -------
+        tstep : int
+            The time step to resume from.
+        """
+
+        fh = MPI.File.Open(self.MPIcomm, path, MPI.MODE_RDONLY)
+
+        if self.MPIrank == 0:
+            length = np.zeros(1, dtype='<u8')
+            fh.Read_at(0, length)
+            saved = bytearray(int(length[0]))
+            fh.Read_at(8, saved)
+            saved = json.loads(saved.decode())
+        else: saved = None
+
+        saved  = self.MPIcomm.bcast(saved, root=0)
+        arrays = self._checkpoint_arrays(collectors)
+        header, offset = self._checkpoint_header(saved['tstep'], arrays)
+
+        for key in ('MPIsize', 'pencil', 'batch', 'grid', 'dtype', 'myNx_indice'):
+            if saved[key] != json.loads(header)[key]:
+                raise ValueError("Checkpoint {} has {} = {}, this run has {}." .format(path, key, saved[key], json.loads(header)[key]))
+
+        if saved['ranks'] != json.loads(header)['ranks']:
+            raise ValueError("Checkpoint {} holds different arrays than this run." .format(path))
+
+        buf, datatype = self._checkpoint_buffer(arrays)
+        fh.Read_at_all(offset, buf)
+        datatype.Free()
+
+        fh.Close()
+
+        return saved['tstep']
+
+    def _checkpoint_arrays(self, collectors):
+        """Arrays which carry the state of the solver and of the collectors between time steps."""
+
+        names  = ['Ex_re', 'Ey_re', 'Ez_re', 'Hx_re', 'Hy_re', 'Hz_re']
+        names += sorted(name for name in vars(self) if name.startswith('psi_'))
+        names += [name for name in ('src_re', 'ref_re', 'trs_re', 'tfsf_Einc', 'tfsf_Hinc') if hasattr(self, name)]
+
+        arrays = [(name, getattr(self, name)) for name in names]
+
+        for collector in collectors:
+            arrays += [(collector.name+'/'+name, array) for name, array in collector.state_arrays()]
+
+        return arrays
+
+    def _checkpoint_header(self, tstep, arrays):
+        """JSON header of a checkpoint and the file offset of this rank."""
+
+        table  = [(name, list(array.shape), array.dtype.str) for name, array in arrays]
+        tables = self.MPIcomm.allgather(table)
+        sizes  = [sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for name, shape, dtype in t) for t in tables]
+
+        header = json.dumps({
+                                'tstep'      : tstep,
+                                'MPIsize'    : self.MPIsize,
+                                'pencil'     : self.MPIysize,
+                                'batch'      : self.batch,
+                                'grid'       : list(self.grid),
+                                'dtype'      : np.dtype(self.dtype).str,
+                                'myNx_indice': [list(indice) for indice in self.myNx_indice],
+                                'ranks'      : tables,
+                            }).encode()
+
+        # The data starts at the first 4 KiB boundary after the header.
+        data_start = (8 + len(header) + 4095) // 4096 * 4096
 
-        if self.MPIrank == self.who_get_ref:
-            np.save('./graph/ref_re.npy', self.ref_re)
+        return header, data_start + sum(sizes[:self.MPIrank])
+
+    def _checkpoint_buffer(self, arrays):
+        """An MPI datatype which covers the arrays where they are, so they are written and read without a copy."""
+
+        blocks = []
+        displs = []
+
+        # Split the arrays into blocks of at most 1 GiB to keep the lengths in int.
+        for name, array in arrays:
+            assert array.flags['C_CONTIGUOUS'], "{} must be C contiguous." .format(name)
+
+            address = MPI.Get_address(array)
+
+            for srt in range(0, array.nbytes, 2**30):
+                blocks.append(min(2**30, array.nbytes-srt))
+                displs.append(address+srt)
+
+        datatype = MPI.BYTE.Create_hindexed(blocks, displs).Commit()
+
+        return [MPI.BOTTOM, 1, datatype], datatype
+
+    def _mean_over_y(self, local_mean):
+        """Average the plane means of the pencils in the same x-slab.
+
+        All pencils have the same size, so the mean of the means is the mean of the plane.
+        """
+
+        if self.MPIysize == 1: return local_mean
+
+        total = np.zeros_like(local_mean)
+        self.MPIcomm_y.Reduce(local_mean, total, op=MPI.SUM, root=0)
+
+        return total / self.MPIysize
 
 
 class Empty3D(object):
@@ -1853,6 +2889,10 @@ class Empty3D(object):
                 Set the courant number. For FDTD, default is 0.5
                 For PSTD, default is 0.25
 
+            xcost, min_edge :
+                Same as Basic3D. Give the values of the TF and IF spaces,
+                so that the scattered field is split into the same x-slabs.
+
         RETURNS
         -------
         None
@@ -1904,8 +2944,13 @@ class Empty3D(object):
         self.courant = courant
         self.dt = dt
 
+        self.xcost    = None
+        self.min_edge = 1
+
         for key, value in kwargs.items():
-            if key == 'courant': self.courant = value
+            if key == 'courant' : self.courant  = value
+            if key == 'xcost'   : self.xcost    = value
+            if key == 'min_edge': self.min_edge = int(value)
 
         self.maxdt = 2. / c / np.sqrt( (2./self.dx)**2 + (np.pi/self.dy)**2 + (np.pi/self.dz)**2 )
 
@@ -1916,50 +2961,114 @@ class Empty3D(object):
         """
 
         assert self.dt < self.maxdt, "Time interval is too big so that causality is broken. Lower the courant number."
-        assert float(self.Nx) % self.MPIsize == 0., "Nx must be a multiple of the number of nodes."
-        
+        assert self.Nx >= self.MPIsize, "Nx must be at least the number of nodes."
+
+        ###############################################################################
+        ######################## Slice object that each node got ######################
+        ###############################################################################
+
+        # The same x-slabs as Basic3D with the same xcost.
+        xindice = x_slabs(self.Nx, self.MPIsize, self.xcost, self.min_edge)
+
+        self.myNx_slices = [slice(xstart, xend) for xstart, xend in xindice]
+        self.myNx_indice = [     (xstart, xend) for xstart, xend in xindice]
+
         #############################################################################
         ################# Set the loc_grid each node should possess #################
         #############################################################################
 
-        self.myNx     = int(self.Nx / self.MPIsize)
-        self.loc_grid = [self.myNx, self.Ny, self.Nz]
+        self.myNx     = self.myNx_indice[self.MPIrank][1] - self.myNx_indice[self.MPIrank][0]
+        self.myNy     = self.Ny
+        self.loc_grid = [self.myNx, self.myNy, self.Nz]
 
-        self.Ex_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        # The ranks form x-slabs only.
+        self.MPIxsize = self.MPIsize
+        self.MPIxrank = self.MPIrank
+        self.MPIysize = 1
+        self.MPIyrank = 0
+        self.batch    = 1
 
-        self.Ey_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        # The fields are the differences of TF and IF, evaluated only when they are read.
+        self.lazy = True
+        self.TF   = None
+        self.IF   = None
 
-        self.Ez_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        self.myNy_slices = [slice(0, self.Ny)]
+        self.myNy_indice = [     (0, self.Ny)]
 
-        self.Hx_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        self.MPIcomm.Barrier()
 
-        self.Hy_re = np.zeros(self.loc_grid, dtype=self.dtype)
+    def get_SF(self, TF, IF):
+        """Set the total field and the incident field whose difference is the scattered field.
 
-        self.Hz_re = np.zeros(self.loc_grid, dtype=self.dtype)
+        Nothing is computed here. The rft collectors evaluate the difference on their own planes
+        with get_SF_block, and reading Ex_re, ..., Hz_re evaluates it on the whole local grid.
 
-        ###############################################################################
-        ######################## Slice object that each node got ######################
-        ###############################################################################
-        
-        self.myNx_slices = []
-        self.myNx_indice = []
+        PARAMETERS
+        ----------
+        TF : Basic3D
+            Total field.
 
-        for rank in range(self.MPIsize):
+        IF : Basic3D
+            Incident field.
 
-            xstart = (rank    ) * self.myNx
-            xend   = (rank + 1) * self.myNx
+        RETURNS
+        -------
+        None
+        """
 
-            self.myNx_slices.append(slice(xstart, xend))
-            self.myNx_indice.append(     (xstart, xend))
+        assert TF.myNx_indice == self.myNx_indice and IF.myNx_indice == self.myNx_indice, \
+            "TF and IF must be split into the same x-slabs as the scattered field. Give Empty3D the same xcost and min_edge."
 
-        self.MPIcomm.Barrier()
+        self.TF = TF
+        self.IF = IF
 
-    def get_SF(self, TF, IF):
+    def get_SF_block(self, where_re, loc, out):
+        """Write the scattered field on a local box into out.
+
+        PARAMETERS
+        ----------
+        where_re : string
+            'Ex_re', 'Ey_re', 'Ez_re', 'Hx_re', 'Hy_re' or 'Hz_re'.
+
+        loc : tuple
+            ((xsrt, ysrt, zsrt), (xend, yend, zend)) in the local grid.
+
+        out : ndarray
+            Array with the shape of the box.
+
+        RETURNS
+        -------
+        out : ndarray
+        """
+
+        (xsrt, ysrt, zsrt), (xend, yend, zend) = loc
+        box = (slice(xsrt, xend), slice(ysrt, yend), slice(zsrt, zend))
+
+        if self.TF is None: out[...] = 0.
+        else: np.subtract(getattr(self.TF, where_re)[box], getattr(self.IF, where_re)[box], out=out)
+
+        return out
+
+    def _get_SF(self, where_re):
+
+        if self.TF is None: return np.zeros(self.loc_grid, dtype=self.dtype)
+        else: return getattr(self.TF, where_re) - getattr(self.IF, where_re)
+
+    @property
+    def Ex_re(self): return self._get_SF('Ex_re')
+
+    @property
+    def Ey_re(self): return self._get_SF('Ey_re')
+
+    @property
+    def Ez_re(self): return self._get_SF('Ez_re')
+
+    @property
+    def Hx_re(self): return self._get_SF('Hx_re')
 
-        self.Ex_re = TF.Ex_re - IF.Ex_re
-        self.Ey_re = TF.Ey_re - IF.Ey_re
-        self.Ez_re = TF.Ez_re - IF.Ez_re
+    @property
+    def Hy_re(self): return self._get_SF('Hy_re')
 
-        self.Hx_re = TF.Hx_re - IF.Hx_re
-        self.Hy_re = TF.Hy_re - IF.Hy_re
-        self.Hz_re = TF.Hz_re - IF.Hz_re
+    @property
+    def Hz_re(self): return self._get_SF('Hz_re')
@@ -0,0 +1,308 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <mpi.h>
+
+/*
+	Precision of the fields.
+	Compile with mpicc. -DSINGLE_PRECISION gives steploop.f32.so for the float32 fields.
+	space.py loads it as steploop.so or steploop.f32.so in Basic3D.run.
+
+		mpicc -O2 -fPIC -shared steploop.c -o steploop.so -lm
+*/
+#ifdef SINGLE_PRECISION
+typedef float real_t;
+#else
+typedef double real_t;
+#endif
+
+/*
+	Time loop of Basic3D.run.
+
+	A time step puts the sources, updates H and E field with the fused kernels, exchanges
+	the boundary planes along x with the persistent requests made in init_update_equations
+	and accumulates the DFT of the collectors. The loop returns to python after nsteps.
+
+	The fused kernels of core.real.so (core.real.omp.so) and the DFT kernels of rftkernel.so
+	are called through the function pointers set by space.py, so that this library only needs MPI.
+	FFT_plans and CPML are passed to the fused kernels as they are, so they are opaque here.
+*/
+
+/***********************************************************************************/
+/******************************** FUNCTION DECLARATION *****************************/
+/***********************************************************************************/
+
+// updateH_fused and updateE_fused of core.real.c.
+typedef void (*fused_kernel)(
+	void*	plans,
+	int		MPIsize,	int MPIrank,
+	int		myNx,		int		Ny,		int		Nz,
+	int		isrt,		int		iend,
+	int		pml_xm,		int		pml_xp,
+	int		pml_ym,		int		pml_yp,
+	int		pml_zm,		int		pml_zp,
+	double	dt,			double	dx,
+	real_t *ky,			real_t *kz,
+	real_t *F0,			real_t *F1,		real_t *F2,
+	real_t *G0,			real_t *G1,		real_t *G2,
+	unsigned short *mat,	real_t *coef,
+	real_t *recv0,		real_t *recv1,
+	void*	pml
+);
+
+// do_RFT_to_get_Sx, do_RFT_to_get_Sy and do_RFT_to_get_Sz of rftkernel.c.
+typedef void (*planar_kernel)(
+	int MPIrank,
+	int Nf,
+	int Ny,	  int Nz,
+	int xsrt, int xend,
+	int ysrt, int yend,
+	int zsrt, int zend,
+	void* coswdt, void* sinwdt,
+	void* DFT0, void* DFT1, void* DFT2, void* DFT3,
+	void* DFT4, void* DFT5, void* DFT6, void* DFT7,
+	real_t* F0, real_t* F1,
+	real_t* F2, real_t* F3
+);
+
+// do_RFT_blocked of rftkernel.c.
+typedef void (*blocked_kernel)(
+	int Nf,
+	int Ny,	  int Nz,
+	int xsrt, int xend,
+	int ysrt, int yend,
+	int zsrt, int zend,
+	void* coswdt, void* sinwdt,
+	void* DFT,
+	real_t* F0, real_t* F1,
+	real_t* F2, real_t* F3
+);
+
+// A source of put_src. The pulse of tstep is pulses[tstep].
+typedef struct {
+
+	real_t *field;
+	int Ny, Nz;
+	int xsrt, xend;
+	int ysrt, yend;
+	int zsrt, zend;
+	int soft;
+	real_t *pulses;
+
+} Source;
+
+// The DFT of a collector. The twiddles of each step are written into coswdt and sinwdt.
+typedef struct {
+
+	void *kernel;
+	int blocked;
+	int Nf;
+	int Ny, Nz;
+	int xsrt, xend;
+	int ysrt, yend;
+	int zsrt, zend;
+	int stride;
+	int single;			// 1 if the accumulators and the twiddles are float32.
+	double *freqs;
+	void *coswdt, *sinwdt;
+	void *DFT[8];		// The accumulators in the order of the planar kernel, or DFT[0] for the blocked one.
+	real_t *F[4];
+
+} Collector;
+
+// Half step of H or E field.
+typedef struct {
+
+	void *kernel;
+
+	// Boundary planes copied into the send buffers before the requests start.
+	int ncopy;
+	real_t *copy_src[2], *copy_dst[2];
+
+	// Addresses of the MPI_Request handles of the persistent requests.
+	int nreqs;
+	void **reqs;
+
+	// Planes updated before and after the boundary planes of the neighbor are received.
+	int isrt[2], iend[2];
+
+	real_t *F[3], *G[3];
+	real_t *coef;
+	real_t *recv[2];
+
+} HalfStep;
+
+typedef struct {
+
+	void *plans, *pml;
+
+	// Address of the MPI_Win of the shared halo window. NULL if there is none.
+	void *win;
+
+	int MPIsize, MPIrank;
+	int myNx, Ny, Nz;
+	int pml_widths[6];
+	double dt, dx;
+	real_t *ky, *kz;
+	unsigned short *mat;
+
+	HalfStep half[2];
+
+	int nsrc;
+	Source *src;
+
+	int ncol;
+	Collector *col;
+
+} StepLoop;
+
+// Advance the fields from tstart by nsteps time steps.
+void run_steps(StepLoop* loop, int tstart, int nsteps);
+
+/***********************************************************************************/
+/******************************** FUNCTION DESCRIPTION *****************************/
+/***********************************************************************************/
+
+static void put_sources(StepLoop* loop, int tstep){
+
+	int s, i, j, k, idx;
+	real_t pulse;
+	Source *src;
+
+	for(s=0; s<loop->nsrc; s++){
+
+		src   = &loop->src[s];
+		pulse = src->pulses[tstep];
+
+		for(i=src->xsrt; i<src->xend; i++){
+			for(j=src->ysrt; j<src->yend; j++){
+				for(k=src->zsrt; k<src->zend; k++){
+
+					idx = k + j*src->Nz + i*src->Nz*src->Ny;
+
+					if (src->soft) src->field[idx] += pulse;
+					else		   src->field[idx]  = pulse;
+				}
+			}
+		}
+	}
+
+	return;
+}
+
+static void update_half(StepLoop* loop, HalfStep* half){
+
+	int n, part;
+	MPI_Request reqs[8];
+	fused_kernel update = (fused_kernel) half->kernel;
+
+	for(n=0; n<half->ncopy; n++) memcpy(half->copy_dst[n], half->copy_src[n], sizeof(real_t)*loop->Ny*loop->Nz);
+
+	if (loop->win != NULL) MPI_Win_sync(*(MPI_Win*) loop->win);
+
+	// The handles of persistent requests stay the same after they complete.
+	for(n=0; n<half->nreqs; n++) reqs[n] = *(MPI_Request*) half->reqs[n];
+
+	MPI_Startall(half->nreqs, reqs);
+
+	for(part=0; part<2; part++){
+
+		update(	loop->plans,
+				loop->MPIsize, loop->MPIrank,
+				loop->myNx, loop->Ny, loop->Nz,
+				half->isrt[part], half->iend[part],
+				loop->pml_widths[0], loop->pml_widths[1],
+				loop->pml_widths[2], loop->pml_widths[3],
+				loop->pml_widths[4], loop->pml_widths[5],
+				loop->dt, loop->dx,
+				loop->ky, loop->kz,
+				half->F[0], half->F[1], half->F[2],
+				half->G[0], half->G[1], half->G[2],
+				loop->mat, half->coef,
+				half->recv[0], half->recv[1],
+				loop->pml);
+
+		if (part == 0){
+
+			MPI_Waitall(half->nreqs, reqs, MPI_STATUSES_IGNORE);
+
+			if (loop->win != NULL) MPI_Win_sync(*(MPI_Win*) loop->win);
+		}
+	}
+
+	return;
+}
+
+static void do_RFT(StepLoop* loop, int tstep){
+
+	int n, f;
+	double phase, c, s;
+	Collector *col;
+
+	for(n=0; n<loop->ncol; n++){
+
+		col = &loop->col[n];
+
+		if (tstep % col->stride != 0) continue;
+
+		// Same twiddles as Sx.do_RFT. Each sample stands for stride time steps.
+		for(f=0; f<col->Nf; f++){
+
+			phase = 2. * M_PI * col->freqs[f] * tstep * loop->dt;
+			c = cos(phase) * loop->dt * col->stride;
+			s = sin(phase) * loop->dt * col->stride;
+
+			if (col->single){
+				((float*) col->coswdt)[f] = (float) c;
+				((float*) col->sinwdt)[f] = (float) s;
+			}
+			else{
+				((double*) col->coswdt)[f] = c;
+				((double*) col->sinwdt)[f] = s;
+			}
+		}
+
+		if (col->blocked)
+			((blocked_kernel) col->kernel)(	col->Nf,
+											col->Ny, col->Nz,
+											col->xsrt, col->xend,
+											col->ysrt, col->yend,
+											col->zsrt, col->zend,
+											col->coswdt, col->sinwdt,
+											col->DFT[0],
+											col->F[0], col->F[1],
+											col->F[2], col->F[3]);
+		else
+			((planar_kernel) col->kernel)(	loop->MPIrank,
+											col->Nf,
+											col->Ny, col->Nz,
+											col->xsrt, col->xend,
+											col->ysrt, col->yend,
+											col->zsrt, col->zend,
+											col->coswdt, col->sinwdt,
+											col->DFT[0], col->DFT[1], col->DFT[2], col->DFT[3],
+											col->DFT[4], col->DFT[5], col->DFT[6], col->DFT[7],
+											col->F[0], col->F[1],
+											col->F[2], col->F[3]);
+	}
+
+	return;
+}
+
+void run_steps(StepLoop* loop, int tstart, int nsteps){
+
+	int tstep;
+
+	for(tstep=tstart; tstep<tstart+nsteps; tstep++){
+
+		put_sources(loop, tstep);
+
+		update_half(loop, &loop->half[0]);
+		update_half(loop, &loop->half[1]);
+
+		do_RFT(loop, tstep);
+	}
+
+	return;
+}
@@ -1,4 +1,5 @@
 import numpy as np
+from functools import reduce
 from scipy.constants import c, mu_0, epsilon_0
 
 class Structure(object):
@@ -12,6 +13,69 @@ class Structure(object):
     
         self.Space = Space
 
+    def _fill(self, region, frac):
+        """Put the material into the local slab.
+
+        Args:
+            region: tuple of slices
+                Local (x, y, z) region covered by frac.
+
+            frac: ndarray
+                Fill fraction of each cell in the region, boolean or float in [0, 1].
+                The material is averaged with whatever is already there.
+
+        Returns:
+            None
+        """
+
+        self.Space.put_material(region, frac, self.eps_r, self.mu_r)
+
+    def _smooth(self, inside, srt, end, smoothing):
+        """Sub-pixel smoothing by fill-fraction averaging.
+
+        Each cell of the global box (srt, end) that lies in this node is
+        sampled smoothing**3 times, and the fraction of samples inside the
+        structure is put into the slab.
+
+        Args:
+            inside: callable
+                Takes broadcastable global index coordinates x, y, z and
+                returns a boolean array.
+
+            srt, end: tuple
+                Global index box that encloses the structure.
+
+            smoothing: int
+                Number of samples per axis.
+
+        Returns:
+            None
+        """
+
+        node_xsrt = self.Space.myNx_indice[self.Space.MPIxrank][0]
+        node_xend = self.Space.myNx_indice[self.Space.MPIxrank][1]
+
+        xsrt, xend = max(srt[0], node_xsrt), min(end[0], node_xend)
+        ysrt, yend = max(srt[1], 0), min(end[1], self.Space.Ny)
+        zsrt, zend = max(srt[2], 0), min(end[2], self.Space.Nz)
+
+        if xsrt >= xend or ysrt >= yend or zsrt >= zend: return
+
+        x = np.arange(xsrt, xend, dtype=np.float64)[:,None,None]
+        y = np.arange(ysrt, yend, dtype=np.float64)[None,:,None]
+        z = np.arange(zsrt, zend, dtype=np.float64)[None,None,:]
+
+        offset = (np.arange(smoothing) + 0.5) / smoothing - 0.5
+        frac = np.zeros((xend-xsrt, yend-ysrt, zend-zsrt), dtype=np.float64)
+
+        for ox in offset:
+            for oy in offset:
+                for oz in offset:
+                    frac += inside(x+ox, y+oy, z+oz)
+
+        region = (slice(xsrt-node_xsrt, xend-node_xsrt), slice(ysrt, yend), slice(zsrt, zend))
+        self._fill(region, frac / smoothing**3)
+
 class Box(Structure):
     def __init__(self, Space, srt, end, eps_r, mu_r):
         """Place a rectangle inside of a simulation space.
@@ -74,8 +138,8 @@ class Box(Structure):
         MPIsize = self.Space.MPIsize
 
         # Global x index of each node.
-        node_xsrt = self.Space.myNx_indice[MPIrank][0]
-        node_xend = self.Space.myNx_indice[MPIrank][1]
+        node_xsrt = self.Space.myNx_indice[self.Space.MPIxrank][0]
+        node_xend = self.Space.myNx_indice[self.Space.MPIxrank][1]
 
         if xend <  node_xsrt:
             self.global_loc = None
@@ -111,17 +175,14 @@ class Box(Structure):
             loc_yend = self.local_loc[1][1]
             loc_zend = self.local_loc[1][2]
 
-            self.Space.eps_HEE[loc_xsrt:loc_xend, loc_ysrt:loc_yend, loc_zsrt:loc_zend] = self.eps_r * epsilon_0
-            self.Space.eps_EHH[loc_xsrt:loc_xend, loc_ysrt:loc_yend, loc_zsrt:loc_zend] = self.eps_r * epsilon_0
-
-            self.Space. mu_HEE[loc_xsrt:loc_xend, loc_ysrt:loc_yend, loc_zsrt:loc_zend] = self. mu_r * mu_0
-            self.Space. mu_EHH[loc_xsrt:loc_xend, loc_ysrt:loc_yend, loc_zsrt:loc_zend] = self. mu_r * mu_0
+            region = (slice(loc_xsrt, loc_xend), slice(loc_ysrt, loc_yend), slice(loc_zsrt, loc_zend))
+            self.Space.put_material(region, 1., self.eps_r, self.mu_r)
 
         return
 
 class Cone(Structure):
-    def __init__(self, Space, axis, height, radius, center, eps_r, mu_r):
-        """Place a rectangle inside of a simulation space.
+    def __init__(self, Space, axis, height, radius, center, eps_r, mu_r, smoothing=0):
+        """Place a cone inside of a simulation space.
         
         Args:
             Space : Space object
@@ -144,6 +205,10 @@ class Cone(Structure):
             mu_ r : float
                     Relative magnetic constant or permeability.
 
+            smoothing : int
+                Samples per axis for sub-pixel smoothing of the surface.
+                0 or 1 gives a staircased cone.
+
         Returns:
             None
 
@@ -174,8 +239,8 @@ class Cone(Structure):
         MPIsize = self.Space.MPIsize
 
         # Global x index of each node.
-        node_xsrt = self.Space.myNx_indice[MPIrank][0]
-        node_xend = self.Space.myNx_indice[MPIrank][1]
+        node_xsrt = self.Space.myNx_indice[self.Space.MPIxrank][0]
+        node_xend = self.Space.myNx_indice[self.Space.MPIxrank][1]
 
         if gxend <  node_xsrt:
             self.gxloc = None
@@ -198,17 +263,7 @@ class Cone(Structure):
             my_height = np.linspace(portion_srt  , portion_end, len(my_lxloc))
             my_radius = (radius * my_height ) / height
 
-            for i in range(len(my_radius)):
-                for j in range(self.Space.Ny):
-                    for k in range(self.Space.Nz):
-
-                        if ((j-center[1])**2 + (k-center[2])**2) <= (my_radius[i]**2):
-
-                            self.Space.eps_HEE[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-                            self.Space.eps_EHH[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-
-                            self.Space. mu_HEE[my_lxloc[i], j, k] = self. mu_r * mu_0
-                            self.Space. mu_EHH[my_lxloc[i], j, k] = self. mu_r * mu_0
+            if smoothing <= 1: self._fill_disks(my_lxloc, my_radius, center)
 
         # Middle part
         if gxsrt <= node_xsrt and gxend >= node_xend:
@@ -223,17 +278,7 @@ class Cone(Structure):
             my_height = np.linspace(portion_srt  , portion_end, len(my_lxloc))
             my_radius = (radius * my_height ) / height
 
-            for i in range(len(my_radius)):
-                for j in range(self.Space.Ny):
-                    for k in range(self.Space.Nz):
-
-                        if ((j-center[1])**2 + (k-center[2])**2) <= (my_radius[i]**2):
-
-                            self.Space.eps_HEE[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-                            self.Space.eps_EHH[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-
-                            self.Space. mu_HEE[my_lxloc[i], j, k] = self. mu_r * mu_0
-                            self.Space. mu_EHH[my_lxloc[i], j, k] = self. mu_r * mu_0
+            if smoothing <= 1: self._fill_disks(my_lxloc, my_radius, center)
 
         # First part but small
         if gxsrt >= node_xsrt and gxsrt <= node_xend and gxend <=  node_xend:
@@ -248,17 +293,7 @@ class Cone(Structure):
             my_height = np.linspace(portion_srt  , portion_end, len(my_lxloc))
             my_radius = (radius * my_height ) / height
 
-            for i in range(len(my_radius)):
-                for j in range(self.Space.Ny):
-                    for k in range(self.Space.Nz):
-
-                        if ((j-center[1])**2 + (k-center[2])**2) <= (my_radius[i]**2):
-
-                            self.Space.eps_HEE[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-                            self.Space.eps_EHH[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-
-                            self.Space. mu_HEE[my_lxloc[i], j, k] = self. mu_r * mu_0
-                            self.Space. mu_EHH[my_lxloc[i], j, k] = self. mu_r * mu_0
+            if smoothing <= 1: self._fill_disks(my_lxloc, my_radius, center)
 
         # First part but big
         if gxsrt >= node_xsrt and gxsrt <= node_xend and gxend >= node_xend:
@@ -273,17 +308,7 @@ class Cone(Structure):
             my_height = np.linspace(portion_srt  , portion_end, len(my_lxloc))
             my_radius = (radius * my_height ) / height
 
-            for i in range(len(my_radius)):
-                for j in range(self.Space.Ny):
-                    for k in range(self.Space.Nz):
-
-                        if ((j-center[1])**2 + (k-center[2])**2) <= (my_radius[i]**2):
-
-                            self.Space.eps_HEE[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-                            self.Space.eps_EHH[my_lxloc[i], j, k] = self.eps_r * epsilon_0
-
-                            self.Space. mu_HEE[my_lxloc[i], j, k] = self. mu_r * mu_0
-                            self.Space. mu_EHH[my_lxloc[i], j, k] = self. mu_r * mu_0
+            if smoothing <= 1: self._fill_disks(my_lxloc, my_radius, center)
 
         if gxsrt >= node_xend:
                 self.gxloc = None
@@ -304,14 +329,67 @@ class Cone(Structure):
 
         #print(MPIrank, self.portion, self.gxloc, self.lxloc)
         """
+
+        if smoothing > 1:
+
+            # The apex sits at gxsrt and the bottom of radius 'radius' at gxend.
+            def inside(x, y, z):
+                r = radius * (x - gxsrt) / height
+                return (x >= gxsrt) & (x <= gxend) & (((y-center[1])**2 + (z-center[2])**2) <= r**2)
+
+            r = int(np.ceil(radius)) + 1
+            self._smooth(inside, (gxsrt-1, center[1]-r, center[2]-r), (gxend+1, center[1]+r+1, center[2]+r+1), smoothing)
+
         self.Space.MPIcomm.Barrier()
 
         return
 
+    def _fill_disks(self, my_lxloc, my_radius, center):
+        """Fill a disk of radius my_radius[i] on each local x plane my_lxloc[i]."""
+
+        if len(my_lxloc) == 0: return
+
+        # Only the bounding box of the largest disk is touched.
+        r = int(np.ceil(my_radius.max()))
+        ysrt, yend = max(center[1]-r, 0), min(center[1]+r+1, self.Space.Ny)
+        zsrt, zend = max(center[2]-r, 0), min(center[2]+r+1, self.Space.Nz)
+
+        j = np.arange(ysrt, yend)[None,:,None]
+        k = np.arange(zsrt, zend)[None,None,:]
+
+        mask = ((j-center[1])**2 + (k-center[2])**2) <= (my_radius[:,None,None]**2)
+
+        self._fill((slice(my_lxloc[0], my_lxloc[-1]+1), slice(ysrt, yend), slice(zsrt, zend)), mask)
+
 
 class Sphere(Structure):
 
-    def __init__(self, Space, center, radius, eps_r, mu_r):
+    def __init__(self, Space, center, radius, eps_r, mu_r, smoothing=0):
+        """Place a sphere inside of a simulation space.
+
+        Args:
+            Space : Space object
+
+            center : tuple
+                Global index of the center.
+
+            radius : float
+                Radius in meters.
+
+            eps_r : float
+                    Relative electric constant or permitivity.
+
+            mu_ r : float
+                    Relative magnetic constant or permeability.
+
+            smoothing : int
+                Samples per axis for sub-pixel smoothing of the surface.
+                0 or 1 gives a staircased sphere.
+
+        Returns:
+            None
+
+        """
 
         Structure.__init__(self, Space)
 
@@ -337,8 +415,8 @@ class Sphere(Structure):
         MPIsize = self.Space.MPIsize
 
         # Global x index of each node.
-        node_xsrt = self.Space.myNx_indice[MPIrank][0]
-        node_xend = self.Space.myNx_indice[MPIrank][1]
+        node_xsrt = self.Space.myNx_indice[self.Space.MPIxrank][0]
+        node_xend = self.Space.myNx_indice[self.Space.MPIxrank][1]
 
         self.gxloc = None
         self.lxloc = None
@@ -382,24 +460,254 @@ class Sphere(Structure):
             self.portion = np.arange(portion_srt, portion_end)
 
             rx = abs(self.portion - int(radius/dx))
-            rr = np.zeros_like(rx, dtype=np.float64)
-            theta = np.zeros_like(rx, dtype=np.float64)
+            theta = np.arccos(rx*dx/radius)
+            rr = radius * np.sin(theta)
+
+            # Only the yz bounding box of the sphere is touched.
+            ry = int(radius/dy) + 1
+            rz = int(radius/dz) + 1
+            ysrt, yend = max(center[1]-ry, 0), min(center[1]+ry+1, self.Space.Ny)
+            zsrt, zend = max(center[2]-rz, 0), min(center[2]+rz+1, self.Space.Nz)
 
-            for i in range(len(rx)):
-                theta[i] = np.arccos(rx[i]*dx/radius)
-                rr[i] = radius * np.sin(theta[i])
+            if smoothing <= 1:
+                j = np.arange(ysrt, yend)[None,:,None]
+                k = np.arange(zsrt, zend)[None,None,:]
 
-                for j in range(self.Space.Ny):
-                    for k in range(self.Space.Nz):
+                mask = (((j-center[1])*dy)**2 + ((k-center[2])*dz)**2) <= (rr[:,None,None]**2)
+                self._fill((slice(lxloc[0], lxloc[-1]+1), slice(ysrt, yend), slice(zsrt, zend)), mask)
 
-                        if (((j-center[1])*dy)**2 + ((k-center[2])*dz)**2) <= (rr[i]**2):
+            #print(MPIrank, self.gxloc, self.lxloc, rx, rr)
 
-                            self.Space.eps_HEE[lxloc[i], j, k] = self.eps_r * epsilon_0
-                            self.Space.eps_EHH[lxloc[i], j, k] = self.eps_r * epsilon_0
+        if smoothing > 1:
 
-                            self.Space. mu_HEE[lxloc[i], j, k] = self. mu_r * mu_0
-                            self.Space. mu_EHH[lxloc[i], j, k] = self. mu_r * mu_0
+            def inside(x, y, z):
+                return (((x-center[0])*dx)**2 + ((y-center[1])*dy)**2 + ((z-center[2])*dz)**2) <= radius**2
 
-            #print(MPIrank, self.gxloc, self.lxloc, rx, rr)
+            ry = int(radius/dy) + 2
+            rz = int(radius/dz) + 2
+            self._smooth(inside, (xsrt-1, center[1]-ry, center[2]-rz), (xend+2, center[1]+ry+1, center[2]+rz+1), smoothing)
 
         return
+
+
+class Scene(object):
+
+    def __init__(self, Space):
+        """Collect many structures and rasterize them into the local slab in one pass.
+
+        Structures are painted in the order they are added. A later one overwrites an
+        earlier one where they overlap. Shapes can be combined with Union and Difference,
+        and Scene.subtract carves a shape back to vacuum.
+
+        Args:
+            Space : Space object
+
+        Returns:
+            None
+        """
+
+        self.Space = Space
+
+        self.shapes = []
+        self.materials = [(1., 1.)] # Material 1 is vacuum. 0 marks cells no shape touched.
+
+    def add(self, shape, eps_r, mu_r):
+        """Add a shape made of an isotropic material.
+
+        Args:
+            shape : BoxShape, SphereShape, ConeShape, Union or Difference
+
+            eps_r : float
+                    Relative electric constant or permitivity.
+
+            mu_ r : float
+                    Relative magnetic constant or permeability.
+
+        Returns:
+            None
+        """
+
+        assert type(eps_r) == float, "Only isotropic media is possible. eps_r must be a single float."
+        assert type( mu_r) == float, "Only isotropic media is possible.  mu_r must be a single float."
+
+        if (eps_r, mu_r) not in self.materials: self.materials.append((eps_r, mu_r))
+
+        self.shapes.append((shape, self.materials.index((eps_r, mu_r)) + 1))
+
+    def subtract(self, shape):
+        """Carve a shape out of everything added so far."""
+
+        self.shapes.append((shape, 1))
+
+    def rasterize(self):
+        """Put every shape into the local slab.
+
+        A bounding-box index lets each node skip the shapes outside its own range. The
+        shapes only write a material index, and the material arrays are filled by a
+        single table lookup at the end. With the compact material storage of Space,
+        each material is put once with put_material() instead.
+
+        Returns:
+            index: ndarray of uint16 with the shape of the local grid.
+                Material index of each cell, 0 where no shape was placed.
+        """
+
+        Space = self.Space
+
+        node_xsrt = Space.myNx_indice[Space.MPIxrank][0]
+        node_xend = Space.myNx_indice[Space.MPIxrank][1]
+
+        node_ysrt = Space.myNy_indice[Space.MPIyrank][0]
+        node_yend = Space.myNy_indice[Space.MPIyrank][1]
+
+        index = np.zeros(Space.loc_grid, dtype=np.uint16)
+
+        if len(self.shapes) > 0:
+
+            bbox = np.array([shape.bbox(Space) for shape, mat in self.shapes]) # (N, 2, 3)
+
+            lo = np.maximum(bbox[:,0], (node_xsrt, node_ysrt, 0))
+            hi = np.minimum(bbox[:,1], (node_xend, node_yend, Space.Nz))
+
+            hit = np.nonzero(np.all(lo < hi, axis=1))[0]
+
+            for n in hit:
+
+                shape, mat = self.shapes[n]
+
+                x = np.arange(lo[n,0], hi[n,0])[:,None,None]
+                y = np.arange(lo[n,1], hi[n,1])[None,:,None]
+                z = np.arange(lo[n,2], hi[n,2])[None,None,:]
+
+                region = (slice(lo[n,0]-node_xsrt, hi[n,0]-node_xsrt), slice(lo[n,1]-node_ysrt, hi[n,1]-node_ysrt), slice(lo[n,2], hi[n,2]))
+                index[region] = np.where(shape.inside(Space, x, y, z), mat, index[region])
+
+        if Space.materials == 'compact':
+
+            for m in np.unique(index[index > 0]):
+                eps_r, mu_r = self.materials[m-1]
+                Space.put_material(index == m, 1., eps_r, mu_r)
+
+            return index
+
+        touched = index > 0
+        eps = np.array([0.] + [eps_r * epsilon_0 for eps_r, mu_r in self.materials])
+        mu  = np.array([0.] + [ mu_r * mu_0      for eps_r, mu_r in self.materials])
+
+        Space.eps_HEE[touched] = eps[index[touched]]
+        Space.eps_EHH[touched] = eps[index[touched]]
+
+        Space. mu_HEE[touched] =  mu[index[touched]]
+        Space. mu_EHH[touched] =  mu[index[touched]]
+
+        return index
+
+
+class BoxShape(object):
+
+    def __init__(self, srt, end):
+        """A box between the global indices srt and end, end excluded."""
+
+        assert len(srt) == 3 and len(end) == 3, "Only 3D material is possible."
+
+        self.srt = tuple(srt)
+        self.end = tuple(end)
+
+    def bbox(self, Space):
+
+        return self.srt, self.end
+
+    def inside(self, Space, x, y, z):
+
+        return (x >= self.srt[0]) & (x < self.end[0]) \
+             & (y >= self.srt[1]) & (y < self.end[1]) \
+             & (z >= self.srt[2]) & (z < self.end[2])
+
+
+class SphereShape(object):
+
+    def __init__(self, center, radius):
+        """A sphere around the global index center with a radius in meters."""
+
+        assert len(center) == 3, "Please insert x,y,z coordinate of the center."
+
+        self.center = center
+        self.radius = radius
+
+    def bbox(self, Space):
+
+        r = (int(self.radius/Space.dx)+1, int(self.radius/Space.dy)+1, int(self.radius/Space.dz)+1)
+
+        return tuple(self.center[i]-r[i] for i in range(3)), tuple(self.center[i]+r[i]+1 for i in range(3))
+
+    def inside(self, Space, x, y, z):
+
+        return ((x-self.center[0])*Space.dx)**2 \
+             + ((y-self.center[1])*Space.dy)**2 \
+             + ((z-self.center[2])*Space.dz)**2 <= self.radius**2
+
+
+class ConeShape(object):
+
+    def __init__(self, height, radius, center):
+        """A cone along x, with the bottom of radius 'radius' centered at the global index center.
+
+        The apex sits height cells before the bottom. height and radius are in cells.
+        """
+
+        assert len(center) == 3, "Please insert x,y,z coordinate of the center."
+
+        self.height = height
+        self.radius = radius
+        self.center = center
+
+    def bbox(self, Space):
+
+        r = int(np.ceil(self.radius))
+        srt = (self.center[0]-self.height, self.center[1]-r  , self.center[2]-r  )
+        end = (self.center[0]+1          , self.center[1]+r+1, self.center[2]+r+1)
+
+        return srt, end
+
+    def inside(self, Space, x, y, z):
+
+        gxsrt = self.center[0] - self.height
+        r = self.radius * (x - gxsrt) / self.height
+
+        return (x >= gxsrt) & (x <= self.center[0]) \
+             & (((y-self.center[1])**2 + (z-self.center[2])**2) <= r**2)
+
+
+class Union(object):
+
+    def __init__(self, *shapes):
+        """Cells inside any of the shapes."""
+
+        self.shapes = shapes
+
+    def bbox(self, Space):
+
+        boxes = np.array([shape.bbox(Space) for shape in self.shapes])
+
+        return tuple(boxes[:,0].min(axis=0)), tuple(boxes[:,1].max(axis=0))
+
+    def inside(self, Space, x, y, z):
+
+        return reduce(np.logical_or, [shape.inside(Space, x, y, z) for shape in self.shapes])
+
+
+class Difference(object):
+
+    def __init__(self, shape, cut):
+        """Cells inside shape but not inside cut."""
+
+        self.shape = shape
+        self.cut = cut
+
+    def bbox(self, Space):
+
+        return self.shape.bbox(Space)
+
+    def inside(self, Space, x, y, z):
+
+        return self.shape.inside(Space, x, y, z) & ~self.cut.inside(Space, x, y, z)